@@ -1,6 +1,8 @@
 from flask import Blueprint, request, send_file, session,jsonify, render_template
 from werkzeug.security import generate_password_hash
-from config import get_db
+from config import get_db, get_pool
+from schema_cache import refresh_schema_cache
+from resume_render import resume_cache_stats
 from datetime import datetime
 import re
 import traceback
@@ -732,6 +734,35 @@ def admin_get_semesters_list():
         cursor.close()
         conn.close()
 
+# --------------------------------
+# 資料庫連線池監控 / 結構快取
+# --------------------------------
+@admin_bp.route('/api/db_pool_stats', methods=['GET'])
+def db_pool_stats():
+    """連線池統計：借出次數、等待時間、用盡次數、使用中/閒置連線數"""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return jsonify({"success": False, "message": "未授權"}), 403
+    return jsonify({"success": True, "stats": get_pool().stats()})
+
+@admin_bp.route('/api/resume_cache_stats', methods=['GET'])
+def resume_cache_stats_api():
+    """履歷產生結果快取統計：命中 / 未命中次數與命中率"""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return jsonify({"success": False, "message": "未授權"}), 403
+    return jsonify({"success": True, "stats": resume_cache_stats()})
+
+@admin_bp.route('/api/schema_cache/refresh', methods=['POST'])
+def refresh_schema():
+    """資料庫 migration 後重新載入表/欄位結構快取"""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return jsonify({"success": False, "message": "未授權"}), 403
+    try:
+        table_count = refresh_schema_cache()
+        return jsonify({"success": True, "table_count": table_count})
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": str(e)}), 500
+
 # --------------------------------
 # 用戶管理頁面
 # --------------------------------
@@ -1,12 +1,12 @@
-from flask import Blueprint, request, jsonify, session, render_template, redirect, send_file
+from flask import Blueprint, request, jsonify, session, render_template, redirect
 from config import get_db
+from schema_cache import has_table, has_column, get_columns
 from datetime import datetime, timedelta
 from semester import get_current_semester_code, get_current_semester_id, get_flow_semester_id, get_flow_semester_code, get_internship_semester_dates
-from notification import create_notification
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
-import io
+from notification import create_notification, notify_users
+from matching_engine import MatchingSnapshot, propose_matching
+from excel_export import StreamingWorkbook, iter_rows, write_company_grid, company_grid_widths, XLSX_MIMETYPE
+from export_cache import export_cache_key, cached_export_response
 import traceback
 import re
 try:
@@ -51,127 +51,8 @@ def _resolve_duplicate_students(cursor, semester_id):
         semester_id: 學期ID
     """
     try:
-        # 檢查是否有 semester_id 欄位
-        cursor.execute("""
-            SELECT COLUMN_NAME
-            FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA = DATABASE()
-            AND TABLE_NAME = 'manage_director'
-            AND COLUMN_NAME = 'semester_id'
-        """)
-        has_semester_id = cursor.fetchone() is not None
-        cursor.fetchall()
-        
-        # 查詢同一學期內，同一學生有多筆記錄的情況（只考慮 Approved 或 Pending 的記錄）
-        if has_semester_id:
-            cursor.execute("""
-                SELECT 
-                    md.match_id,
-                    md.student_id,
-                    md.preference_id,
-                    md.director_decision,
-                    sp.preference_order
-                FROM manage_director md
-                LEFT JOIN student_job_applications sja ON md.preference_id = sja.id
-                LEFT JOIN student_preferences sp ON sja.student_id = sp.student_id
-                    AND sja.company_id = sp.company_id
-                    AND sja.job_id = sp.job_id
-                    AND sp.semester_id = %s
-                WHERE md.semester_id = %s
-                    AND md.director_decision IN ('Approved', 'Pending')
-                ORDER BY md.student_id, COALESCE(sp.preference_order, 999), md.match_id
-            """, (semester_id, semester_id))
-        else:
-            cursor.execute("""
-                SELECT 
-                    md.match_id,
-                    md.student_id,
-                    md.preference_id,
-                    md.director_decision,
-                    sp.preference_order
-                FROM manage_director md
-                LEFT JOIN student_job_applications sja ON md.preference_id = sja.id
-                LEFT JOIN student_preferences sp ON sja.student_id = sp.student_id
-                    AND sja.company_id = sp.company_id
-                    AND sja.job_id = sp.job_id
-                WHERE md.director_decision IN ('Approved', 'Pending')
-                ORDER BY md.student_id, COALESCE(sp.preference_order, 999), md.match_id
-            """)
-        
-        all_records = cursor.fetchall()
-        print(f"🔍 [resolve_duplicate_students] 查詢到 {len(all_records)} 筆記錄")
-        
-        # 按學生分組
-        student_records = {}
-        for record in all_records:
-            student_id = record.get('student_id')
-            if student_id:
-                if student_id not in student_records:
-                    student_records[student_id] = []
-                student_records[student_id].append(record)
-        
-        # 處理每個有重複記錄的學生
-        updated_count = 0
-        for student_id, records in student_records.items():
-            if len(records) <= 1:
-                continue  # 沒有重複，跳過
-            
-            print(f"🔍 [resolve_duplicate_students] 發現重複學生 student_id={student_id}，有 {len(records)} 筆記錄")
-            
-            # 選擇志願序最高的記錄（preference_order 最小）
-            # 如果志願序相同，選擇 match_id 較小的（較早創建的）
-            best_record = None
-            best_order = 999
-            best_match_id = None
-            
-            for record in records:
-                preference_order = record.get('preference_order')
-                match_id = record.get('match_id')
-                print(f"  - match_id={match_id}, preference_order={preference_order}, director_decision={record.get('director_decision')}")
-                
-                if preference_order is None:
-                    preference_order = 999  # 沒有志願序的排在最後
-                
-                match_id_int = int(match_id) if match_id and str(match_id).isdigit() else 999999
-                
-                # 優先考慮志願序，如果志願序相同則考慮 match_id
-                if preference_order < best_order or (preference_order == best_order and match_id_int < (int(best_match_id) if best_match_id and str(best_match_id).isdigit() else 999999)):
-                    best_record = record
-                    best_order = preference_order
-                    best_match_id = match_id
-            
-            if not best_record:
-                print(f"  ⚠️ 無法選擇最佳記錄，跳過")
-                continue
-            
-            print(f"  ✅ 選擇最佳記錄: match_id={best_match_id}, preference_order={best_order}")
-            
-            # 將其他記錄的 director_decision 更新為 Pending
-            best_match_id_str = str(best_record.get('match_id'))
-            for record in records:
-                match_id = str(record.get('match_id'))
-                if match_id != best_match_id_str:
-                    # 更新為 Pending（但保持 Approved 的記錄不變，除非志願序更低）
-                    current_decision = record.get('director_decision')
-                    if current_decision == 'Approved':
-                        # 如果當前是 Approved 但志願序更低，更新為 Pending
-                        print(f"  🔄 更新 match_id={match_id} 為 Pending（志願序較低）")
-                        cursor.execute("""
-                            UPDATE manage_director
-                            SET director_decision = 'Pending',
-                                updated_at = CURRENT_TIMESTAMP
-                            WHERE match_id = %s
-                        """, (match_id,))
-                        updated_count += cursor.rowcount
-                    elif current_decision == 'Pending':
-                        # 已經是 Pending，不需要更新
-                        print(f"  ℹ️ match_id={match_id} 已經是 Pending，跳過")
-                        pass
-        
-        if updated_count > 0:
-            print(f"✅ 自動處理重複學生：已將 {updated_count} 筆記錄更新為 Pending")
-        
-        return updated_count
+        snapshot = MatchingSnapshot.load(cursor, semester_id, with_details=False)
+        return snapshot.resolve_duplicate_students(cursor)
     except Exception as e:
         print(f"⚠️ 處理重複學生時發生錯誤: {str(e)}")
         traceback.print_exc()
@@ -342,12 +223,7 @@ def record_admission():
         current_datetime_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
         # 4.1 偵測 teacher_student_relations 表是否有 semester_id 或 semester 欄位
-        cursor.execute("""
-            SELECT COLUMN_NAME FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'teacher_student_relations'
-            AND COLUMN_NAME IN ('semester_id', 'semester', 'company_id')
-        """)
-        tsr_columns = {row['COLUMN_NAME'] for row in cursor.fetchall()}
+        tsr_columns = set(get_columns('teacher_student_relations'))
         has_semester_id = 'semester_id' in tsr_columns
         has_semester = 'semester' in tsr_columns
         has_company_id = 'company_id' in tsr_columns
@@ -421,11 +297,7 @@ def record_admission():
         
         # 7. 在 matching_results 表中記錄錄取結果（統一媒合結果來源，取代 internship_offers）
         print(f"🔍 [DEBUG] record_admission - 準備寫入 matching_results: student_id={student_id}, job_id={job_id}")
-        cursor.execute("""
-            SELECT COLUMN_NAME FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'matching_results'
-        """)
-        mr_cols = {row['COLUMN_NAME'] for row in cursor.fetchall()}
+        mr_cols = set(get_columns('matching_results'))
         mr_has_semester_id = 'semester_id' in mr_cols
         mr_has_job_id = 'job_id' in mr_cols
         mr_has_job_title = 'job_title' in mr_cols
@@ -570,11 +442,7 @@ def get_my_admission():
         # 從 matching_results 表獲取錄取資料（統一媒合結果來源，取代 internship_offers）
         # 不依賴 mr.job_id（該欄位可能不存在），job_id 改由子查詢取得
         print(f"🔍 [DEBUG] 查詢 matching_results，student_id={student_id}")
-        cursor.execute("""
-            SELECT COLUMN_NAME FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'matching_results'
-        """)
-        mr_cols = {row['COLUMN_NAME'] for row in cursor.fetchall()}
+        mr_cols = set(get_columns('matching_results'))
         mr_has_matched_at = 'matched_at' in mr_cols
         mr_has_job_title = 'job_title' in mr_cols
         mr_has_mentor_id = 'mentor_id' in mr_cols
@@ -1035,13 +903,7 @@ def sync_internship_offers():
             else:
                 admitted_at = str(admitted_at)[:19]
             # 針對沒有 semester_id 欄位的 matching_results 做相容處理
-            cursor.execute("""
-                SELECT COLUMN_NAME
-                FROM information_schema.COLUMNS
-                WHERE TABLE_SCHEMA = DATABASE()
-                  AND TABLE_NAME = 'matching_results'
-            """)
-            mr_sync_cols = {row["COLUMN_NAME"] for row in (cursor.fetchall() or [])}
+            mr_sync_cols = set(get_columns('matching_results'))
             has_semester_sync = "semester_id" in mr_sync_cols
             has_company_sync = "company_id" in mr_sync_cols
             has_mentor_sync = "mentor_id" in mr_sync_cols
@@ -1153,12 +1015,7 @@ def get_company_students():
     
     try:
         # 檢測 teacher_student_relations 表的結構
-        cursor.execute("""
-            SELECT COLUMN_NAME FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'teacher_student_relations'
-            AND COLUMN_NAME IN ('semester_id', 'semester')
-        """)
-        tsr_columns = {row['COLUMN_NAME'] for row in cursor.fetchall()}
+        tsr_columns = set(get_columns('teacher_student_relations'))
         has_semester_id = 'semester_id' in tsr_columns
         has_semester = 'semester' in tsr_columns
         
@@ -2233,12 +2090,7 @@ def director_matching_results():
         # 檢查本學期是否已產生最終媒合結果（matching_results），供前端控制「送出最終媒合結果」按鈕：送出後永久唯讀，返回頁面也唯讀
         already_confirmed = False
         try:
-            cursor.execute("""
-                SELECT COLUMN_NAME FROM information_schema.COLUMNS
-                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'matching_results' AND COLUMN_NAME = 'semester_id'
-            """)
-            has_mr_semester = cursor.fetchone() is not None
-            cursor.fetchall()
+            has_mr_semester = has_column('matching_results', 'semester_id')
             if has_mr_semester:
                 cursor.execute("SELECT 1 FROM matching_results WHERE semester_id = %s LIMIT 1", (current_semester_id,))
                 already_confirmed = cursor.fetchone() is not None
@@ -2248,650 +2100,16 @@ def director_matching_results():
         except Exception:
             pass
 
-        # 優先從 resume_applications 讀取廠商的媒合排序資料
-        # 如果 manage_director 表有資料，則合併兩者的資料
-        # 這樣即使 manage_director 表為空，也能顯示廠商的排序結果
-        # 注意：使用 LEFT JOIN 確保即使 student_job_applications 或 student_preferences 沒有記錄也能顯示
-        query = """
-            SELECT 
-                COALESCE(md.match_id, CONCAT('ra_', ra.id)) AS match_id,
-                COALESCE(md.vendor_id, sja.company_id) AS vendor_id,
-                COALESCE(md.student_id, sja.student_id) AS student_id,
-                COALESCE(sp.id, NULL) AS preference_id,
-                md.original_type AS md_original_type,
-                COALESCE(md.original_type, CASE WHEN ra.is_reserve = 0 THEN 'Regular' ELSE 'Backup' END) AS original_type,
-                COALESCE(md.original_rank, ra.slot_index) AS original_rank,
-                COALESCE(md.is_conflict, 0) AS is_conflict,
-                COALESCE(md.director_decision, 'Pending') AS director_decision,
-                md.final_rank,
-                COALESCE(md.is_adjusted, 0) AS is_adjusted,
-                COALESCE(md.updated_at, ra.updated_at, ra.created_at) AS updated_at,
-                COALESCE(sp.company_id, sja.company_id, md.vendor_id, ra.job_id) AS company_id,
-                (SELECT sp2.preference_order FROM student_preferences sp2
-                 WHERE sp2.student_id = sja.student_id AND sp2.company_id = sja.company_id AND sp2.job_id = sja.job_id
-                   AND sp2.status = 'approved'
-                 ORDER BY sp2.submitted_at DESC LIMIT 1) AS preference_order,
-                COALESCE(sp.job_id, sja.job_id, ra.job_id) AS job_id,
-                ic.company_name,
-                u.name AS student_name,
-                u.username AS student_number,
-                u.email AS student_email,
-                c.name AS class_name,
-                c.department AS class_department,
-                COALESCE(v.name, ic.company_name) AS vendor_name,
-                ij.title AS job_title,
-                ij.slots AS job_slots,
-                ra.is_reserve AS vendor_is_reserve,
-                ra.slot_index AS vendor_slot_index
-            FROM resume_applications ra
-            LEFT JOIN student_job_applications sja ON ra.application_id = sja.id
-            LEFT JOIN student_preferences sp ON (sja.student_id = sp.student_id 
-                AND sja.company_id = sp.company_id 
-                AND sja.job_id = sp.job_id
-                AND (sp.semester_id = %s OR sp.semester_id IS NULL))
-            RIGHT JOIN manage_director md ON ra.application_id = md.preference_id
-            LEFT JOIN internship_companies ic ON COALESCE(sp.company_id, sja.company_id, md.vendor_id) = ic.id
-            LEFT JOIN internship_jobs ij ON COALESCE(sp.job_id, sja.job_id, ra.job_id) = ij.id
-            LEFT JOIN users u ON COALESCE(md.student_id, sja.student_id) = u.id
-            LEFT JOIN classes c ON u.class_id = c.id
-            LEFT JOIN users v ON md.vendor_id = v.id
-            WHERE (
-                -- 1) 有廠商排序且通過審核的紀錄（原本條件）
-                (ra.apply_status = 'approved'
-                 AND (
-                    (ra.is_reserve = 0 AND ra.slot_index IS NOT NULL)
-                    OR (ra.is_reserve = 1)
-                 )
-                )
-                -- 2) 任何存在於 manage_director 的紀錄（主任手動加入或調整），即使廠商尚未審核也要顯示
-                OR md.match_id IS NOT NULL
-            )
-            AND (ic.status = 'approved' OR ic.status IS NULL)  -- 公司狀態必須是已審核（如果公司不存在則也顯示）
-            AND (ra.id IS NULL OR ra.apply_status != 'rejected')  -- 廠商已設為未錄取(rejected)的學生不顯示在主任畫面，與廠商排序一致
-            ORDER BY 
-                CASE COALESCE(md.director_decision, 'Pending')
-                    WHEN 'Approved' THEN 1 
-                    WHEN 'Pending' THEN 2 
-                    WHEN 'Rejected' THEN 3 
-                    ELSE 4 
-                END,
-                COALESCE(sp.company_id, sja.company_id, md.vendor_id), 
-                COALESCE(sp.job_id, sja.job_id, ra.job_id), 
-                CASE WHEN md.director_decision = 'Approved' AND md.final_rank IS NOT NULL THEN 0 ELSE 1 END,
-                COALESCE(md.final_rank, md.original_rank, ra.slot_index, 999) ASC,
-                COALESCE(md.original_rank, ra.slot_index, 999) ASC
-        """
-        cursor.execute(query, (current_semester_id,))
-        all_results = cursor.fetchall() or []
-        
-        # 調試：檢查是否有廠商排序資料
-        vendor_sort_count = sum(1 for r in all_results if r.get("vendor_is_reserve") is not None or r.get("vendor_slot_index") is not None)
-        print(f"📊 director_matching_results: 總記錄數={len(all_results)}, 有廠商排序資料的記錄數={vendor_sort_count}")
-        
-        # 調試：檢查查詢參數
-        print(f"📊 查詢參數: current_semester_id={current_semester_id}")
-        
-        # 調試：如果沒有結果，檢查每個 JOIN 條件
-        if len(all_results) == 0:
-            # 檢查是否有 student_job_applications 記錄
-            debug_query_sja = """
-                SELECT COUNT(*) as count
-                FROM resume_applications ra
-                INNER JOIN student_job_applications sja ON ra.application_id = sja.id
-                WHERE ra.apply_status = 'approved'
-                AND (
-                    (ra.is_reserve = 0 AND ra.slot_index IS NOT NULL)
-                    OR (ra.is_reserve = 1)
-                )
-            """
-            cursor.execute(debug_query_sja)
-            debug_result_sja = cursor.fetchone()
-            print(f"⚠️ 加上 student_job_applications JOIN 後的記錄數: {debug_result_sja.get('count', 0) if debug_result_sja else 0}")
-            
-            # 檢查具體的 resume_applications 記錄
-            debug_query_ra = """
-                SELECT ra.id, ra.application_id, ra.job_id, ra.apply_status, ra.is_reserve, ra.slot_index,
-                       sja.id as sja_id, sja.student_id, sja.company_id, sja.job_id as sja_job_id
-                FROM resume_applications ra
-                LEFT JOIN student_job_applications sja ON ra.application_id = sja.id
-                WHERE ra.apply_status = 'approved'
-                AND (
-                    (ra.is_reserve = 0 AND ra.slot_index IS NOT NULL)
-                    OR (ra.is_reserve = 1)
-                )
-                LIMIT 5
-            """
-            cursor.execute(debug_query_ra)
-            debug_ra_results = cursor.fetchall()
-            print(f"⚠️ resume_applications 記錄詳情（前5筆）:")
-            for ra_record in debug_ra_results:
-                print(f"   - ra.id={ra_record.get('id')}, application_id={ra_record.get('application_id')}, sja_id={ra_record.get('sja_id')}, student_id={ra_record.get('student_id')}, is_reserve={ra_record.get('is_reserve')}, slot_index={ra_record.get('slot_index')}")
-            
-            # 檢查 manage_director 表的記錄
-            debug_query_md = """
-                SELECT md.match_id, md.preference_id, md.student_id, md.director_decision
-                FROM manage_director md
-                LIMIT 5
-            """
-            cursor.execute(debug_query_md)
-            debug_md_results = cursor.fetchall()
-            print(f"⚠️ manage_director 記錄詳情（前5筆）:")
-            for md_record in debug_md_results:
-                print(f"   - match_id={md_record.get('match_id')}, preference_id={md_record.get('preference_id')}, student_id={md_record.get('student_id')}, director_decision={md_record.get('director_decision')}")
-        
-        # 調試：如果沒有資料，檢查可能的原因
-        if len(all_results) == 0:
-            # 檢查 resume_applications 中是否有符合條件的記錄（不考慮 manage_director 和 student_preferences）
-            debug_query1 = """
-                SELECT COUNT(*) as count
-                FROM resume_applications ra
-                INNER JOIN student_job_applications sja ON ra.application_id = sja.id
-                LEFT JOIN internship_companies ic ON sja.company_id = ic.id
-                WHERE ra.apply_status = 'approved'
-                AND (
-                    (ra.is_reserve = 0 AND ra.slot_index IS NOT NULL)
-                    OR (ra.is_reserve = 1)
-                )
-            """
-            cursor.execute(debug_query1)
-            debug_result1 = cursor.fetchone()
-            total_with_sort = debug_result1.get('count', 0) if debug_result1 else 0
-            print(f"⚠️ 沒有符合條件的記錄。resume_applications 中有媒合排序的記錄數: {total_with_sort}")
-            
-            # 檢查公司狀態
-            debug_query2 = """
-                SELECT COUNT(*) as count
-                FROM resume_applications ra
-                INNER JOIN student_job_applications sja ON ra.application_id = sja.id
-                LEFT JOIN internship_companies ic ON sja.company_id = ic.id
-                WHERE ra.apply_status = 'approved'
-                AND (
-                    (ra.is_reserve = 0 AND ra.slot_index IS NOT NULL)
-                    OR (ra.is_reserve = 1)
-                )
-                AND (ic.status = 'approved' OR ic.status IS NULL)
-            """
-            cursor.execute(debug_query2)
-            debug_result2 = cursor.fetchone()
-            total_with_company = debug_result2.get('count', 0) if debug_result2 else 0
-            print(f"⚠️ 加上公司狀態條件後的記錄數: {total_with_company}")
-            
-            # 檢查是否有 apply_status = 'approved' 的記錄
-            debug_query3 = """
-                SELECT COUNT(*) as count, 
-                       SUM(CASE WHEN is_reserve = 0 AND slot_index IS NOT NULL THEN 1 ELSE 0 END) as regular_count,
-                       SUM(CASE WHEN is_reserve = 1 THEN 1 ELSE 0 END) as reserve_count
-                FROM resume_applications
-                WHERE apply_status = 'approved'
-                AND (
-                    (is_reserve = 0 AND slot_index IS NOT NULL)
-                    OR (is_reserve = 1)
-                )
-            """
-            cursor.execute(debug_query3)
-            debug_result3 = cursor.fetchone()
-            if debug_result3:
-                print(f"⚠️ resume_applications 中 apply_status='approved' 且有媒合排序的記錄數: {debug_result3.get('count', 0)}")
-                print(f"   - 正取: {debug_result3.get('regular_count', 0)}, 候補: {debug_result3.get('reserve_count', 0)}")
-        
-        # 格式化結果並組織資料結構
-        formatted_results = []
-        student_company_map = {}  # 用於檢測重複中選：{student_id: [company_ids]}
-        
-        # 使用字典去重：同一學生在同一公司/職缺只保留一條記錄
-        # key: (student_id, company_id, job_id)
-        seen_students = {}
-        
-        for result in all_results:
-            student_id = result.get("student_id")
-            company_id = result.get("company_id")
-            job_id = result.get("job_id")
-            
-            # 檢查是否已存在（同一學生在同一公司/職缺）
-            key = (student_id, company_id, job_id)
-            if key in seen_students:
-                # 如果已存在，優先保留有 manage_director 記錄的（match_id 不以 'ra_' 開頭）
-                existing_match_id = seen_students[key].get("match_id", "")
-                current_match_id = result.get("match_id", "")
-                if isinstance(existing_match_id, str) and existing_match_id.startswith("ra_") and not (isinstance(current_match_id, str) and current_match_id.startswith("ra_")):
-                    # 當前記錄有 manage_director，替換舊記錄
-                    seen_students[key] = result
-                # 否則保留已存在的記錄（跳過當前重複記錄）
-                continue
-            
-            # 記錄已看到的學生
-            seen_students[key] = result
-        
-        # 處理去重後的記錄
-        for key, result in seen_students.items():
-            student_id, company_id, job_id = key
-            
-            # 記錄每個學生被哪些公司選中
-            if student_id not in student_company_map:
-                student_company_map[student_id] = []
-            if company_id not in student_company_map[student_id]:
-                student_company_map[student_id].append(company_id)
-            
-            # 判斷是否為正取或備取
-            # 優先使用廠商的媒合排序資料（resume_applications 表的 is_reserve 和 slot_index）
-            # 如果沒有廠商排序資料，則根據 director_decision 和 original_type 判斷
-            is_reserve = False
-            slot_index = None
-            
-            # 優先使用廠商的媒合排序資料
-            vendor_is_reserve = result.get("vendor_is_reserve")
-            vendor_slot_index = result.get("vendor_slot_index")
-            original_rank = result.get("original_rank")
-            original_type = result.get("original_type")
-            md_original_type = result.get("md_original_type")
-            
-            # 如果 resume_applications 表中有記錄（vendor_is_reserve 或 vendor_slot_index 不是 NULL），表示廠商已經排序
-            # 但我們只把「真的來自廠商排序」的紀錄當成廠商原始結果：
-            # 1) 來自 manage_director 的 original_type 需要有值（廠商端產生的 Regular / Backup）
-            # 2) 同時具備 vendor_is_reserve 或 vendor_slot_index（來自 resume_applications）
-            has_vendor_sorting = (
-                md_original_type is not None and
-                (vendor_is_reserve is not None or vendor_slot_index is not None)
-            )
-            if has_vendor_sorting:
-                # 有廠商的媒合排序資料，優先使用
-                # is_reserve: 0=正取, 1=備取
-                is_reserve = bool(vendor_is_reserve) if vendor_is_reserve is not None else False
-                # 優先使用 original_rank（如果存在），否則使用 vendor_slot_index
-                slot_index = original_rank if original_rank is not None else (vendor_slot_index if vendor_slot_index is not None else None)
-            elif result.get("director_decision") == "Approved" and result.get("final_rank") is not None:
-                # 主任已核定為正取
-                is_reserve = False
-                slot_index = result.get("final_rank")
-            elif result.get("director_decision") == "Pending":
-                # 待定狀態，根據原始設定判斷
-                if original_type == "Regular" and original_rank is not None:
-                    is_reserve = False
-                    slot_index = original_rank
-                else:
-                    is_reserve = True
-                    slot_index = None
-            else:
-                is_reserve = True
-                slot_index = None
-            
-            formatted_result = {
-                "id": result.get("match_id"),  # 使用 match_id 作為識別符
-                "match_id": result.get("match_id"),
-                "vendor_id": result.get("vendor_id"),
-                "vendor_name": result.get("vendor_name"),
-                "company_id": company_id,
-                "company_name": result.get("company_name"),
-                "job_id": result.get("job_id"),
-                "job_title": result.get("job_title") or "未指定職缺",
-                "student_id": student_id,
-                "student_name": result.get("student_name"),
-                "student_number": result.get("student_number"),
-                "student_email": result.get("student_email"),
-                "class_name": result.get("class_name"),
-                "class_department": result.get("class_department"),
-                "preference_order": result.get("preference_order"),
-                "preference_id": result.get("preference_id"),
-                "slot_index": slot_index,
-                "is_reserve": is_reserve,
-                "director_decision": result.get("director_decision"),
-                "final_rank": result.get("final_rank"),
-                "is_adjusted": bool(result.get("is_adjusted")),
-                "is_conflict": bool(result.get("is_conflict")),
-                "original_type": result.get("original_type"),
-                "original_rank": result.get("original_rank"),
-                "vendor_is_reserve": vendor_is_reserve,
-                "vendor_slot_index": vendor_slot_index,  # 廠商的排序索引，用於判斷是否有媒合排序
-                "has_vendor_sorting": has_vendor_sorting,
-                "updated_at": result.get("updated_at").strftime("%Y-%m-%d %H:%M:%S") if isinstance(result.get("updated_at"), datetime) else str(result.get("updated_at", ""))
-            }
-            formatted_results.append(formatted_result)
-        
-        # 標記重複中選的學生（根據 is_conflict 或實際重複情況）
-        duplicate_students = {}
-        for sid, companies in student_company_map.items():
-            if len(companies) > 1:
-                duplicate_students[sid] = companies
-        
-        # 也檢查 is_conflict 標記
-        for result in formatted_results:
-            if result.get("is_conflict") or result["student_id"] in duplicate_students:
-                result["is_duplicate"] = True
-                result["duplicate_companies"] = duplicate_students.get(result["student_id"], [])
-            else:
-                result["is_duplicate"] = False
-                result["duplicate_companies"] = []
-        
-        # 先獲取所有已審核的公司（即使沒有媒合結果也要顯示）
-        cursor.execute("""
-            SELECT DISTINCT ic.id AS company_id, ic.company_name
-            FROM internship_companies ic
-            WHERE ic.status = 'approved'
-            ORDER BY ic.company_name
-        """)
-        all_companies = cursor.fetchall() or []
-        
-        # 獲取所有已審核公司的職缺
-        cursor.execute("""
-            SELECT ij.id AS job_id, ij.company_id, ij.title AS job_title, ij.slots AS job_slots
-            FROM internship_jobs ij
-            JOIN internship_companies ic ON ij.company_id = ic.id
-            WHERE ic.status = 'approved' AND ij.is_active = 1
-            ORDER BY ij.company_id, ij.id
-        """)
-        all_jobs = cursor.fetchall() or []
-        
-        # 按公司組織資料
-        companies_data = {}
-            
-        # 先初始化所有已審核的公司
-        for company in all_companies:
-            company_id = company["company_id"]
-            company_name = company["company_name"]
-            companies_data[company_id] = {
-                "company_id": company_id,
-                "company_name": company_name,
-                "jobs": {}
-            }
-            
-        # 為每個公司添加職缺（即使沒有媒合結果）
-        for job in all_jobs:
-            company_id = job["company_id"]
-            job_id = job["job_id"]
-            job_title = job["job_title"] or "未指定職缺"
-            job_slots = job["job_slots"] or 1
-            
-            if company_id in companies_data:
-                companies_data[company_id]["jobs"][job_id] = {
-                    "job_id": job_id,
-                    "job_title": job_title,
-                    "job_slots": job_slots,
-                    "regulars": [],
-                    "reserves": []
-                }
-        
-        # 將媒合結果分配到對應的公司和職缺
-        # 對於重複中選的學生，優先選擇「有媒合排序結果」且「志願序最高」的記錄
-        # 如果第一志願的公司還沒做媒合排序，選擇其他有媒合排序的公司中志願序最高的
-        student_best_match_id = {}  # key: student_id, value: (match_id, preference_order, has_sorting)
-        
-        for result in formatted_results:
-            student_id = result.get("student_id")
-            if student_id in duplicate_students:
-                # 這是重複中選的學生，需要選擇最合適的記錄
-                preference_order = result.get("preference_order")
-                if preference_order is None:
-                    preference_order = 999  # 沒有志願序的排在最後
-                
-                # 判斷是否有媒合排序結果（廠商已排序）
-                # 如果有 vendor_slot_index 或 original_rank，表示有媒合排序
-                # vendor_slot_index 來自 resume_applications.slot_index，是最直接的判斷方式
-                has_sorting = (result.get("vendor_slot_index") is not None) or (result.get("original_rank") is not None)
-                
-                match_id = result.get("match_id") or result.get("id")
-                # 確保 match_id 是字符串，以便正確比較
-                match_id_str = str(match_id) if match_id is not None else None
-                
-                if student_id not in student_best_match_id:
-                    student_best_match_id[student_id] = (match_id_str, preference_order, has_sorting)
-                else:
-                    # 優先考慮志願序（志願序越小，優先級越高）
-                    # 只有在志願序相同時，才優先選擇有媒合排序的記錄
-                    current_has_sorting = student_best_match_id[student_id][2]
-                    current_order = student_best_match_id[student_id][1]
-                    
-                    # 如果當前記錄的志願序更小（優先級更高），則替換
-                    if preference_order < current_order:
-                        student_best_match_id[student_id] = (match_id_str, preference_order, has_sorting)
-                    # 如果志願序相同，則優先選擇有媒合排序的記錄
-                    elif preference_order == current_order:
-                        if has_sorting and not current_has_sorting:
-                            student_best_match_id[student_id] = (match_id_str, preference_order, has_sorting)
-                    # 如果當前記錄的志願序更大（優先級更低），則不替換
-        
-        # 即時排序：對於重複中選的學生，優先選擇志願序最高的記錄（preference_order 最小的）
-        # 不需要等待第一志願完成媒合排序，只要廠商有做媒合排序並選擇了該學生，就應該顯示
-        # 邏輯已在上面完成：優先考慮志願序，如果志願序相同則優先選擇有媒合排序的記錄
-        
-        # 先建立廠商原始排序的資料（不過濾重複學生，保持原樣；不受 director_decision 影響）
-        # 使用集合追蹤已添加的學生，確保同一學生在同一公司/職缺只出現一次
-        added_students_vendor = {}  # key: (company_id, job_id, student_id)
-        companies_data_vendor = {}
-        
-        # 初始化所有已審核的公司（廠商原始排序）
-        for company in all_companies:
-            company_id = company["company_id"]
-            company_name = company["company_name"]
-            companies_data_vendor[company_id] = {
-                "company_id": company_id,
-                "company_name": company_name,
-                "jobs": {}
-            }
-        
-        # 為每個公司添加職缺（廠商原始排序）
-        for job in all_jobs:
-            company_id = job["company_id"]
-            job_id = job["job_id"]
-            job_title = job["job_title"] or "未指定職缺"
-            job_slots = job["job_slots"] or 1
-            
-            if company_id in companies_data_vendor:
-                companies_data_vendor[company_id]["jobs"][job_id] = {
-                    "job_id": job_id,
-                    "job_title": job_title,
-                    "job_slots": job_slots,
-                    "regulars": [],
-                    "reserves": []
-                }
-        
-        # 將所有「有廠商實際排序資料」的媒合結果分配到廠商原始排序
-        # 僅保留廠商在系統中實際排過的正取／備取名單，排除純粹由主任手動加入、且沒有廠商排序紀錄的學生
-        for result in formatted_results:
-            # has_vendor_sorting 為 True 代表此筆來自 resume_applications 的實際排序結果
-            if not result.get("has_vendor_sorting"):
-                continue
-            company_id = result["company_id"]
-            job_id = result.get("job_id") or 0
-            job_title = result.get("job_title") or "未指定職缺"
-            student_id = result.get("student_id")
-            
-            key = (company_id, job_id, student_id)
-            if key in added_students_vendor:
-                continue
-            
-            if company_id not in companies_data_vendor:
-                companies_data_vendor[company_id] = {
-                    "company_id": company_id,
-                    "company_name": result["company_name"],
-                    "jobs": {}
-                }
-            
-            if job_id not in companies_data_vendor[company_id]["jobs"]:
-                job_slots = result.get("job_slots") or 1
-                companies_data_vendor[company_id]["jobs"][job_id] = {
-                    "job_id": job_id,
-                    "job_title": job_title,
-                    "job_slots": job_slots,
-                    "regulars": [],
-                    "reserves": []
-                }
-            
-            # 廠商原始排序應依照廠商自己的正／備取設定（vendor_is_reserve），而非主任後續調整結果
-            is_reserve_vendor = None
-            if result.get("vendor_is_reserve") is not None:
-                is_reserve_vendor = bool(result.get("vendor_is_reserve"))
-            else:
-                # 理論上 has_vendor_sorting 為 True 時應該有 vendor_is_reserve
-                # 保險起見，若缺少則退回使用 is_reserve
-                is_reserve_vendor = bool(result.get("is_reserve"))
+        # 一次載入本學期媒合資料，在記憶體中組出主任排序與廠商原始排序
+        snapshot = MatchingSnapshot.load(cursor, current_semester_id)
+        view = snapshot.director_view()
 
-            if is_reserve_vendor:
-                companies_data_vendor[company_id]["jobs"][job_id]["reserves"].append(result)
-            else:
-                companies_data_vendor[company_id]["jobs"][job_id]["regulars"].append(result)
-            
-            added_students_vendor[key] = True
-        
-        # 過濾 formatted_results：重複中選的學生只保留志願序最高的記錄（主任排序結果）
-        # 只顯示在 manage_director 有對應記錄的學生（match_id 非 'ra_xxx'）；主任按移除會刪除該筆，故不會再出現
-        filtered_results = []
-        for result in formatted_results:
-            if result.get("director_decision") == "Rejected":
-                continue
-            match_id_val = result.get("match_id")
-            if isinstance(match_id_val, str) and match_id_val.startswith("ra_"):
-                continue
-            student_id = result.get("student_id")
-            if student_id in duplicate_students:
-                # 只保留志願序最高的記錄
-                match_id = result.get("match_id") or result.get("id")
-                match_id_str = str(match_id) if match_id is not None else None
-                if student_id in student_best_match_id and student_best_match_id[student_id][0] == match_id_str:
-                    # 調試：記錄選擇的記錄
-                    selected_order = student_best_match_id[student_id][1]
-                    selected_has_sorting = student_best_match_id[student_id][2]
-                    current_order = result.get("preference_order")
-                    current_company = result.get("company_name")
-                    print(f"✅ 重複中選學生 {student_id}：選擇公司 {current_company}，志願序={current_order}（已選擇的志願序={selected_order}，有媒合排序={selected_has_sorting}）")
-                    filtered_results.append(result)
-            else:
-                # 不是重複中選的學生，直接保留
-                filtered_results.append(result)
-        
-        # 使用集合追蹤已添加的學生，確保同一學生在同一公司/職缺只出現一次（主任排序結果）
-        added_students = {}  # key: (company_id, job_id, student_id)
-        
-        for result in filtered_results:
-            company_id = result["company_id"]
-            job_id = result.get("job_id") or 0
-            job_title = result.get("job_title") or "未指定職缺"
-            student_id = result.get("student_id")
-            
-            # 檢查是否已添加（同一學生在同一公司/職缺）
-            key = (company_id, job_id, student_id)
-            if key in added_students:
-                # 已存在，跳過（避免重複）
-                continue
-            
-            # 如果公司不在列表中，添加它
-            if company_id not in companies_data:
-                companies_data[company_id] = {
-                    "company_id": company_id,
-                    "company_name": result["company_name"],
-                    "jobs": {}
-                }
-            
-            # 如果職缺不在列表中，添加它
-            if job_id not in companies_data[company_id]["jobs"]:
-                job_slots = result.get("job_slots") or 1
-                companies_data[company_id]["jobs"][job_id] = {
-                    "job_id": job_id,
-                    "job_title": job_title,
-                    "job_slots": job_slots,
-                    "regulars": [],
-                    "reserves": []
-                }
-            
-            # 分配學生到正取或備取
-            if result["is_reserve"]:
-                companies_data[company_id]["jobs"][job_id]["reserves"].append(result)
-            else:
-                companies_data[company_id]["jobs"][job_id]["regulars"].append(result)
-            
-            # 標記為已添加
-            added_students[key] = True
-        
-        # 轉換為列表格式，並對正取和備取名單進行排序
-        companies_list = []
-        for company_id, company_data in companies_data.items():
-            jobs_list = []
-            for job_id, job_data in company_data["jobs"].items():
-                # 對正取名單排序：重複中選的學生優先按志願序排序，然後按 original_rank 或 slot_index 排序
-                def sort_key_regulars(x):
-                    student_id = x.get("student_id")
-                    is_duplicate = student_id in duplicate_students
-                    preference_order = x.get("preference_order")
-                    # 優先使用 original_rank（廠商的排序），如果沒有則使用 slot_index
-                    rank_value = x.get("original_rank") if x.get("original_rank") is not None else x.get("slot_index")
-                    
-                    # 排序優先級：
-                    # 1. 重複中選的學生排在前面（False < True，所以 not is_duplicate 會讓重複中選的排在前面）
-                    # 2. 如果是重複中選，按志願序排序（志願序小的在前）
-                    # 3. 如果不是重複中選，或志願序相同，按 original_rank 或 slot_index 排序
-                    return (
-                        not is_duplicate,  # 重複中選的排在前面（False < True）
-                        preference_order is None if is_duplicate else False,  # 重複中選但沒有志願序的排在後面
-                        preference_order if (is_duplicate and preference_order is not None) else 999,  # 重複中選的按志願序排序
-                        rank_value is None,  # None 值排在後面
-                        rank_value or 999  # 按 original_rank 或 slot_index 排序
-                    )
-                
-                regulars = sorted(job_data["regulars"], key=sort_key_regulars)
-                
-                # 對備取名單排序：重複中選的學生優先按志願序排序，然後按 original_rank 或 slot_index 排序
-                def sort_key_reserves(x):
-                    student_id = x.get("student_id")
-                    is_duplicate = student_id in duplicate_students
-                    preference_order = x.get("preference_order")
-                    # 優先使用 original_rank（廠商的排序），如果沒有則使用 slot_index
-                    rank_value = x.get("original_rank") if x.get("original_rank") is not None else x.get("slot_index")
-                    
-                    return (
-                        not is_duplicate,  # 重複中選的排在前面
-                        preference_order is None if is_duplicate else False,  # 重複中選但沒有志願序的排在後面
-                        preference_order if (is_duplicate and preference_order is not None) else 999,  # 重複中選的按志願序排序
-                        rank_value is None,  # None 值排在後面
-                        rank_value or 999  # 按 original_rank 或 slot_index 排序
-                    )
-                
-                reserves = sorted(job_data["reserves"], key=sort_key_reserves)
-                jobs_list.append({
-                    "job_id": job_data["job_id"],
-                    "job_title": job_data["job_title"],
-                    "job_slots": job_data["job_slots"],
-                    "regulars": regulars,
-                    "reserves": reserves
-                })
-            companies_list.append({
-                "company_id": company_id,
-                "company_name": company_data["company_name"],
-                "jobs": jobs_list
-            })
-        
-        # 建立廠商原始排序的列表格式（不過濾重複學生）
-        companies_list_vendor = []
-        for company_id, company_data in companies_data_vendor.items():
-            jobs_list_vendor = []
-            for job_id, job_data in company_data["jobs"].items():
-                # 對正取名單排序（按 original_rank 或 slot_index）
-                regulars_vendor = sorted(job_data["regulars"], key=lambda x: (
-                    x.get("original_rank") is None,
-                    x.get("original_rank") or x.get("slot_index") or 999
-                ))
-                # 對備取名單排序
-                reserves_vendor = sorted(job_data["reserves"], key=lambda x: (
-                    x.get("original_rank") is None,
-                    x.get("original_rank") or x.get("slot_index") or 999
-                ))
-                jobs_list_vendor.append({
-                    "job_id": job_data["job_id"],
-                    "job_title": job_data["job_title"],
-                    "job_slots": job_data["job_slots"],
-                    "regulars": regulars_vendor,
-                    "reserves": reserves_vendor
-                })
-            companies_list_vendor.append({
-                "company_id": company_id,
-                "company_name": company_data["company_name"],
-                "jobs": jobs_list_vendor
-            })
-        
         return jsonify({
             "success": True,
-            "companies": companies_list,  # 主任排序結果（已過濾重複學生）
-            "vendor_companies": companies_list_vendor,  # 廠商原始排序（不過濾，保持原樣）
-            "duplicate_students": list(duplicate_students.keys()),
-            "total_matches": len(formatted_results),
+            "companies": view["companies"],  # 主任排序結果（已過濾重複學生）
+            "vendor_companies": view["vendor_companies"],  # 廠商原始排序（不過濾，保持原樣）
+            "duplicate_students": view["duplicate_students"],
+            "total_matches": view["total_matches"],
             "director_read_only": director_read_only,  # 實習學期（如 1132）時主任僅可檢視
             "already_confirmed": already_confirmed,    # 是否已產生最終媒合結果
         })
@@ -2903,381 +2121,39 @@ def director_matching_results():
         cursor.close()
         conn.close()
 
-# =========================================================
-# API: 查看主任確認後的媒合結果（供其他角色使用，如 TA、admin）
-# =========================================================
-@admission_bp.route("/api/final_matching_results", methods=["GET"])
-def final_matching_results():
-    """查看主任確認後的媒合結果（只顯示 Approved 狀態），允許 TA、admin、director 等角色訪問
-    使用與 director_matching_results 相同的邏輯，但只過濾出 director_decision = 'Approved' 的記錄"""
-    if 'user_id' not in session:
-        return jsonify({"success": False, "message": "未登入"}), 401
-    
-    user_role = session.get('role')
-    # 允許 director、ta、admin、class_teacher、teacher 訪問
-    if user_role not in ['director', 'ta', 'admin', 'class_teacher', 'teacher']:
-        return jsonify({"success": False, "message": "未授權"}), 403
-    
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    
-    try:
-        # 獲取當前學期ID和代碼
-        current_semester_id = get_current_semester_id(cursor)
-        current_semester_code = get_current_semester_code(cursor)
-        if not current_semester_id or not current_semester_code:
-            return jsonify({"success": False, "message": "無法取得當前學期"}), 500
-        
-        # 使用與 director_matching_results 相同的查詢邏輯
-        # 但只過濾出 director_decision = 'Approved' 的記錄
-        query = """
-            SELECT 
-                COALESCE(md.match_id, CONCAT('ra_', ra.id)) AS match_id,
-                COALESCE(md.vendor_id, sja.company_id) AS vendor_id,
-                COALESCE(md.student_id, sja.student_id) AS student_id,
-                COALESCE(sp.id, NULL) AS preference_id,
-                COALESCE(md.original_type, CASE WHEN ra.is_reserve = 0 THEN 'Regular' ELSE 'Backup' END) AS original_type,
-                COALESCE(md.original_rank, ra.slot_index) AS original_rank,
-                COALESCE(md.is_conflict, 0) AS is_conflict,
-                COALESCE(md.director_decision, 'Pending') AS director_decision,
-                md.final_rank,
-                COALESCE(md.is_adjusted, 0) AS is_adjusted,
-                COALESCE(md.updated_at, ra.updated_at, ra.created_at) AS updated_at,
-                COALESCE(sp.company_id, sja.company_id, md.vendor_id, ra.job_id) AS company_id,
-                (SELECT sp2.preference_order FROM student_preferences sp2
-                 WHERE sp2.student_id = sja.student_id AND sp2.company_id = sja.company_id AND sp2.job_id = sja.job_id
-                   AND sp2.status = 'approved'
-                 ORDER BY sp2.submitted_at DESC LIMIT 1) AS preference_order,
-                COALESCE(sp.job_id, sja.job_id, ra.job_id) AS job_id,
-                ic.company_name,
-                u.name AS student_name,
-                u.username AS student_number,
-                u.email AS student_email,
-                u.admission_year AS admission_year,
-                c.name AS class_name,
-                c.department AS class_department,
-                COALESCE(v.name, ic.company_name) AS vendor_name,
-                ij.title AS job_title,
-                ij.slots AS job_slots,
-                ra.is_reserve AS vendor_is_reserve,
-                ra.slot_index AS vendor_slot_index
-            FROM resume_applications ra
-            LEFT JOIN student_job_applications sja ON ra.application_id = sja.id
-            LEFT JOIN student_preferences sp ON (sja.student_id = sp.student_id 
-                AND sja.company_id = sp.company_id 
-                AND sja.job_id = sp.job_id
-                AND (sp.semester_id = %s OR sp.semester_id IS NULL))
-            RIGHT JOIN manage_director md ON ra.application_id = md.preference_id
-            LEFT JOIN internship_companies ic ON COALESCE(sp.company_id, sja.company_id, md.vendor_id) = ic.id
-            LEFT JOIN internship_jobs ij ON COALESCE(sp.job_id, sja.job_id, ra.job_id) = ij.id
-            LEFT JOIN users u ON COALESCE(md.student_id, sja.student_id) = u.id
-            LEFT JOIN classes c ON u.class_id = c.id
-            LEFT JOIN users v ON md.vendor_id = v.id
-            WHERE (
-                -- 1) 有廠商排序且通過審核的紀錄（原本條件）
-                (ra.apply_status = 'approved'
-                 AND (
-                    (ra.is_reserve = 0 AND ra.slot_index IS NOT NULL)
-                    OR (ra.is_reserve = 1)
-                 )
-                )
-                -- 2) 任何存在於 manage_director 的紀錄（主任已確認），即使廠商尚未審核也要顯示
-                OR md.match_id IS NOT NULL
-            )
-            AND (md.director_decision = 'Approved')  -- 只顯示主任已確認的記錄
-            AND (ic.status = 'approved' OR ic.status IS NULL)  -- 公司狀態必須是已審核
-            AND (ra.id IS NULL OR ra.apply_status != 'rejected')  -- 廠商已設為未錄取者不顯示
-            ORDER BY 
-                COALESCE(sp.company_id, sja.company_id, md.vendor_id), 
-                COALESCE(sp.job_id, sja.job_id, ra.job_id), 
-                CASE WHEN md.final_rank IS NOT NULL THEN 0 ELSE 1 END,
-                COALESCE(md.final_rank, md.original_rank, ra.slot_index, 999) ASC,
-                COALESCE(md.original_rank, ra.slot_index, 999) ASC
-        """
-        cursor.execute(query, (current_semester_id,))
-        all_results = cursor.fetchall() or []
-        
-        # 獲取當前學年用於計算年級
-        active_semester_year = _get_active_semester_year(cursor)
-        
-        # 格式化結果並組織資料結構（與 director_matching_results 相同）
-        formatted_results = []
-        student_company_map = {}  # 用於檢測重複中選：{student_id: [company_ids]}
-        
-        # 使用字典去重：同一學生在同一公司/職缺只保留一條記錄
-        seen_students = {}
-        
-        for result in all_results:
-            student_id = result.get("student_id")
-            company_id = result.get("company_id")
-            job_id = result.get("job_id")
-            
-            # 檢查是否已存在（同一學生在同一公司/職缺）
-            key = (student_id, company_id, job_id)
-            if key in seen_students:
-                # 如果已存在，優先保留有 manage_director 記錄的（match_id 不以 'ra_' 開頭）
-                existing_match_id = seen_students[key].get("match_id", "")
-                current_match_id = result.get("match_id", "")
-                if isinstance(existing_match_id, str) and existing_match_id.startswith("ra_") and not (isinstance(current_match_id, str) and current_match_id.startswith("ra_")):
-                    # 當前記錄有 manage_director，替換舊記錄
-                    seen_students[key] = result
-                # 否則保留已存在的記錄（跳過當前重複記錄）
-                continue
-            
-            # 記錄已看到的學生
-            seen_students[key] = result
-        
-        # 處理去重後的記錄，並檢測重複中選
-        for key, result in seen_students.items():
-            student_id, company_id, job_id = key
-            
-            # 記錄每個學生被哪些公司選中（用於檢測重複中選）
-            if student_id not in student_company_map:
-                student_company_map[student_id] = []
-            if company_id not in student_company_map[student_id]:
-                student_company_map[student_id].append(company_id)
-        
-        # 標記重複中選的學生
-        duplicate_students = {}
-        for sid, companies in student_company_map.items():
-            if len(companies) > 1:
-                duplicate_students[sid] = companies
-        
-        # 對於重複中選的學生，選擇志願序最高的記錄
-        student_best_match_id = {}  # key: student_id, value: (match_id, preference_order, has_sorting)
-        
-        for key, result in seen_students.items():
-            student_id, company_id, job_id = key
-            
-            if student_id in duplicate_students:
-                # 這是重複中選的學生，需要選擇最合適的記錄
-                preference_order = result.get("preference_order")
-                if preference_order is None:
-                    preference_order = 999  # 沒有志願序的排在最後
-                
-                # 判斷是否有媒合排序結果（廠商已排序）
-                vendor_slot_index = result.get("vendor_slot_index")
-                original_rank = result.get("original_rank")
-                has_sorting = (vendor_slot_index is not None) or (original_rank is not None)
-                
-                match_id = result.get("match_id") or result.get("id")
-                match_id_str = str(match_id) if match_id is not None else None
-                
-                if student_id not in student_best_match_id:
-                    student_best_match_id[student_id] = (match_id_str, preference_order, has_sorting)
-                else:
-                    # 優先考慮志願序（志願序越小，優先級越高）
-                    current_has_sorting = student_best_match_id[student_id][2]
-                    current_order = student_best_match_id[student_id][1]
-                    
-                    # 如果當前記錄的志願序更小（優先級更高），則替換
-                    if preference_order < current_order:
-                        student_best_match_id[student_id] = (match_id_str, preference_order, has_sorting)
-                    # 如果志願序相同，則優先選擇有媒合排序的記錄
-                    elif preference_order == current_order:
-                        if has_sorting and not current_has_sorting:
-                            student_best_match_id[student_id] = (match_id_str, preference_order, has_sorting)
-        
-        # 過濾 formatted_results：重複中選的學生只保留志願序最高的記錄
-        filtered_seen_students = {}
-        for key, result in seen_students.items():
-            student_id, company_id, job_id = key
-            
-            if student_id in duplicate_students:
-                # 只保留志願序最高的記錄
-                match_id = result.get("match_id") or result.get("id")
-                match_id_str = str(match_id) if match_id is not None else None
-                if student_id in student_best_match_id and student_best_match_id[student_id][0] == match_id_str:
-                    filtered_seen_students[key] = result
-            else:
-                # 不是重複中選的學生，直接保留
-                filtered_seen_students[key] = result
-        
-        # 處理過濾後的記錄
-        for key, result in filtered_seen_students.items():
-            student_id, company_id, job_id = key
-            
-            # 判斷是否為正取或備取（使用與 director_matching_results 相同的邏輯）
-            # 優先使用廠商的媒合排序資料（resume_applications 表的 is_reserve 和 slot_index）
-            # 如果沒有廠商排序資料，則根據 director_decision 和 original_type 判斷
-            is_reserve = False
-            slot_index = None
-            
-            # 優先使用廠商的媒合排序資料
-            vendor_is_reserve = result.get("vendor_is_reserve")
-            vendor_slot_index = result.get("vendor_slot_index")
-            original_rank = result.get("original_rank")
-            original_type = result.get("original_type")
-            
-            # 如果 resume_applications 表中有記錄（vendor_is_reserve 或 vendor_slot_index 不是 NULL），表示廠商已經排序
-            if vendor_is_reserve is not None or vendor_slot_index is not None:
-                # 有廠商的媒合排序資料，優先使用
-                # is_reserve: 0=正取, 1=備取
-                is_reserve = bool(vendor_is_reserve) if vendor_is_reserve is not None else False
-                # 優先使用 final_rank（主任調整後的排序），如果沒有則使用 original_rank，最後使用 vendor_slot_index
-                if result.get("final_rank") is not None:
-                    slot_index = result.get("final_rank")
-                else:
-                    slot_index = original_rank if original_rank is not None else (vendor_slot_index if vendor_slot_index is not None else None)
-            elif result.get("director_decision") == "Approved" and result.get("final_rank") is not None:
-                # 主任已核定為正取
-                is_reserve = False
-                slot_index = result.get("final_rank")
-            elif result.get("director_decision") == "Approved":
-                # 主任已確認，根據原始設定判斷
-                if original_type == "Regular" and original_rank is not None:
-                    is_reserve = False
-                    slot_index = original_rank
-                else:
-                    is_reserve = True
-                    slot_index = None
-            else:
-                is_reserve = True
-                slot_index = None
-            
-            # 計算年級
-            grade_display = ''
-            admission_year = result.get("admission_year")
-            class_name = result.get("class_name") or ''
-            
-            # 如果沒有 admission_year，嘗試從學號前3碼獲取
-            if admission_year is None or str(admission_year).strip() == '':
-                student_number = result.get("student_number")
-                if student_number and len(str(student_number)) >= 3:
-                    try:
-                        admission_year = int(str(student_number)[:3])
-                    except (TypeError, ValueError):
-                        pass
-            
-            # 計算年級
-            if active_semester_year is not None and admission_year is not None:
-                try:
-                    grade_num = active_semester_year - int(admission_year) + 1
-                    grade_labels = ('一', '二', '三', '四', '五', '六')
-                    if 1 <= grade_num <= 6:
-                        grade_char = grade_labels[grade_num - 1]
-                        # 從 class_name 中提取班級名稱（例如「孝」）
-                        class_char = ''
-                        if class_name:
-                            # 提取最後一個字作為班級名稱
-                            class_char = class_name[-1] if len(class_name) > 0 else ''
-                        grade_display = f"{grade_char}{class_char}" if class_char else f"{grade_char}年級"
-                    elif grade_num > 0:
-                        grade_display = f"{grade_num}年級"
-                except (TypeError, ValueError):
-                    pass
-            
-            formatted_result = {
-                "id": result.get("match_id"),
-                "match_id": result.get("match_id"),
-                "student_id": student_id,
-                "student_name": result.get("student_name"),
-                "student_number": result.get("student_number"),
-                "class_name": result.get("class_name"),
-                "grade_display": grade_display,
-                "company_id": company_id,
-                "company_name": result.get("company_name"),
-                "job_id": result.get("job_id"),
-                "job_title": result.get("job_title") or "未指定職缺",
-                "job_slots": result.get("job_slots") or 1,
-                "preference_order": result.get("preference_order"),
-                "slot_index": slot_index,
-                "is_reserve": is_reserve,
-                # 添加主任媒合結果的原始信息，用於顯示「原正取2」等標籤
-                "original_rank": original_rank,
-                "original_type": original_type,
-                "final_rank": result.get("final_rank"),
-                "is_adjusted": bool(result.get("is_adjusted", False))
-            }
-            formatted_results.append(formatted_result)
-        
-        # 先獲取所有已審核的公司（即使沒有媒合結果也要顯示）
-        cursor.execute("""
-            SELECT DISTINCT ic.id AS company_id, ic.company_name
-            FROM internship_companies ic
-            WHERE ic.status = 'approved'
-            ORDER BY ic.company_name
-        """)
-        all_companies = cursor.fetchall() or []
-        
-        # 獲取所有已審核公司的職缺
-        cursor.execute("""
-            SELECT ij.id AS job_id, ij.company_id, ij.title AS job_title, ij.slots AS job_slots
-            FROM internship_jobs ij
-            JOIN internship_companies ic ON ij.company_id = ic.id
-            WHERE ic.status = 'approved' AND ij.is_active = 1
-            ORDER BY ij.company_id, ij.id
-        """)
-        all_jobs = cursor.fetchall() or []
-        
-        # 按公司和職缺組織資料
-        companies_data = {}
-        
-        # 先初始化所有已審核的公司
-        for company in all_companies:
-            company_id = company["company_id"]
-            company_name = company["company_name"]
-            companies_data[company_id] = {
-                "company_id": company_id,
-                "company_name": company_name,
-                "jobs": {}
-            }
-            
-        # 為每個公司添加職缺（即使沒有媒合結果）
-        for job in all_jobs:
-            company_id = job["company_id"]
-            job_id = job["job_id"]
-            job_title = job["job_title"]
-            job_slots = job["job_slots"] or 1
-            
-            if company_id in companies_data:
-                if job_id not in companies_data[company_id]["jobs"]:
-                    companies_data[company_id]["jobs"][job_id] = {
-                        "job_id": job_id,
-                        "job_title": job_title,
-                        "job_slots": job_slots,
-                        "regulars": [],
-                        "reserves": []
-                    }
-        
-        # 添加媒合結果到對應的公司和職缺
-        for result in formatted_results:
-            company_id = result.get("company_id")
-            company_name = result.get("company_name")
-            job_id = result.get("job_id")
-            job_title = result.get("job_title") or "未指定職缺"
-            
-            if company_id and company_id in companies_data:
-                # 如果職缺不存在，創建一個
-                if job_id not in companies_data[company_id]["jobs"]:
-                    companies_data[company_id]["jobs"][job_id] = {
-                        "job_id": job_id,
-                        "job_title": job_title,
-                        "job_slots": result.get("job_slots", 1),
-                        "regulars": [],
-                        "reserves": []
-                    }
-                
-                # 根據 is_reserve 分類
-                if result.get("is_reserve"):
-                    companies_data[company_id]["jobs"][job_id]["reserves"].append(result)
-                else:
-                    companies_data[company_id]["jobs"][job_id]["regulars"].append(result)
-        
-        # 轉換為列表格式
-        companies_list = []
-        for company_id, company_data in companies_data.items():
-            jobs_list = list(company_data["jobs"].values())
-            companies_list.append({
-                "company_id": company_id,
-                "company_name": company_data["company_name"],
-                "jobs": jobs_list
-            })
+# =========================================================
+# API: 查看主任確認後的媒合結果（供其他角色使用，如 TA、admin）
+# =========================================================
+@admission_bp.route("/api/final_matching_results", methods=["GET"])
+def final_matching_results():
+    """查看主任確認後的媒合結果（只顯示 Approved 狀態），允許 TA、admin、director 等角色訪問
+    使用與 director_matching_results 相同的邏輯，但只過濾出 director_decision = 'Approved' 的記錄"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "未登入"}), 401
+    
+    user_role = session.get('role')
+    # 允許 director、ta、admin、class_teacher、teacher 訪問
+    if user_role not in ['director', 'ta', 'admin', 'class_teacher', 'teacher']:
+        return jsonify({"success": False, "message": "未授權"}), 403
+    
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    
+    try:
+        # 獲取當前學期ID和代碼
+        current_semester_id = get_current_semester_id(cursor)
+        current_semester_code = get_current_semester_code(cursor)
+        if not current_semester_id or not current_semester_code:
+            return jsonify({"success": False, "message": "無法取得當前學期"}), 500
         
+        # 只取主任已確認（Approved）的記錄，邏輯與 director_matching_results 相同
+        snapshot = MatchingSnapshot.load(cursor, current_semester_id)
+        view = snapshot.final_view(_get_active_semester_year(cursor))
+
         return jsonify({
             "success": True,
-            "companies": companies_list,
-            "total_matches": len(formatted_results)
+            "companies": view["companies"],
+            "total_matches": view["total_matches"]
         })
     
     except Exception as e:
@@ -3519,15 +2395,7 @@ def director_add_student():
         # 檢查 students 表是否存在，如果存在則確保有對應記錄
         try:
             # 先檢查 students 表是否存在
-            cursor.execute("""
-                SELECT TABLE_NAME 
-                FROM information_schema.TABLES 
-                WHERE TABLE_SCHEMA = DATABASE() 
-                AND TABLE_NAME = 'students'
-            """)
-            students_table_exists = cursor.fetchone()
-            # 確保所有結果都被讀取
-            cursor.fetchall()
+            students_table_exists = has_table('students')
             
             if students_table_exists:
                 # 檢查 students 表中是否有該學生記錄
@@ -3540,15 +2408,7 @@ def director_add_student():
                 
                 if not student_in_students:
                     # 獲取 students 表的欄位結構
-                    cursor.execute("""
-                        SELECT COLUMN_NAME, DATA_TYPE 
-                        FROM information_schema.COLUMNS 
-                        WHERE TABLE_SCHEMA = DATABASE() 
-                        AND TABLE_NAME = 'students'
-                        ORDER BY ORDINAL_POSITION
-                    """)
-                    columns = cursor.fetchall()
-                    column_names = [col['COLUMN_NAME'] for col in columns] if columns else []
+                    column_names = get_columns('students')
                     
                     # 根據實際欄位構建 INSERT 語句
                     if 'id' in column_names:
@@ -3822,15 +2682,7 @@ def director_add_student():
         else:
             print(f"➕ 創建新記錄")
             # 檢查 project_id 欄位是否存在，如果存在則包含在 INSERT 中
-            cursor.execute("""
-                SELECT COLUMN_NAME 
-                FROM information_schema.COLUMNS 
-                WHERE TABLE_SCHEMA = DATABASE() 
-                AND TABLE_NAME = 'manage_director'
-                AND COLUMN_NAME = 'project_id'
-            """)
-            has_project_id = cursor.fetchone() is not None
-            cursor.fetchall()  # 確保所有結果都被讀取
+            has_project_id = has_column('manage_director', 'project_id')
             
             if has_project_id:
                 cursor.execute("""
@@ -3892,6 +2744,30 @@ def director_add_student():
 # =========================================================
 # API: 主任調整學生位置
 # =========================================================
+def _update_history_position(cursor, history_id, slot_index, is_reserve):
+    """更新 vendor_preference_history 記錄的位置；沒有 slot_index / is_reserve 欄位時改寫在 comment"""
+    existing_columns = set(get_columns('vendor_preference_history'))
+    
+    if 'slot_index' in existing_columns and 'is_reserve' in existing_columns:
+        # 更新位置
+        cursor.execute("""
+            UPDATE vendor_preference_history
+            SET slot_index = %s, is_reserve = %s
+            WHERE id = %s
+        """, (slot_index, is_reserve, history_id))
+    else:
+        # 如果欄位不存在，更新 comment
+        if is_reserve:
+            comment = "媒合排序：候補"
+        else:
+            comment = f"媒合排序：正取{slot_index}"
+        cursor.execute("""
+            UPDATE vendor_preference_history
+            SET comment = %s
+            WHERE id = %s
+        """, (comment, history_id))
+
+
 @admission_bp.route("/api/director_update_position", methods=["POST"])
 def director_update_position():
     """主任調整學生在媒合結果中的位置"""
@@ -3912,36 +2788,7 @@ def director_update_position():
     try:
         from vendor import _ensure_history_table
         _ensure_history_table(cursor)
-        
-        # 檢查欄位是否存在
-        cursor.execute("""
-            SELECT COLUMN_NAME 
-            FROM information_schema.COLUMNS 
-            WHERE TABLE_SCHEMA = DATABASE() 
-            AND TABLE_NAME = 'vendor_preference_history'
-            AND COLUMN_NAME IN ('slot_index', 'is_reserve')
-        """)
-        existing_columns = {row['COLUMN_NAME'] for row in cursor.fetchall()}
-        
-        if 'slot_index' in existing_columns and 'is_reserve' in existing_columns:
-            # 更新位置
-            cursor.execute("""
-                UPDATE vendor_preference_history
-                SET slot_index = %s, is_reserve = %s
-                WHERE id = %s
-            """, (slot_index, is_reserve, history_id))
-        else:
-            # 如果欄位不存在，更新 comment
-            if is_reserve:
-                comment = "媒合排序：候補"
-            else:
-                comment = f"媒合排序：正取{slot_index}"
-            cursor.execute("""
-                UPDATE vendor_preference_history
-                SET comment = %s
-                WHERE id = %s
-            """, (comment, history_id))
-        
+        _update_history_position(cursor, history_id, slot_index, is_reserve)
         conn.commit()
         
         return jsonify({
@@ -4101,6 +2948,195 @@ def director_swap_positions():
         cursor.close()
         conn.close()
 
+# =========================================================
+# API: 主任批次調整媒合結果（單一交易）
+# =========================================================
+def _plan_director_operations(snapshot, operations):
+    """
+    依序在快照上驗證並套用主任的調整，回傳 (manage_director 最終狀態, resume_applications 名次,
+    vendor_preference_history 位置)。任一步驟不合法即拋出 ValueError，整批都不寫入。
+    支援：remove / promote / swap / add（重新加入已有媒合記錄的學生）
+         / move（與 director_update_position 相同：以 history_id 更新 vendor_preference_history 的
+           正取位置 slot_index 或候補 is_reserve，不改 manage_director）
+    """
+    records = {str(md['match_id']): dict(md) for md in snapshot.md_rows}
+    touched = {}       # match_id -> 調整後的 manage_director 記錄
+    ra_slots = {}      # preference_id -> resume_applications.slot_index
+    history_moves = {}  # vendor_preference_history.id -> (slot_index, is_reserve)
+
+    def lookup(match_id, index):
+        record = touched.get(str(match_id)) or records.get(str(match_id))
+        if match_id is None or record is None:
+            raise ValueError(f"第 {index + 1} 個操作：找不到記錄 {match_id}")
+        return record
+
+    def rank_of(record):
+        return record['final_rank'] if record['final_rank'] is not None else record['original_rank']
+
+    for index, op in enumerate(operations):
+        if not isinstance(op, dict):
+            raise ValueError(f"第 {index + 1} 個操作格式錯誤")
+        op_type = op.get("op")
+        if op_type == "remove":
+            record = lookup(op.get("match_id") or op.get("history_id"), index)
+            record.update(director_decision='Rejected', final_rank=None, is_adjusted=1)
+        elif op_type == "promote":
+            record = lookup(op.get("match_id") or op.get("history_id"), index)
+            if op.get("slot_index") is None:
+                raise ValueError(f"第 {index + 1} 個操作：請提供正取位置")
+            slot_index = int(op["slot_index"])
+            is_adjusted = not (record['original_type'] == 'Regular' and record['original_rank'] == slot_index)
+            record.update(director_decision='Approved', final_rank=slot_index, is_adjusted=int(is_adjusted))
+        elif op_type == "swap":
+            first = lookup(op.get("match_id1"), index)
+            second = lookup(op.get("match_id2"), index)
+            rank1, rank2 = rank_of(first), rank_of(second)
+            if rank1 is None or rank2 is None:
+                raise ValueError(f"第 {index + 1} 個操作：學生必須有正取位置才能調整順序")
+            for swapped, new_rank in ((first, rank2), (second, rank1)):
+                swapped.update(final_rank=new_rank, original_rank=new_rank, is_adjusted=1)
+                if swapped['preference_id']:
+                    ra_slots[swapped['preference_id']] = new_rank
+            touched[str(first['match_id'])] = first
+            record = second
+        elif op_type == "move":
+            history_id = op.get("history_id")
+            if not history_id:
+                raise ValueError(f"第 {index + 1} 個操作：請提供記錄ID")
+            history_moves[str(history_id)] = (op.get("slot_index"), bool(op.get("is_reserve", False)))
+            continue
+        elif op_type == "add":
+            student_id, company_id, job_id = op.get("student_id"), op.get("company_id"), op.get("job_id")
+            record = None
+            for candidate in list(touched.values()) + list(records.values()):
+                sja = snapshot.sja_by_id.get(candidate['preference_id'])
+                if sja and str(candidate['student_id']) == str(student_id) and \
+                   str(sja['company_id']) == str(company_id) and str(sja['job_id']) == str(job_id):
+                    record = touched.get(str(candidate['match_id']), candidate)
+                    break
+            if record is None:
+                raise ValueError(f"第 {index + 1} 個操作：學生尚無此職缺的媒合記錄，請使用「添加學生」功能")
+            if op.get("type", "regular") == "reserve":
+                record.update(director_decision='Pending', final_rank=None, is_adjusted=1)
+            else:
+                slot_index = op.get("slot_index")
+                record.update(director_decision='Approved',
+                              final_rank=int(slot_index) if slot_index is not None else None, is_adjusted=1)
+        else:
+            raise ValueError(f"第 {index + 1} 個操作：不支援的類型 {op_type}")
+        touched[str(record['match_id'])] = record
+
+    return list(touched.values()), ra_slots, history_moves
+
+
+def _write_director_operations(cursor, md_updates, ra_slots, history_moves):
+    """
+    以一條 UPDATE ... JOIN 寫入所有 manage_director 變更，再以一條寫入 resume_applications 名次；
+    move 的 vendor_preference_history 位置逐筆寫入（與 director_update_position 相同）
+    """
+    if md_updates:
+        derived = " UNION ALL ".join(
+            ["SELECT %s AS match_id, %s AS director_decision, %s AS final_rank, %s AS original_rank, %s AS is_adjusted"]
+            * len(md_updates)
+        )
+        params = []
+        for record in md_updates:
+            params.extend([record['match_id'], record['director_decision'], record['final_rank'],
+                           record['original_rank'], record['is_adjusted']])
+        cursor.execute(f"""
+            UPDATE manage_director md
+            JOIN ({derived}) t ON md.match_id = t.match_id
+            SET md.director_decision = t.director_decision,
+                md.final_rank = t.final_rank,
+                md.original_rank = t.original_rank,
+                md.is_adjusted = t.is_adjusted,
+                md.updated_at = CURRENT_TIMESTAMP
+        """, params)
+    if ra_slots:
+        derived = " UNION ALL ".join(["SELECT %s AS application_id, %s AS slot_index"] * len(ra_slots))
+        params = [value for item in ra_slots.items() for value in item]
+        cursor.execute(f"""
+            UPDATE resume_applications ra
+            JOIN ({derived}) t ON ra.application_id = t.application_id
+            SET ra.slot_index = t.slot_index,
+                ra.updated_at = CURRENT_TIMESTAMP
+        """, params)
+    if history_moves:
+        for history_id, (slot_index, is_reserve) in history_moves.items():
+            _update_history_position(cursor, history_id, slot_index, is_reserve)
+
+
+def _apply_to_snapshot(snapshot, md_updates, ra_slots):
+    """把已寫入的調整套用到快照，回傳結果時不必重新載入"""
+    updates = {str(record['match_id']): record for record in md_updates}
+    for md in snapshot.md_rows:
+        record = updates.get(str(md['match_id']))
+        if record:
+            for key in ('director_decision', 'final_rank', 'original_rank', 'is_adjusted'):
+                md[key] = record[key]
+    for application_id, slot_index in ra_slots.items():
+        for ra in snapshot.ra_by_application.get(application_id) or []:
+            ra['slot_index'] = slot_index
+
+
+@admission_bp.route("/api/director_apply_operations", methods=["POST"])
+def director_apply_operations():
+    """
+    主任一次送出多個調整（拖拉排序等），依序驗證後在單一交易內寫入，並回傳調整後的媒合結果。
+    operations: [{"op": "remove" | "promote" | "swap" | "move" | "add", ...}]
+      remove / promote（match_id, slot_index）、swap（match_id1, match_id2）、
+      add（student_id, company_id, job_id, type, slot_index）調整 manage_director；
+      move（history_id, slot_index, is_reserve）與 /api/director_update_position 相同，
+      只更新 vendor_preference_history 的位置
+    媒合快照只載入一次：驗證、處理重複學生與回傳的結果都使用同一份快照
+    """
+    if 'user_id' not in session or session.get('role') != 'director':
+        return jsonify({"success": False, "message": "未授權"}), 403
+
+    data = request.get_json(silent=True) or {}
+    operations = data.get("operations")
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"success": False, "message": "請提供調整操作"}), 400
+
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        current_semester_id = get_flow_semester_id(cursor)
+        if not current_semester_id:
+            return jsonify({"success": False, "message": "無法取得當前學期"}), 500
+
+        snapshot = MatchingSnapshot.load(cursor, current_semester_id)
+        try:
+            md_updates, ra_slots, history_moves = _plan_director_operations(snapshot, operations)
+        except (ValueError, TypeError) as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+        if history_moves and not has_table('vendor_preference_history'):
+            return jsonify({"success": False, "message": "找不到媒合排序記錄表，無法調整位置（move）"}), 400
+
+        _write_director_operations(cursor, md_updates, ra_slots, history_moves)
+        _apply_to_snapshot(snapshot, md_updates, ra_slots)
+        # 與單筆「添加學生」相同：自動處理重複學生（同時更新快照）
+        snapshot.resolve_duplicate_students(cursor)
+        conn.commit()
+
+        view = snapshot.director_view()
+        return jsonify({
+            "success": True,
+            "message": f"已套用 {len(operations)} 個調整",
+            "updated_count": len(md_updates),
+            **view
+        })
+
+    except Exception as e:
+        traceback.print_exc()
+        if conn:
+            conn.rollback()
+        return jsonify({"success": False, "message": f"調整失敗: {str(e)}"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
 # =========================================================
 # API: 手動處理重複學生（管理員/主任可用）
 # =========================================================
@@ -4139,6 +3175,48 @@ def resolve_duplicate_students():
         cursor.close()
         conn.close()
 
+# =========================================================
+# API: 主任自動媒合建議（穩定媒合，僅試算不寫入）
+# =========================================================
+@admission_bp.route("/api/director_matching_proposal", methods=["GET", "POST"])
+def director_matching_proposal():
+    """
+    依學生志願序與廠商排序（正取/備取、名次）及職缺名額，以延遲接受演算法產生媒合建議。
+    POST 可帶 moves（假設調整：swap / promote / remove / slots）試算 what-if 結果；
+    兩者都不寫入 manage_director，主任確認後仍以 director_confirm_matching 送出。
+    """
+    if 'user_id' not in session or session.get('role') != 'director':
+        return jsonify({"success": False, "message": "未授權"}), 403
+
+    data = request.get_json(silent=True) or {}
+    moves = data.get("moves") or []
+    department = data.get("department") or request.args.get("department") or None
+    if not isinstance(moves, list):
+        return jsonify({"success": False, "message": "moves 格式錯誤"}), 400
+
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        current_semester_id = get_flow_semester_id(cursor)
+        if not current_semester_id:
+            return jsonify({"success": False, "message": "無法取得當前學期"}), 500
+
+        snapshot = MatchingSnapshot.load(cursor, current_semester_id)
+        try:
+            proposal = propose_matching(snapshot, moves=moves, department=department)
+        except (ValueError, TypeError) as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        return jsonify({"success": True, **proposal})
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"試算失敗: {str(e)}"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
 # =========================================================
 # API: 主任確認媒合結果
 # =========================================================
@@ -4169,15 +3247,7 @@ def director_confirm_matching():
         # 0. 檢查本學期是否已經產生最終媒合結果（寫入 matching_results）
         #    若已產生，則不允許主任重複送出，避免科助端結果被覆蓋
         try:
-            cursor.execute("""
-                SELECT COLUMN_NAME
-                FROM information_schema.COLUMNS
-                WHERE TABLE_SCHEMA = DATABASE()
-                  AND TABLE_NAME = 'matching_results'
-                  AND COLUMN_NAME = 'semester_id'
-            """)
-            has_mr_semester_id = cursor.fetchone() is not None
-            cursor.fetchall()
+            has_mr_semester_id = has_column('matching_results', 'semester_id')
             
             if has_mr_semester_id:
                 cursor.execute(
@@ -4219,15 +3289,7 @@ def director_confirm_matching():
         # 0.1. 為來自 resume_applications 但還沒有 manage_director 記錄的學生創建記錄
         # 這些學生是廠商已排序但主任還沒有處理的
         # 先檢查 semester_id 欄位是否存在
-        cursor.execute("""
-            SELECT COLUMN_NAME
-            FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA = DATABASE()
-            AND TABLE_NAME = 'manage_director'
-            AND COLUMN_NAME = 'semester_id'
-        """)
-        has_semester_id = cursor.fetchone() is not None
-        cursor.fetchall()
+        has_semester_id = has_column('manage_director', 'semester_id')
         
         if has_semester_id:
             # 有 semester_id 欄位
@@ -4308,20 +3370,13 @@ def director_confirm_matching():
         _resolve_duplicate_students(cursor, flow_semester_id)
         
         # 主任確認：只通知科助（指導老師、班導、學生、廠商由科助確認時一併通知）
-        cursor.execute("SELECT id, name FROM users WHERE role = 'ta'")
-        tas = cursor.fetchall() or []
-        
-        for ta in tas:
-            title = f"{semester_prefix} 媒合結果待發布"
-            message = f"{semester_prefix}媒合結果已由主任確認，請進行最後發布。"
-            link_url = "/final_results"
-            create_notification(
-                user_id=ta['id'],
-                title=title,
-                message=message,
-                category="approval",
-                link_url=link_url
-            )
+        tas_notified = notify_users(
+            title=f"{semester_prefix} 媒合結果待發布",
+            message=f"{semester_prefix}媒合結果已由主任確認，請進行最後發布。",
+            roles=['ta'],
+            category="approval",
+            link_url="/final_results"
+        )
         
         # 2. 將已確認的媒合結果寫入 matching_results 表（與主任排序畫面一致：含 sp.semester_id 為 NULL 的志願，確保尤思婷等會寫入）
         #    只寫入「仍為錄取」的學生：排除被廠商設為未錄取(rejected)者
@@ -4350,12 +3405,7 @@ def director_confirm_matching():
         
         # 2.1 從 matching_results 移除該學期「未錄取」的學生（廠商已 reject），修正既有錯誤資料（如 user_id 3）
         try:
-            cursor.execute("""
-                SELECT COLUMN_NAME FROM information_schema.COLUMNS
-                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'matching_results' AND COLUMN_NAME = 'semester_id'
-            """)
-            if cursor.fetchone() is not None:
-                cursor.fetchall()
+            if has_column('matching_results', 'semester_id'):
                 cursor.execute("""
                     DELETE mr FROM matching_results mr
                     WHERE mr.semester_id = %s
@@ -4376,14 +3426,7 @@ def director_confirm_matching():
             print(f"⚠️ 清理 matching_results 未錄取學生時發生錯誤：{cleanup_err}")
         
         # 檢查 matching_results 表是否具有各欄位（舊資料庫可能缺少 semester_id / job_id 等）
-        cursor.execute("""
-            SELECT COLUMN_NAME
-            FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA = DATABASE()
-              AND TABLE_NAME = 'matching_results'
-        """)
-        mr_cols_rows = cursor.fetchall() or []
-        mr_cols = {row["COLUMN_NAME"] for row in mr_cols_rows}
+        mr_cols = set(get_columns('matching_results'))
         mr_has_semester_id = "semester_id" in mr_cols
         mr_has_company_id = "company_id" in mr_cols
         mr_has_mentor_id = "mentor_id" in mr_cols
@@ -4522,7 +3565,7 @@ def director_confirm_matching():
             "success": True,
             "message": "確認成功",
             "approved_count": approved_count,
-            "notified": {"tas": len(tas)}
+            "notified": {"tas": tas_notified["inserted"]}
         })
     
     except Exception as e:
@@ -4603,14 +3646,7 @@ def ta_confirm_matching():
         message = f"{semester_prefix}媒合結果已由科助確認並發布，請前往查看。"
         link_url = "/admission/results"
         
-        for user_id in notified_user_ids:
-            create_notification(
-                user_id=user_id,
-                title=title,
-                message=message,
-                category="matching",
-                link_url=link_url
-            )
+        notify_users(title, message, user_ids=notified_user_ids, category="matching", link_url=link_url)
         
         # 2. 通知所有在媒合結果中的學生（Approved 狀態）
         # md.preference_id 引用的是 student_job_applications.id（即 resume_applications.application_id）
@@ -4631,47 +3667,29 @@ def ta_confirm_matching():
         student_message = f"{semester_prefix}媒合結果已發布，請前往查看您的媒合結果。"
         student_link_url = "/student_home"
         
-        for student in matched_students:
-            student_id = student.get('student_id')
-            if student_id:
-                create_notification(
-                    user_id=student_id,
-                    title=student_title,
-                    message=student_message,
-                    category="matching",
-                    link_url=student_link_url
-                )
+        notify_users(
+            student_title, student_message,
+            user_ids=[student.get('student_id') for student in matched_students],
+            category="matching", link_url=student_link_url
+        )
         
         # 3. 通知所有廠商（role='vendor'）媒合結果已發布
-        cursor.execute("SELECT id, name FROM users WHERE role = 'vendor'")
-        vendors = cursor.fetchall() or []
-        
-        for vendor in vendors:
-            title = f"{semester_prefix} 媒合結果已發布"
-            message = f"{semester_prefix}媒合結果已由科助公告，請點選「媒合結果」頁面查看最終媒合結果。"
-            link_url = "/confirm_matching"
-            create_notification(
-                user_id=vendor['id'],
-                title=title,
-                message=message,
-                category="matching",
-                link_url=link_url
-            )
+        vendors_notified = notify_users(
+            title=f"{semester_prefix} 媒合結果已發布",
+            message=f"{semester_prefix}媒合結果已由科助公告，請點選「媒合結果」頁面查看最終媒合結果。",
+            roles=['vendor'],
+            category="matching",
+            link_url="/confirm_matching"
+        )
         
         # 4. 通知管理員與主任（科助確認時通知所有使用者）
-        cursor.execute("SELECT id FROM users WHERE role IN ('admin', 'director')")
-        admins_directors = cursor.fetchall() or []
-        admin_title = f"{semester_prefix} 媒合結果已發布"
-        admin_message = f"{semester_prefix}媒合結果已由科助確認並發布，請前往查看。"
-        admin_link_url = "/admission/results"
-        for u in admins_directors:
-            create_notification(
-                user_id=u['id'],
-                title=admin_title,
-                message=admin_message,
-                category="matching",
-                link_url=admin_link_url
-            )
+        admins_directors_notified = notify_users(
+            title=f"{semester_prefix} 媒合結果已發布",
+            message=f"{semester_prefix}媒合結果已由科助確認並發布，請前往查看。",
+            roles=['admin', 'director'],
+            category="matching",
+            link_url="/admission/results"
+        )
         
         # 5. 將已確認的媒合結果寫入 matching_results 表
         cursor.execute("""
@@ -4695,11 +3713,7 @@ def ta_confirm_matching():
         match_results = cursor.fetchall() or []
         
         # 檢查 matching_results 表實際有哪些欄位（相容各種表結構）
-        cursor.execute("""
-            SELECT COLUMN_NAME FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'matching_results'
-        """)
-        mr_columns = {row['COLUMN_NAME'] for row in cursor.fetchall()}
+        mr_columns = set(get_columns('matching_results'))
         mr_has_semester_id = 'semester_id' in mr_columns
         mr_has_job_id = 'job_id' in mr_columns
         mr_has_job_title = 'job_title' in mr_columns
@@ -4814,12 +3828,7 @@ def ta_confirm_matching():
         print(f"✅ [DEBUG] 寫入 matching_results: 新增 {inserted_count} 筆，更新 {updated_count} 筆")
         
         # 5.1 一併寫入 teacher_student_relations，讓「查看錄取結果」頁（班導／指導老師／主任／科助）有資料
-        cursor.execute("""
-            SELECT COLUMN_NAME FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'teacher_student_relations'
-            AND COLUMN_NAME IN ('semester_id', 'semester', 'company_id')
-        """)
-        tsr_columns = {row['COLUMN_NAME'] for row in cursor.fetchall()}
+        tsr_columns = set(get_columns('teacher_student_relations'))
         has_semester_id = 'semester_id' in tsr_columns
         has_semester = 'semester' in tsr_columns
         has_company_id = 'company_id' in tsr_columns
@@ -4878,30 +3887,14 @@ def ta_confirm_matching():
                     tsr_inserted += 1
         print(f"✅ [DEBUG] 寫入 teacher_student_relations: 新增 {tsr_inserted} 筆，更新 {tsr_updated} 筆")
         
-        # 6. 發送通知給所有使用者（所有人）
-        cursor.execute("SELECT id FROM users")
-        all_users = cursor.fetchall() or []
-        
-        # 發送統一的通知給所有用戶
-        all_users_title = f"{semester_prefix} 媒合結果已發布"
-        all_users_message = f"{semester_prefix}媒合結果已由科助確認並發布，請前往查看。"
-        all_users_link_url = "/admission/results"
-        
-        all_users_notified_count = 0
-        for user in all_users:
-            user_id = user.get('id')
-            if user_id:
-                try:
-                    create_notification(
-                        user_id=user_id,
-                        title=all_users_title,
-                        message=all_users_message,
-                        category="matching",
-                        link_url=all_users_link_url
-                    )
-                    all_users_notified_count += 1
-                except Exception as e:
-                    print(f"⚠️ [警告] 為用戶 {user_id} 發送通知失敗: {e}")
+        # 6. 發送通知給所有使用者（所有人），一次 INSERT ... SELECT 寫入
+        all_users_notified_count = notify_users(
+            title=f"{semester_prefix} 媒合結果已發布",
+            message=f"{semester_prefix}媒合結果已由科助確認並發布，請前往查看。",
+            all_users=True,
+            category="matching",
+            link_url="/admission/results"
+        )["inserted"]
         
         print(f"✅ [DEBUG] 已通知所有用戶，共 {all_users_notified_count} 位")
         
@@ -4914,8 +3907,8 @@ def ta_confirm_matching():
             "notified": {
                 "teachers_and_class_teachers": len(notified_user_ids),
                 "students": len(matched_students),
-                "vendors": len(vendors),
-                "admins_directors": len(admins_directors),
+                "vendors": vendors_notified["inserted"],
+                "admins_directors": admins_directors_notified["inserted"],
                 "all_users": all_users_notified_count
             },
             "approved_count": approved_count,
@@ -5303,12 +4296,7 @@ def director_second_round_unadmitted():
         department = dept_result["department"]
         # 已錄取：若本學期已有 matching_results 則以其為準；否則與 get_all_students 一致（manage_director Approved/Pending 且該志願未被廠商 reject）
         # 如此「主任排序正取但被廠商 reject 未寫入 matching_results」的學生在送出後會出現在未錄取名單
-        cursor.execute("""
-            SELECT COLUMN_NAME FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'matching_results' AND COLUMN_NAME = 'semester_id'
-        """)
-        mr_has_semester = cursor.fetchone() is not None
-        cursor.fetchall()
+        mr_has_semester = has_column('matching_results', 'semester_id')
         use_mr = False
         if mr_has_semester:
             cursor.execute("SELECT COUNT(*) AS cnt FROM matching_results WHERE semester_id = %s", (sid,))
@@ -5532,31 +4520,20 @@ def export_second_round_excel():
             WHERE sra.semester_id = %s
             ORDER BY ic.company_name, ij.title, u.username
         """, (sid,))
-        rows = cursor.fetchall() or []
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "二面名單"
-        headers = ["學號", "姓名", "公司", "職缺", "狀態", "指派時間"]
-        for col, h in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=h)
-            cell.font = Font(bold=True)
-        for i, r in enumerate(rows, 2):
-            ws.cell(row=i, column=1, value=r.get("student_number") or "")
-            ws.cell(row=i, column=2, value=r.get("student_name") or "")
-            ws.cell(row=i, column=3, value=r.get("company_name") or "")
-            ws.cell(row=i, column=4, value=r.get("job_title") or "")
-            ws.cell(row=i, column=5, value=r.get("status") or "")
+        book = StreamingWorkbook()
+        sheet = book.sheet("二面名單")
+        sheet.append(["學號", "姓名", "公司", "職缺", "狀態", "指派時間"], "x_bold")
+        for r in iter_rows(cursor):
             at = r.get("assigned_at")
-            ws.cell(row=i, column=6, value=at.strftime("%Y-%m-%d %H:%M") if at and hasattr(at, "strftime") else str(at or ""))
-        buf = io.BytesIO()
-        wb.save(buf)
-        buf.seek(0)
-        return send_file(
-            buf,
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            as_attachment=True,
-            download_name="二面名單.xlsx",
-        )
+            sheet.append([
+                r.get("student_number") or "",
+                r.get("student_name") or "",
+                r.get("company_name") or "",
+                r.get("job_title") or "",
+                r.get("status") or "",
+                at.strftime("%Y-%m-%d %H:%M") if at and hasattr(at, "strftime") else str(at or ""),
+            ])
+        return book.response("二面名單.xlsx")
     except Exception as e:
         traceback.print_exc()
         return jsonify({"success": False, "message": str(e)}), 500
@@ -6161,6 +5138,13 @@ def simplify_job_title(job_title):
     simplified = simplified.replace('(', '').replace(')', '').replace('（', '').replace('）', '').strip()
     return simplified if simplified else job_title
 
+# 各匯出的快取版本來源表（這些表變動時快取失效，見 export_cache）
+ADMITTED_EXPORT_SOURCES = ("manage_director", "matching_results", "resume_applications",
+                           "student_preferences", "student_job_applications")
+MATCHING_EXPORT_SOURCES = ("manage_director", "student_preferences", "student_job_applications")
+UNADMITTED_EXPORT_SOURCES = ("manage_director", "resume_applications", "student_preferences",
+                             "student_job_applications")
+
 # =========================================================
 # API: 匯出錄取名單 Excel（以主任排序為準，一位學生一家公司）
 # =========================================================
@@ -6181,13 +5165,14 @@ def export_admitted_list_excel():
         if not flow_semester_id:
             return jsonify({"success": False, "message": "無法取得學期"}), 500
 
+        filename = f"錄取名單_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        cache_key = export_cache_key(cursor, "admitted_list", flow_semester_id, ADMITTED_EXPORT_SOURCES)
+        cached = cached_export_response(cache_key, filename, XLSX_MIMETYPE)
+        if cached:
+            return cached
+
         # 檢查 matching_results 是否有 semester_id 欄位
-        cursor.execute("""
-            SELECT COLUMN_NAME FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'matching_results' AND COLUMN_NAME = 'semester_id'
-        """)
-        has_semester_id = cursor.fetchone() is not None
-        cursor.fetchall()
+        has_semester_id = has_column('matching_results', 'semester_id')
 
         # 以 matching_results 為來源，但只匯出「仍為錄取」者：主任 Approved 且未被廠商 reject（與未錄取名單定義一致，排除如馬嫚蔆）
         # 透過 sja + manage_director + resume_applications 篩掉應在未錄取名單的學生
@@ -6301,19 +5286,6 @@ def export_admitted_list_excel():
                 "job_title": job_title,
             })
 
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "媒合結果"
-        company_header_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-        company_header_font = Font(bold=True, size=12)
-        student_font = Font(size=11)
-        total_font = Font(bold=True, size=11)
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
         COLUMNS = 4
         companies_list = []
         for company in companies_data.values():
@@ -6333,97 +5305,10 @@ def export_admitted_list_excel():
             if all_students:
                 companies_list.append({"name": company_name, "students": all_students})
 
-        columns_data = [[], [], [], []]
-        for idx, company in enumerate(companies_list):
-            columns_data[idx % COLUMNS].append(company)
-
-        for col_idx in range(COLUMNS):
-            col_number_start = col_idx * 3 + 1
-            col_letter_start = get_column_letter(col_number_start)
-            col_letter_end = get_column_letter(col_number_start + 1)
-            col_letter_right = get_column_letter(col_number_start + 2)
-            current_row = 1
-            for company in columns_data[col_idx]:
-                company_name = company["name"]
-                students = company["students"]
-                header_cell = ws[f"{col_letter_start}{current_row}"]
-                header_cell.value = company_name
-                header_cell.fill = company_header_fill
-                header_cell.font = company_header_font
-                header_cell.border = thin_border
-                header_cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=False)
-                ws.merge_cells(f"{col_letter_start}{current_row}:{col_letter_end}{current_row}")
-                end_cell = ws[f"{col_letter_end}{current_row}"]
-                end_cell.border = thin_border
-                end_cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=False)
-                ws[f"{col_letter_right}{current_row}"].value = ""
-                ws[f"{col_letter_right}{current_row}"].border = thin_border
-                current_row += 1
-                for student in students:
-                    student_number = student.get("student_number") or ""
-                    student_name = student.get("student_name") or ""
-                    if student_number:
-                        student_number_clean = "".join(filter(str.isdigit, str(student_number)))
-                        try:
-                            student_number_value = int(student_number_clean) if student_number_clean else ""
-                        except (ValueError, TypeError):
-                            student_number_value = student_number_clean
-                    else:
-                        student_number_value = ""
-                    number_cell = ws[f"{col_letter_start}{current_row}"]
-                    number_cell.value = student_number_value
-                    number_cell.font = student_font
-                    number_cell.border = thin_border
-                    number_cell.alignment = Alignment(horizontal='center', vertical='center')
-                    name_cell = ws[f"{col_letter_end}{current_row}"]
-                    name_cell.value = student_name
-                    name_cell.font = student_font
-                    name_cell.border = thin_border
-                    name_cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=False)
-                    ws[f"{col_letter_right}{current_row}"].value = ""
-                    ws[f"{col_letter_right}{current_row}"].border = thin_border
-                    ws[f"{col_letter_right}{current_row}"].alignment = Alignment(horizontal='center', vertical='center')
-                    current_row += 1
-                ws[f"{col_letter_start}{current_row}"].value = ""
-                ws[f"{col_letter_start}{current_row}"].border = thin_border
-                ws[f"{col_letter_start}{current_row}"].alignment = Alignment(horizontal='center', vertical='center')
-                total_cell = ws[f"{col_letter_end}{current_row}"]
-                total_cell.value = f"{len(students)}人"
-                total_cell.font = total_font
-                total_cell.border = thin_border
-                total_cell.alignment = Alignment(horizontal='center', vertical='center')
-                ws[f"{col_letter_right}{current_row}"].value = ""
-                ws[f"{col_letter_right}{current_row}"].border = thin_border
-                ws[f"{col_letter_right}{current_row}"].alignment = Alignment(horizontal='center', vertical='center')
-                current_row += 1
-                ws[f"{col_letter_start}{current_row}"].value = ""
-                ws[f"{col_letter_start}{current_row}"].border = thin_border
-                ws[f"{col_letter_start}{current_row}"].alignment = Alignment(horizontal='center', vertical='center')
-                ws[f"{col_letter_end}{current_row}"].value = ""
-                ws[f"{col_letter_end}{current_row}"].border = thin_border
-                ws[f"{col_letter_end}{current_row}"].alignment = Alignment(horizontal='center', vertical='center')
-                ws[f"{col_letter_right}{current_row}"].value = ""
-                ws[f"{col_letter_right}{current_row}"].border = thin_border
-                ws[f"{col_letter_right}{current_row}"].alignment = Alignment(horizontal='center', vertical='center')
-                current_row += 1
-        for col in range(1, COLUMNS * 3 + 1):
-            col_letter = get_column_letter(col)
-            if (col - 2) % 3 == 0:
-                ws.column_dimensions[col_letter].width = 20
-            else:
-                ws.column_dimensions[col_letter].width = 12
-        for row in range(1, ws.max_row + 1):
-            ws.row_dimensions[row].height = 20
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-        filename = f"錄取名單_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        return send_file(
-            output,
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            as_attachment=True,
-            download_name=filename,
-        )
+        book = StreamingWorkbook()
+        sheet = book.sheet("媒合結果", widths=company_grid_widths(COLUMNS), row_height=20)
+        write_company_grid(sheet, companies_list, COLUMNS)
+        return book.response(filename, cache_key=cache_key)
     except Exception as e:
         traceback.print_exc()
         return jsonify({"success": False, "message": str(e)}), 500
@@ -6457,6 +5342,12 @@ def export_matching_results_excel():
         if not current_semester_id:
             return jsonify({"success": False, "message": "無法取得當前學期"}), 500
         
+        filename = f"媒合結果_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        cache_key = export_cache_key(cursor, "matching_results", current_semester_id, MATCHING_EXPORT_SOURCES)
+        cached = cached_export_response(cache_key, filename, XLSX_MIMETYPE)
+        if cached:
+            return cached
+        
         # 獲取媒合結果數據（與 director_matching_results 相同的邏輯）
         query = """
             SELECT 
@@ -6529,31 +5420,7 @@ def export_matching_results_excel():
                 "job_title": job_title
             })
         
-        # 創建 Excel 工作簿
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "媒合結果"
-        
-        # 設定樣式
-        company_header_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")  # 黃色背景
-        company_header_font = Font(bold=True, size=12)
-        student_font = Font(size=11)
-        total_fill = PatternFill(start_color="F0F0F0", end_color="F0F0F0", fill_type="solid")  # 灰色背景
-        total_font = Font(bold=True, size=11)
-        
-        # 邊框樣式
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-        
-        # 4列網格布局
         COLUMNS = 4
-        COLUMN_WIDTH = 20  # 每列寬度（字符）
-        
-        # 準備公司數據
         companies_list = []
         for company in companies_data.values():
             company_name = company["company_name"]
@@ -6583,143 +5450,10 @@ def export_matching_results_excel():
                     "students": all_students
                 })
         
-        # 將公司分配到4列
-        columns_data = [[], [], [], []]  # 4列
-        for idx, company in enumerate(companies_list):
-            col_idx = idx % COLUMNS
-            columns_data[col_idx].append(company)
-        
-        # 為每列填充數據
-        for col_idx in range(COLUMNS):
-            # 計算欄位：第1列用A-B-C，第2列用D-E-F，第3列用G-H-I，第4列用J-K-L
-            # 每個公司區塊佔用3欄（前兩欄用於內容，第三欄為空）
-            col_number_start = col_idx * 3 + 1  # A=1, D=4, G=7, J=10
-            col_letter_start = get_column_letter(col_number_start)
-            col_letter_end = get_column_letter(col_number_start + 1)
-            col_letter_right = get_column_letter(col_number_start + 2)  # 右邊空一格
-            current_row = 1
-            
-            for company in columns_data[col_idx]:
-                company_name = company["name"]
-                students = company["students"]
-                
-                # 公司名稱標題（黃色背景，跨兩欄置中，右邊空一格）
-                header_cell = ws[f"{col_letter_start}{current_row}"]
-                header_cell.value = company_name
-                header_cell.fill = company_header_fill
-                header_cell.font = company_header_font
-                header_cell.border = thin_border
-                header_cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=False)
-                # 合併兩欄
-                ws.merge_cells(f"{col_letter_start}{current_row}:{col_letter_end}{current_row}")
-                # 確保合併後的單元格也有邊框
-                end_cell = ws[f"{col_letter_end}{current_row}"]
-                end_cell.border = thin_border
-                end_cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=False)
-                # 右邊空一格（第三欄留空）
-                right_empty_cell = ws[f"{col_letter_right}{current_row}"]
-                right_empty_cell.value = ""
-                right_empty_cell.border = thin_border
-                current_row += 1
-                
-                # 學生列表（學號和姓名分開兩欄，右邊空一格）
-                for student in students:
-                    student_number = student.get('student_number') or ''
-                    student_name = student.get('student_name') or ''
-                    
-                    # 將學號轉為純數字（移除所有非數字字符）
-                    if student_number:
-                        student_number_clean = ''.join(filter(str.isdigit, str(student_number)))
-                        # 嘗試轉換為 int，讓 Excel 識別為數字類型
-                        try:
-                            student_number_value = int(student_number_clean) if student_number_clean else ''
-                        except (ValueError, TypeError):
-                            student_number_value = student_number_clean
-                    else:
-                        student_number_value = ''
-                    
-                    # 學號欄位
-                    number_cell = ws[f"{col_letter_start}{current_row}"]
-                    number_cell.value = student_number_value
-                    number_cell.font = student_font
-                    number_cell.border = thin_border
-                    number_cell.alignment = Alignment(horizontal='center', vertical='center')
-                    
-                    # 姓名欄位
-                    name_cell = ws[f"{col_letter_end}{current_row}"]
-                    name_cell.value = student_name
-                    name_cell.font = student_font
-                    name_cell.border = thin_border
-                    name_cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=False)
-                    
-                    # 右邊空一格（第三欄留空）
-                    right_empty_cell = ws[f"{col_letter_right}{current_row}"]
-                    right_empty_cell.value = ""
-                    right_empty_cell.border = thin_border
-                    right_empty_cell.alignment = Alignment(horizontal='center', vertical='center')
-                    
-                    current_row += 1
-                
-                # 總人數
-                # 左欄留空
-                ws[f"{col_letter_start}{current_row}"].value = ""
-                ws[f"{col_letter_start}{current_row}"].border = thin_border
-                ws[f"{col_letter_start}{current_row}"].alignment = Alignment(horizontal='center', vertical='center')
-                # 右欄顯示總人數
-                total_text = f"{len(students)}人"
-                total_cell = ws[f"{col_letter_end}{current_row}"]
-                total_cell.value = total_text
-                # 移除灰色背景
-                total_cell.font = total_font
-                total_cell.border = thin_border
-                total_cell.alignment = Alignment(horizontal='center', vertical='center')
-                # 右邊空一格（第三欄留空）
-                right_empty_cell = ws[f"{col_letter_right}{current_row}"]
-                right_empty_cell.value = ""
-                right_empty_cell.border = thin_border
-                right_empty_cell.alignment = Alignment(horizontal='center', vertical='center')
-                current_row += 1  # 移到下一行
-                
-                # 公司與公司之間的間隔行（三欄都留空）
-                ws[f"{col_letter_start}{current_row}"].value = ""
-                ws[f"{col_letter_start}{current_row}"].border = thin_border
-                ws[f"{col_letter_start}{current_row}"].alignment = Alignment(horizontal='center', vertical='center')
-                ws[f"{col_letter_end}{current_row}"].value = ""
-                ws[f"{col_letter_end}{current_row}"].border = thin_border
-                ws[f"{col_letter_end}{current_row}"].alignment = Alignment(horizontal='center', vertical='center')
-                ws[f"{col_letter_right}{current_row}"].value = ""
-                ws[f"{col_letter_right}{current_row}"].border = thin_border
-                ws[f"{col_letter_right}{current_row}"].alignment = Alignment(horizontal='center', vertical='center')
-                current_row += 1  # 移到下一行
-        
-        # 設定列寬（每列佔用3個欄位，所以總共12欄）
-        # 增加列寬以確保公司名稱可以完整顯示（合併兩欄後寬度足夠）
-        for col in range(1, COLUMNS * 3 + 1):
-            col_letter = get_column_letter(col)
-            # 姓名欄位（每列的第2個欄位：2, 5, 8, 11）增加寬度以確保姓名完整顯示
-            if (col - 2) % 3 == 0:
-                ws.column_dimensions[col_letter].width = 20  # 姓名欄位更寬，確保「姓名(職缺)」完整顯示
-            else:
-                ws.column_dimensions[col_letter].width = 12  # 其他欄位
-        
-        # 設定行高
-        for row in range(1, ws.max_row + 1):
-            ws.row_dimensions[row].height = 20
-        
-        # 保存到內存
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        # 生成文件名
-        filename = f"媒合結果_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        book = StreamingWorkbook()
+        sheet = book.sheet("媒合結果", widths=company_grid_widths(COLUMNS), row_height=20)
+        write_company_grid(sheet, companies_list, COLUMNS)
+        return book.response(filename, cache_key=cache_key)
     
     except Exception as e:
         traceback.print_exc()
@@ -6750,6 +5484,13 @@ def ta_export_matching_results_excel():
         if not current_semester_id:
             return jsonify({"success": False, "message": "無法取得當前學期"}), 500
         
+        filename = f"媒合結果公告_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        cache_key = export_cache_key(cursor, "matching_results_announcement", current_semester_id,
+                                     MATCHING_EXPORT_SOURCES)
+        cached = cached_export_response(cache_key, filename, XLSX_MIMETYPE)
+        if cached:
+            return cached
+        
         # 獲取媒合結果數據（使用 manage_director.semester_id 篩選，與 final_matching_results 一致）
         query = """
             SELECT 
@@ -6826,28 +5567,7 @@ def ta_export_matching_results_excel():
                 "job_title": job_title
             })
         
-        # 創建 Excel 工作簿（與原函數相同的邏輯）
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "媒合結果"
-        
-        # 設定樣式
-        company_header_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-        company_header_font = Font(bold=True, size=12)
-        student_font = Font(size=11)
-        total_fill = PatternFill(start_color="F0F0F0", end_color="F0F0F0", fill_type="solid")
-        total_font = Font(bold=True, size=11)
-        
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-        
         COLUMNS = 4
-        COLUMN_WIDTH = 20
-        
         companies_list = []
         for company in companies_data.values():
             company_name = company["company_name"]
@@ -6877,117 +5597,10 @@ def ta_export_matching_results_excel():
                     "students": all_students
                 })
         
-        columns_data = [[], [], [], []]
-        for idx, company in enumerate(companies_list):
-            col_idx = idx % COLUMNS
-            columns_data[col_idx].append(company)
-        
-        for col_idx in range(COLUMNS):
-            col_number_start = col_idx * 3 + 1
-            col_letter_start = get_column_letter(col_number_start)
-            col_letter_end = get_column_letter(col_number_start + 1)
-            col_letter_right = get_column_letter(col_number_start + 2)
-            current_row = 1
-            
-            for company in columns_data[col_idx]:
-                company_name = company["name"]
-                students = company["students"]
-                
-                header_cell = ws[f"{col_letter_start}{current_row}"]
-                header_cell.value = company_name
-                header_cell.fill = company_header_fill
-                header_cell.font = company_header_font
-                header_cell.border = thin_border
-                header_cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=False)
-                ws.merge_cells(f"{col_letter_start}{current_row}:{col_letter_end}{current_row}")
-                end_cell = ws[f"{col_letter_end}{current_row}"]
-                end_cell.border = thin_border
-                end_cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=False)
-                ws[f"{col_letter_right}{current_row}"].value = ""
-                ws[f"{col_letter_right}{current_row}"].border = thin_border
-                current_row += 1
-                
-                for student in students:
-                    student_number = student.get('student_number') or ''
-                    student_name = student.get('student_name') or ''
-                    
-                    # 將學號轉為純數字（移除所有非數字字符）
-                    if student_number:
-                        student_number_clean = ''.join(filter(str.isdigit, str(student_number)))
-                        # 嘗試轉換為 int，讓 Excel 識別為數字類型
-                        try:
-                            student_number_value = int(student_number_clean) if student_number_clean else ''
-                        except (ValueError, TypeError):
-                            student_number_value = student_number_clean
-                    else:
-                        student_number_value = ''
-                    
-                    number_cell = ws[f"{col_letter_start}{current_row}"]
-                    number_cell.value = student_number_value
-                    number_cell.font = student_font
-                    number_cell.border = thin_border
-                    number_cell.alignment = Alignment(horizontal='center', vertical='center')
-                    
-                    name_cell = ws[f"{col_letter_end}{current_row}"]
-                    name_cell.value = student_name
-                    name_cell.font = student_font
-                    name_cell.border = thin_border
-                    name_cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=False)
-                    
-                    ws[f"{col_letter_right}{current_row}"].value = ""
-                    ws[f"{col_letter_right}{current_row}"].border = thin_border
-                    ws[f"{col_letter_right}{current_row}"].alignment = Alignment(horizontal='center', vertical='center')
-                    current_row += 1
-                
-                ws[f"{col_letter_start}{current_row}"].value = ""
-                ws[f"{col_letter_start}{current_row}"].border = thin_border
-                ws[f"{col_letter_start}{current_row}"].alignment = Alignment(horizontal='center', vertical='center')
-                total_text = f"{len(students)}人"
-                total_cell = ws[f"{col_letter_end}{current_row}"]
-                total_cell.value = total_text
-                # 移除灰色背景
-                total_cell.font = total_font
-                total_cell.border = thin_border
-                total_cell.alignment = Alignment(horizontal='center', vertical='center')
-                ws[f"{col_letter_right}{current_row}"].value = ""
-                ws[f"{col_letter_right}{current_row}"].border = thin_border
-                ws[f"{col_letter_right}{current_row}"].alignment = Alignment(horizontal='center', vertical='center')
-                current_row += 1
-                
-                ws[f"{col_letter_start}{current_row}"].value = ""
-                ws[f"{col_letter_start}{current_row}"].border = thin_border
-                ws[f"{col_letter_start}{current_row}"].alignment = Alignment(horizontal='center', vertical='center')
-                ws[f"{col_letter_end}{current_row}"].value = ""
-                ws[f"{col_letter_end}{current_row}"].border = thin_border
-                ws[f"{col_letter_end}{current_row}"].alignment = Alignment(horizontal='center', vertical='center')
-                ws[f"{col_letter_right}{current_row}"].value = ""
-                ws[f"{col_letter_right}{current_row}"].border = thin_border
-                ws[f"{col_letter_right}{current_row}"].alignment = Alignment(horizontal='center', vertical='center')
-                current_row += 1
-        
-        for col in range(1, COLUMNS * 3 + 1):
-            col_letter = get_column_letter(col)
-            # 姓名欄位（每列的第2個欄位：2, 5, 8, 11）增加寬度以確保姓名完整顯示
-            if (col - 2) % 3 == 0:
-                ws.column_dimensions[col_letter].width = 20  # 姓名欄位更寬，確保「姓名(職缺)」完整顯示
-            else:
-                ws.column_dimensions[col_letter].width = 12  # 其他欄位
-        
-        for row in range(1, ws.max_row + 1):
-            ws.row_dimensions[row].height = 20
-        
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        filename = f"媒合結果公告_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        book = StreamingWorkbook()
+        sheet = book.sheet("媒合結果", widths=company_grid_widths(COLUMNS), row_height=20)
+        write_company_grid(sheet, companies_list, COLUMNS)
+        return book.response(filename, cache_key=cache_key)
     
     except Exception as e:
         traceback.print_exc()
@@ -7037,6 +5650,19 @@ def ta_export_unadmitted_students_excel():
         if not current_semester_id:
             return jsonify({"success": False, "message": "無法取得當前學期"}), 500
 
+        # 檔名（包含學期與時間）；主任 / 班導的匯出範圍依所屬班級而定
+        filename = f"未錄取學生名單_{current_semester_code}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        cache_scope = {
+            "role": user_role,
+            "user_id": user_id if user_role in ('director', 'class_teacher') else None,
+            "class_id": class_id,
+        }
+        cache_key = export_cache_key(cursor, "unadmitted_students", current_semester_id,
+                                     UNADMITTED_EXPORT_SOURCES, cache_scope)
+        cached = cached_export_response(cache_key, filename, XLSX_MIMETYPE)
+        if cached:
+            return cached
+
         # 未媒合名單以主任排序為準；已媒合 = manage_director 為 Approved/Pending 且該志願未被廠商 reject
         cursor.execute("""
             SELECT DISTINCT md.student_id
@@ -7115,15 +5741,11 @@ def ta_export_unadmitted_students_excel():
 
         base_query += " ORDER BY u.username ASC"
         cursor.execute(base_query, params)
-        students = cursor.fetchall() or []
-
-        # 只匯出未錄取（未媒合）者
-        unadmitted_students = []
-        for s in students:
-            sid = s.get('student_id')
-            is_matched = (sid in matched_student_ids) if sid else False
-            if not is_matched:
-                unadmitted_students.append(s)
+        # 只匯出未錄取（未媒合）者；逐批讀取，寫入工作表時才取出
+        unadmitted_students = (
+            s for s in iter_rows(cursor)
+            if not (s.get('student_id') and s.get('student_id') in matched_student_ids)
+        )
 
         # 學期 label（與 get_all_students 一致）
         semester_label = current_semester_code
@@ -7137,32 +5759,13 @@ def ta_export_unadmitted_students_excel():
                 pass
 
         # 建立 Excel
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "未錄取名單"
-
-        header_font = Font(bold=True)
-        header_fill = PatternFill(start_color="E6F0FF", end_color="E6F0FF", fill_type="solid")
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
+        book = StreamingWorkbook()
+        sheet = book.sheet("未錄取名單", widths=[18, 18, 24])
 
         title = f"未錄取學生名單\n（{current_semester_code} {semester_label}）"
-        ws["A1"].value = title
-        ws.merge_cells("A1:C1")
-        ws["A1"].font = Font(bold=True, size=14)
-        ws["A1"].alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-        ws.row_dimensions[1].height = 50  # 增加第一行高度，確保兩行文字完整顯示不被切到
-
-        ws.append(["姓名", "學號", "班級"])
-        for cell in ws[2]:
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.border = thin_border
-            cell.alignment = Alignment(horizontal="center", vertical="center")
+        sheet.append([title, None, None], ["x_title", None, None], height=50)  # 增加第一行高度，確保兩行文字完整顯示不被切到
+        sheet.merge(1, 3)
+        sheet.append(["姓名", "學號", "班級"], "x_header")
 
         # 計算當前學年（從學期代碼提取：1132 -> 113）
         current_semester_year = None
@@ -7220,40 +5823,14 @@ def ta_export_unadmitted_students_excel():
                     # 如果無法轉換，保持原值
                     student_number_value = student_number
             
-            ws.append([
+            # 學號欄位（B欄）數字以整數格式顯示
+            sheet.append([
                 s.get("student_name") or "",
                 student_number_value,
                 class_label
-            ])
-
-        # 套用基本格式
-        for row in ws.iter_rows(min_row=3, max_row=ws.max_row, min_col=1, max_col=3):
-            for cell in row:
-                cell.border = thin_border
-                cell.alignment = Alignment(horizontal="center", vertical="center")
-                # 學號欄位（B欄）設定為數字格式
-                if cell.column == 2:  # B欄是第2欄
-                    if isinstance(cell.value, (int, float)):
-                        cell.number_format = '0'  # 設定為整數格式，不顯示小數點
-
-        # 增加欄位寬度，確保標題完整顯示
-        ws.column_dimensions["A"].width = 18
-        ws.column_dimensions["B"].width = 18
-        ws.column_dimensions["C"].width = 24
-
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-
-        # 檔名（包含學期與時間）
-        filename = f"未錄取學生名單_{current_semester_code}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+            ], ["x_cell", "x_number" if isinstance(student_number_value, (int, float)) else "x_cell", "x_cell"])
 
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        return book.response(filename, cache_key=cache_key)
     except Exception as e:
         traceback.print_exc()
         return jsonify({"success": False, "message": f"匯出失敗: {str(e)}"}), 500
@@ -0,0 +1,490 @@
+"""
+AI 呼叫閘道（Gemini）
+
+所有模型呼叫經由 generate_text / stream_text：
+- 模型物件：genai.configure 只在第一次使用時執行一次，GenerativeModel 依模型名稱建立後重複使用
+- 併發限制：全域（AI_MAX_CONCURRENCY）與每位使用者（AI_USER_CONCURRENCY）同時進行的呼叫數，
+  額滿時排隊等候，超過 AI_QUEUE_TIMEOUT 秒則回覆忙碌
+- 速率限制：每位使用者每分鐘 AI_USER_RATE_PER_MINUTE 次（超過直接回覆，附 retry_after），
+  全域每分鐘 AI_GLOBAL_RATE_PER_MINUTE 次（超過時排隊）；快取命中不計入
+- 逾時：每次呼叫帶 request_options timeout（AI_CALL_TIMEOUT 秒）
+- 斷路器：同一模型連續失敗 AI_BREAKER_THRESHOLD 次後暫停 AI_BREAKER_COOLDOWN 秒，期間直接回覆錯誤；
+  配額錯誤（429）依回應的 retry 秒數暫停。暫停結束後進入半開：只放行一個試探呼叫，
+  成功才恢復，失敗則立即再暫停
+- 使用者的名額與速率紀錄在閒置後移除（名額無人使用即移除，速率紀錄每分鐘清理一次）
+- 回應快取：(模型, prompt 雜湊, generation_config) → 文字，保留 AI_CACHE_TTL 秒，相同的潤飾 / 推薦請求立即回應
+- AI_BACKEND=fake 時改用 FakeBackend（不連網路，供開發與 bench_ai_gateway.py 使用）；也可用 set_backend 替換
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+try:
+    import google.generativeai as genai
+except ImportError:  # 未安裝時只能使用 FakeBackend
+    genai = None
+
+DEFAULT_MODEL = os.getenv("AI_DEFAULT_MODEL", "gemini-2.5-flash")
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "4"))
+AI_USER_CONCURRENCY = int(os.getenv("AI_USER_CONCURRENCY", "2"))  # 至少 2：成績單 OCR 的 hedge 需要同時兩個呼叫
+AI_QUEUE_TIMEOUT = float(os.getenv("AI_QUEUE_TIMEOUT", "20"))
+AI_USER_RATE_PER_MINUTE = int(os.getenv("AI_USER_RATE_PER_MINUTE", "10"))
+AI_GLOBAL_RATE_PER_MINUTE = int(os.getenv("AI_GLOBAL_RATE_PER_MINUTE", "60"))
+AI_CALL_TIMEOUT = float(os.getenv("AI_CALL_TIMEOUT", "60"))
+AI_BREAKER_THRESHOLD = int(os.getenv("AI_BREAKER_THRESHOLD", "5"))
+AI_BREAKER_COOLDOWN = float(os.getenv("AI_BREAKER_COOLDOWN", "30"))
+AI_CACHE_TTL = int(os.getenv("AI_CACHE_TTL", "3600"))
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "500"))
+
+
+class AIGatewayError(Exception):
+    """
+    閘道拒絕或呼叫失敗。error_type：unavailable / busy / rate_limited / quota_exceeded / timeout / circuit_open / failed
+    status 為建議的 HTTP 狀態碼，retry_after 為建議等待秒數（可能為 None）
+    """
+
+    def __init__(self, message, error_type="failed", status=500, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.error_type = error_type
+        self.status = status
+        self.retry_after = retry_after
+
+
+# =========================================================
+# 模型後端
+# =========================================================
+class GeminiBackend:
+    """Google Gemini；configure 一次，GenerativeModel 依名稱快取"""
+
+    name = "gemini"
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self._models = {}
+        self._lock = threading.Lock()
+        self._configured = False
+
+    def available(self):
+        return bool(self.api_key) and genai is not None
+
+    def _model(self, model_name):
+        with self._lock:
+            if not self._configured:
+                genai.configure(api_key=self.api_key)
+                self._configured = True
+            model = self._models.get(model_name)
+            if model is None:
+                model = genai.GenerativeModel(model_name)
+                self._models[model_name] = model
+            return model
+
+    def generate(self, model_name, contents, generation_config=None, timeout=None):
+        response = self._model(model_name).generate_content(
+            contents, generation_config=generation_config, request_options={"timeout": timeout}
+        )
+        return (getattr(response, "text", None) or "")
+
+    def stream(self, model_name, contents, generation_config=None, timeout=None):
+        response = self._model(model_name).generate_content(
+            contents, generation_config=generation_config, stream=True, request_options={"timeout": timeout}
+        )
+        for chunk in response:
+            text = getattr(chunk, "text", None)
+            if text:
+                yield text
+
+
+class FakeBackend:
+    """
+    本機假模型：不連網路，依 responder(model_name, contents, generation_config) 回傳文字。
+    未指定 responder 時，JSON 模式回傳 {}，其他回傳 prompt 開頭的摘要。
+    latency 模擬每次呼叫耗時（秒）；fail_models 中的模型一律拋出錯誤（測試備援與斷路器）。
+    """
+
+    name = "fake"
+
+    def __init__(self, responder=None, latency=0.0, fail_models=()):
+        self.responder = responder
+        self.latency = latency
+        self.fail_models = set(fail_models)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def available(self):
+        return True
+
+    def generate(self, model_name, contents, generation_config=None, timeout=None):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            if timeout and self.latency > timeout:
+                time.sleep(timeout)
+                raise TimeoutError(f"fake model {model_name} timed out")
+            time.sleep(self.latency)
+        if model_name in self.fail_models:
+            raise RuntimeError(f"fake model {model_name} failed")
+        if self.responder:
+            return self.responder(model_name, contents, generation_config)
+        if (generation_config or {}).get("response_mime_type") == "application/json":
+            return "{}"
+        text = contents if isinstance(contents, str) else " ".join(p for p in contents if isinstance(p, str))
+        return f"[{model_name}] {text.strip()[:40]}"
+
+    def stream(self, model_name, contents, generation_config=None, timeout=None):
+        text = self.generate(model_name, contents, generation_config, timeout)
+        for i in range(0, len(text), 16):
+            yield text[i:i + 16]
+
+
+def _default_backend():
+    if os.getenv("AI_BACKEND", "").lower() == "fake":
+        return FakeBackend()
+    return GeminiBackend(os.getenv("GEMINI_API_KEY"))
+
+
+_backend = _default_backend()
+
+
+def set_backend(backend):
+    """替換模型後端（bench / 開發用），同時清除快取與斷路器狀態"""
+    global _backend
+    _backend = backend
+    _cache.clear()
+    with _breaker_lock:
+        _breakers.clear()
+
+
+def ai_available():
+    return _backend.available()
+
+
+# =========================================================
+# 回應快取
+# =========================================================
+class _ResponseCache:
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item and item[1] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            if item:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, text):
+        with self._lock:
+            self._data[key] = (text, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_cache = _ResponseCache(AI_CACHE_TTL, AI_CACHE_MAX_ENTRIES)
+
+
+def _contents_digest(contents):
+    """prompt 雜湊：文字直接雜湊，圖片等二進位內容以 mime_type + 資料雜湊"""
+    digest = hashlib.sha256()
+    parts = [contents] if isinstance(contents, (str, dict)) else list(contents)
+    for part in parts:
+        if isinstance(part, dict):
+            digest.update(str(part.get("mime_type", "")).encode("utf-8"))
+            data = part.get("data", b"")
+            digest.update(data if isinstance(data, bytes) else str(data).encode("utf-8"))
+        else:
+            digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def cache_key(model_name, contents, generation_config=None):
+    config = json.dumps(generation_config or {}, sort_keys=True, default=str)
+    return f"{model_name}:{_contents_digest(contents)}:{hashlib.sha1(config.encode('utf-8')).hexdigest()}"
+
+
+# =========================================================
+# 併發與速率限制
+# =========================================================
+_global_slots = threading.BoundedSemaphore(AI_MAX_CONCURRENCY)
+_user_slots = {}  # user_id -> [BoundedSemaphore, 使用中的 _Slot 數]；降為 0 時移除
+_user_slots_lock = threading.Lock()
+_rate_lock = threading.Condition()
+_global_calls = deque()
+_user_calls = {}
+_last_user_sweep = 0.0
+
+
+def _user_semaphore(user_id):
+    """取得使用者的名額 semaphore 並登記使用中；用完需呼叫 _release_user_semaphore"""
+    with _user_slots_lock:
+        entry = _user_slots.get(user_id)
+        if entry is None:
+            entry = [threading.BoundedSemaphore(AI_USER_CONCURRENCY), 0]
+            _user_slots[user_id] = entry
+        entry[1] += 1
+        return entry[0]
+
+
+def _release_user_semaphore(user_id):
+    with _user_slots_lock:
+        entry = _user_slots.get(user_id)
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del _user_slots[user_id]
+
+
+def _sweep_idle_users(now):
+    """移除一分鐘內沒有呼叫的使用者速率紀錄（每分鐘最多執行一次，呼叫端持有 _rate_lock）"""
+    global _last_user_sweep
+    if now - _last_user_sweep < 60:
+        return
+    _last_user_sweep = now
+    for user_id in [uid for uid, calls in _user_calls.items() if not calls or now - calls[-1] >= 60]:
+        del _user_calls[user_id]
+
+
+def _prune_window(calls, now):
+    while calls and now - calls[0] >= 60:
+        calls.popleft()
+
+
+def _take_rate(user_id, deadline):
+    """記錄一次呼叫；使用者超量直接拒絕，全域超量則等候到 deadline"""
+    with _rate_lock:
+        while True:
+            now = time.monotonic()
+            _prune_window(_global_calls, now)
+            _sweep_idle_users(now)
+            if user_id is not None:
+                user_calls = _user_calls.setdefault(user_id, deque())
+                _prune_window(user_calls, now)
+                if len(user_calls) >= AI_USER_RATE_PER_MINUTE:
+                    retry_after = int(60 - (now - user_calls[0])) + 1
+                    raise AIGatewayError(f"AI 使用次數過於頻繁，請在 {retry_after} 秒後再試",
+                                         "rate_limited", 429, retry_after)
+            if len(_global_calls) < AI_GLOBAL_RATE_PER_MINUTE:
+                _global_calls.append(now)
+                if user_id is not None:
+                    _user_calls[user_id].append(now)
+                return
+            wait = min(60 - (now - _global_calls[0]), deadline - now)
+            if wait <= 0:
+                raise AIGatewayError("AI 服務目前使用人數眾多，請稍後再試", "busy", 503, 10)
+            _rate_lock.wait(wait)
+
+
+class _Slot:
+    """取得全域與使用者的呼叫名額（排隊等候），離開時歸還"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._held = []
+        self._user_registered = False
+
+    def __enter__(self):
+        deadline = time.monotonic() + AI_QUEUE_TIMEOUT
+        sems = []
+        if self.user_id is not None:
+            sems.append(_user_semaphore(self.user_id))
+            self._user_registered = True
+        sems.append(_global_slots)
+        for sem in sems:
+            if not sem.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                self.__exit__(None, None, None)
+                raise AIGatewayError("AI 服務目前使用人數眾多，請稍後再試", "busy", 503, 10)
+            self._held.append(sem)
+        try:
+            _take_rate(self.user_id, deadline)
+        except AIGatewayError:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        while self._held:
+            self._held.pop().release()
+        if self._user_registered:
+            self._user_registered = False
+            _release_user_semaphore(self.user_id)
+        return False
+
+
+# =========================================================
+# 斷路器
+# =========================================================
+_breakers = {}  # model_name -> {"failures": n, "open_until": monotonic, "trial": 半開試探呼叫進行中}
+_breaker_lock = threading.Lock()
+
+
+def _check_breaker(model_name):
+    """
+    斷路器開啟中直接拒絕；暫停結束（半開）時只放行一個試探呼叫，回傳 True 表示本次為試探，
+    呼叫結束後需以 _end_trial 釋放（成功 / 失敗已由 _record_success / _record_failure 更新狀態）
+    """
+    with _breaker_lock:
+        state = _breakers.get(model_name)
+        if not state or not state["open_until"]:
+            return False
+        now = time.monotonic()
+        if state["open_until"] > now:
+            retry_after = int(state["open_until"] - now) + 1
+        elif state["trial"]:
+            retry_after = 1
+        else:
+            state["trial"] = True
+            print(f"🔁 [ai-gateway] 模型 {model_name} 半開，放行一個試探呼叫")
+            return True
+        raise AIGatewayError(f"AI 模型 {model_name} 暫時停用，請在 {retry_after} 秒後再試",
+                             "circuit_open", 503, retry_after)
+
+
+def _end_trial(model_name):
+    """試探呼叫結束但未呼叫到模型（例如排隊逾時）時，讓下一個呼叫可以再試探"""
+    with _breaker_lock:
+        state = _breakers.get(model_name)
+        if state:
+            state["trial"] = False
+
+
+def _record_success(model_name):
+    with _breaker_lock:
+        _breakers.pop(model_name, None)
+
+
+def _record_failure(model_name, cooldown=None):
+    with _breaker_lock:
+        state = _breakers.setdefault(model_name, {"failures": 0, "open_until": 0.0, "trial": False})
+        state["failures"] += 1
+        # 半開試探失敗：不必再累積到門檻，立即再暫停
+        if cooldown is not None or state["failures"] >= AI_BREAKER_THRESHOLD or state["trial"]:
+            state["trial"] = False
+            state["open_until"] = time.monotonic() + (cooldown if cooldown is not None else AI_BREAKER_COOLDOWN)
+            print(f"⚠️ [ai-gateway] 模型 {model_name} 暫停 {int(state['open_until'] - time.monotonic())} 秒")
+
+
+def _retry_seconds(error_str):
+    match = re.search(r'retry in ([\d.]+)s', error_str, re.IGNORECASE)
+    return int(float(match.group(1))) if match else None
+
+
+def _translate_error(model_name, e):
+    """後端例外轉為 AIGatewayError 並更新斷路器；配額錯誤保留原訊息（呼叫端依 429 / quota 判斷）"""
+    if isinstance(e, AIGatewayError):
+        return e
+    error_str = str(e)
+    if "429" in error_str or "quota" in error_str.lower():
+        retry_after = _retry_seconds(error_str)
+        _record_failure(model_name, cooldown=retry_after or AI_BREAKER_COOLDOWN)
+        return AIGatewayError(error_str, "quota_exceeded", 429, retry_after)
+    _record_failure(model_name)
+    if isinstance(e, TimeoutError) or "timeout" in error_str.lower() or "deadline" in error_str.lower():
+        return AIGatewayError(f"AI 服務回應逾時（{model_name}）", "timeout", 504)
+    return AIGatewayError(error_str, "failed", 500)
+
+
+# =========================================================
+# 對外介面
+# =========================================================
+def generate_text(contents, model_name=None, generation_config=None, user_id=None, timeout=None, use_cache=True):
+    """
+    呼叫模型並回傳文字。contents 為字串或 [{"mime_type":..., "data": bytes}, "prompt"] 列表。
+    失敗時 raise AIGatewayError。
+    """
+    model_name = model_name or DEFAULT_MODEL
+    if not _backend.available():
+        raise AIGatewayError("AI 服務未正確配置 API Key。", "unavailable", 500)
+    key = cache_key(model_name, contents, generation_config) if use_cache else None
+    if key:
+        cached = _cache.get(key)
+        if cached is not None:
+            return cached
+
+    trial = _check_breaker(model_name)
+    try:
+        with _Slot(user_id):
+            started = time.perf_counter()
+            try:
+                text = _backend.generate(model_name, contents, generation_config, timeout or AI_CALL_TIMEOUT)
+            except Exception as e:
+                raise _translate_error(model_name, e) from e
+        _record_success(model_name)
+    finally:
+        if trial:
+            _end_trial(model_name)
+    print(f"🤖 [ai-gateway] {model_name} {int((time.perf_counter() - started) * 1000)}ms")
+    if key and text:
+        _cache.set(key, text)
+    return text
+
+
+def stream_text(contents, model_name=None, generation_config=None, user_id=None, timeout=None, use_cache=True):
+    """
+    串流呼叫，逐段 yield 文字；完整回應結束後存入快取，命中快取時一次回傳。
+    名額與速率在第一次取值時檢查，失敗時 raise AIGatewayError（由呼叫端的串流產生器處理）。
+    """
+    model_name = model_name or DEFAULT_MODEL
+    if not _backend.available():
+        raise AIGatewayError("AI 服務未正確配置 API Key。", "unavailable", 500)
+    key = cache_key(model_name, contents, generation_config) if use_cache else None
+    if key:
+        cached = _cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    trial = _check_breaker(model_name)
+    chunks = []
+    try:
+        with _Slot(user_id):
+            try:
+                for text in _backend.stream(model_name, contents, generation_config, timeout or AI_CALL_TIMEOUT):
+                    chunks.append(text)
+                    yield text
+            except Exception as e:
+                raise _translate_error(model_name, e) from e
+        _record_success(model_name)
+    finally:
+        # 呼叫端中途停止讀取（GeneratorExit）也要釋放試探名額
+        if trial:
+            _end_trial(model_name)
+    if key and chunks:
+        _cache.set(key, "".join(chunks))
+
+
+def gateway_stats():
+    with _breaker_lock:
+        now = time.monotonic()
+        open_models = [name for name, s in _breakers.items() if s["open_until"] > now]
+        half_open_models = [name for name, s in _breakers.items() if 0 < s["open_until"] <= now]
+    with _user_slots_lock:
+        tracked_users = len(_user_slots)
+    return {
+        "backend": _backend.name,
+        "cache_hits": _cache.hits,
+        "cache_misses": _cache.misses,
+        "cache_entries": len(_cache._data),
+        "open_circuits": open_models,
+        "half_open_circuits": half_open_models,
+        "active_users": tracked_users,
+    }
@@ -1,14 +1,20 @@
 import os
 import re
-import google.generativeai as genai
 from flask import Blueprint, request, Response, jsonify, session, current_app, send_file
 from config import get_db
+from schema_cache import has_column
 import json
 import traceback
 from werkzeug.utils import secure_filename
 from docx import Document
-from PIL import Image, ImageEnhance
+from PIL import Image, ImageEnhance, ImageOps
 import io
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from ai_gateway import AIGatewayError, ai_available, generate_text, stream_text
 
 
 
@@ -16,18 +22,17 @@ import io
 # --- 初始化 AI Blueprint ---
 ai_bp = Blueprint('ai_bp', __name__)
 
-# --- 初始化 Google GenAI ---
-api_key = os.getenv('GEMINI_API_KEY')
-
-# 檢查 API Key 是否存在
-if not api_key:
+# --- Google GenAI：模型呼叫統一經由 ai_gateway（併發 / 速率限制、逾時、斷路器、回應快取）---
+if not ai_available():
     print("AI 模組警告：在環境變數中找不到 GEMINI_API_KEY。")
-    model = None # 將 model 設為 None
-else:
-    # 設定 Google Gen AI
-    genai.configure(api_key=api_key)
-    # 初始化模型
-    model = genai.GenerativeModel('gemini-2.5-flash')
+
+
+def _gateway_error_response(e, with_success=False):
+    """閘道拒絕（忙碌、頻率過高、逾時、模型暫停）時的 JSON 回應；配額錯誤仍由原本的 429 處理"""
+    body = {"error": e.message, "error_type": e.error_type, "retry_after": e.retry_after}
+    if with_success:
+        body["success"] = False
+    return jsonify(body), e.status
 
 # ==========================================================
 # 🧠 系統提示詞（System Prompt）
@@ -72,8 +77,9 @@ def _build_keyword_guidance(user_keywords: str) -> str:
 @ai_bp.route('/api/revise-resume', methods=['POST'])
 def revise_resume():
     # 檢查 API Key 是否在啟動時成功載入
-    if not api_key or not model:
+    if not ai_available():
         return jsonify({"error": "AI 服務未正確配置 API Key。"}), 500
+    ai_user_id = session.get('user_id')
 
     # 接收履歷文本、任務風格、語氣風格、關鍵字（選填）
     try:
@@ -184,8 +190,7 @@ def revise_resume():
                 )
             else:
                 keyword_prompt = f"[任務] 從以下履歷文本中提取 5-7 個最核心的技能和成就關鍵字。[規則] 以逗號 (,) 分隔所有關鍵字，並在**一行中**輸出。[原始文本] {user_resume_text} [關鍵字列表]"
-                keyword_response = model.generate_content(keyword_prompt)
-                keywords = keyword_response.text.strip()
+                keywords = generate_text(keyword_prompt, user_id=ai_user_id).strip()
                 print(f"偵測任務: 關鍵字導向 (自動提取關鍵字: {keywords}), 語氣: {tone_style}")
                 final_prompt = (
                     "[任務] 你是一位頂尖的人力資源顧問。"
@@ -237,12 +242,13 @@ def revise_resume():
         # --- 統一的串流輸出 ---
         def generate_stream():
             try:
-                response_stream = model.generate_content(final_prompt, stream=True)
-                for chunk in response_stream:
-                    if chunk.text:
-                        yield chunk.text
+                for text in stream_text(final_prompt, user_id=ai_user_id):
+                    yield text
             except Exception as e:
                 print(f"串流處理中發生錯誤: {e}")
+                if isinstance(e, AIGatewayError) and e.error_type != "quota_exceeded":
+                    yield f"⚠️ {e.message}"
+                    return
                 error_str = str(e)
                 # 檢查是否為配額限制錯誤（429）
                 if "429" in error_str or "quota" in error_str.lower() or "Quota exceeded" in error_str:
@@ -271,6 +277,8 @@ def revise_resume():
 
     except Exception as e:
         print(f"Gemini API 呼叫失敗： {e}")
+        if isinstance(e, AIGatewayError) and e.error_type != "quota_exceeded":
+            return _gateway_error_response(e)
         error_str = str(e)
         if "429" in error_str or "quota" in error_str.lower() or "Quota exceeded" in error_str:
             retry_seconds = None
@@ -298,11 +306,8 @@ def revise_resume():
 # ==========================================================
 @ai_bp.route('/api/recommend-preferences', methods=['POST'])
 def recommend_preferences():
-    if not model:
-        return jsonify({"success": False, "error": "AI 模型未正確初始化"}), 500
-    
     # 檢查 API Key
-    if not api_key or not model:
+    if not ai_available():
         return jsonify({"success": False, "error": "AI 服務未正確配置 API Key。"}), 500
     
     # 權限檢查
@@ -349,14 +354,8 @@ def recommend_preferences():
         student_info = cursor.fetchone() or {}
         
         # 獲取課程成績
-        try:
-            cursor.execute("SHOW COLUMNS FROM course_grades LIKE 'ProofImage'")
-            has_proof_image = cursor.fetchone() is not None
-            cursor.execute("SHOW COLUMNS FROM course_grades LIKE 'transcript_path'")
-            has_transcript_path = cursor.fetchone() is not None
-        except:
-            has_proof_image = False
-            has_transcript_path = False
+        has_proof_image = has_column('course_grades', 'ProofImage')
+        has_transcript_path = has_column('course_grades', 'transcript_path')
         
         if has_proof_image:
             cursor.execute("SELECT CourseName, Credits, Grade, ProofImage FROM course_grades WHERE StuID=%s", (student_id,))
@@ -373,14 +372,9 @@ def recommend_preferences():
                 break
         
         # 獲取證照
-        try:
-            cursor.execute("SHOW COLUMNS FROM student_certifications")
-            cert_columns = {row["Field"] for row in cursor.fetchall()}
-            has_cert_path = 'CertPath' in cert_columns
-            has_cert_photo_path = 'CertPhotoPath' in cert_columns
-            cert_path_field = 'CertPath' if has_cert_path else ('CertPhotoPath' if has_cert_photo_path else None)
-        except:
-            cert_path_field = None
+        has_cert_path = has_column('student_certifications', 'CertPath')
+        has_cert_photo_path = has_column('student_certifications', 'CertPhotoPath')
+        cert_path_field = 'CertPath' if has_cert_path else ('CertPhotoPath' if has_cert_photo_path else None)
         
         try:
             cert_path_select = f"sc.{cert_path_field} AS CertPath" if cert_path_field else "NULL AS CertPath"
@@ -724,15 +718,14 @@ def recommend_preferences():
   ]
 }}
 """
-        response = model.generate_content(
+        ai_response_text = generate_text(
             prompt,
             generation_config={
                 "response_mime_type": "application/json",
                 "temperature": 0.2
-            }
-        )
-
-        ai_response_text = response.text.strip()
+            },
+            user_id=session.get("user_id")
+        ).strip()
         if ai_response_text.startswith('```json'):
             ai_response_text = ai_response_text[7:]
         if ai_response_text.startswith('```'):
@@ -840,6 +833,8 @@ def recommend_preferences():
 
     except Exception as e:
         traceback.print_exc()
+        if isinstance(e, AIGatewayError) and e.error_type != "quota_exceeded":
+            return _gateway_error_response(e, with_success=True)
         error_str = str(e)
         if "429" in error_str or "quota" in error_str.lower() or "Quota exceeded" in error_str:
             retry_seconds = None
@@ -1281,30 +1276,37 @@ def _normalize_transcript_json_payload(parsed):
     return out, meta
 
 
-def _gemini_try_transcript_json(model_instance, img_data, mimetype):
+def _gemini_try_transcript_json(model_name, img_data, mimetype, user_id=None):
     """請模型以 application/json 回傳；失敗回傳 None。"""
     try:
         generation_config = {"temperature": 0.05, "response_mime_type": "application/json"}
-        response = model_instance.generate_content(
+        text = generate_text(
             [
                 {"mime_type": mimetype or "image/jpeg", "data": img_data},
                 build_transcript_json_prompt(),
             ],
+            model_name=model_name,
             generation_config=generation_config,
+            user_id=user_id,
         )
-        if not response or not getattr(response, "text", None):
+        if not text:
             return None
-        raw = response.text.strip()
+        raw = text.strip()
         parsed = json.loads(raw)
         if not isinstance(parsed, dict):
             return None
         return parsed
+    except AIGatewayError as e:
+        if e.error_type in OCR_GATEWAY_REFUSALS:
+            raise
+        print(f"⚠️ JSON 模式辨識失敗: {e}")
+        return None
     except Exception as e:
         print(f"⚠️ JSON 模式辨識失敗: {e}")
         return None
 
 
-def _gemini_try_transcript_markdown(model_instance, img_data, mimetype):
+def _gemini_try_transcript_markdown(model_name, img_data, mimetype, user_id=None):
     """舊版 Markdown 表格輸出（備援）。"""
     ref_block = _format_core_reference_for_prompt()
     prompt = f"""
@@ -1327,16 +1329,18 @@ def _gemini_try_transcript_markdown(model_instance, img_data, mimetype):
    - 如果圖片模糊、無法辨識文字或根本不是成績單，請輸出：「[無法辨識] 請重新拍攝更清晰的圖片上傳。」
    - **請在輸出的最後一行（單獨一行）評估本次辨識的準確率（信心度），格式為：「信心度：[0-100]」**
 """
-    response = model_instance.generate_content(
+    text = generate_text(
         [
             {"mime_type": mimetype or "image/jpeg", "data": img_data},
             prompt,
-        ]
+        ],
+        model_name=model_name,
+        user_id=user_id,
     )
-    if not response or not response.text:
+    if not text:
         return None, None
 
-    gemini_text = response.text.strip()
+    gemini_text = text.strip()
     gemini_conf = 95.0
     confidence_match = re.search(r"信心度：\s*(\d+)", gemini_text.split("\n")[-1])
     if confidence_match:
@@ -1348,6 +1352,194 @@ def _gemini_try_transcript_markdown(model_instance, img_data, mimetype):
     return gemini_text, gemini_conf
 
 
+# ==========================================================
+# 成績單 OCR 流程：前處理一次 → 多模型競速 → 依圖片內容快取
+# ==========================================================
+OCR_CANDIDATE_MODELS = [
+    'gemini-2.5-flash',
+    'gemini-1.5-flash',
+    'gemini-1.5-pro',
+    'gemini-2.0-flash-exp',
+]
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2000"))
+OCR_HEDGE_SECONDS = float(os.getenv("OCR_HEDGE_SECONDS", "8"))  # 目前模型超過此秒數未回應，就同時啟動下一個模型
+OCR_DEADLINE_SECONDS = float(os.getenv("OCR_DEADLINE_SECONDS", "90"))
+OCR_MAX_INFLIGHT = int(os.getenv("OCR_MAX_INFLIGHT", "2"))  # 同一張圖同時進行的模型呼叫上限（含 hedge）
+OCR_MAX_ATTEMPTS = int(os.getenv("OCR_MAX_ATTEMPTS", "3"))  # 同一張圖最多呼叫幾個模型（熔斷中、未實際呼叫的不計）
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "8"))
+OCR_RESULT_CACHE_SIZE = int(os.getenv("OCR_RESULT_CACHE_SIZE", "200"))
+# 閘道拒絕（沒有實際呼叫模型）：不算模型失敗；使用者頻率限制 / 忙碌換模型也一樣，直接回報給使用者
+OCR_GATEWAY_REFUSALS = ("rate_limited", "busy", "circuit_open")
+
+_ocr_executor = ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix="ocr")
+# 執行中的 OCR 呼叫數（含競速結束後被放棄、仍在背景執行的呼叫）；沒有空位時不再 hedge
+_ocr_slots = threading.BoundedSemaphore(OCR_WORKERS)
+_ocr_lock = threading.Lock()
+_ocr_preferred_model = None  # 最近一次成功的模型，下次優先使用
+_ocr_results = OrderedDict()  # (圖片雜湊, prompt 雜湊) -> 辨識結果
+
+
+def _preprocess_transcript_image(img_data):
+    """
+    轉正、縮到 OCR_MAX_SIDE、灰階並拉開對比後以 JPEG 重新編碼，只做一次、所有模型共用。
+    回傳 (bytes, mimetype)；無法解析時回傳 (None, None)，由呼叫端改送原圖。
+    """
+    try:
+        with Image.open(io.BytesIO(img_data)) as img:
+            img = ImageOps.exif_transpose(img).convert("L")
+            if max(img.size) > OCR_MAX_SIDE:
+                img.thumbnail((OCR_MAX_SIDE, OCR_MAX_SIDE), Image.LANCZOS)
+            img = ImageOps.autocontrast(img, cutoff=1)
+            img = ImageEnhance.Contrast(img).enhance(1.2)
+            out = io.BytesIO()
+            img.save(out, "JPEG", quality=90, optimize=True)
+        data = out.getvalue()
+        print(f"🖼️ OCR 圖片前處理: {len(img_data) // 1024}KB → {len(data) // 1024}KB")
+        return data, "image/jpeg"
+    except Exception as e:
+        print(f"⚠️ OCR 圖片前處理失敗，改送原圖: {e}")
+        return None, None
+
+
+def _ocr_cache_key(img_data):
+    prompt_digest = hashlib.sha1(build_transcript_json_prompt().encode("utf-8")).hexdigest()[:12]
+    return hashlib.sha256(img_data).hexdigest(), prompt_digest
+
+
+def _ocr_cache_get(key):
+    with _ocr_lock:
+        result = _ocr_results.get(key)
+        if result is not None:
+            _ocr_results.move_to_end(key)
+        return result
+
+
+def _ocr_cache_set(key, result):
+    with _ocr_lock:
+        _ocr_results[key] = result
+        _ocr_results.move_to_end(key)
+        while len(_ocr_results) > OCR_RESULT_CACHE_SIZE:
+            _ocr_results.popitem(last=False)
+
+
+def _ocr_attempt(model_name, img_data, mimetype, user_id=None, markdown_fallback=True):
+    """
+    單一模型：先 JSON 結構化，失敗再 Markdown 備援（markdown_fallback=False 時不備援）；
+    成功回傳辨識結果 dict，否則 None；閘道拒絕（OCR_GATEWAY_REFUSALS）時拋出 AIGatewayError。
+    在 OCR 執行緒中執行（沒有 request context），user_id 由呼叫端先從 session 取出，計入該使用者的 AI 用量。
+    """
+    started = time.perf_counter()
+    try:
+        parsed = _gemini_try_transcript_json(model_name, img_data, mimetype, user_id=user_id)
+        if parsed is not None:
+            structured_courses, transcript_meta = _normalize_transcript_json_payload(parsed)
+            try:
+                conf_raw = parsed.get('confidence', 85)
+                gemini_conf = float(conf_raw) if conf_raw is not None else 85.0
+            except (TypeError, ValueError):
+                gemini_conf = 85.0
+            print(f"✅ 使用 Gemini AI ({model_name}) JSON 模式完成圖片辨識，courses={len(structured_courses)}，"
+                  f"{int((time.perf_counter() - started) * 1000)}ms")
+            return {
+                "text": _transcript_courses_to_markdown(structured_courses),
+                "confidence": gemini_conf,
+                "courses": structured_courses,
+                "transcript_meta": transcript_meta,
+                "model": model_name,
+            }
+
+        if not markdown_fallback:
+            return None
+        md_text, md_conf = _gemini_try_transcript_markdown(model_name, img_data, mimetype, user_id=user_id)
+        if md_text:
+            print(f"✅ 使用 Gemini AI ({model_name}) Markdown 備援完成圖片辨識，"
+                  f"{int((time.perf_counter() - started) * 1000)}ms")
+            return {"text": md_text, "confidence": md_conf, "courses": None, "transcript_meta": None, "model": model_name}
+    except AIGatewayError as e:
+        if e.error_type in OCR_GATEWAY_REFUSALS:
+            raise
+        print(f"⚠️ 模型 {model_name} 嘗試失敗: {e}")
+    except Exception as e:
+        print(f"⚠️ 模型 {model_name} 嘗試失敗: {e}")
+    return None
+
+
+def _race_ocr_models(img_data, mimetype, user_id=None):
+    """
+    依「最近成功的模型優先」的順序啟動；某模型失敗立即換下一個，超過 OCR_HEDGE_SECONDS 未回應則同時啟動下一個
+    （同時進行最多 OCR_MAX_INFLIGHT 個、總共最多 OCR_MAX_ATTEMPTS 個），取最先成功的結果。
+    可以 hedge 時每個模型只送 JSON 模式，不再追加 Markdown 備援呼叫。
+    熔斷中的模型直接跳過、不計次數；使用者頻率限制 / 服務忙碌不再換模型，所有呼叫結束仍無結果時拋出該 AIGatewayError
+    （所有模型都熔斷時亦同）。
+    超過 OCR_DEADLINE_SECONDS 仍無結果則回傳 None（其餘呼叫在背景結束後忽略，仍佔用 _ocr_slots 直到結束）。
+    """
+    global _ocr_preferred_model
+    preferred = _ocr_preferred_model
+    remaining = [preferred] if preferred in OCR_CANDIDATE_MODELS else []
+    remaining += [m for m in OCR_CANDIDATE_MODELS if m not in remaining]
+    markdown_fallback = OCR_MAX_INFLIGHT <= 1
+    deadline = time.monotonic() + OCR_DEADLINE_SECONDS
+    pending = {}
+    attempts = 0
+    gateway_error = None
+
+    def can_launch():
+        return remaining and attempts < OCR_MAX_ATTEMPTS and (
+            gateway_error is None or gateway_error.error_type == "circuit_open")
+
+    def launch(block):
+        """取得執行空位後啟動下一個模型；block=False 時沒有空位就放棄（不 hedge）"""
+        nonlocal attempts
+        if block:
+            acquired = _ocr_slots.acquire(timeout=max(0.0, deadline - time.monotonic()))
+        else:
+            acquired = _ocr_slots.acquire(blocking=False)
+        if not acquired:
+            return False
+        model_name = remaining.pop(0)
+        attempts += 1
+        print(f"OCR 嘗試使用模型: {model_name}")
+        future = _ocr_executor.submit(_ocr_attempt, model_name, img_data, mimetype, user_id, markdown_fallback)
+        future.add_done_callback(lambda _: _ocr_slots.release())
+        pending[future] = model_name
+        return True
+
+    if not launch(block=True):
+        raise AIGatewayError("AI 服務目前使用人數眾多，請稍後再試", "busy", 503, 10)
+    while pending:
+        time_left = deadline - time.monotonic()
+        if time_left <= 0:
+            print(f"❌ OCR 超過 {OCR_DEADLINE_SECONDS:.0f} 秒仍無結果")
+            return None
+        can_hedge = can_launch() and len(pending) < OCR_MAX_INFLIGHT
+        done, _ = wait(pending, timeout=min(OCR_HEDGE_SECONDS, time_left) if can_hedge else time_left,
+                       return_when=FIRST_COMPLETED)
+        if not done:
+            if can_hedge:
+                launch(block=False)
+            continue
+        for future in done:
+            model_name = pending.pop(future)
+            try:
+                result = future.result()
+            except AIGatewayError as e:
+                print(f"⚠️ 模型 {model_name} 未呼叫（{e.error_type}）: {e.message}")
+                if e.error_type == "circuit_open":
+                    attempts -= 1  # 熔斷中的模型沒有實際呼叫，不計入次數
+                if gateway_error is None or gateway_error.error_type == "circuit_open":
+                    gateway_error = e
+                result = None
+            if result:
+                _ocr_preferred_model = result["model"]
+                return result
+            if can_launch() and len(pending) < OCR_MAX_INFLIGHT:
+                launch(block=not pending)
+    # 有模型實際呼叫過仍失敗時回傳 None；全部熔斷或被頻率限制擋下時回報閘道錯誤
+    if gateway_error is not None and (gateway_error.error_type != "circuit_open" or attempts == 0):
+        raise gateway_error
+    return None
+
+
 def perform_ocr_on_file(file_storage):
     """
     對上傳的檔案 (Image/PDF) 進行 OCR 或文字識別。
@@ -1373,81 +1565,59 @@ def perform_ocr_on_file(file_storage):
             "message": "伺服器未安裝 PDF 解析套件，無法處理 PDF 檔案。"
         }
 
-    # 2. 圖片處理：優先使用 Google Gemini AI（先 JSON 結構化，失敗再 Markdown 備援）
-    gemini_text = ""
-    gemini_conf = None
-    use_gemini = False
-    structured_courses = None
-    transcript_meta = None
-
-    local_api_key = os.getenv('GEMINI_API_KEY')
-
-    if local_api_key:
+    # 2. 圖片處理：Google Gemini AI（相同圖片直接回傳快取；否則前處理一次後多模型競速）
+    result = None
+    user_id = session.get('user_id')  # OCR 執行緒沒有 request context，先取出
+    if ai_available():
         try:
             file_storage.stream.seek(0)
             img_data = file_storage.read()
             file_storage.stream.seek(0)
 
-            genai.configure(api_key=local_api_key)
-
-            candidate_models = [
-                'gemini-2.5-flash',
-                'gemini-1.5-flash',
-                'gemini-1.5-pro',
-                'gemini-2.0-flash-exp',
-            ]
-            mimetype = file_storage.mimetype or 'image/jpeg'
-
-            for model_name in candidate_models:
-                try:
-                    print(f"OCR 嘗試使用模型: {model_name}")
-                    model_instance = genai.GenerativeModel(model_name)
-
-                    parsed = _gemini_try_transcript_json(model_instance, img_data, mimetype)
-                    if parsed is not None:
-                        structured_courses, transcript_meta = _normalize_transcript_json_payload(parsed)
-                        try:
-                            conf_raw = parsed.get('confidence', 85)
-                            gemini_conf = float(conf_raw) if conf_raw is not None else 85.0
-                        except (TypeError, ValueError):
-                            gemini_conf = 85.0
-                        gemini_text = _transcript_courses_to_markdown(structured_courses)
-                        use_gemini = True
-                        print(f"✅ 使用 Gemini AI ({model_name}) JSON 模式完成圖片辨識，courses={len(structured_courses)}")
-                        break
-
-                    md_text, md_conf = _gemini_try_transcript_markdown(model_instance, img_data, mimetype)
-                    if md_text:
-                        gemini_text = md_text
-                        gemini_conf = md_conf
-                        structured_courses = None
-                        transcript_meta = None
-                        use_gemini = True
-                        print(f"✅ 使用 Gemini AI ({model_name}) Markdown 備援完成圖片辨識")
-                        break
-                except Exception as inner_e:
-                    print(f"⚠️ 模型 {model_name} 嘗試失敗: {inner_e}")
-                    continue
-
-            if not use_gemini:
-                print("❌ 所有 Gemini 模型皆嘗試失敗")
+            cache_key = _ocr_cache_key(img_data)
+            result = _ocr_cache_get(cache_key)
+            if result is not None:
+                print(f"⚡ OCR 快取命中: {filename}")
+            else:
+                processed, processed_mimetype = _preprocess_transcript_image(img_data)
+                if processed:
+                    result = _race_ocr_models(processed, processed_mimetype, user_id=user_id)
+                else:
+                    result = _race_ocr_models(img_data, file_storage.mimetype or 'image/jpeg', user_id=user_id)
+                if result:
+                    _ocr_cache_set(cache_key, result)
+                else:
+                    print("❌ 所有 Gemini 模型皆嘗試失敗")
 
+        except AIGatewayError as e:
+            print(f"⚠️ Gemini OCR 閘道拒絕（{e.error_type}）: {e.message}")
+            file_storage.stream.seek(0)
+            return {
+                "success": False,
+                "filename": filename,
+                "size_kb": size_kb,
+                "text": "",
+                "confidence": None,
+                "message": e.message,
+                "error_type": e.error_type,
+                "retry_after": e.retry_after,
+            }
         except Exception as e:
             print(f"⚠️ Gemini OCR 系統性錯誤: {e}")
             file_storage.stream.seek(0)
 
-    if use_gemini and gemini_text:
+    if result and result.get("text"):
         payload = {
             "success": True,
             "filename": filename,
             "size_kb": size_kb,
-            "text": gemini_text,
-            "confidence": gemini_conf,
+            "text": result["text"],
+            "confidence": result["confidence"],
         }
-        if structured_courses is not None:
-            payload["courses"] = structured_courses
-        if transcript_meta:
-            payload["transcript_meta"] = transcript_meta
+        if result.get("courses") is not None:
+            payload["courses"] = result["courses"]
+        if result.get("transcript_meta"):
+            payload["transcript_meta"] = result["transcript_meta"]
         return payload
 
     # 3. 圖片處理：AI 辨識失敗
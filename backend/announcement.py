@@ -6,6 +6,8 @@ import traceback
 import re
 import os
 from semester import get_current_semester_deadline
+from notification import notify_users, refresh_unread_counts, publish_unread_change
+from schema_cache import has_column, refresh_schema_cache, execute_ddl
 
 
 # 註：此處需根據你的資料庫實作匯入模型，例如：from models import Announcement
@@ -235,17 +237,11 @@ def get_announcement(ann_id):
         traceback.print_exc()
         return jsonify({"success": False, "message": "載入失敗"}), 500
 
-# --- API：列出公告並自動檢查預約發布 ---
+# --- API：列出公告（預約發布與截止提醒由排程 run_announcement_jobs 處理） ---
 @announcement_bp.route("/api/list", methods=["GET"])
 def list_announcements():
     try:
         conn = get_db()
-        # 關鍵：進入列表時，自動掃描並補發「時間已到但尚未通知」的公告
-        check_and_push_scheduled_announcements(conn)
-        
-        # 同步檢查截止提醒 (統一標題為公告)
-        maybe_push_deadline_reminders(conn)
-
         cursor = conn.cursor(dictionary=True)
         cursor.execute("SELECT * FROM announcement ORDER BY created_at DESC")
         rows = cursor.fetchall() or []
@@ -409,13 +405,18 @@ def update_announcement(ann_id):
         cursor = conn.cursor(dictionary=True, buffered=True)
         
         # 更新資料庫中的公告資訊
+        # 截止時間變更時重新發送截止提醒
+        reset_announcement_reminder(cursor, ann_id, end_time)
         cursor.execute("""
             UPDATE announcement 
             SET title=%s, content=%s, start_time=%s, end_time=%s, is_published=%s
             WHERE id=%s
         """, (title, content, start_time, end_time, is_published, ann_id))
-        
+        # 公告起訖時間可能改變，鈴鐺未讀數需重新計算
+        refresh_unread_counts(cursor)
+
         conn.commit()
+        publish_unread_change()
 
         # 公告附件：先刪除舊的再寫入新的（路徑為 uploads/announcements）
         attachments = data.get("attachments") or []
@@ -463,8 +464,10 @@ def delete_announcement(ann_id):
         # 3. 同步刪除相關通知 (避免使用者點到已不存在的公告)
         link_url = f"/view_announcement/{ann_id}"
         cursor.execute("DELETE FROM notifications WHERE link_url = %s", (link_url,))
-        
+        refresh_unread_counts(cursor)
+
         conn.commit()
+        publish_unread_change()
         cursor.close()
         conn.close()
         
@@ -480,6 +483,7 @@ def push_announcement_notifications(conn, title, content, ann_id, target_roles=N
     - target_roles: 可選，若提供則只對這些角色的使用者建立通知
       例如 ["student", "teacher"]。
       若為空或 None，則維持原本邏輯：對所有使用者建立通知。
+    回傳是否成功（失敗時已 rollback）。
     """
     cursor = None
     try:
@@ -509,16 +513,6 @@ def push_announcement_notifications(conn, title, content, ann_id, target_roles=N
         if roles and "ta" not in roles:
             roles.append("ta")
 
-        if roles:
-            # 只取指定角色的使用者 + 科助
-            placeholders = ", ".join(["%s"] * len(roles))
-            cursor.execute(f"SELECT id FROM users WHERE role IN ({placeholders})", roles)
-        else:
-            # 未指定角色 → 所有人
-            cursor.execute("SELECT id FROM users")
-
-        users = cursor.fetchall() or []
-        
         # 獲取公告的最新內容和 end_time，用於格式化通知內容中的時間
         # 從資料庫中獲取最新的內容，確保內容完整且格式正確
         cursor.execute("""
@@ -714,104 +708,166 @@ def push_announcement_notifications(conn, title, content, ann_id, target_roles=N
             
             return message_content
         
-        # 為每個用戶創建通知記錄（如果還不存在）
-        for u in users:
-            uid = u['id'] if isinstance(u, dict) else u[0]
-            
-            # 檢查該用戶是否已有此公告的通知記錄
-            cursor.execute("""
-                SELECT id FROM notifications 
-                WHERE user_id = %s AND link_url = %s
-            """, (uid, link_url))
-            
-            existing = cursor.fetchone()
-            # 確保讀取完查詢結果（即使為空也要讀取）
-            
-            # 準備通知內容（先處理時間格式，再截斷，確保時間信息完整）
-            message_content = content if content else ""
-            
-            # 確保時間格式完整（無論是創建還是更新都要處理）
-            # 在截斷前先處理時間格式，確保時間信息不會被截斷
-            # 注意：如果內容中有「請選擇結束時間」，保留它；如果有錯誤的時間格式，替換為「請選擇結束時間」
-            if ann_info:
-                message_content = ensure_full_time_in_content(message_content, ann_info.get('end_time'))
-            
-            # 處理完時間格式後再截斷（保留足夠長度以包含完整的時間信息）
-            # 如果內容包含時間信息，確保截斷後仍包含完整的時間
-            if len(message_content) > 200:
-                # 檢查是否包含時間信息，如果包含，確保時間信息完整
-                time_pattern = r'截止時間為[：:]\s*\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}'
-                time_match = re.search(time_pattern, message_content)
-                if time_match:
-                    # 如果包含時間信息，截斷時確保時間信息完整
-                    time_end_pos = time_match.end()
-                    if time_end_pos <= 200:
-                        # 時間信息在200字符內，正常截斷
-                        message_content = message_content[:200]
-                    else:
-                        # 時間信息超過200字符，保留時間信息及前面的內容
-                        # 找到時間信息前的句子邊界，盡量保留完整句子
-                        before_time = message_content[:time_match.start()]
-                        if len(before_time) > 150:
-                            # 找到最後一個句號、逗號或換行符
-                            last_punct = max(
-                                before_time.rfind('。'),
-                                before_time.rfind('，'),
-                                before_time.rfind('.'),
-                                before_time.rfind(','),
-                                before_time.rfind('\n')
-                            )
-                            if last_punct > 100:  # 確保保留足夠的上下文
-                                message_content = before_time[:last_punct + 1] + message_content[time_match.start():time_match.end()]
-                            else:
-                                # 如果找不到合適的斷點，直接保留時間信息前的150字符
-                                message_content = before_time[:150] + '...' + message_content[time_match.start():time_match.end()]
-                        else:
-                            # 時間信息前的內容不長，完整保留
-                            message_content = before_time + message_content[time_match.start():time_match.end()]
-                else:
-                    # 不包含時間信息，正常截斷
+        # 準備通知內容（所有使用者相同，只處理一次；先處理時間格式，再截斷，確保時間信息完整）
+        message_content = content if content else ""
+
+        # 確保時間格式完整（無論是創建還是更新都要處理）
+        # 在截斷前先處理時間格式，確保時間信息不會被截斷
+        # 注意：如果內容中有「請選擇結束時間」，保留它；如果有錯誤的時間格式，替換為「請選擇結束時間」
+        if ann_info:
+            message_content = ensure_full_time_in_content(message_content, ann_info.get('end_time'))
+
+        # 處理完時間格式後再截斷（保留足夠長度以包含完整的時間信息）
+        # 如果內容包含時間信息，確保截斷後仍包含完整的時間
+        if len(message_content) > 200:
+            # 檢查是否包含時間信息，如果包含，確保時間信息完整
+            time_pattern = r'截止時間為[：:]\s*\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}'
+            time_match = re.search(time_pattern, message_content)
+            if time_match:
+                # 如果包含時間信息，截斷時確保時間信息完整
+                time_end_pos = time_match.end()
+                if time_end_pos <= 200:
+                    # 時間信息在200字符內，正常截斷
                     message_content = message_content[:200]
-            
-            if existing is None:
-                # 如果不存在，創建新通知
-                cursor.execute("""
-                    INSERT INTO notifications (user_id, title, message, category, link_url, is_read, created_at)
-                    VALUES (%s, %s, %s, %s, %s, 0, %s)
-                """, (uid, f"公告：{title}", message_content, category, link_url, now))
+                else:
+                    # 時間信息超過200字符，保留時間信息及前面的內容
+                    # 找到時間信息前的句子邊界，盡量保留完整句子
+                    before_time = message_content[:time_match.start()]
+                    if len(before_time) > 150:
+                        # 找到最後一個句號、逗號或換行符
+                        last_punct = max(
+                            before_time.rfind('。'),
+                            before_time.rfind('，'),
+                            before_time.rfind('.'),
+                            before_time.rfind(','),
+                            before_time.rfind('\n')
+                        )
+                        if last_punct > 100:  # 確保保留足夠的上下文
+                            message_content = before_time[:last_punct + 1] + message_content[time_match.start():time_match.end()]
+                        else:
+                            # 如果找不到合適的斷點，直接保留時間信息前的150字符
+                            message_content = before_time[:150] + '...' + message_content[time_match.start():time_match.end()]
+                    else:
+                        # 時間信息前的內容不長，完整保留
+                        message_content = before_time + message_content[time_match.start():time_match.end()]
             else:
-                # 如果已存在，更新通知時間為當前時間，並重置為未讀狀態
-                # 這樣已結束的公告修改後會重新出現在通知列表中，時間為修改時間
-                # 同時更新通知內容，確保內容中的時間資訊與公告一致
-                cursor.execute("""
-                    UPDATE notifications 
-                    SET created_at = %s, is_read = 0, title = %s, message = %s, category = %s
-                    WHERE id = %s
-                """, (now, f"公告：{title}", message_content, category, existing['id']))
+                # 不包含時間信息，正常截斷
+                message_content = message_content[:200]
+
+        # 批次寫入：指定角色（含科助）或所有人；已有此公告通知者更新內容、時間並重設為未讀，
+        # 這樣已結束的公告修改後會重新出現在通知列表中，時間為修改時間
+        notify_users(
+            title=f"公告：{title}",
+            message=message_content,
+            roles=roles or None,
+            all_users=not roles,
+            category=category,
+            link_url=link_url,
+            created_at=now,
+            refresh_existing=True,
+            conn=conn
+        )
+        mark_announcement_pushed(cursor, ann_id, now)
         
         conn.commit()
+        return True
     except Exception:
         traceback.print_exc()
         if conn:
             conn.rollback()
+        return False
     finally:
         if cursor:
             cursor.close()
 
-# --- 自動檢查：預約時間已到的公告 ---
+# --- 推播狀態：pushed_at（已推播到通知頁面）/ reminder_sent_at（已發送截止提醒） ---
+
+def ensure_announcement_push_columns(cursor, conn):
+    """
+    確保 announcement 有推播狀態欄位；新增欄位時依既有通知回填，避免舊公告被重複推播。
+    多個程序同時執行時，晚到的 ALTER 遇到欄位已存在視為成功；不論成功與否都重新載入結構快取
+    """
+    if has_column('announcement', 'pushed_at') and has_column('announcement', 'reminder_sent_at'):
+        return
+    try:
+        if not has_column('announcement', 'pushed_at'):
+            if execute_ddl(cursor, "ALTER TABLE announcement ADD COLUMN pushed_at DATETIME NULL"):
+                cursor.execute("""
+                    UPDATE announcement a
+                    SET a.pushed_at = a.created_at
+                    WHERE EXISTS (
+                        SELECT 1 FROM notifications n
+                        WHERE n.link_url = CONCAT('/view_announcement/', a.id)
+                    )
+                """)
+                print("✅ announcement 已新增 pushed_at 欄位")
+            execute_ddl(cursor, "CREATE INDEX idx_announcement_pending_push ON announcement (is_published, pushed_at, start_time)")
+        if not has_column('announcement', 'reminder_sent_at'):
+            if execute_ddl(cursor, "ALTER TABLE announcement ADD COLUMN reminder_sent_at DATETIME NULL"):
+                # 舊邏輯：已有同標題通知即視為已提醒
+                cursor.execute("""
+                    UPDATE announcement a
+                    SET a.reminder_sent_at = a.created_at
+                    WHERE EXISTS (
+                        SELECT 1 FROM notifications n WHERE n.title = CONCAT('公告：', a.title)
+                    )
+                """)
+                print("✅ announcement 已新增 reminder_sent_at 欄位")
+        conn.commit()
+    finally:
+        refresh_schema_cache(cursor)
+
+
+def mark_announcement_pushed(cursor, ann_id, pushed_at=None):
+    """標記公告已推播（不 commit）；欄位尚未建立時略過"""
+    if not has_column('announcement', 'pushed_at'):
+        return
+    cursor.execute("""
+        UPDATE announcement SET pushed_at = COALESCE(pushed_at, %s) WHERE id = %s
+    """, (pushed_at or get_taiwan_time(), ann_id))
+
+
+def reset_announcement_reminder(cursor, ann_id, end_time):
+    """公告截止時間變更時清除 reminder_sent_at（需在 UPDATE end_time 之前呼叫）"""
+    if not has_column('announcement', 'reminder_sent_at'):
+        return
+    cursor.execute("""
+        UPDATE announcement SET reminder_sent_at = NULL
+        WHERE id = %s AND NOT (end_time <=> %s)
+    """, (ann_id, end_time))
+
+
+def _claim_and_push(cursor, conn, column, ann_id, now, push):
+    """
+    搶佔與推播在同一個 transaction：條件式 UPDATE 鎖住公告列但不 commit（其他程序的排程會等待，
+    之後看到 column 已有值而略過），push() 寫入通知後連同 column 一起 commit。
+    push() 失敗或程序在推播途中結束時整個 transaction rollback，column 仍為 NULL，下一輪排程重試。
+    錯誤只記錄，不中斷其他公告的推播。回傳是否成功推播。
+    """
+    try:
+        cursor.execute(f"""
+            UPDATE announcement SET {column} = %s WHERE id = %s AND {column} IS NULL
+        """, (now, ann_id))
+        if cursor.rowcount == 0:
+            conn.rollback()
+            return False
+        if push():
+            return True
+    except Exception:
+        traceback.print_exc()
+    conn.rollback()
+    print(f"⚠️ [announcement] 公告 {ann_id} 推播失敗（{column}），下次排程重試")
+    return False
+
+
+# --- 排程：預約時間已到的公告 ---
 def check_and_push_scheduled_announcements(conn):
     now_tw = get_taiwan_time()
-    cursor = conn.cursor(dictionary=True)
-    # 尋找：已勾選發布、時間已到、但在通知頁面還沒出現的公告
-    # 注意：需要檢查所有類別的通知（announcement、experience、ranking、resume等），不只是 announcement
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    # 尋找：已勾選發布、時間已到、尚未推播的公告
     cursor.execute("""
         SELECT id, title, content, target_role FROM announcement 
-        WHERE is_published = 1 AND start_time <= %s
-        AND id NOT IN (
-            SELECT DISTINCT CAST(SUBSTRING_INDEX(link_url, '/', -1) AS UNSIGNED) 
-            FROM notifications 
-            WHERE link_url LIKE '/view_announcement/%'
-        )
+        WHERE is_published = 1 AND pushed_at IS NULL AND start_time <= %s
     """, (now_tw,))
     pending = cursor.fetchall() or []
     for ann in pending:
@@ -822,8 +878,49 @@ def check_and_push_scheduled_announcements(conn):
             # 否則只發送給指定角色
             if ann['target_role'] != 'all':
                 target_roles = [ann['target_role']]
-        push_announcement_notifications(conn, ann['title'], ann['content'], ann['id'], target_roles=target_roles)
+        _claim_and_push(cursor, conn, 'pushed_at', ann['id'], now_tw, lambda: push_announcement_notifications(
+            conn, ann['title'], ann['content'], ann['id'], target_roles=target_roles))
+    cursor.close()
+    return len(pending)
+
+
+# --- 排程：截止提醒 (統一為公告標題) ---
+def maybe_push_deadline_reminders(conn, hours_before=24):
+    now = get_taiwan_time()
+    cutoff_end = now + timedelta(hours=hours_before)
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    cursor.execute("""
+        SELECT id, title, end_time FROM announcement
+        WHERE is_published = 1 AND reminder_sent_at IS NULL
+          AND end_time IS NOT NULL AND end_time BETWEEN %s AND %s
+    """, (now, cutoff_end))
+    rows = cursor.fetchall() or []
+    for row in rows:
+        _claim_and_push(cursor, conn, 'reminder_sent_at', row['id'], now, lambda: push_announcement_notifications(
+            conn, row['title'], f"內容將於 {row['end_time']} 截止", row['id']))
     cursor.close()
+    return len(rows)
+
+
+def run_announcement_jobs():
+    """排程任務（app.py APScheduler）：推播預約時間已到的公告、發送截止提醒"""
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        ensure_announcement_push_columns(cursor, conn)
+        cursor.close()
+        cursor = None
+        published = check_and_push_scheduled_announcements(conn)
+        reminded = maybe_push_deadline_reminders(conn)
+        if published or reminded:
+            print(f"📢 [announcement] 推播預約公告 {published} 則，截止提醒 {reminded} 則")
+    except Exception as e:
+        print(f"❌ [announcement] 公告排程錯誤: {e}")
+        traceback.print_exc()
+    finally:
+        if cursor:
+            cursor.close()
+        conn.close()
 
 # --- API：儲存作業截止時間 ---
 @announcement_bp.route("/api/save_deadlines", methods=["POST"])
@@ -902,6 +999,8 @@ def save_deadlines():
             # 檢查是否已存在相同類型的公告（通過標題匹配）
             if edit_id:
                 # 編輯模式：更新現有公告
+                # 截止時間變更時重新發送截止提醒
+                reset_announcement_reminder(cursor, edit_id, end_dt)
                 cursor.execute("""
                     UPDATE announcement 
                     SET title=%s, content=%s, start_time=%s, end_time=%s, is_published=%s
@@ -922,6 +1021,8 @@ def save_deadlines():
                 if existing:
                     # 更新現有公告
                     ann_id = existing[0]
+                    # 截止時間變更時重新發送截止提醒
+                    reset_announcement_reminder(cursor, ann_id, end_dt)
                     cursor.execute("""
                         UPDATE announcement 
                         SET title=%s, content=%s, start_time=%s, end_time=%s, is_published=%s
@@ -966,6 +1067,8 @@ def save_deadlines():
             # 檢查是否已存在相同類型的公告（通過標題匹配）
             if edit_id:
                 # 編輯模式：更新現有公告
+                # 截止時間變更時重新發送截止提醒
+                reset_announcement_reminder(cursor, edit_id, end_dt)
                 cursor.execute("""
                     UPDATE announcement 
                     SET title=%s, content=%s, start_time=%s, end_time=%s, is_published=%s
@@ -986,6 +1089,8 @@ def save_deadlines():
                 if existing:
                     # 更新現有公告
                     ann_id = existing[0]
+                    # 截止時間變更時重新發送截止提醒
+                    reset_announcement_reminder(cursor, ann_id, end_dt)
                     cursor.execute("""
                         UPDATE announcement 
                         SET title=%s, content=%s, start_time=%s, end_time=%s, is_published=%s
@@ -1030,6 +1135,8 @@ def save_deadlines():
             # 檢查是否已存在相同類型的公告（通過標題匹配）
             if edit_id:
                 # 編輯模式：更新現有公告
+                # 截止時間變更時重新發送截止提醒
+                reset_announcement_reminder(cursor, edit_id, end_dt)
                 cursor.execute("""
                     UPDATE announcement 
                     SET title=%s, content=%s, start_time=%s, end_time=%s, is_published=%s
@@ -1050,6 +1157,8 @@ def save_deadlines():
                 if existing:
                     # 更新現有公告
                     ann_id = existing[0]
+                    # 截止時間變更時重新發送截止提醒
+                    reset_announcement_reminder(cursor, ann_id, end_dt)
                     cursor.execute("""
                         UPDATE announcement 
                         SET title=%s, content=%s, start_time=%s, end_time=%s, is_published=%s
@@ -1094,6 +1203,8 @@ def save_deadlines():
             # 檢查是否已存在相同類型的公告（通過標題匹配）
             if edit_id:
                 # 編輯模式：更新現有公告
+                # 截止時間變更時重新發送截止提醒
+                reset_announcement_reminder(cursor, edit_id, end_dt)
                 cursor.execute("""
                     UPDATE announcement 
                     SET title=%s, content=%s, start_time=%s, end_time=%s, is_published=%s
@@ -1114,6 +1225,8 @@ def save_deadlines():
                 if existing:
                     # 更新現有公告
                     ann_id = existing[0]
+                    # 截止時間變更時重新發送截止提醒
+                    reset_announcement_reminder(cursor, ann_id, end_dt)
                     cursor.execute("""
                         UPDATE announcement 
                         SET title=%s, content=%s, start_time=%s, end_time=%s, is_published=%s
@@ -1343,19 +1456,4 @@ def check_deadline():
         traceback.print_exc()
         return jsonify({"success": False, "message": f"檢查失敗：{str(e)}"}), 500
 
-# --- 自動化功能：截止提醒 (統一為公告標題) ---
-def maybe_push_deadline_reminders(conn, hours_before=24):
-    now = get_taiwan_time()
-    cutoff_end = now + timedelta(hours=hours_before)
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT id, title, end_time FROM announcement
-        WHERE is_published = 1 AND end_time IS NOT NULL AND end_time BETWEEN %s AND %s
-    """, (now, cutoff_end))
-    rows = cursor.fetchall() or []
-    for row in rows:
-        reminder_title = f"公告：{row['title']}"
-        cursor.execute("SELECT 1 FROM notifications WHERE title = %s LIMIT 1", (reminder_title,))
-        if cursor.fetchone(): continue
-        push_announcement_notifications(conn, row['title'], f"內容將於 {row['end_time']} 截止", row['id'])
 
@@ -149,6 +149,8 @@ def upload_standard_courses_page():
 # -------------------------
 from flask_apscheduler import APScheduler
 from semester import check_auto_switch
+from deadline_engine import run_deadline_sweeps
+from announcement import run_announcement_jobs
 
 scheduler = APScheduler()
 
@@ -160,13 +162,59 @@ class SchedulerConfig:
             'func': check_auto_switch,
             'trigger': 'interval',
             'minutes': 60  # 每 60 分鐘檢查一次
+        },
+        {
+            'id': 'deadline_sweep_job',
+            'func': run_deadline_sweeps,
+            'trigger': 'interval',
+            'minutes': 1,  # 截止時間跨越後一分鐘內完成狀態轉換（每個截止時間只執行一次）
+            'max_instances': 1,
+            'coalesce': True
+        },
+        {
+            'id': 'announcement_publish_job',
+            'func': run_announcement_jobs,
+            'trigger': 'interval',
+            'minutes': 1,  # 推播預約時間已到的公告、發送截止前 24 小時提醒（各只執行一次）
+            'max_instances': 1,
+            'coalesce': True
         }
     ]
     SCHEDULER_API_ENABLED = True
 
 app.config.from_object(SchedulerConfig())
 scheduler.init_app(app)
-scheduler.start()
+
+# -------------------------
+# 啟動初始化（資料庫、快取、字型、排程器與背景 worker）
+# -------------------------
+# 以 python app.py 啟動時，履歷渲染 process pool（spawn）的 worker 會以 __mp_main__ 重新載入本檔；
+# 所有有副作用的初始化只在主程序執行，worker 只需要 resume_docx / resume_render 的程式碼
+if __name__ != "__mp_main__":
+    # 資料庫連線池：request 結束時歸還共用連線
+    from config import init_db
+    init_db(app)
+
+    # 資料庫結構快取：啟動時載入一次（失敗則於第一次查詢時再載入）
+    from schema_cache import refresh_schema_cache
+    try:
+        refresh_schema_cache()
+    except Exception as e:
+        print(f"⚠️ 載入資料庫結構快取失敗，將於首次使用時重試: {e}")
+
+    # PDF 中文字型：啟動時註冊一次（PDF_CJK_FONT_PATHS 可指定字型檔）
+    from pdf_render import init_pdf_fonts
+    init_pdf_fonts()
+
+    scheduler.start()
+
+    # 郵件佇列 worker：啟動時接手上次未發送完的 pending 郵件
+    from email_service import start_email_workers
+    start_email_workers()
+
+    # 履歷產生 worker：處理 /api/submit_and_generate 排入的工作
+    from resume_jobs import start_resume_job_workers
+    start_resume_job_workers()
 
 # -------------------------
 # 主程式入口
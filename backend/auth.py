@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, render_template, session, redirect, url_for
 from werkzeug.security import check_password_hash, generate_password_hash
-from config import get_db
+from config import get_db, get_request_db
+from notification import notify_users, publish_unread_change
 from flask import current_app
 import json
 import re
@@ -16,7 +17,7 @@ auth_bp = Blueprint("auth_bp", __name__)
 # =========================================================
 def check_is_homeroom(user_id):
     """查詢用戶是否在 classes_teacher 中擔任班導師角色（role = 'classteacher'）"""
-    conn = get_db()
+    conn = get_request_db()
     cursor = conn.cursor(dictionary=True)
     is_homeroom = False
     try:
@@ -38,59 +39,26 @@ def check_is_homeroom(user_id):
 # 輔助函式：發送通知給所有科助
 # =========================================================
 def notify_all_ta(conn, title, message, link_url=None, category="general"):
-    """發送通知給所有科助（role='ta'）"""
-    cursor = None
-    try:
-        cursor = conn.cursor()
-        # 查詢所有科助的 user_id
-        cursor.execute("SELECT id FROM users WHERE role = 'ta'")
-        ta_users = cursor.fetchall()
-        
-        # 為每個科助創建通知
-        for ta_user in ta_users:
-            ta_user_id = ta_user[0]
-            cursor.execute("""
-                INSERT INTO notifications (user_id, title, message, category, link_url, is_read, created_at)
-                VALUES (%s, %s, %s, %s, %s, 0, NOW())
-            """, (ta_user_id, title, message, category, link_url))
-        
-        # 注意：不在此處 commit，由調用者負責 commit
-        if cursor:
-            cursor.close()
-    except Exception as e:
-        if cursor:
-            cursor.close()
-        print(f"❌ 發送科助通知錯誤: {e}")
-        # 不影響主流程，只記錄錯誤
+    """
+    發送通知給所有科助（role='ta'）
+    不在此處 commit 與推播：錯誤直接拋出，由調用者 rollback；
+    調用者 commit 後以 publish_unread_change(**result["publish"]) 推播
+    """
+    # 一次 INSERT ... SELECT 寫入所有科助的通知
+    return notify_users(title, message, roles=['ta'], category=category, link_url=link_url,
+                        auto_category=False, conn=conn)
 
 # =========================================================
 # 輔助函式：發送通知給所有主任
 # =========================================================
 def notify_all_directors(conn, title, message, link_url=None, category="general"):
-    """發送通知給所有主任（role='director'）"""
-    cursor = None
-    try:
-        cursor = conn.cursor()
-        # 查詢所有主任的 user_id
-        cursor.execute("SELECT id FROM users WHERE role = 'director'")
-        director_users = cursor.fetchall()
-        
-        # 為每個主任創建通知
-        for director_user in director_users:
-            director_user_id = director_user[0]
-            cursor.execute("""
-                INSERT INTO notifications (user_id, title, message, category, link_url, is_read, created_at)
-                VALUES (%s, %s, %s, %s, %s, 0, NOW())
-            """, (director_user_id, title, message, category, link_url))
-        
-        # 注意：不在此處 commit，由調用者負責 commit
-        if cursor:
-            cursor.close()
-    except Exception as e:
-        if cursor:
-            cursor.close()
-        print(f"❌ 發送主任通知錯誤: {e}")
-        # 不影響主流程，只記錄錯誤
+    """
+    發送通知給所有主任（role='director'）
+    與 notify_all_ta 相同：錯誤直接拋出，調用者 commit 後再推播
+    """
+    # 一次 INSERT ... SELECT 寫入所有主任的通知
+    return notify_users(title, message, roles=['director'], category=category, link_url=link_url,
+                        auto_category=False, conn=conn)
 
 # =========================================================
 # API - 登入
@@ -492,10 +460,15 @@ def register_company():
         title = "新廠商註冊通知"
         message = f"有新的廠商已完成註冊：\n帳號：{username}\nEmail：{email}\n請前往管理頁面留意後續合作。"
         link_url = "/admin/user_management"
-        notify_all_ta(conn, title, message, link_url, category="company")
-        notify_all_directors(conn, title, message, link_url, category="company")
+        notified = [
+            notify_all_ta(conn, title, message, link_url, category="company"),
+            notify_all_directors(conn, title, message, link_url, category="company"),
+        ]
         
         conn.commit()
+        for result in notified:
+            if result["publish"]:
+                publish_unread_change(**result["publish"])
 
         # 註冊完成後直接建立登入 Session
         session.clear()
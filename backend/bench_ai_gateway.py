@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ai_gateway 行為與效能檢查（使用 FakeBackend，不連網路、不耗用 Gemini 配額）
+
+- 快取：相同 prompt 第二次呼叫不經過模型
+- 併發：N 個執行緒同時呼叫時，同時進行的模型呼叫不超過 AI_MAX_CONCURRENCY
+- 斷路器：模型連續失敗後暫停，期間不再呼叫後端
+用法：python bench_ai_gateway.py [執行緒數]   （預設 20）
+"""
+
+import sys
+import threading
+import time
+
+import ai_gateway
+from ai_gateway import AIGatewayError, FakeBackend, generate_text, gateway_stats, set_backend
+
+LATENCY = 0.2
+
+
+class CountingBackend(FakeBackend):
+    """記錄同時進行的呼叫數峰值"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.active = 0
+        self.peak = 0
+        self._active_lock = threading.Lock()
+
+    def generate(self, model_name, contents, generation_config=None, timeout=None):
+        with self._active_lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            return super().generate(model_name, contents, generation_config, timeout)
+        finally:
+            with self._active_lock:
+                self.active -= 1
+
+
+def bench_cache():
+    backend = CountingBackend(latency=LATENCY)
+    set_backend(backend)
+    prompt = "[任務] 美化以下自傳 [原始文本] 我是一位資管系學生"
+    started = time.perf_counter()
+    generate_text(prompt)
+    miss_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    generate_text(prompt)
+    hit_ms = (time.perf_counter() - started) * 1000
+    generate_text(prompt, generation_config={"temperature": 0.2})
+    print(f"快取：miss {miss_ms:.1f}ms / hit {hit_ms:.2f}ms，後端呼叫 {backend.calls} 次（預期 2）")
+
+
+def bench_concurrency(threads):
+    backend = CountingBackend(latency=LATENCY)
+    set_backend(backend)
+    errors = []
+
+    def worker(i):
+        try:
+            generate_text(f"prompt {i}", user_id=i)
+        except AIGatewayError as e:
+            errors.append(e.error_type)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    expected = LATENCY * -(-threads // ai_gateway.AI_MAX_CONCURRENCY)
+    print(f"併發：{threads} 個請求 {elapsed:.2f}s（理論 {expected:.2f}s），"
+          f"同時呼叫峰值 {backend.peak}（上限 {ai_gateway.AI_MAX_CONCURRENCY}），拒絕 {len(errors)} 筆 {set(errors) or ''}")
+
+
+def bench_user_limit():
+    set_backend(CountingBackend(latency=LATENCY))
+    results = []
+
+    def worker(i):
+        try:
+            generate_text(f"same user {i}", user_id="u1")
+            results.append("ok")
+        except AIGatewayError as e:
+            results.append(e.error_type)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(ai_gateway.AI_USER_RATE_PER_MINUTE + 2)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    print(f"單一使用者：{len(pool)} 次呼叫 → 成功 {results.count('ok')}，"
+          f"超過每分鐘上限 {results.count('rate_limited')}（上限 {ai_gateway.AI_USER_RATE_PER_MINUTE}）")
+
+
+def bench_breaker():
+    backend = CountingBackend(fail_models={"bad-model"})
+    set_backend(backend)
+    outcomes = []
+    for i in range(ai_gateway.AI_BREAKER_THRESHOLD + 3):
+        try:
+            generate_text(f"x{i}", model_name="bad-model")
+        except AIGatewayError as e:
+            outcomes.append(e.error_type)
+    print(f"斷路器：{len(outcomes)} 次呼叫，後端實際呼叫 {backend.calls} 次（門檻 {ai_gateway.AI_BREAKER_THRESHOLD}），"
+          f"circuit_open {outcomes.count('circuit_open')} 次")
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    bench_cache()
+    bench_concurrency(threads)
+    bench_user_limit()
+    bench_breaker()
+    print(f"統計：{gateway_stats()}")
+
+
+if __name__ == "__main__":
+    main()
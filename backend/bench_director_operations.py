@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+主任批次調整規劃檢查（_plan_director_operations，純記憶體，不連資料庫）
+
+以固定的快照資料逐一驗證 swap / remove / promote / move / add 的規劃結果，
+並量測大量操作時的規劃耗時。任何檢查不符即以 AssertionError 結束。
+用法：python bench_director_operations.py [操作數]   （預設 2000）
+"""
+
+import sys
+import time
+from types import SimpleNamespace
+
+from admission import _plan_director_operations
+
+
+def make_snapshot():
+    md_rows = [
+        {"match_id": 1, "student_id": 101, "preference_id": 11, "original_type": "Regular",
+         "original_rank": 1, "final_rank": None, "director_decision": "Pending", "is_adjusted": 0},
+        {"match_id": 2, "student_id": 102, "preference_id": 12, "original_type": "Regular",
+         "original_rank": 2, "final_rank": None, "director_decision": "Pending", "is_adjusted": 0},
+        {"match_id": 3, "student_id": 103, "preference_id": 13, "original_type": "Reserve",
+         "original_rank": None, "final_rank": None, "director_decision": "Pending", "is_adjusted": 0},
+    ]
+    sja_by_id = {
+        11: {"id": 11, "student_id": 101, "company_id": 1, "job_id": 7},
+        12: {"id": 12, "student_id": 102, "company_id": 1, "job_id": 7},
+        13: {"id": 13, "student_id": 103, "company_id": 1, "job_id": 7},
+    }
+    return SimpleNamespace(md_rows=md_rows, sja_by_id=sja_by_id)
+
+
+def by_match_id(md_updates):
+    return {record["match_id"]: record for record in md_updates}
+
+
+def check_swap():
+    md_updates, ra_slots, _ = _plan_director_operations(make_snapshot(), [
+        {"op": "swap", "match_id1": 1, "match_id2": 2},
+    ])
+    updates = by_match_id(md_updates)
+    assert set(updates) == {1, 2}, f"swap 應同時寫入兩筆記錄，實際 {sorted(updates)}"
+    assert updates[1]["final_rank"] == 2 and updates[2]["final_rank"] == 1, updates
+    assert updates[1]["is_adjusted"] == 1 and updates[2]["is_adjusted"] == 1, updates
+    assert ra_slots == {11: 2, 12: 1}, ra_slots
+    print("✅ swap：兩筆記錄名次互換且都列入寫入清單")
+
+
+def check_swap_then_remove():
+    md_updates, ra_slots, _ = _plan_director_operations(make_snapshot(), [
+        {"op": "swap", "match_id1": 1, "match_id2": 2},
+        {"op": "remove", "match_id": 1},
+    ])
+    updates = by_match_id(md_updates)
+    assert set(updates) == {1, 2}, sorted(updates)
+    assert updates[1]["director_decision"] == "Rejected" and updates[1]["final_rank"] is None, updates[1]
+    assert updates[2]["final_rank"] == 1, updates[2]
+    assert ra_slots == {11: 2, 12: 1}, ra_slots
+    print("✅ swap 後 remove：後續操作套用在已調整的記錄上")
+
+
+def check_promote_move_add():
+    md_updates, _, history_moves = _plan_director_operations(make_snapshot(), [
+        {"op": "promote", "match_id": 3, "slot_index": 3},
+        {"op": "move", "history_id": 55, "is_reserve": True},
+        {"op": "add", "student_id": 102, "company_id": 1, "job_id": 7, "slot_index": 2},
+        {"op": "move", "history_id": 56, "slot_index": 1},
+    ])
+    updates = by_match_id(md_updates)
+    assert set(updates) == {2, 3}, sorted(updates)
+    assert updates[3]["director_decision"] == "Approved" and updates[3]["final_rank"] == 3, updates[3]
+    assert updates[2]["director_decision"] == "Approved" and updates[2]["final_rank"] == 2, updates[2]
+    # move 與 director_update_position 相同：只調整 vendor_preference_history，不改 manage_director
+    assert history_moves == {"55": (None, True), "56": (1, False)}, history_moves
+    print("✅ promote / move / add：依序套用，move 寫入 vendor_preference_history")
+
+
+def check_invalid():
+    for operations in ([{"op": "swap", "match_id1": 1, "match_id2": 3}],
+                       [{"op": "remove", "match_id": 99}],
+                       [{"op": "move", "match_id": 1, "slot_index": 1}],
+                       ["swap"],
+                       [{"op": "unknown"}]):
+        try:
+            _plan_director_operations(make_snapshot(), operations)
+        except ValueError:
+            continue
+        raise AssertionError(f"應拒絕不合法的操作：{operations}")
+    print("✅ 不合法操作：整批拒絕（ValueError）")
+
+
+def bench(count):
+    snapshot = make_snapshot()
+    operations = [{"op": "swap", "match_id1": 1, "match_id2": 2} for _ in range(count)]
+    started = time.perf_counter()
+    md_updates, _, _ = _plan_director_operations(snapshot, operations)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"規劃 {count} 個操作：{elapsed_ms:.1f}ms，寫入 {len(md_updates)} 筆記錄")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    check_swap()
+    check_swap_then_remove()
+    check_promote_move_add()
+    check_invalid()
+    bench(count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+resume_teacher 同步效能比較：逐筆 SELECT/INSERT（舊）vs 集合運算（sync_resume_teacher_for_approved_applications）
+
+在獨立的 <database>_bench 資料庫建立最小結構、灌入 N 筆投遞後分別計時，不會動到正式資料。
+用法：python bench_resume_teacher_sync.py [N ...]   （預設 1000 5000）
+"""
+
+import sys
+import time
+
+import mysql.connector
+
+from config import DB_CONFIG
+from resume import sync_resume_teacher_for_approved_applications
+from schema_cache import refresh_schema_cache
+
+BENCH_DB = DB_CONFIG["database"] + "_bench"
+
+
+def connect():
+    server_config = {k: v for k, v in DB_CONFIG.items() if k != "database"}
+    conn = mysql.connector.connect(**server_config)
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{BENCH_DB}` DEFAULT CHARACTER SET utf8mb4")
+    cursor.close()
+    conn.database = BENCH_DB
+    return conn
+
+
+def create_schema(cursor, with_unique_key):
+    for table in ("resume_teacher", "student_job_applications", "resumes", "internship_companies"):
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    cursor.execute("""
+        CREATE TABLE internship_companies (
+            id INT PRIMARY KEY,
+            advisor_user_id INT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE resumes (
+            id INT PRIMARY KEY,
+            user_id INT NOT NULL,
+            status VARCHAR(20) NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE student_job_applications (
+            id INT PRIMARY KEY,
+            student_id INT NOT NULL,
+            resume_id INT NOT NULL,
+            company_id INT NOT NULL,
+            KEY idx_resume (resume_id)
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TABLE resume_teacher (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            application_id INT NOT NULL,
+            teacher_id INT NOT NULL,
+            review_status VARCHAR(20) NULL,
+            comment TEXT NULL,
+            reviewed_at DATETIME NULL,
+            created_at DATETIME NULL,
+            {"UNIQUE KEY uq_app_teacher (application_id, teacher_id)" if with_unique_key else "KEY idx_app_teacher (application_id, teacher_id)"}
+        )
+    """)
+
+
+def seed(cursor, conn, n):
+    """每位學生一份履歷投遞 2 家公司；約 1/10 已有 approved 審核、1/10 已有 uploaded 記錄"""
+    company_count = max(1, n // 20)
+    cursor.executemany(
+        "INSERT INTO internship_companies (id, advisor_user_id) VALUES (%s, %s)",
+        [(c, 10000 + c % 50 if c % 7 else None) for c in range(1, company_count + 1)],
+    )
+    student_count = max(1, n // 2)
+    cursor.executemany(
+        "INSERT INTO resumes (id, user_id, status) VALUES (%s, %s, %s)",
+        [(s, s, "approved" if s % 5 else "rejected") for s in range(1, student_count + 1)],
+    )
+    apps = [(a, (a + 1) // 2, (a + 1) // 2, a % company_count + 1) for a in range(1, n + 1)]
+    cursor.executemany(
+        "INSERT INTO student_job_applications (id, student_id, resume_id, company_id) VALUES (%s, %s, %s, %s)",
+        apps,
+    )
+    existing = []
+    for app_id, _, _, company_id in apps:
+        advisor = 10000 + company_id % 50 if company_id % 7 else None
+        if advisor is None:
+            continue
+        if app_id % 10 == 0:
+            existing.append((app_id, advisor, "approved"))
+        elif app_id % 10 == 1:
+            existing.append((app_id, advisor, "uploaded"))
+    cursor.executemany(
+        "INSERT INTO resume_teacher (application_id, teacher_id, review_status, created_at) VALUES (%s, %s, %s, NOW())",
+        existing,
+    )
+    conn.commit()
+
+
+def legacy_sync(cursor):
+    """舊版：逐筆 SELECT 後 UPDATE 或 INSERT"""
+    cursor.execute("""
+        SELECT sja.id AS application_id, ic.advisor_user_id
+        FROM resumes r
+        INNER JOIN student_job_applications sja ON sja.resume_id = r.id AND sja.student_id = r.user_id
+        JOIN internship_companies ic ON sja.company_id = ic.id
+        WHERE r.status = 'approved'
+          AND ic.advisor_user_id IS NOT NULL
+    """)
+    synced_count = 0
+    for app_info in cursor.fetchall():
+        application_id = app_info["application_id"]
+        advisor_user_id = app_info["advisor_user_id"]
+        cursor.execute("""
+            SELECT id, review_status FROM resume_teacher
+            WHERE application_id = %s AND teacher_id = %s
+        """, (application_id, advisor_user_id))
+        existing = cursor.fetchone()
+        if existing:
+            if existing.get("review_status") in ("uploaded", None):
+                cursor.execute("""
+                    UPDATE resume_teacher SET review_status='uploaded', reviewed_at=NULL
+                    WHERE application_id = %s AND teacher_id = %s
+                """, (application_id, advisor_user_id))
+                synced_count += 1
+        else:
+            cursor.execute("""
+                INSERT INTO resume_teacher (application_id, teacher_id, review_status, comment, reviewed_at, created_at)
+                VALUES (%s, %s, 'uploaded', NULL, NULL, NOW())
+            """, (application_id, advisor_user_id))
+            synced_count += 1
+    return synced_count
+
+
+def snapshot(cursor):
+    cursor.execute("""
+        SELECT application_id, teacher_id, review_status, reviewed_at
+        FROM resume_teacher ORDER BY application_id, teacher_id
+    """)
+    return [tuple(row.values()) for row in cursor.fetchall()]
+
+
+def run_once(conn, n, with_unique_key, sync_func):
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    create_schema(cursor, with_unique_key)
+    refresh_schema_cache(cursor)
+    seed(cursor, conn, n)
+    start = time.perf_counter()
+    sync_func(cursor)
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    result = snapshot(cursor)
+    cursor.close()
+    return elapsed, result
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 5000]
+    conn = connect()
+    try:
+        print("\n" + "=" * 60)
+        print(f"📊 resume_teacher 同步效能比較（資料庫 {BENCH_DB}）")
+        print("=" * 60)
+        for n in sizes:
+            for with_unique_key in (True, False):
+                legacy_time, legacy_rows = run_once(conn, n, with_unique_key, legacy_sync)
+                bulk_time, bulk_rows = run_once(conn, n, with_unique_key, sync_resume_teacher_for_approved_applications)
+                same = "✅ 結果一致" if legacy_rows == bulk_rows else "❌ 結果不一致"
+                key_label = "唯一索引" if with_unique_key else "無唯一索引"
+                print(f"N={n:<7} {key_label:<6} 逐筆: {legacy_time * 1000:9.1f} ms   "
+                      f"集合: {bulk_time * 1000:9.1f} ms   x{legacy_time / max(bulk_time, 1e-9):6.1f}   {same}")
+    finally:
+        conn.close()
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+廠商媒合排序保存效能比較：逐筆查詢/寫入（舊）vs 批次解析（_save_matching_sort_rows）
+
+在獨立的 <database>_bench 資料庫建立最小結構、灌入 N 位學生的排序後分別計時，不會動到正式資料。
+用法：python bench_save_matching_sort.py [N ...]   （預設 40 400）
+"""
+
+import sys
+import time
+
+import mysql.connector
+
+from config import DB_CONFIG
+from schema_cache import refresh_schema_cache
+from vendor import _save_matching_sort_rows
+
+BENCH_DB = DB_CONFIG["database"] + "_bench"
+COMPANY_ID = 1
+SEMESTER_ID = 1
+
+
+def connect():
+    server_config = {k: v for k, v in DB_CONFIG.items() if k != "database"}
+    conn = mysql.connector.connect(**server_config)
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{BENCH_DB}` DEFAULT CHARACTER SET utf8mb4")
+    cursor.close()
+    conn.database = BENCH_DB
+    return conn
+
+
+def create_schema(cursor, with_unique_key):
+    for table in ("manage_director", "resume_applications", "student_job_applications",
+                  "student_preferences", "internship_jobs"):
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    cursor.execute("""
+        CREATE TABLE internship_jobs (
+            id INT PRIMARY KEY,
+            company_id INT NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE student_preferences (
+            id INT PRIMARY KEY,
+            student_id INT NOT NULL,
+            company_id INT NOT NULL,
+            job_id INT NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            KEY idx_student_job (student_id, job_id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE student_job_applications (
+            id INT PRIMARY KEY,
+            student_id INT NOT NULL,
+            company_id INT NOT NULL,
+            job_id INT NOT NULL,
+            applied_at DATETIME NULL,
+            KEY idx_student_company_job (student_id, company_id, job_id)
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TABLE resume_applications (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            application_id INT NOT NULL,
+            job_id INT NOT NULL,
+            apply_status VARCHAR(20) NULL,
+            interview_status VARCHAR(20) NULL,
+            interview_result VARCHAR(20) NULL,
+            is_reserve TINYINT NOT NULL DEFAULT 0,
+            slot_index INT NULL,
+            created_at DATETIME NULL,
+            updated_at DATETIME NULL,
+            {"UNIQUE KEY uq_app_job (application_id, job_id)" if with_unique_key else "KEY idx_app_job (application_id, job_id)"}
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE manage_director (
+            match_id INT AUTO_INCREMENT PRIMARY KEY,
+            semester_id INT NULL,
+            vendor_id INT NULL,
+            student_id INT NULL,
+            preference_id INT NULL,
+            original_type VARCHAR(20) NULL,
+            original_rank INT NULL,
+            is_conflict TINYINT NOT NULL DEFAULT 0,
+            director_decision VARCHAR(20) NULL,
+            final_rank INT NULL,
+            is_adjusted TINYINT NOT NULL DEFAULT 0,
+            updated_at DATETIME NULL,
+            KEY idx_preference (preference_id)
+        )
+    """)
+    refresh_schema_cache(cursor)
+
+
+def seed(cursor, conn, n):
+    """同一公司 4 個職缺、每位學生一筆志願與投遞；約半數已有 resume_applications、1/4 已有 manage_director（含 Rejected）"""
+    cursor.executemany("INSERT INTO internship_jobs (id, company_id) VALUES (%s, %s)",
+                       [(j, COMPANY_ID) for j in range(1, 5)])
+    cursor.executemany(
+        "INSERT INTO student_preferences (id, student_id, company_id, job_id, status) VALUES (%s, %s, %s, %s, 'approved')",
+        [(s, s, COMPANY_ID, s % 4 + 1) for s in range(1, n + 1)],
+    )
+    cursor.executemany(
+        "INSERT INTO student_job_applications (id, student_id, company_id, job_id, applied_at) VALUES (%s, %s, %s, %s, NOW())",
+        [(s, s, COMPANY_ID, s % 4 + 1) for s in range(1, n + 1)],
+    )
+    cursor.executemany(
+        "INSERT INTO resume_applications (application_id, job_id, apply_status, is_reserve, created_at) VALUES (%s, %s, 'approved', 0, NOW())",
+        [(s, s % 4 + 1) for s in range(1, n + 1) if s % 2 == 0],
+    )
+    cursor.executemany(
+        "INSERT INTO manage_director (semester_id, vendor_id, student_id, preference_id, director_decision, updated_at) VALUES (%s, %s, %s, %s, %s, NOW())",
+        [(SEMESTER_ID, COMPANY_ID, s, s, "Rejected" if s % 8 == 0 else "Pending") for s in range(1, n + 1) if s % 4 == 0],
+    )
+    conn.commit()
+
+
+def ranking(n):
+    """前 2/3 正取、其餘備取；每 5 位學生有一位不帶 preference_id（需回推）"""
+    regulars = n * 2 // 3
+    return [
+        {
+            "student_id": s,
+            "job_id": s % 4 + 1,
+            "preference_id": None if s % 5 == 0 else s,
+            "slot_index": s if s <= regulars else None,
+            "is_reserve": s > regulars,
+        }
+        for s in range(1, n + 1)
+    ]
+
+
+def legacy_save(cursor, students, company_ids, semester_id):
+    """舊版：每位學生分別查 internship_jobs / student_preferences / student_job_applications / resume_applications / manage_director"""
+    saved_count = 0
+    for student in students:
+        student_id = student.get("student_id")
+        job_id = student.get("job_id")
+        preference_id = student.get("preference_id")
+        company_id = None
+        if job_id:
+            cursor.execute("SELECT company_id FROM internship_jobs WHERE id = %s", (job_id,))
+            job_row = cursor.fetchone()
+            if job_row:
+                company_id = job_row.get("company_id")
+                if company_id not in company_ids:
+                    continue
+        if not company_id and preference_id:
+            cursor.execute("SELECT company_id FROM student_preferences WHERE id = %s", (preference_id,))
+            pref_row = cursor.fetchone()
+            if pref_row:
+                company_id = pref_row.get("company_id")
+                if company_id not in company_ids:
+                    continue
+        if not preference_id and student_id and job_id:
+            cursor.execute("""
+                SELECT id FROM student_preferences
+                WHERE student_id = %s AND job_id = %s AND company_id = %s AND status = 'approved'
+                ORDER BY id DESC LIMIT 1
+            """, (student_id, job_id, company_id))
+            pref = cursor.fetchone()
+            cursor.fetchall()
+            if pref:
+                preference_id = pref["id"]
+        if not preference_id or not student_id:
+            continue
+        slot_index_val = student.get("slot_index")
+        is_reserve_val = student.get("is_reserve", False)
+        cursor.execute("""
+            SELECT id FROM student_job_applications
+            WHERE student_id = %s AND company_id = %s AND job_id = %s
+            ORDER BY applied_at DESC LIMIT 1
+        """, (student_id, company_id, job_id))
+        sja_result = cursor.fetchone()
+        cursor.fetchall()
+        if not sja_result:
+            continue
+        application_id = sja_result["id"]
+        cursor.execute("SELECT id FROM resume_applications WHERE application_id = %s AND job_id = %s",
+                       (application_id, job_id))
+        existing_ra = cursor.fetchone()
+        cursor.fetchall()
+        if existing_ra:
+            cursor.execute("""
+                UPDATE resume_applications
+                SET is_reserve = %s, slot_index = %s, apply_status = 'approved', updated_at = NOW()
+                WHERE application_id = %s AND job_id = %s
+            """, (1 if is_reserve_val else 0, slot_index_val, application_id, job_id))
+        else:
+            cursor.execute("""
+                INSERT INTO resume_applications
+                (application_id, job_id, apply_status, interview_status, interview_result, is_reserve, slot_index, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
+            """, (application_id, job_id, 'approved', 'none', 'pending', 1 if is_reserve_val else 0, slot_index_val))
+        cursor.execute("SELECT match_id, director_decision FROM manage_director WHERE preference_id = %s",
+                       (application_id,))
+        existing_md = cursor.fetchone()
+        cursor.fetchall()
+        original_type = 'Regular' if not is_reserve_val else 'Backup'
+        original_rank = slot_index_val if not is_reserve_val else None
+        if existing_md:
+            decision = "'Pending'" if existing_md.get("director_decision") == 'Rejected' else "director_decision"
+            cursor.execute(f"""
+                UPDATE manage_director
+                SET original_type = %s, original_rank = %s, director_decision = {decision}, updated_at = NOW()
+                WHERE preference_id = %s
+            """, (original_type, original_rank, application_id))
+        else:
+            cursor.execute("""
+                INSERT INTO manage_director
+                (semester_id, vendor_id, student_id, preference_id, original_type, original_rank,
+                 is_conflict, director_decision, final_rank, is_adjusted, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, 0, 'Pending', %s, 0, NOW())
+            """, (semester_id, company_id, student_id, application_id, original_type, original_rank, original_rank))
+        saved_count += 1
+    return saved_count
+
+
+def snapshot(cursor):
+    cursor.execute("""
+        SELECT application_id, job_id, apply_status, is_reserve, slot_index
+        FROM resume_applications ORDER BY application_id, job_id
+    """)
+    ra = [tuple(row.values()) for row in cursor.fetchall()]
+    cursor.execute("""
+        SELECT semester_id, vendor_id, student_id, preference_id, original_type, original_rank,
+               director_decision, final_rank
+        FROM manage_director ORDER BY preference_id
+    """)
+    return ra, [tuple(row.values()) for row in cursor.fetchall()]
+
+
+def run_once(conn, n, with_unique_key, save_func):
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    create_schema(cursor, with_unique_key)
+    seed(cursor, conn, n)
+    start = time.perf_counter()
+    saved = save_func(cursor, ranking(n), [COMPANY_ID], SEMESTER_ID)
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    result = snapshot(cursor)
+    cursor.close()
+    return elapsed, saved, result
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [40, 400]
+    conn = connect()
+    try:
+        print("\n" + "=" * 60)
+        print(f"📊 媒合排序保存效能比較（資料庫 {BENCH_DB}）")
+        print("=" * 60)
+        for n in sizes:
+            for with_unique_key in (True, False):
+                legacy_time, legacy_saved, legacy_rows = run_once(conn, n, with_unique_key, legacy_save)
+                bulk_time, bulk_saved, bulk_rows = run_once(conn, n, with_unique_key, _save_matching_sort_rows)
+                same = "✅ 結果一致" if (legacy_saved, legacy_rows) == (bulk_saved, bulk_rows) else "❌ 結果不一致"
+                key_label = "唯一索引" if with_unique_key else "無唯一索引"
+                print(f"N={n:<7} {key_label:<6} 逐筆: {legacy_time * 1000:9.1f} ms   "
+                      f"批次: {bulk_time * 1000:9.1f} ms   x{legacy_time / max(bulk_time, 1e-9):6.1f}   {same}")
+    finally:
+        conn.close()
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,94 @@
-import mysql.connector
-
-def get_db():
-    return mysql.connector.connect(
-        host="localhost",
-        user="root",
-        password="",
-        database="user"
-    )
+import os
+import threading
+
+from flask import g, has_request_context
+
+from db_pool import ConnectionPool
+
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "root",
+    "password": "",
+    "database": "user",
+}
+
+# 連線池設定（可由環境變數覆寫）
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = float(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """取得（必要時建立）全域連線池"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    DB_CONFIG,
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_POOL_MAX_OVERFLOW,
+                    pool_timeout=DB_POOL_TIMEOUT,
+                    pool_recycle=DB_POOL_RECYCLE,
+                    pre_ping=DB_POOL_PRE_PING,
+                )
+    return _pool
+
+
+def get_db(shared=True):
+    """
+    取得資料庫連線，呼叫端照舊 conn.close()。
+    - 在 request 中：回傳該 request 共用的連線（route 與其呼叫的 helper 共用一條，只佔一個連線池名額；
+      close() 不歸還，request 結束時統一歸還）
+    - 不在 request 中（排程器、背景 worker、命令列）或 shared=False：從連線池借出獨立連線，close() 即歸還
+    """
+    if not shared or not has_request_context():
+        return get_pool().get_connection()
+    conn = g.get("_request_db")
+    if conn is None:
+        conn = get_pool().get_connection()
+        g._request_db = conn
+    return _RequestConnection(conn)
+
+
+# =========================================================
+# 請求範圍連線：同一個 request 內的 route 與 helper 共用一條連線
+# =========================================================
+class _RequestConnection:
+    """request 共用連線的包裝：close() 不歸還，等 teardown 時統一歸還"""
+
+    def __init__(self, conn):
+        object.__setattr__(self, "_conn", conn)
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(object.__getattribute__(self, "_conn"), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __bool__(self):
+        return True
+
+
+def get_request_db():
+    """與 get_db() 相同（request 中回傳共用連線，否則借出獨立連線）；保留給既有呼叫端"""
+    return get_db()
+
+
+def close_request_db(exc=None):
+    conn = g.pop("_request_db", None)
+    if conn is not None:
+        conn.close()
+
+
+def init_db(app):
+    """註冊 request 結束時歸還共用連線"""
+    app.teardown_appcontext(close_request_db)
@@ -0,0 +1,206 @@
+"""
+MySQL 連線池
+
+- 固定大小 + 溢出連線（pool_size / max_overflow），用盡時等待 pool_timeout 秒
+- 借出時健康檢查（ping），閒置過久（pool_recycle 秒）的連線直接重建
+- 歸還時自動 rollback 未提交交易、丟棄未讀結果，避免污染下一個使用者
+- 統計資訊（借出次數、等待時間、用盡事件…）供監控使用：get_pool().stats()
+"""
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+
+
+class PoolExhaustedError(Exception):
+    """連線池已滿且等待逾時"""
+
+
+class PooledConnection:
+    """包裝實際的 mysql 連線：close() 時歸還連線池，其餘屬性/方法直接轉交原連線"""
+
+    def __init__(self, pool, raw_conn):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_conn", raw_conn)
+
+    def close(self):
+        raw_conn = self._conn
+        if raw_conn is None:
+            return  # 重複 close 視為無動作，與既有 finally 區塊寫法相容
+        object.__setattr__(self, "_conn", None)
+        self._pool._release(raw_conn)
+
+    def __getattr__(self, name):
+        raw_conn = object.__getattribute__(self, "_conn")
+        if raw_conn is None:
+            raise mysql.connector.errors.OperationalError("連線已歸還連線池，無法再使用")
+        return getattr(raw_conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __bool__(self):
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def __del__(self):
+        # 呼叫端忘記 close 時仍把連線還回池中，避免連線洩漏
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    def __init__(self, db_config, pool_size=10, max_overflow=10, pool_timeout=30,
+                 pool_recycle=1800, pre_ping=True):
+        self._db_config = dict(db_config)
+        self.pool_size = max(1, int(pool_size))
+        self.max_overflow = max(0, int(max_overflow))
+        self.pool_timeout = float(pool_timeout)
+        self.pool_recycle = float(pool_recycle)
+        self.pre_ping = pre_ping
+
+        self._idle = deque()  # (raw_conn, last_used)；LIFO 取用，讓多餘連線自然閒置後被回收
+        self._total = 0       # 已建立（借出 + 閒置）的連線數
+        self._cond = threading.Condition()
+
+        self._stats = {
+            "checkouts": 0,
+            "created": 0,
+            "recycled": 0,
+            "ping_failures": 0,
+            "discarded": 0,
+            "exhausted": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+    # -------------------------
+    # 內部：建立 / 檢查連線
+    # -------------------------
+    def _connect(self):
+        raw_conn = mysql.connector.connect(**self._db_config)
+        with self._cond:
+            self._stats["created"] += 1
+        return raw_conn
+
+    def _close_quietly(self, raw_conn):
+        try:
+            raw_conn.close()
+        except Exception:
+            pass
+
+    def _validate(self, raw_conn, last_used):
+        """回傳可用的連線（必要時重建）"""
+        if self.pool_recycle > 0 and time.monotonic() - last_used > self.pool_recycle:
+            self._close_quietly(raw_conn)
+            with self._cond:
+                self._stats["recycled"] += 1
+            return self._connect()
+        if self.pre_ping:
+            try:
+                raw_conn.ping(reconnect=True, attempts=1, delay=0)
+            except Exception:
+                self._close_quietly(raw_conn)
+                with self._cond:
+                    self._stats["ping_failures"] += 1
+                return self._connect()
+        return raw_conn
+
+    # -------------------------
+    # 借出 / 歸還
+    # -------------------------
+    def get_connection(self):
+        start = time.monotonic()
+        deadline = start + self.pool_timeout
+        idle_item = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    idle_item = self._idle.pop()
+                    break
+                if self._total < self.pool_size + self.max_overflow:
+                    self._total += 1  # 先佔位，實際連線在鎖外建立
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["exhausted"] += 1
+                    raise PoolExhaustedError(
+                        f"資料庫連線池已滿（{self.pool_size}+{self.max_overflow}），等待 {self.pool_timeout:g} 秒逾時"
+                    )
+                self._cond.wait(remaining)
+
+            waited = time.monotonic() - start
+            self._stats["checkouts"] += 1
+            self._stats["wait_time_total"] += waited
+            if waited > self._stats["wait_time_max"]:
+                self._stats["wait_time_max"] = waited
+
+        try:
+            if idle_item is not None:
+                raw_conn = self._validate(*idle_item)
+            else:
+                raw_conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, raw_conn)
+
+    def _release(self, raw_conn):
+        reusable = True
+        try:
+            if raw_conn.unread_result:
+                raw_conn.consume_results()
+            if raw_conn.in_transaction:
+                raw_conn.rollback()
+        except Exception:
+            reusable = False
+
+        with self._cond:
+            if reusable and len(self._idle) < self.pool_size:
+                self._idle.append((raw_conn, time.monotonic()))
+                raw_conn = None
+            else:
+                self._total -= 1
+                self._stats["discarded"] += 1
+            self._cond.notify()
+
+        if raw_conn is not None:
+            self._close_quietly(raw_conn)
+
+    def dispose(self):
+        """關閉所有閒置連線（借出中的連線歸還時會自然補回）"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._total -= len(idle)
+            self._cond.notify_all()
+        for raw_conn, _ in idle:
+            self._close_quietly(raw_conn)
+
+    def stats(self):
+        with self._cond:
+            data = dict(self._stats)
+            idle = len(self._idle)
+            total = self._total
+        checkouts = data["checkouts"]
+        data.update({
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "total": total,
+            "idle": idle,
+            "in_use": total - idle,
+            "overflow": max(0, total - self.pool_size),
+            "wait_time_avg": (data["wait_time_total"] / checkouts) if checkouts else 0.0,
+        })
+        return data
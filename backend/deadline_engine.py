@@ -0,0 +1,116 @@
+"""
+截止時間狀態轉換引擎
+
+原本 GET 端點（/api/teacher_review_resumes、/vendor/api/resumes、班導審核志願序…）每次被瀏覽
+都會執行截止後的批次 UPDATE/INSERT。改由 app.py 的 APScheduler 定期呼叫 run_deadline_sweeps()：
+每個截止時間（類型 + 學期 + 截止時間值）只會成功執行一次，紀錄於 deadline_sweeps 表。
+截止時間被延後/修改時視為新的一次跨越，會再執行一次。
+"""
+import json
+import traceback
+from datetime import datetime
+
+from config import get_db
+
+# 依序執行：履歷截止（班導 → 指導老師）必須在指導老師截止（指導老師 → 廠商）之前
+SWEEP_TYPES = ('resume', 'advisor', 'preference')
+
+STALE_RUNNING_MINUTES = 30
+
+
+def _sweep_registry():
+    """deadline_type -> (取得截止時間, 執行轉換)；延遲導入避免循環依賴"""
+    from resume import (
+        get_resume_deadline, update_resume_status_after_deadline,
+        get_advisor_deadline, update_resume_applications_after_advisor_deadline,
+    )
+    from preferences import get_preference_deadline, update_preference_status_after_deadline
+    return {
+        'resume': (get_resume_deadline, update_resume_status_after_deadline),
+        'advisor': (get_advisor_deadline, update_resume_applications_after_advisor_deadline),
+        'preference': (get_preference_deadline, update_preference_status_after_deadline),
+    }
+
+
+def ensure_sweep_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS deadline_sweeps (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            deadline_type VARCHAR(32) NOT NULL,
+            semester_id INT NOT NULL DEFAULT 0,
+            deadline_at DATETIME NOT NULL,
+            status VARCHAR(16) NOT NULL DEFAULT 'running',
+            result TEXT,
+            started_at DATETIME,
+            finished_at DATETIME,
+            UNIQUE KEY unique_sweep (deadline_type, semester_id, deadline_at)
+        )
+    """)
+
+
+def _claim(cursor, conn, deadline_type, semester_id, deadline_at):
+    """搶佔此次截止跨越；已執行過（或其他 worker 正在執行）則回傳 False"""
+    # 執行中途程序中斷而殘留的 running 標記，逾時後釋放讓本輪重試
+    cursor.execute("""
+        DELETE FROM deadline_sweeps
+        WHERE status = 'running' AND started_at < NOW() - INTERVAL %s MINUTE
+    """, (STALE_RUNNING_MINUTES,))
+    cursor.execute("""
+        INSERT IGNORE INTO deadline_sweeps (deadline_type, semester_id, deadline_at, status, started_at)
+        VALUES (%s, %s, %s, 'running', NOW())
+    """, (deadline_type, semester_id, deadline_at))
+    claimed = cursor.rowcount > 0
+    conn.commit()
+    return claimed
+
+
+def run_deadline_sweeps():
+    """排程任務：對已跨越、尚未處理的截止時間執行狀態轉換"""
+    from semester import get_current_semester_id
+
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    results = {}
+    try:
+        ensure_sweep_table(cursor)
+        conn.commit()
+        semester_id = get_current_semester_id(cursor) or 0
+        registry = _sweep_registry()
+        now = datetime.now()
+
+        for deadline_type in SWEEP_TYPES:
+            get_deadline, sweep = registry[deadline_type]
+            try:
+                deadline_at = get_deadline(cursor)
+            except Exception as e:
+                print(f"⚠️ [deadline_engine] 查詢 {deadline_type} 截止時間失敗: {e}")
+                continue
+            if deadline_at is None or now <= deadline_at:
+                continue
+            if not _claim(cursor, conn, deadline_type, semester_id, deadline_at):
+                continue
+
+            print(f"⏰ [deadline_engine] {deadline_type} 截止時間 {deadline_at} 已過，執行狀態轉換")
+            passed, counts = sweep(cursor, conn)
+            if passed:
+                cursor.execute("""
+                    UPDATE deadline_sweeps
+                    SET status = 'done', result = %s, finished_at = NOW()
+                    WHERE deadline_type = %s AND semester_id = %s AND deadline_at = %s
+                """, (json.dumps(counts, ensure_ascii=False), deadline_type, semester_id, deadline_at))
+                results[deadline_type] = counts
+            else:
+                # 轉換失敗（函式內已 print 錯誤）：移除標記，下一輪排程重試
+                conn.rollback()
+                cursor.execute("""
+                    DELETE FROM deadline_sweeps
+                    WHERE deadline_type = %s AND semester_id = %s AND deadline_at = %s
+                """, (deadline_type, semester_id, deadline_at))
+            conn.commit()
+    except Exception as e:
+        print(f"❌ [deadline_engine] 截止時間狀態轉換錯誤: {e}")
+        traceback.print_exc()
+    finally:
+        cursor.close()
+        conn.close()
+    return results
@@ -1,6 +1,21 @@
+"""
+郵件服務
+
+send_email() 只負責寫入 email_logs（status = 'pending'）後立即返回，實際發送由背景 worker 執行：
+pending → sending → sent / failed。每個 worker 保持一條已登入的 SMTP 連線，一次取一批郵件連續發送，
+佇列閒置超過 SMTP_IDLE_SECONDS 才關閉連線。程序重啟時殘留的 pending / 逾時的 sending 記錄會被重新發送。
+
+本機測試（不寄出真實郵件）：
+    python -m aiosmtpd -n -l localhost:1025
+    EMAIL.env 設定 SMTP_HOST=localhost、SMTP_PORT=1025、SMTP_STARTTLS=false、SMTP_LOGIN=false
+"""
 import os
 import base64
+import socket
+import threading
+import time
 import traceback
+import uuid
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -15,7 +30,8 @@ except ImportError:
     GMAIL_API_AVAILABLE = False
     print("⚠️ Gmail API 套件未安裝，將使用 SMTP 方式發送郵件")
 
-from config import get_db
+from config import get_db, get_request_db
+from schema_cache import has_column, refresh_schema_cache, execute_ddl
 
 # =========================================================
 # Gmail API 設定
@@ -40,6 +56,18 @@ SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")  # Gmail 應用程式密碼
 USE_SMTP = os.getenv("USE_SMTP", "true").lower() == "true"  # 是否使用 SMTP（預設為 true）
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_LOGIN = os.getenv("SMTP_LOGIN", "true").lower() == "true"  # 本機測試 SMTP 不需登入時設為 false
+SMTP_TIMEOUT = int(os.getenv("SMTP_TIMEOUT", "60"))  # 單一連線的超時秒數（不再修改全域 socket 預設值）
+SMTP_IDLE_SECONDS = int(os.getenv("SMTP_IDLE_SECONDS", "60"))  # 佇列閒置多久後關閉 SMTP 連線
+
+# 郵件佇列設定
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+EMAIL_POLL_SECONDS = float(os.getenv("EMAIL_POLL_SECONDS", "5"))  # 也接手其他程序寫入的 pending 郵件
+EMAIL_SENDING_STALE_MINUTES = 10  # sending 超過此時間視為 worker 中斷，重新排入佇列
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "3"))  # 發送失敗達此次數才標記 failed
+EMAIL_RETRY_BASE_SECONDS = int(os.getenv("EMAIL_RETRY_BASE_SECONDS", "60"))  # 重試間隔：60s、120s、240s...
 
 # =========================================================
 # 建立 Gmail API Service
@@ -78,71 +106,44 @@ def get_gmail_service():
     service = build('gmail', 'v1', credentials=creds)
     return service
 
-def send_email_smtp(recipient_email, subject, content):
-    """使用 SMTP 發送郵件（實際發送）"""
-    if not SMTP_FROM_EMAIL:
-        raise ValueError("寄件人信箱未設定")
-    
-    if not SMTP_PASSWORD:
-        raise ValueError("SMTP 密碼未設定。請在 EMAIL.env 中設定 SMTP_PASSWORD（Gmail 應用程式密碼）")
-    
-    # 自動去掉密碼中的空格（Gmail 應用程式密碼可能包含空格）
-    password = SMTP_PASSWORD.replace(" ", "").strip()
-    
-    # 建立郵件
-    msg = MIMEMultipart()
-    msg['From'] = f"{SMTP_FROM_NAME} <{SMTP_FROM_EMAIL}>"
-    msg['To'] = recipient_email
-    msg['Subject'] = subject
-    
-    # 添加郵件內容
-    msg.attach(MIMEText(content, 'plain', 'utf-8'))
-    
-    # 發送郵件
-    try:
-        # 設定連線超時時間（30秒）
-        import socket
-        # 設定更長的超時時間（60 秒）
-        socket.setdefaulttimeout(60)
-        
-        # 建立 SMTP 連線，設定超時時間
-        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=60)
-        server.set_debuglevel(0)  # 關閉除錯模式
-        
-        # 啟用 TLS
-        server.starttls()
-        
-        # 登入
-        server.login(SMTP_FROM_EMAIL, password)
-        
-        # 發送郵件
-        server.send_message(msg)
-        
-        # 關閉連線
-        server.quit()
-        
-        return True, "郵件發送成功（SMTP）"
-    except socket.timeout:
-        return False, "SMTP 連線超時：無法連線到郵件伺服器。\n\n可能原因：\n1. 防火牆阻擋了 SMTP 連線（埠 587）\n2. 網路連線不穩定\n3. Gmail SMTP 伺服器暫時無法回應\n\n解決方法：\n1. 以系統管理員身分執行 PowerShell，執行：\n   netsh advfirewall firewall add rule name=\"Allow SMTP Outbound\" dir=out action=allow protocol=TCP localport=587\n2. 檢查網路連線是否正常\n3. 稍後再試"
-    except socket.gaierror as e:
-        return False, f"SMTP 連線失敗：無法解析主機名稱 '{SMTP_HOST}'。請檢查網路連線。錯誤：{str(e)}"
-    except ConnectionRefusedError:
-        return False, f"SMTP 連線被拒絕：無法連線到 {SMTP_HOST}:{SMTP_PORT}。請檢查防火牆設定。"
-    except OSError as e:
-        err_str = str(e)
-        if "10060" in err_str or "timed out" in err_str.lower():
-            return False, f"SMTP 連線超時：無法連線到郵件伺服器。可能原因：1) 防火牆阻擋 2) 網路連線問題 3) SMTP 伺服器無法回應。錯誤：{err_str}"
-        if "534" in err_str or "5.7.9" in err_str or "WebLoginRequired" in err_str:
-            return False, (
-                "Gmail 要求使用「應用程式密碼」登入。\n\n"
-                "請至 Google 帳戶 → 安全性 → 兩步驟驗證 → 應用程式密碼，產生一組密碼後填入 EMAIL.env 的 SMTP_PASSWORD，並重啟程式。\n"
-                "參考：https://support.google.com/mail/answer/185833"
-            )
-        return False, f"SMTP 連線錯誤：{err_str}"
-    except smtplib.SMTPAuthenticationError as e:
-        err_str = str(e)
-        if "534" in err_str or "5.7.9" in err_str or "WebLoginRequired" in err_str or "Application-specific" in err_str.lower():
-            return False, (
+
+def _send_via_gmail(service, recipient_email, subject, content):
+    """以 Gmail API 發送一封郵件"""
+    message = MIMEText(content, 'plain', 'utf-8')
+    message['to'] = recipient_email
+    message['from'] = f"{SMTP_FROM_NAME} <{SMTP_FROM_EMAIL}>"
+    message['subject'] = subject
+
+    raw_b64 = base64.urlsafe_b64encode(message.as_bytes()).decode()
+    service.users().messages().send(userId='me', body={'raw': raw_b64}).execute()
+
+# =========================================================
+# SMTP 連線（可重複使用）
+# =========================================================
+
+_APP_PASSWORD_HINT = (
+    "Gmail 要求使用「應用程式密碼」登入。\n\n"
+    "請至 Google 帳戶 → 安全性 → 兩步驟驗證 → 應用程式密碼，產生一組密碼後填入 EMAIL.env 的 SMTP_PASSWORD，並重啟程式。\n"
+    "參考：https://support.google.com/mail/answer/185833"
+)
+
+
+def _is_app_password_error(err_str):
+    return "534" in err_str or "5.7.9" in err_str or "WebLoginRequired" in err_str
+
+
+def _smtp_error_message(e):
+    """將 SMTP 例外轉為給管理員看的說明"""
+    err_str = str(e)
+    if isinstance(e, socket.timeout):
+        return "SMTP 連線超時：無法連線到郵件伺服器。\n\n可能原因：\n1. 防火牆阻擋了 SMTP 連線（埠 587）\n2. 網路連線不穩定\n3. Gmail SMTP 伺服器暫時無法回應\n\n解決方法：\n1. 以系統管理員身分執行 PowerShell，執行：\n   netsh advfirewall firewall add rule name=\"Allow SMTP Outbound\" dir=out action=allow protocol=TCP localport=587\n2. 檢查網路連線是否正常\n3. 稍後再試"
+    if isinstance(e, socket.gaierror):
+        return f"SMTP 連線失敗：無法解析主機名稱 '{SMTP_HOST}'。請檢查網路連線。錯誤：{err_str}"
+    if isinstance(e, ConnectionRefusedError):
+        return f"SMTP 連線被拒絕：無法連線到 {SMTP_HOST}:{SMTP_PORT}。請檢查防火牆設定。"
+    if isinstance(e, smtplib.SMTPAuthenticationError):
+        if _is_app_password_error(err_str) or "application-specific" in err_str.lower():
+            return (
                 "Gmail 要求使用「應用程式密碼」登入，無法使用一般帳號密碼。\n\n"
                 "請依下列步驟設定：\n"
                 "1. 開啟 Google 帳戶 → 安全性 → 啟用「兩步驟驗證」。\n"
@@ -150,39 +151,334 @@ def send_email_smtp(recipient_email, subject, content):
                 "3. 將 EMAIL.env 的 SMTP_PASSWORD 改為這組「應用程式密碼」（不是您的 Gmail 登入密碼）。\n"
                 "參考：https://support.google.com/mail/answer/185833"
             )
-        return False, f"SMTP 認證失敗：請確認應用程式密碼是否正確。錯誤：{str(e)}"
-    except smtplib.SMTPException as e:
-        err_str = str(e)
-        if "534" in err_str or "5.7.9" in err_str or "WebLoginRequired" in err_str:
-            return False, (
+        return f"SMTP 認證失敗：請確認應用程式密碼是否正確。錯誤：{err_str}"
+    if isinstance(e, smtplib.SMTPException):
+        if _is_app_password_error(err_str):
+            return (
                 "Gmail 要求先透過瀏覽器登入或使用「應用程式密碼」。\n\n"
                 "請至 Google 帳戶啟用兩步驟驗證後，建立「應用程式密碼」，並將 EMAIL.env 的 SMTP_PASSWORD 改為該密碼。\n"
                 "參考：https://support.google.com/mail/?p=WebLoginRequired"
             )
-        return False, f"SMTP 錯誤：{str(e)}"
+        return f"SMTP 錯誤：{err_str}"
+    if isinstance(e, OSError):
+        if "10060" in err_str or "timed out" in err_str.lower():
+            return f"SMTP 連線超時：無法連線到郵件伺服器。可能原因：1) 防火牆阻擋 2) 網路連線問題 3) SMTP 伺服器無法回應。錯誤：{err_str}"
+        if _is_app_password_error(err_str):
+            return _APP_PASSWORD_HINT
+        return f"SMTP 連線錯誤：{err_str}"
+    if _is_app_password_error(err_str):
+        return _APP_PASSWORD_HINT
+    return f"SMTP 發送失敗：{err_str}"
+
+
+def _build_smtp_message(recipient_email, subject, content):
+    msg = MIMEMultipart()
+    msg['From'] = f"{SMTP_FROM_NAME} <{SMTP_FROM_EMAIL}>"
+    msg['To'] = recipient_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(content, 'plain', 'utf-8'))
+    return msg
+
+
+class SMTPSession:
+    """一條已登入的 SMTP 連線；連線被伺服器關閉時自動重連一次"""
+
+    def __init__(self):
+        self.server = None
+        self.last_used = 0.0
+
+    def _connect(self):
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        server.set_debuglevel(0)  # 關閉除錯模式
+        try:
+            if SMTP_STARTTLS:
+                server.starttls()
+            if SMTP_LOGIN:
+                # 自動去掉密碼中的空格（Gmail 應用程式密碼可能包含空格）
+                server.login(SMTP_FROM_EMAIL, SMTP_PASSWORD.replace(" ", "").strip())
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+
+    def send(self, recipient_email, subject, content):
+        msg = _build_smtp_message(recipient_email, subject, content)
+        if self.server is None:
+            self._connect()
+        try:
+            self.server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # 閒置期間被伺服器斷線：重連後重送一次
+            self.server = None
+            self._connect()
+            self.server.send_message(msg)
+        self.last_used = time.monotonic()
+
+    def idle_seconds(self):
+        return time.monotonic() - self.last_used
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            try:
+                self.server.close()
+            except Exception:
+                pass
+        self.server = None
+
+
+def _check_smtp_settings():
+    if not SMTP_FROM_EMAIL:
+        raise ValueError("寄件人信箱未設定")
+    if SMTP_LOGIN and not SMTP_PASSWORD:
+        raise ValueError("SMTP 密碼未設定。請在 EMAIL.env 中設定 SMTP_PASSWORD（Gmail 應用程式密碼）")
+
+
+def send_email_smtp(recipient_email, subject, content):
+    """使用 SMTP 立即發送單封郵件（不經佇列，單獨建立一條連線）"""
+    _check_smtp_settings()
+    smtp = SMTPSession()
+    try:
+        smtp.send(recipient_email, subject, content)
+        return True, "郵件發送成功（SMTP）"
     except Exception as e:
-        err_str = str(e)
-        if "534" in err_str or "5.7.9" in err_str or "WebLoginRequired" in err_str:
-            return False, (
-                "Gmail 要求使用「應用程式密碼」登入。\n\n"
-                "請至 Google 帳戶 → 安全性 → 兩步驟驗證 → 應用程式密碼，產生一組密碼後填入 EMAIL.env 的 SMTP_PASSWORD，並重啟程式。\n"
-                "參考：https://support.google.com/mail/answer/185833"
+        return False, _smtp_error_message(e)
+    finally:
+        smtp.close()
+
+# =========================================================
+# 郵件佇列 worker（email_logs: pending → sending → sent / failed）
+# =========================================================
+
+_wakeup = threading.Event()
+_workers_lock = threading.Lock()
+_workers = []
+_waiters = {}  # log_id -> {"event": Event, "result": (success, message)}，供 send_email(wait_seconds=...) 等待結果
+_last_stale_check = 0.0
+
+
+def _recipient_column():
+    # 舊版資料表欄位名稱為 recipient
+    return 'recipient_email' if has_column('email_logs', 'recipient_email') else 'recipient'
+
+
+def ensure_email_queue_columns():
+    """
+    確保 email_logs 有佇列欄位：claimed_by（搶佔批次的識別碼）、attempts（已嘗試次數）、next_attempt_at（下次重試時間）。
+    多個程序同時執行時，晚到的 ALTER 遇到欄位已存在視為成功
+    """
+    if (has_column('email_logs', 'claimed_by') and has_column('email_logs', 'attempts')
+            and has_column('email_logs', 'next_attempt_at')):
+        return
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        if not has_column('email_logs', 'claimed_by'):
+            execute_ddl(cursor, "ALTER TABLE email_logs ADD COLUMN claimed_by VARCHAR(64) NULL")
+            execute_ddl(cursor, "CREATE INDEX idx_email_logs_claimed_by ON email_logs (claimed_by)")
+        if not has_column('email_logs', 'attempts'):
+            execute_ddl(cursor, "ALTER TABLE email_logs ADD COLUMN attempts INT NOT NULL DEFAULT 0")
+        if not has_column('email_logs', 'next_attempt_at'):
+            execute_ddl(cursor, "ALTER TABLE email_logs ADD COLUMN next_attempt_at DATETIME NULL")
+            execute_ddl(cursor, "CREATE INDEX idx_email_logs_queue ON email_logs (status, next_attempt_at)")
+        conn.commit()
+        print("✅ email_logs 佇列欄位已就緒")
+    finally:
+        refresh_schema_cache(cursor)
+        cursor.close()
+        conn.close()
+
+
+def _requeue_stale_sending(cursor, conn):
+    """
+    worker 中斷而卡在 sending 的郵件重新排入佇列（每分鐘最多檢查一次）；
+    中斷也計入嘗試次數，達 EMAIL_MAX_ATTEMPTS 即標記 failed，避免同一封信反覆卡住 worker
+    """
+    global _last_stale_check
+    now = time.monotonic()
+    if now - _last_stale_check < 60:
+        return
+    _last_stale_check = now
+    cursor.execute("""
+        UPDATE email_logs
+        SET attempts = attempts + 1,
+            status = IF(attempts >= %s, 'failed', 'pending'),
+            claimed_by = NULL
+        WHERE status = 'sending' AND sent_at < NOW() - INTERVAL %s MINUTE
+    """, (EMAIL_MAX_ATTEMPTS, EMAIL_SENDING_STALE_MINUTES))
+    if cursor.rowcount:
+        print(f"⚠️ [email] {cursor.rowcount} 封郵件發送中斷，已重新排入佇列（超過重試次數者標記 failed）")
+    conn.commit()
+
+
+def _claim_batch():
+    """
+    取出一批到期的 pending 郵件並標記為 sending：以單一條件式 UPDATE ... ORDER BY id LIMIT 搶佔並寫入本次的
+    claimed_by，再依 claimed_by 讀回，多 worker / 多程序不會重複發送
+    """
+    ensure_email_queue_columns()
+    claim_token = uuid.uuid4().hex
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        _requeue_stale_sending(cursor, conn)
+        cursor.execute("""
+            UPDATE email_logs
+            SET status = 'sending', claimed_by = %s, sent_at = NOW()
+            WHERE status = 'pending' AND (next_attempt_at IS NULL OR next_attempt_at <= NOW())
+            ORDER BY id
+            LIMIT %s
+        """, (claim_token, EMAIL_BATCH_SIZE))
+        claimed = cursor.rowcount
+        conn.commit()
+        if not claimed:
+            return []
+
+        cursor.execute(f"""
+            SELECT id, {_recipient_column()} AS recipient_email, subject, content, attempts
+            FROM email_logs
+            WHERE claimed_by = %s AND status = 'sending'
+            ORDER BY id
+        """, (claim_token,))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _record_results(results):
+    """
+    批次回寫發送結果，並喚醒等待中的 send_email(wait_seconds=...)。
+    失敗未達 EMAIL_MAX_ATTEMPTS 次時改回 pending，依嘗試次數指數退避後重試；達上限才標記 failed
+    """
+    sent_ids = [(log_id,) for log_id, success, _ in results if success]
+    failed = [(log_id, message) for log_id, success, message in results if not success]
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        if sent_ids:
+            cursor.executemany("""
+                UPDATE email_logs SET status = 'sent', claimed_by = NULL, sent_at = NOW()
+                WHERE id = %s
+            """, sent_ids)
+        if failed:
+            # MySQL 單表 UPDATE 由左至右套用 SET，後面的運算式讀到的是已 +1 的 attempts
+            if has_column('email_logs', 'error_message'):
+                error_sql = ", error_message = %s"
+                params = [(EMAIL_MAX_ATTEMPTS, EMAIL_RETRY_BASE_SECONDS, message, log_id) for log_id, message in failed]
+            else:
+                error_sql = ""
+                params = [(EMAIL_MAX_ATTEMPTS, EMAIL_RETRY_BASE_SECONDS, log_id) for log_id, _ in failed]
+            cursor.executemany(f"""
+                UPDATE email_logs
+                SET attempts = attempts + 1,
+                    status = IF(attempts >= %s, 'failed', 'pending'),
+                    next_attempt_at = NOW() + INTERVAL (%s * POW(2, attempts - 1)) SECOND,
+                    claimed_by = NULL{error_sql}
+                WHERE id = %s
+            """, params)
+        conn.commit()
+    except Exception as e:
+        print(f"⚠️ [email] 更新 email_logs 失敗: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+
+    with _workers_lock:
+        for log_id, success, message in results:
+            waiter = _waiters.get(log_id)
+            if waiter:
+                waiter["result"] = (success, message)
+                waiter["event"].set()
+
+
+def _friendly_error(e):
+    err = str(e)
+    # 處理 FileNotFoundError，提供更友好的錯誤訊息
+    if isinstance(e, FileNotFoundError) and 'credentials.json' in err:
+        return "Gmail 認證檔案未設定，請聯絡系統管理員設定郵件服務"
+    if 'credentials.json' in err:
+        return "Gmail 認證檔案設定錯誤，請聯絡系統管理員"
+    if USE_SMTP:
+        return _smtp_error_message(e)
+    return err
+
+
+def _worker_loop(worker_no):
+    smtp = SMTPSession()
+    gmail_service = None
+    while True:
+        try:
+            batch = _claim_batch()
+        except Exception as e:
+            print(f"⚠️ [email-worker-{worker_no}] 讀取郵件佇列失敗: {e}")
+            batch = []
+
+        if not batch:
+            if smtp.server is not None and smtp.idle_seconds() > SMTP_IDLE_SECONDS:
+                smtp.close()
+            _wakeup.wait(EMAIL_POLL_SECONDS)
+            _wakeup.clear()
+            continue
+
+        results = []
+        for row in batch:
+            recipient_email = row['recipient_email']
+            subject = row['subject']
+            try:
+                if USE_SMTP:
+                    smtp.send(recipient_email, subject, row['content'])
+                else:
+                    if gmail_service is None:
+                        gmail_service = get_gmail_service()
+                    _send_via_gmail(gmail_service, recipient_email, subject, row['content'])
+                print(f"✅ 郵件發送成功: {recipient_email} - {subject} ({'SMTP' if USE_SMTP else 'Gmail API'})")
+                results.append((row['id'], True, "郵件發送成功"))
+            except Exception as e:
+                message = _friendly_error(e)
+                attempt = (row.get('attempts') or 0) + 1
+                print(f"❌ 郵件發送失敗（第 {attempt}/{EMAIL_MAX_ATTEMPTS} 次）: {recipient_email} - {subject}: {message}")
+                results.append((row['id'], False, message))
+                # 連線狀態不明，下一封重新建立
+                smtp.close()
+                gmail_service = None
+        _record_results(results)
+
+
+def start_email_workers():
+    """啟動背景發送 worker（重複呼叫不會重複啟動）"""
+    if not EMAIL_ENABLED:
+        return
+    with _workers_lock:
+        if _workers:
+            return
+        for worker_no in range(max(1, EMAIL_WORKERS)):
+            worker = threading.Thread(
+                target=_worker_loop, args=(worker_no,),
+                name=f"email-worker-{worker_no}", daemon=True
             )
-        return False, f"SMTP 發送失敗：{err_str}"
+            worker.start()
+            _workers.append(worker)
+    print(f"📧 郵件佇列 worker 已啟動（{len(_workers)} 個）")
+    _wakeup.set()
 
 # =========================================================
-# 發送郵件 (Gmail API)
+# 發送郵件（寫入佇列）
 # =========================================================
 
-def send_email(recipient_email, subject, content, related_user_id=None):
+def send_email(recipient_email, subject, content, related_user_id=None, wait_seconds=None):
     """
-    使用 Gmail API 發送郵件
+    將郵件寫入 email_logs 佇列（status = 'pending'），由背景 worker 以 SMTP 或 Gmail API 發送
 
     參數:
         recipient_email: 收件人信箱
         subject: 郵件主旨
         content: 郵件內容 (純文字)
         related_user_id: 可選，用來記錄 email_logs
+        wait_seconds: 可選，等待實際發送結果的秒數（測試郵件用）；不傳則寫入佇列後立即返回
 
     回傳:
         (success: bool, message: str, log_id: int 或 None)
@@ -198,130 +494,66 @@ def send_email(recipient_email, subject, content, related_user_id=None):
     if not recipient_email:
         return (False, "收件人信箱為空", None)
 
+    try:
+        if USE_SMTP:
+            _check_smtp_settings()
+        elif not GMAIL_API_AVAILABLE or not os.path.exists(CREDENTIALS_PATH):
+            raise FileNotFoundError(
+                "Gmail API 未設定或憑證文件不存在。請設定 USE_SMTP=true 使用 SMTP 方式，"
+                "或在 EMAIL.env 中設定 USE_SMTP=false 並提供 credentials.json 文件"
+            )
+    except Exception as e:
+        print(f"❌ 郵件發送失敗: {e}")
+        return (False, _friendly_error(e), None)
+
     conn = None
     cursor = None
     log_id = None
+    waiter = None
 
     try:
         # 寫入 email_logs (pending)
-        conn = get_db()
+        conn = get_request_db()
         cursor = conn.cursor(dictionary=True)
-        # 檢查欄位名稱：可能是 recipient 或 recipient_email
-        try:
-            cursor.execute("""
-                INSERT INTO email_logs (recipient_email, subject, content, related_user_id, status, sent_at)
-                VALUES (%s, %s, %s, %s, 'pending', NOW())
-            """, (recipient_email, subject, content, related_user_id))
-        except Exception:
-            # 如果失敗，嘗試使用 recipient 欄位名稱
-            cursor.execute("""
-                INSERT INTO email_logs (recipient, subject, content, related_user_id, status, sent_at)
-                VALUES (%s, %s, %s, %s, 'pending', NOW())
-            """, (recipient_email, subject, content, related_user_id))
+        cursor.execute(f"""
+            INSERT INTO email_logs ({_recipient_column()}, subject, content, related_user_id, status, sent_at)
+            VALUES (%s, %s, %s, %s, 'pending', NOW())
+        """, (recipient_email, subject, content, related_user_id))
         log_id = cursor.lastrowid
+        if wait_seconds:
+            waiter = {"event": threading.Event(), "result": None}
+            with _workers_lock:
+                _waiters[log_id] = waiter
         conn.commit()
-
-        # 選擇發送方式：SMTP（推薦）或 Gmail API
-        if USE_SMTP:
-            # 使用 SMTP 發送（推薦，更簡單）
-            print("📧 使用 SMTP 方式發送郵件")
-            
-            if not SMTP_PASSWORD:
-                raise ValueError("SMTP 密碼未設定。請在 EMAIL.env 中設定 SMTP_PASSWORD（Gmail 應用程式密碼）")
-            
-            email_success, email_message = send_email_smtp(recipient_email, subject, content)
-            
-            if email_success:
-                # 更新 email_logs 成功
-                cursor.execute("""
-                    UPDATE email_logs
-                    SET status = 'sent', sent_at = NOW()
-                    WHERE id = %s
-                """, (log_id,))
-                conn.commit()
-                print(f"✅ 郵件發送成功: {recipient_email} - {subject} (SMTP)")
-                return (True, "郵件發送成功", log_id)
-            else:
-                raise Exception(email_message)
-        else:
-            # 使用 Gmail API 發送（需要 credentials.json）
-            if not GMAIL_API_AVAILABLE or not os.path.exists(CREDENTIALS_PATH):
-                raise FileNotFoundError(
-                    "Gmail API 未設定或憑證文件不存在。請設定 USE_SMTP=true 使用 SMTP 方式，"
-                    "或在 EMAIL.env 中設定 USE_SMTP=false 並提供 credentials.json 文件"
-                )
-            
-            print("📧 使用 Gmail API 方式發送郵件")
-            service = get_gmail_service()
-
-            # 建立郵件內容
-            message = MIMEText(content, 'plain', 'utf-8')
-            message['to'] = recipient_email
-            message['from'] = f"{SMTP_FROM_NAME} <{SMTP_FROM_EMAIL}>"
-            message['subject'] = subject
-
-            raw_bytes = message.as_bytes()
-            raw_b64 = base64.urlsafe_b64encode(raw_bytes).decode()
-
-            # 呼叫 Gmail API 寄信
-            send_result = service.users().messages().send(
-                userId='me',
-                body={'raw': raw_b64}
-            ).execute()
-
-            # 更新 email_logs 成功
-            cursor.execute("""
-                UPDATE email_logs
-                SET status = 'sent', sent_at = NOW()
-                WHERE id = %s
-            """, (log_id,))
-            conn.commit()
-
-            print(f"✅ 郵件發送成功: {recipient_email} - {subject} (Gmail API)")
-            return (True, "郵件發送成功", log_id)
-
     except Exception as e:
-        err = str(e)
-        print(f"❌ 郵件發送失敗: {err}")
+        print(f"❌ 郵件寫入佇列失敗: {e}")
         traceback.print_exc()
-
-        # 處理 FileNotFoundError，提供更友好的錯誤訊息
-        if isinstance(e, FileNotFoundError) and 'credentials.json' in err:
-            friendly_err = "Gmail 認證檔案未設定，請聯絡系統管理員設定郵件服務"
-        elif 'credentials.json' in err:
-            friendly_err = "Gmail 認證檔案設定錯誤，請聯絡系統管理員"
-        else:
-            friendly_err = err
-
-        # 更新 email_logs 為失敗
-        if conn and cursor and log_id:
-            try:
-                # 先嘗試更新 status 和 error_message
-                try:
-                    cursor.execute("""
-                        UPDATE email_logs
-                        SET status = 'failed', error_message = %s
-                        WHERE id = %s
-                    """, (friendly_err, log_id))
-                except Exception:
-                    # 如果 error_message 欄位不存在，只更新 status
-                    cursor.execute("""
-                        UPDATE email_logs
-                        SET status = 'failed'
-                        WHERE id = %s
-                    """, (log_id,))
-                conn.commit()
-            except Exception as inner_e:
-                print(f"⚠️ 更新記錄失敗: {inner_e}")
-
-        return (False, friendly_err, log_id)
-
+        if log_id is not None:
+            with _workers_lock:
+                _waiters.pop(log_id, None)
+        return (False, str(e), None)
     finally:
         if cursor:
             cursor.close()
         if conn:
             conn.close()
 
+    start_email_workers()
+    _wakeup.set()
+
+    if waiter is None:
+        print(f"📧 郵件已加入發送佇列: {recipient_email} - {subject}")
+        return (True, "郵件已加入發送佇列", log_id)
+
+    try:
+        if waiter["event"].wait(wait_seconds):
+            success, message = waiter["result"]
+            return (success, message, log_id)
+        return (True, "郵件已加入發送佇列，仍在發送中", log_id)
+    finally:
+        with _workers_lock:
+            _waiters.pop(log_id, None)
+
 # =========================================================
 # 審核履歷通過/退件、實習錄取通知郵件
 # =========================================================
@@ -0,0 +1,206 @@
+"""
+Excel 匯出引擎（各匯出 API 共用）
+
+- StreamingWorkbook：openpyxl write-only 工作簿，逐列寫入暫存檔，記憶體用量不隨列數增加
+- 樣式預先建立成 NamedStyle（標題、表頭、儲存格、公司標題…），每格只帶樣式名稱，不再逐格建立 Font / Border
+- iter_rows：以 fetchmany 分批讀取查詢結果，直接餵給工作表
+- write_company_grid：媒合結果 / 錄取名單共用的「4 欄公司網格」版面（依列輸出，write-only 可用）
+- response()：工作簿寫入暫存檔後以 send_file 分塊串流給前端，不複製到 BytesIO；暫存檔在傳送完畢關閉時刪除；
+  指定 cache_key 時改寫入匯出快取檔再傳送
+"""
+import shutil
+import tempfile
+
+from flask import send_file
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+from export_cache import store_export
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+FETCH_BATCH_SIZE = 500
+
+_THIN = Side(style="thin")
+_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+_CENTER = Alignment(horizontal="center", vertical="center")
+
+
+def _style(name, font=None, fill=None, border=None, alignment=None, number_format=None):
+    style = NamedStyle(name=name)
+    if font:
+        style.font = font
+    if fill:
+        style.fill = fill
+    if border:
+        style.border = border
+    if alignment:
+        style.alignment = alignment
+    if number_format:
+        style.number_format = number_format
+    return style
+
+
+def _build_styles():
+    return [
+        _style("x_title", font=Font(bold=True, size=14),
+               alignment=Alignment(horizontal="center", vertical="center", wrap_text=True)),
+        _style("x_title_left", font=Font(bold=True, size=14)),
+        _style("x_title_large", font=Font(bold=True, size=16), alignment=_CENTER),
+        _style("x_bold", font=Font(bold=True)),
+        _style("x_right", alignment=Alignment(horizontal="right")),
+        _style("x_header_blue", font=Font(bold=True, color="FFFFFF"), border=_BORDER, alignment=_CENTER,
+               fill=PatternFill(start_color="0066CC", end_color="0066CC", fill_type="solid")),
+        _style("x_header", font=Font(bold=True), border=_BORDER, alignment=_CENTER,
+               fill=PatternFill(start_color="E6F0FF", end_color="E6F0FF", fill_type="solid")),
+        _style("x_header_gray", font=Font(bold=True), border=_BORDER, alignment=_CENTER,
+               fill=PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")),
+        _style("x_cell", border=_BORDER, alignment=_CENTER),
+        _style("x_cell_wrap", border=_BORDER, alignment=Alignment(horizontal="center", vertical="center", wrap_text=True)),
+        _style("x_plain_border", border=_BORDER),
+        _style("x_cell_left", border=_BORDER, alignment=Alignment(vertical="center", wrap_text=True)),
+        _style("x_number", border=_BORDER, alignment=_CENTER, number_format="0"),
+        _style("x_company", font=Font(bold=True, size=12), border=_BORDER, alignment=_CENTER,
+               fill=PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")),
+        _style("x_student", font=Font(size=11), border=_BORDER, alignment=_CENTER),
+        _style("x_total", font=Font(bold=True, size=11), border=_BORDER, alignment=_CENTER),
+        _style("x_border", border=_BORDER, alignment=_CENTER),
+    ]
+
+
+def iter_rows(cursor, batch_size=FETCH_BATCH_SIZE):
+    """分批讀取已執行查詢的結果列"""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        for row in rows:
+            yield row
+
+
+class StreamingSheet:
+    """write-only 工作表；append 的 styles 可為單一樣式名稱或逐欄列表（None 表示不套用）"""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.row_count = 0
+
+    def append(self, values, styles=None, height=None):
+        if isinstance(styles, str) or styles is None:
+            styles = [styles] * len(values)
+        cells = []
+        for value, style in zip(values, styles):
+            if style is None:
+                cells.append(value)
+                continue
+            cell = WriteOnlyCell(self.ws, value=value)
+            cell.style = style
+            cells.append(cell)
+        self.row_count += 1
+        if height:
+            self.ws.row_dimensions[self.row_count].height = height
+        self.ws.append(cells)
+
+    def merge(self, first_col, last_col, row=None):
+        """合併目前列（或指定列）的 first_col..last_col（1-based）"""
+        row = row or self.row_count
+        self.ws.merged_cells.add(f"{get_column_letter(first_col)}{row}:{get_column_letter(last_col)}{row}")
+
+
+class StreamingWorkbook:
+    def __init__(self):
+        self.wb = Workbook(write_only=True)
+        for style in _build_styles():
+            self.wb.add_named_style(style)
+
+    def sheet(self, title, widths=None, row_height=None):
+        """建立工作表；widths 為各欄寬度（依序 A, B, C…），須在寫入資料前設定"""
+        ws = self.wb.create_sheet(title=title)
+        for idx, width in enumerate(widths or [], start=1):
+            if width:
+                ws.column_dimensions[get_column_letter(idx)].width = width
+        if row_height:
+            ws.sheet_format.defaultRowHeight = row_height
+            ws.sheet_format.customHeight = True
+        return StreamingSheet(ws)
+
+    def response(self, filename, cache_key=None, cache_meta=None):
+        """傳送工作簿；指定 cache_key 時同時存入匯出快取（見 export_cache），cache_meta 為命中時需要的附加資訊"""
+        output = tempfile.TemporaryFile()
+        self.wb.save(output)  # write-only 工作簿只能儲存一次，快取檔由暫存檔複製
+        if cache_key:
+            output.seek(0)
+            store_export(cache_key, lambda f: shutil.copyfileobj(output, f), meta=cache_meta)
+        output.seek(0)
+        return send_file(output, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=filename)
+
+
+def write_company_grid(sheet, companies, columns=4):
+    """
+    公司網格：公司依序分配到 columns 欄，每個區塊為
+    黃色公司標題（合併兩格）→ 學號 / 姓名 → N人 → 空白列，每區塊右側留一空欄。
+    companies：[{"name":..., "students": [{"student_number":..., "student_name":...}]}]
+    """
+    column_blocks = [[] for _ in range(columns)]
+    for idx, company in enumerate(companies):
+        column_blocks[idx % columns].append(company)
+
+    # 每一欄先展開成列（每列 3 格：值與樣式），再橫向組合成整列輸出
+    column_rows = []
+    for blocks in column_blocks:
+        rows = []
+        for company in blocks:
+            students = company["students"]
+            rows.append(((company["name"], "x_company"), ("", "x_company"), ("", "x_border"), "merge"))
+            for student in students:
+                rows.append(((_student_number_value(student.get("student_number")), "x_student"),
+                             (student.get("student_name") or "", "x_student"), ("", "x_border"), None))
+            rows.append((("", "x_border"), (f"{len(students)}人", "x_total"), ("", "x_border"), None))
+            rows.append((("", "x_border"), ("", "x_border"), ("", "x_border"), None))
+        column_rows.append(rows)
+
+    total_rows = max((len(rows) for rows in column_rows), default=0)
+    for row_idx in range(total_rows):
+        values, styles, merges = [], [], []
+        for col_idx, rows in enumerate(column_rows):
+            if row_idx < len(rows):
+                *cells, flag = rows[row_idx]
+                values.extend(value for value, _ in cells)
+                styles.extend(style for _, style in cells)
+                if flag == "merge":
+                    merges.append(col_idx * 3 + 1)
+            else:
+                values.extend([None, None, None])
+                styles.extend([None, None, None])
+        sheet.append(values, styles)
+        for first_col in merges:
+            sheet.merge(first_col, first_col + 1)
+
+
+def fit_widths(rows, padding=4):
+    """依各欄最長內容估算欄寬（write-only 無法事後調整，須先算好再建立工作表）"""
+    widths = []
+    for row in rows:
+        for idx, value in enumerate(row):
+            if idx >= len(widths):
+                widths.append(0)
+            if value is not None:
+                widths[idx] = max(widths[idx], len(str(value)))
+    return [w + padding for w in widths]
+
+
+def company_grid_widths(columns=4):
+    """姓名欄（每區塊第 2 欄）較寬，確保「姓名(職缺)」完整顯示"""
+    return [20 if col % 3 == 2 else 12 for col in range(1, columns * 3 + 1)]
+
+
+def _student_number_value(student_number):
+    """學號轉為純數字（Excel 以數字儲存）"""
+    if not student_number:
+        return ""
+    cleaned = "".join(filter(str.isdigit, str(student_number)))
+    try:
+        return int(cleaned) if cleaned else ""
+    except (ValueError, TypeError):
+        return cleaned
@@ -0,0 +1,150 @@
+"""
+匯出檔快取（媒合結果、錄取名單、未錄取名單、志願序）
+
+- 快取鍵：(匯出類型, 學期, 角色範圍, 資料版本)；資料版本只看該匯出讀取的來源表（呼叫端傳入 tables），
+  每張表取 COUNT(*) 與 MAX(updated_at)（有 updated_at 欄位時），只走索引 / 聚合，不逐列計算檢查碼；
+  新增、刪除或更新時寫入 updated_at 的變動都會讓版本不同，舊快取自然失效，寫入端不需任何額外動作
+- 命中時直接以 send_file 傳送 uploads/export_cache 中已產生的檔案，不再執行 JOIN 與產生工作簿
+- 未更新 updated_at 的就地修改、使用者姓名與公司名稱等其他表的變動不在版本內，
+  以 EXPORT_CACHE_TTL_SECONDS 限制快取最長使用時間
+- 無法取得資料版本時不使用快取，每次照常產生
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from flask import send_file
+
+from schema_cache import has_column
+
+EXPORT_CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "uploads", "export_cache"))
+EXPORT_CACHE_TTL_SECONDS = int(os.getenv("EXPORT_CACHE_TTL_SECONDS", "1800"))
+EXPORT_CACHE_MAX_FILES = int(os.getenv("EXPORT_CACHE_MAX_FILES", "200"))
+# 匯出版面變更時遞增，讓舊格式的快取檔失效
+EXPORT_CACHE_FORMAT_VERSION = 2
+
+_cache_stats = {"hits": 0, "misses": 0, "version_errors": 0}
+_cache_stats_lock = threading.Lock()
+
+
+def export_data_version(cursor, tables):
+    """tables 目前的資料版本（各表的筆數與最後更新時間）；無法取得時回傳 None（不使用快取）"""
+    columns = []
+    for table in tables:
+        columns.append(f"(SELECT COUNT(*) FROM {table})")
+        if has_column(table, "updated_at"):
+            columns.append(f"(SELECT MAX(updated_at) FROM {table})")
+    select_sql = ", ".join(f"{column} AS v{i}" for i, column in enumerate(columns))
+    try:
+        cursor.execute(f"SELECT {select_sql}")
+        row = cursor.fetchone()
+    except Exception as e:
+        with _cache_stats_lock:
+            _cache_stats["version_errors"] += 1
+        print(f"⚠️ 匯出快取：無法取得資料版本，本次不使用快取: {e}")
+        return None
+    values = list(row.values()) if isinstance(row, dict) else list(row or ())
+    return [list(tables), values]
+
+
+def export_cache_key(cursor, export_type, semester_id, tables, scope=None):
+    """
+    回傳快取鍵（快取未啟用時為 None）。
+    tables：此匯出讀取、且變動後內容即不同的來源表，例如 ("manage_director", "student_preferences")
+    scope：影響匯出內容的角色範圍與參數，例如 {"role": "class_teacher", "user_id": 3, "class_id": 5}
+    """
+    version = export_data_version(cursor, tables)
+    if version is None:
+        return None
+    raw = json.dumps([EXPORT_CACHE_FORMAT_VERSION, export_type, semester_id, scope or {}, version],
+                     sort_keys=True, ensure_ascii=False, default=str)
+    return f"{export_type}_{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+
+def export_cache_path(cache_key, ext=".xlsx"):
+    return os.path.join(EXPORT_CACHE_DIR, f"{cache_key}{ext}")
+
+
+def cached_export_response(cache_key, filename, mimetype, ext=".xlsx"):
+    """快取命中且未逾時則回傳 send_file 回應，否則回傳 None"""
+    if not cache_key:
+        return None
+    path = export_cache_path(cache_key, ext)
+    try:
+        fresh = time.time() - os.path.getmtime(path) < EXPORT_CACHE_TTL_SECONDS
+    except OSError:
+        fresh = False
+    with _cache_stats_lock:
+        _cache_stats["hits" if fresh else "misses"] += 1
+    if not fresh:
+        return None
+    print(f"⚡ 匯出快取命中: {filename}")
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=filename)
+
+
+def load_export_meta(cache_key):
+    """讀取與快取檔一起存放的附加資訊（例如檔名需要的班級名稱）；沒有則回傳 None"""
+    if not cache_key:
+        return None
+    try:
+        with open(export_cache_path(cache_key, ".json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path, write):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def store_export(cache_key, write, ext=".xlsx", meta=None):
+    """
+    以 write(file_obj) 寫入快取檔（先寫暫存檔再 os.replace，其他 worker 不會讀到寫到一半的檔案）；
+    meta 會另存為同名 .json，命中時以 load_export_meta 取回。回傳快取檔路徑；寫入失敗時回傳 None。
+    """
+    path = export_cache_path(cache_key, ext)
+    try:
+        os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+        if meta is not None:
+            payload = json.dumps(meta, ensure_ascii=False, default=str).encode("utf-8")
+            _write_atomic(export_cache_path(cache_key, ".json"), lambda f: f.write(payload))
+        _write_atomic(path, write)
+        _prune_cache()
+        return path
+    except OSError as e:
+        print(f"⚠️ 寫入匯出快取失敗: {e}")
+        return None
+
+
+def _prune_cache():
+    """快取檔超過上限時刪除最舊的一半"""
+    try:
+        entries = [os.path.join(EXPORT_CACHE_DIR, name) for name in os.listdir(EXPORT_CACHE_DIR)
+                   if not name.endswith(".tmp")]
+        if len(entries) <= EXPORT_CACHE_MAX_FILES:
+            return
+        entries.sort(key=lambda p: os.path.getmtime(p))
+        for path in entries[:len(entries) // 2]:
+            os.remove(path)
+    except OSError as e:
+        print(f"⚠️ 清理匯出快取失敗: {e}")
+
+
+def export_cache_stats():
+    with _cache_stats_lock:
+        stats = dict(_cache_stats)
+    total = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / total, 3) if total else None
+    return stats
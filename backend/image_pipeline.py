@@ -0,0 +1,135 @@
+"""
+上傳圖片正規化（照片、證照、成績單、缺勤佐證、頭像）
+
+save_uploaded_image 取代直接 file.save()：
+- 以 Pillow 驗證圖片、依 EXIF 方向轉正、縮到該用途的最大尺寸後重新編碼（JPEG 漸進式 / PNG optimize）
+- 會放進 Word 的圖片（DOCUMENT_KINDS）同目錄另存衍生檔 <檔名>.doc.jpg；頭像只保留縮小後的原檔
+- PDF 等非圖片檔、或未安裝 Pillow 時照原樣儲存
+
+產生履歷時以 document_image_path 取用 .doc 衍生檔，不再讀入完整原圖。
+"""
+import io
+import os
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow 未安裝時照原樣儲存
+    Image = None
+    ImageOps = None
+
+# 各用途原檔保留的最大邊長（px）；文件用圖 300 dpi 下約 4 吋寬
+MAX_SIDES = {
+    "photo": 1200,
+    "certificate": 2000,
+    "transcript": 2400,
+    "proof": 2000,
+    "avatar": 512,
+}
+# 產生履歷 Word 時會插入的用途，才需要 .doc 衍生檔
+DOCUMENT_KINDS = {"photo", "certificate", "transcript", "proof"}
+DOC_MAX_SIDE = 1200
+JPEG_QUALITY = 85
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tif', '.tiff'}
+_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.gif': 'GIF', '.bmp': 'BMP',
+            '.webp': 'WEBP', '.tif': 'TIFF', '.tiff': 'TIFF'}
+
+
+def variant_path(path, variant):
+    """衍生檔路徑：photo.png → photo.doc.jpg"""
+    stem, _ = os.path.splitext(path)
+    return f"{stem}.{variant}.jpg"
+
+
+def _has_alpha(img):
+    return img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+
+
+def _to_rgb(img):
+    """去除透明背景（補白底）並轉 RGB，供 JPEG 編碼"""
+    if _has_alpha(img):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+
+def _resized(img, max_side):
+    if max(img.size) <= max_side:
+        return img
+    img = img.copy()
+    img.thumbnail((max_side, max_side), Image.LANCZOS)
+    return img
+
+
+def _save_encoded(img, path, fmt):
+    if fmt == "JPEG":
+        _to_rgb(img).save(path, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    elif fmt == "PNG":
+        img.save(path, "PNG", optimize=True)
+    else:
+        img.save(path, fmt)
+
+
+def _write_variants(img, path, kind):
+    if kind in DOCUMENT_KINDS:
+        _save_encoded(_resized(img, DOC_MAX_SIDE), variant_path(path, "doc"), "JPEG")
+
+
+def save_uploaded_image(file_storage, save_path, kind="photo"):
+    """
+    儲存上傳檔（werkzeug FileStorage）到 save_path。
+    圖片會驗證、轉正、縮圖，文件用圖另產生 .doc 衍生檔；回傳是否成功（圖片損壞或無法辨識時回傳 False，不會留下檔案）。
+    """
+    ext = os.path.splitext(save_path)[1].lower()
+    if Image is None or ext not in IMAGE_EXTENSIONS:
+        file_storage.save(save_path)
+        return True
+
+    data = file_storage.read()
+    try:
+        with Image.open(io.BytesIO(data)) as probe:
+            probe.verify()
+        img = Image.open(io.BytesIO(data))
+        if getattr(img, "is_animated", False):
+            # 動畫 GIF 不重新編碼，只產生靜態衍生檔
+            with open(save_path, "wb") as f:
+                f.write(data)
+            img.seek(0)
+            _write_variants(img.convert("RGBA"), save_path, kind)
+            return True
+        img = ImageOps.exif_transpose(img)
+        img.load()
+    except Exception as e:
+        print(f"⚠️ 上傳圖片無效或損壞，已拒絕: {os.path.basename(save_path)} ({e})")
+        return False
+
+    max_side = MAX_SIDES.get(kind, DOC_MAX_SIDE)
+    normalized = _resized(img, max_side)
+    try:
+        # 原檔維持副檔名對應的格式，資料庫與既有路徑不受影響
+        _save_encoded(normalized, save_path, _FORMATS[ext])
+        _write_variants(normalized, save_path, kind)
+    except Exception as e:
+        print(f"⚠️ 圖片重新編碼失敗，改存原檔: {os.path.basename(save_path)} ({e})")
+        with open(save_path, "wb") as f:
+            f.write(data)
+    saved = os.path.getsize(save_path)
+    if saved < len(data):
+        print(f"🖼️ 圖片已正規化: {os.path.basename(save_path)} {len(data) // 1024}KB → {saved // 1024}KB")
+    return True
+
+
+def _fresh_variant(path, variant):
+    candidate = variant_path(path, variant)
+    try:
+        if os.path.getmtime(candidate) >= os.path.getmtime(path):
+            return candidate
+    except OSError:
+        pass
+    return path
+
+
+def document_image_path(path):
+    """產生 Word 用的圖片：有較新的 .doc 衍生檔則用衍生檔，否則用原檔（舊資料）"""
+    return _fresh_variant(path, "doc") if path else path
@@ -3,7 +3,8 @@ from config import get_db
 import traceback
 from datetime import datetime, timezone, timedelta
 from email_service import send_email, send_interview_email, send_admission_email
-from notification import create_notification
+from notification import create_notification, add_unread_counts, publish_unread_change
+from announcement import mark_announcement_pushed
 
 def get_taiwan_time():
     """取得目前的台灣時間 (UTC+8)"""
@@ -541,6 +542,8 @@ def approve_experience(exp_id):
                 VALUES (%s, %s, %s, %s, %s, %s, %s)
             """, (ann_title, ann_content, start_time, end_time, 1, "student", now))
             ann_id = cursor.lastrowid
+            # 只通知該學生（下方），標記為已推播，避免排程推播給所有學生
+            mark_announcement_pushed(cursor, ann_id, now)
             db.commit()
             
             # 為該學生創建通知，指向該公告（使用同一個資料庫連接）
@@ -552,7 +555,9 @@ def approve_experience(exp_id):
                     INSERT INTO notifications (user_id, title, message, category, link_url, is_read, created_at)
                     VALUES (%s, %s, %s, %s, %s, 0, NOW())
                 """, (student_id, notification_title, notification_message, "experience", link_url))
+                add_unread_counts(cursor, [student_id], link_url)
                 db.commit()
+                publish_unread_change([student_id], cursor=cursor)
                 print(f"[成功] 為學生 {student_id} 創建通知成功，公告ID: {ann_id}, 通知標題: {notification_title}")
             except Exception as e:
                 print(f"[錯誤] 創建通知時發生異常: {traceback.format_exc()}")
@@ -714,7 +719,8 @@ def test_email():
             recipient_email=recipient_email,
             subject=subject,
             content=content,
-            related_user_id=session.get('user_id')
+            related_user_id=session.get('user_id'),
+            wait_seconds=30  # 測試郵件需回報實際發送結果
         )
         
         if success:
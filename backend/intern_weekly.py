@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify, session, send_from_directory
 from config import get_db
+from schema_cache import has_column, refresh_schema_cache
 from semester import get_current_semester_code
 from datetime import datetime
 from werkzeug.utils import secure_filename
@@ -18,13 +19,14 @@ def _ensure_file_name_column():
   if _column_checked:
     return
   try:
-    db = get_db()
-    cur = db.cursor()
-    cur.execute("SHOW COLUMNS FROM intern_weeklies LIKE 'file_name'")
-    if not cur.fetchone():
+    if not has_column('intern_weeklies', 'file_name'):
+      db = get_db()
+      cur = db.cursor()
       cur.execute("ALTER TABLE intern_weeklies ADD COLUMN file_name VARCHAR(255) DEFAULT NULL AFTER file_path")
       db.commit()
-    cur.close()
+      refresh_schema_cache(cur)
+      cur.close()
+      db.close()
     _column_checked = True
   except Exception:
     traceback.print_exc()
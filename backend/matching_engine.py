@@ -0,0 +1,876 @@
+"""
+第一輪媒合引擎
+
+以少數幾個批次查詢載入 manage_director、resume_applications（廠商排序 slot_index / is_reserve）、
+student_job_applications、student_preferences 與公司 / 職缺 / 學生資料，建立以 id 為鍵的索引，
+在記憶體中一次算出重複中選、各職缺名額與主任 / 廠商排序畫面。
+
+原本 director_matching_results / final_matching_results 的多表 LEFT JOIN（每列一個取最新志願序的
+相關子查詢）與 _resolve_duplicate_students 的重複讀取，都改由同一份 MatchingSnapshot 提供。
+"""
+import time
+from collections import deque
+from copy import deepcopy
+from datetime import datetime
+
+from schema_cache import has_column
+
+_DECISION_ORDER = {'Approved': 1, 'Pending': 2, 'Rejected': 3}
+NO_ORDER = 999  # 沒有志願序 / 排序者排在最後
+
+
+def _get(row, key):
+    return row[key] if row else None
+
+
+def _coalesce(*values):
+    for value in values:
+        if value is not None:
+            return value
+    return None
+
+
+def _nulls_first(value):
+    """與 MySQL ORDER BY 相同：NULL 排在最前面"""
+    return (value is not None, value if value is not None else 0)
+
+
+def _empty_job(job_id, job_title, job_slots):
+    return {
+        "job_id": job_id,
+        "job_title": job_title,
+        "job_slots": job_slots,
+        "regulars": [],
+        "reserves": []
+    }
+
+
+class MatchingSnapshot:
+    """某學期第一輪媒合資料的記憶體快照"""
+
+    def __init__(self, semester_id):
+        self.semester_id = semester_id
+        self.has_md_semester = False
+        self.md_rows = []
+        self.sja_by_id = {}
+        self.ra_by_application = {}   # application_id -> [resume_applications]
+        self.sp_by_key = {}           # (student_id, company_id, job_id) -> [student_preferences]
+        self.latest_approved_order = {}  # (student_id, company_id, job_id) -> 最新一筆 approved 的 preference_order
+        self.companies = {}           # id -> 公司（依 company_name 排序載入）
+        self.jobs = {}                # id -> 職缺（依 company_id, id 排序載入）
+        self.users = {}               # id -> 學生 / 廠商使用者
+
+    # -----------------------------------------------------
+    # 載入
+    # -----------------------------------------------------
+    @classmethod
+    def load(cls, cursor, semester_id, with_details=True):
+        """with_details=False 只載入重複學生處理所需的資料（不含廠商排序與公司 / 學生資料）"""
+        snap = cls(semester_id)
+        snap.has_md_semester = has_column('manage_director', 'semester_id')
+        md_semester_col = "md.semester_id" if snap.has_md_semester else "NULL"
+
+        cursor.execute(f"""
+            SELECT md.match_id, md.vendor_id, md.student_id, md.preference_id,
+                   md.original_type, md.original_rank, md.is_conflict, md.director_decision,
+                   md.final_rank, md.is_adjusted, md.updated_at,
+                   {md_semester_col} AS semester_id
+            FROM manage_director md
+            ORDER BY md.match_id
+        """)
+        snap.md_rows = cursor.fetchall() or []
+
+        cursor.execute("""
+            SELECT sja.id, sja.student_id, sja.company_id, sja.job_id
+            FROM student_job_applications sja
+            JOIN (SELECT DISTINCT preference_id FROM manage_director) p ON p.preference_id = sja.id
+        """)
+        snap.sja_by_id = {row['id']: row for row in cursor.fetchall() or []}
+
+        cursor.execute("""
+            SELECT sp.id, sp.student_id, sp.company_id, sp.job_id, sp.semester_id,
+                   sp.preference_order, sp.status, sp.submitted_at
+            FROM student_preferences sp
+            JOIN (
+                SELECT DISTINCT sja.student_id
+                FROM student_job_applications sja
+                JOIN manage_director md ON md.preference_id = sja.id
+            ) s ON s.student_id = sp.student_id
+            ORDER BY sp.id
+        """)
+        latest_submitted = {}
+        for sp in cursor.fetchall() or []:
+            key = (sp['student_id'], sp['company_id'], sp['job_id'])
+            snap.sp_by_key.setdefault(key, []).append(sp)
+            if sp['status'] == 'approved':
+                submitted_at = sp['submitted_at']
+                if key not in latest_submitted or _nulls_first(submitted_at) > _nulls_first(latest_submitted[key]):
+                    latest_submitted[key] = submitted_at
+                    snap.latest_approved_order[key] = sp['preference_order']
+
+        if not with_details:
+            return snap
+
+        cursor.execute("""
+            SELECT ra.id, ra.application_id, ra.job_id, ra.apply_status, ra.is_reserve, ra.slot_index,
+                   ra.updated_at, ra.created_at
+            FROM resume_applications ra
+            JOIN (SELECT DISTINCT preference_id FROM manage_director) p ON p.preference_id = ra.application_id
+            ORDER BY ra.id
+        """)
+        for ra in cursor.fetchall() or []:
+            snap.ra_by_application.setdefault(ra['application_id'], []).append(ra)
+
+        cursor.execute("SELECT id, company_name, status FROM internship_companies ORDER BY company_name")
+        snap.companies = {row['id']: row for row in cursor.fetchall() or []}
+
+        cursor.execute("SELECT id, company_id, title, slots, is_active FROM internship_jobs ORDER BY company_id, id")
+        snap.jobs = {row['id']: row for row in cursor.fetchall() or []}
+
+        cursor.execute("""
+            SELECT u.id, u.name, u.username, u.email, u.admission_year,
+                   c.name AS class_name, c.department AS class_department
+            FROM users u
+            LEFT JOIN classes c ON u.class_id = c.id
+            JOIN (
+                SELECT student_id AS uid FROM manage_director
+                UNION SELECT vendor_id FROM manage_director
+                UNION SELECT sja.student_id FROM student_job_applications sja
+                      JOIN manage_director md ON md.preference_id = sja.id
+            ) t ON t.uid = u.id
+        """)
+        snap.users = {row['id']: row for row in cursor.fetchall() or []}
+        return snap
+
+    # -----------------------------------------------------
+    # 組合媒合記錄（對應原本 resume_applications ... RIGHT JOIN manage_director 的每一列）
+    # -----------------------------------------------------
+    def _matching_rows(self):
+        for md in self.md_rows:
+            sja = self.sja_by_id.get(md['preference_id'])
+            for ra in self.ra_by_application.get(md['preference_id']) or [None]:
+                # 原查詢以 resume_applications 為左表：沒有廠商排序記錄時 sja / sp 也都是 NULL
+                row_sja = sja if ra is not None else None
+                sps = [None]
+                if row_sja:
+                    key = (row_sja['student_id'], row_sja['company_id'], row_sja['job_id'])
+                    if None not in key:
+                        sps = [
+                            sp for sp in self.sp_by_key.get(key, [])
+                            if sp['semester_id'] == self.semester_id or sp['semester_id'] is None
+                        ] or [None]
+                for sp in sps:
+                    row = self._build_row(md, ra, row_sja, sp)
+                    if row is not None:
+                        yield row
+
+    def _build_row(self, md, ra, sja, sp):
+        company_ref = _coalesce(_get(sp, 'company_id'), _get(sja, 'company_id'), md['vendor_id'])
+        company = self.companies.get(company_ref)
+        # 公司狀態必須是已審核（公司不存在則也顯示）；廠商已設為未錄取(rejected)的學生不顯示
+        if company and company['status'] is not None and company['status'] != 'approved':
+            return None
+        if ra is not None and (ra['apply_status'] is None or ra['apply_status'] == 'rejected'):
+            return None
+
+        job_id = _coalesce(_get(sp, 'job_id'), _get(sja, 'job_id'), _get(ra, 'job_id'))
+        job = self.jobs.get(job_id)
+        student_id = _coalesce(md['student_id'], _get(sja, 'student_id'))
+        student = self.users.get(student_id)
+        vendor_user = self.users.get(md['vendor_id'])
+        preference_order = None
+        if sja:
+            preference_order = self.latest_approved_order.get((sja['student_id'], sja['company_id'], sja['job_id']))
+
+        return {
+            "match_id": md['match_id'],
+            "vendor_id": _coalesce(md['vendor_id'], _get(sja, 'company_id')),
+            "student_id": student_id,
+            "preference_id": _get(sp, 'id'),
+            "md_original_type": md['original_type'],
+            "original_type": _coalesce(
+                md['original_type'],
+                'Regular' if ra is not None and ra['is_reserve'] == 0 else 'Backup'
+            ),
+            "original_rank": _coalesce(md['original_rank'], _get(ra, 'slot_index')),
+            "is_conflict": _coalesce(md['is_conflict'], 0),
+            "director_decision": _coalesce(md['director_decision'], 'Pending'),
+            "md_director_decision": md['director_decision'],
+            "final_rank": md['final_rank'],
+            "is_adjusted": _coalesce(md['is_adjusted'], 0),
+            "updated_at": _coalesce(md['updated_at'], _get(ra, 'updated_at'), _get(ra, 'created_at')),
+            "company_id": _coalesce(company_ref, _get(ra, 'job_id')),
+            "company_ref": company_ref,
+            "preference_order": preference_order,
+            "job_id": job_id,
+            "company_name": _get(company, 'company_name'),
+            "student_name": _get(student, 'name'),
+            "student_number": _get(student, 'username'),
+            "student_email": _get(student, 'email'),
+            "admission_year": _get(student, 'admission_year'),
+            "class_name": _get(student, 'class_name'),
+            "class_department": _get(student, 'class_department'),
+            "vendor_name": _coalesce(_get(vendor_user, 'name'), _get(company, 'company_name')),
+            "job_title": _get(job, 'title'),
+            "job_slots": _get(job, 'slots'),
+            "vendor_is_reserve": _get(ra, 'is_reserve'),
+            "vendor_slot_index": _get(ra, 'slot_index'),
+            "_ra_slot_index": _get(ra, 'slot_index'),
+        }
+
+    @staticmethod
+    def _rank_keys(row):
+        final_rank = row['final_rank']
+        original_rank = row['original_rank']
+        return (
+            _coalesce(final_rank, original_rank, NO_ORDER),
+            _coalesce(original_rank, NO_ORDER),
+        )
+
+    def director_rows(self):
+        """主任畫面記錄，排序同原查詢：決定狀態 → 公司 → 職缺 → 主任名次 → 廠商名次"""
+        rows = list(self._matching_rows())
+        rows.sort(key=lambda r: (
+            _DECISION_ORDER.get(r['director_decision'], 4),
+            _nulls_first(r['company_ref']),
+            _nulls_first(r['job_id']),
+            0 if r['md_director_decision'] == 'Approved' and r['final_rank'] is not None else 1,
+        ) + self._rank_keys(r))
+        return rows
+
+    def approved_rows(self):
+        """主任已確認（Approved）的記錄，排序：公司 → 職缺 → 主任名次 → 廠商名次"""
+        rows = [r for r in self._matching_rows() if r['md_director_decision'] == 'Approved']
+        rows.sort(key=lambda r: (
+            _nulls_first(r['company_ref']),
+            _nulls_first(r['job_id']),
+            0 if r['final_rank'] is not None else 1,
+        ) + self._rank_keys(r))
+        return rows
+
+    # -----------------------------------------------------
+    # 重複中選 / 職缺
+    # -----------------------------------------------------
+    @staticmethod
+    def _dedupe(rows):
+        """同一學生在同一公司/職缺只保留第一筆；回傳 (保留的記錄, 重複中選學生 {student_id: [company_ids]})"""
+        seen = {}
+        student_companies = {}
+        for row in rows:
+            key = (row['student_id'], row['company_id'], row['job_id'])
+            if key in seen:
+                continue
+            seen[key] = row
+            companies = student_companies.setdefault(row['student_id'], [])
+            if row['company_id'] not in companies:
+                companies.append(row['company_id'])
+        duplicates = {sid: companies for sid, companies in student_companies.items() if len(companies) > 1}
+        return seen, duplicates
+
+    @staticmethod
+    def _best_match_ids(rows, duplicates):
+        """重複中選的學生：志願序最高者優先，志願序相同時優先選有媒合排序的記錄"""
+        best = {}  # student_id -> (match_id_str, preference_order, has_sorting)
+        for row in rows:
+            student_id = row['student_id']
+            if student_id not in duplicates:
+                continue
+            preference_order = row['preference_order'] if row['preference_order'] is not None else NO_ORDER
+            has_sorting = row['vendor_slot_index'] is not None or row['original_rank'] is not None
+            match_id_str = str(row['match_id']) if row['match_id'] is not None else None
+            current = best.get(student_id)
+            if current is None or preference_order < current[1] or \
+               (preference_order == current[1] and has_sorting and not current[2]):
+                best[student_id] = (match_id_str, preference_order, has_sorting)
+        return best
+
+    def _approved_companies_with_jobs(self):
+        """所有已審核公司及其啟用中的職缺（即使沒有媒合結果也要顯示）"""
+        companies_data = {}
+        for company_id, company in self.companies.items():
+            if company['status'] == 'approved':
+                companies_data[company_id] = {
+                    "company_id": company_id,
+                    "company_name": company['company_name'],
+                    "jobs": {}
+                }
+        for job_id, job in self.jobs.items():
+            if job['company_id'] in companies_data and job['is_active'] == 1:
+                companies_data[job['company_id']]["jobs"][job_id] = _empty_job(
+                    job_id, job['title'] or "未指定職缺", effective_slots(job['slots'])
+                )
+        return companies_data
+
+    # -----------------------------------------------------
+    # 重複學生自動處理（原 _resolve_duplicate_students）
+    # -----------------------------------------------------
+    def resolve_duplicate_students(self, cursor):
+        """
+        同一學期同一學生有多筆 Approved / Pending 記錄時，保留志願序最高（preference_order 最小，
+        相同則 match_id 較小）的記錄，其餘 Approved 改為 Pending。回傳更新筆數。
+        """
+        records_by_student = {}
+        for md in self.md_rows:
+            if md['director_decision'] not in ('Approved', 'Pending'):
+                continue
+            if self.has_md_semester and md['semester_id'] != self.semester_id:
+                continue
+            if not md['student_id']:
+                continue
+            sja = self.sja_by_id.get(md['preference_id'])
+            orders = [None]
+            if sja and None not in (sja['student_id'], sja['company_id'], sja['job_id']):
+                sps = self.sp_by_key.get((sja['student_id'], sja['company_id'], sja['job_id']), [])
+                if self.has_md_semester:
+                    sps = [sp for sp in sps if sp['semester_id'] == self.semester_id]
+                orders = [sp['preference_order'] for sp in sps] or [None]
+            for order in orders:
+                records_by_student.setdefault(md['student_id'], []).append((md, order))
+
+        demote_ids = []
+        for student_id, records in records_by_student.items():
+            if len(records) <= 1:
+                continue
+
+            def record_key(record):
+                md, order = record
+                match_id = md['match_id']
+                match_id_int = int(match_id) if match_id and str(match_id).isdigit() else 999999
+                return (order if order is not None else NO_ORDER, match_id_int)
+
+            best_md = min(records, key=record_key)[0]
+            for md, _ in records:
+                if str(md['match_id']) != str(best_md['match_id']) and md['director_decision'] == 'Approved' \
+                   and md['match_id'] not in demote_ids:
+                    demote_ids.append(md['match_id'])
+
+        if not demote_ids:
+            return 0
+        placeholders = ", ".join(["%s"] * len(demote_ids))
+        cursor.execute(f"""
+            UPDATE manage_director
+            SET director_decision = 'Pending',
+                updated_at = CURRENT_TIMESTAMP
+            WHERE match_id IN ({placeholders})
+        """, demote_ids)
+        updated_count = cursor.rowcount
+        # 快照同步，供同一請求後續使用
+        for md in self.md_rows:
+            if md['match_id'] in demote_ids:
+                md['director_decision'] = 'Pending'
+        print(f"✅ 自動處理重複學生：已將 {updated_count} 筆記錄更新為 Pending（match_id={demote_ids}）")
+        return updated_count
+
+    # -----------------------------------------------------
+    # 主任媒合畫面（director_matching_results）
+    # -----------------------------------------------------
+    def director_view(self):
+        seen, duplicate_students = self._dedupe(self.director_rows())
+
+        formatted_results = []
+        for (student_id, company_id, job_id), result in seen.items():
+            # 判斷是否為正取或備取：只把「真的來自廠商排序」的紀錄（manage_director 有 original_type，
+            # 且 resume_applications 有 is_reserve / slot_index）當成廠商原始結果
+            vendor_is_reserve = result["vendor_is_reserve"]
+            vendor_slot_index = result["vendor_slot_index"]
+            original_rank = result["original_rank"]
+            original_type = result["original_type"]
+            has_vendor_sorting = (
+                result["md_original_type"] is not None and
+                (vendor_is_reserve is not None or vendor_slot_index is not None)
+            )
+            if has_vendor_sorting:
+                is_reserve = bool(vendor_is_reserve) if vendor_is_reserve is not None else False
+                slot_index = original_rank if original_rank is not None else vendor_slot_index
+            elif result["director_decision"] == "Approved" and result["final_rank"] is not None:
+                # 主任已核定為正取
+                is_reserve = False
+                slot_index = result["final_rank"]
+            elif result["director_decision"] == "Pending" and original_type == "Regular" and original_rank is not None:
+                is_reserve = False
+                slot_index = original_rank
+            else:
+                is_reserve = True
+                slot_index = None
+
+            updated_at = result["updated_at"]
+            formatted_results.append({
+                "id": result["match_id"],  # 使用 match_id 作為識別符
+                "match_id": result["match_id"],
+                "vendor_id": result["vendor_id"],
+                "vendor_name": result["vendor_name"],
+                "company_id": company_id,
+                "company_name": result["company_name"],
+                "job_id": job_id,
+                "job_title": result["job_title"] or "未指定職缺",
+                "job_slots": result["job_slots"],
+                "student_id": student_id,
+                "student_name": result["student_name"],
+                "student_number": result["student_number"],
+                "student_email": result["student_email"],
+                "class_name": result["class_name"],
+                "class_department": result["class_department"],
+                "preference_order": result["preference_order"],
+                "preference_id": result["preference_id"],
+                "slot_index": slot_index,
+                "is_reserve": is_reserve,
+                "director_decision": result["director_decision"],
+                "final_rank": result["final_rank"],
+                "is_adjusted": bool(result["is_adjusted"]),
+                "is_conflict": bool(result["is_conflict"]),
+                "original_type": original_type,
+                "original_rank": original_rank,
+                "vendor_is_reserve": vendor_is_reserve,
+                "vendor_slot_index": vendor_slot_index,  # 廠商的排序索引，用於判斷是否有媒合排序
+                "has_vendor_sorting": has_vendor_sorting,
+                "updated_at": updated_at.strftime("%Y-%m-%d %H:%M:%S") if isinstance(updated_at, datetime) else str(updated_at),
+                "is_duplicate": bool(result["is_conflict"]) or student_id in duplicate_students,
+                "duplicate_companies": duplicate_students.get(student_id, []),
+            })
+
+        best_match_id = self._best_match_ids(formatted_results, duplicate_students)
+
+        # 廠商原始排序：只放有廠商實際排序資料的記錄，依廠商自己的正／備取設定，不過濾重複學生
+        companies_data_vendor = self._approved_companies_with_jobs()
+        self._place(companies_data_vendor, (r for r in formatted_results if r["has_vendor_sorting"]),
+                    lambda r: bool(r["vendor_is_reserve"]) if r["vendor_is_reserve"] is not None else r["is_reserve"])
+
+        # 主任排序結果：排除 Rejected；重複中選的學生只保留志願序最高的記錄
+        filtered_results = []
+        for result in formatted_results:
+            if result["director_decision"] == "Rejected":
+                continue
+            student_id = result["student_id"]
+            if student_id in duplicate_students:
+                match_id_str = str(result["match_id"]) if result["match_id"] is not None else None
+                if best_match_id.get(student_id, (None,))[0] != match_id_str:
+                    continue
+            filtered_results.append(result)
+        companies_data = self._approved_companies_with_jobs()
+        self._place(companies_data, filtered_results, lambda r: r["is_reserve"])
+
+        def director_sort_key(x):
+            # 重複中選的學生排前面並依志願序，其餘依 original_rank 或 slot_index
+            is_duplicate = x["student_id"] in duplicate_students
+            preference_order = x["preference_order"]
+            rank_value = x["original_rank"] if x["original_rank"] is not None else x["slot_index"]
+            return (
+                not is_duplicate,
+                preference_order is None if is_duplicate else False,
+                preference_order if (is_duplicate and preference_order is not None) else NO_ORDER,
+                rank_value is None,
+                rank_value or NO_ORDER
+            )
+
+        def vendor_sort_key(x):
+            return (x["original_rank"] is None, x["original_rank"] or x["slot_index"] or NO_ORDER)
+
+        return {
+            "companies": self._to_list(companies_data, director_sort_key, with_vacancy=True),  # 主任排序結果（已過濾重複學生）
+            "vendor_companies": self._to_list(companies_data_vendor, vendor_sort_key),  # 廠商原始排序（不過濾，保持原樣）
+            "duplicate_students": list(duplicate_students.keys()),
+            "total_matches": len(formatted_results),
+        }
+
+    @staticmethod
+    def _place(companies_data, results, is_reserve_of):
+        """將記錄分配到公司/職缺的正取或備取；同一學生在同一公司/職缺只放一次"""
+        added = set()
+        for result in results:
+            company_id = result["company_id"]
+            job_id = result["job_id"] or 0
+            key = (company_id, job_id, result["student_id"])
+            if key in added:
+                continue
+            company = companies_data.setdefault(company_id, {
+                "company_id": company_id,
+                "company_name": result["company_name"],
+                "jobs": {}
+            })
+            job = company["jobs"].setdefault(job_id, _empty_job(
+                job_id, result["job_title"] or "未指定職缺", result["job_slots"] or 1
+            ))
+            job["reserves" if is_reserve_of(result) else "regulars"].append(result)
+            added.add(key)
+
+    @staticmethod
+    def _to_list(companies_data, sort_key, with_vacancy=False):
+        companies_list = []
+        for company_id, company_data in companies_data.items():
+            jobs_list = []
+            for job_data in company_data["jobs"].values():
+                regulars = sorted(job_data["regulars"], key=sort_key)
+                job_entry = {
+                    "job_id": job_data["job_id"],
+                    "job_title": job_data["job_title"],
+                    "job_slots": job_data["job_slots"],
+                    "regulars": regulars,
+                    "reserves": sorted(job_data["reserves"], key=sort_key)
+                }
+                if with_vacancy:
+                    job_entry["vacancy"] = max((job_data["job_slots"] or 1) - len(regulars), 0)
+                jobs_list.append(job_entry)
+            companies_list.append({
+                "company_id": company_id,
+                "company_name": company_data["company_name"],
+                "jobs": jobs_list
+            })
+        return companies_list
+
+    # -----------------------------------------------------
+    # 主任確認後的媒合結果（final_matching_results）
+    # -----------------------------------------------------
+    def final_view(self, active_semester_year):
+        seen, duplicate_students = self._dedupe(self.approved_rows())
+        best_match_id = self._best_match_ids(seen.values(), duplicate_students)
+
+        formatted_results = []
+        for (student_id, company_id, job_id), result in seen.items():
+            if student_id in duplicate_students:
+                match_id_str = str(result["match_id"]) if result["match_id"] is not None else None
+                if best_match_id.get(student_id, (None,))[0] != match_id_str:
+                    continue
+
+            vendor_is_reserve = result["vendor_is_reserve"]
+            vendor_slot_index = result["vendor_slot_index"]
+            original_rank = result["original_rank"]
+            original_type = result["original_type"]
+            if vendor_is_reserve is not None or vendor_slot_index is not None:
+                # 有廠商的媒合排序資料：final_rank（主任調整後）→ original_rank → vendor_slot_index
+                is_reserve = bool(vendor_is_reserve) if vendor_is_reserve is not None else False
+                slot_index = _coalesce(result["final_rank"], original_rank, vendor_slot_index)
+            elif result["final_rank"] is not None:
+                is_reserve = False
+                slot_index = result["final_rank"]
+            elif original_type == "Regular" and original_rank is not None:
+                is_reserve = False
+                slot_index = original_rank
+            else:
+                is_reserve = True
+                slot_index = None
+
+            formatted_results.append({
+                "id": result["match_id"],
+                "match_id": result["match_id"],
+                "student_id": student_id,
+                "student_name": result["student_name"],
+                "student_number": result["student_number"],
+                "class_name": result["class_name"],
+                "grade_display": _grade_display(active_semester_year, result),
+                "company_id": company_id,
+                "company_name": result["company_name"],
+                "job_id": job_id,
+                "job_title": result["job_title"] or "未指定職缺",
+                "job_slots": result["job_slots"] or 1,
+                "preference_order": result["preference_order"],
+                "slot_index": slot_index,
+                "is_reserve": is_reserve,
+                # 主任媒合結果的原始信息，用於顯示「原正取2」等標籤
+                "original_rank": original_rank,
+                "original_type": original_type,
+                "final_rank": result["final_rank"],
+                "is_adjusted": bool(result["is_adjusted"])
+            })
+
+        # 只放入已審核公司（保持查詢排序，不重新排序）
+        companies_data = self._approved_companies_with_jobs()
+        for result in formatted_results:
+            company_id = result["company_id"]
+            if not company_id or company_id not in companies_data:
+                continue
+            job = companies_data[company_id]["jobs"].setdefault(result["job_id"], _empty_job(
+                result["job_id"], result["job_title"], result["job_slots"]
+            ))
+            job["reserves" if result["is_reserve"] else "regulars"].append(result)
+
+        return {
+            "companies": [
+                {
+                    "company_id": company_id,
+                    "company_name": company_data["company_name"],
+                    "jobs": list(company_data["jobs"].values())
+                }
+                for company_id, company_data in companies_data.items()
+            ],
+            "total_matches": len(formatted_results),
+        }
+
+    # -----------------------------------------------------
+    # 自動媒合建議（穩定媒合）
+    # -----------------------------------------------------
+    def candidates(self, department=None):
+        """
+        穩定媒合的候選記錄：主任畫面中未被移除（非 Rejected）的記錄，同一學生在同一公司/職缺只取一筆。
+        department 指定時只取該科系（classes.department）的學生。
+        """
+        seen, _ = self._dedupe(r for r in self.director_rows() if r['director_decision'] != 'Rejected')
+        result = []
+        for (student_id, company_id, job_id), row in seen.items():
+            if student_id is None:
+                continue
+            if department and row['class_department'] != department:
+                continue
+            result.append({
+                "match_id": row['match_id'],
+                "student_id": student_id,
+                "student_name": row['student_name'],
+                "student_number": row['student_number'],
+                "class_name": row['class_name'],
+                "company_id": company_id,
+                "company_name": row['company_name'],
+                "job_id": job_id,
+                "job_title": row['job_title'] or "未指定職缺",
+                "preference_order": row['preference_order'],
+                # 廠商排序：正取在前、備取在後，同類依名次
+                "is_reserve": row['original_type'] != 'Regular',
+                "vendor_rank": row['original_rank'],
+                "director_decision": row['director_decision'],
+            })
+        return result
+
+    def capacities(self):
+        """各職缺名額：{(company_id, job_id): slots}，規則與主任頁面相同（見 effective_slots）"""
+        return {
+            (job['company_id'], job_id): effective_slots(job['slots'])
+            for job_id, job in self.jobs.items()
+        }
+
+
+def _student_choice_key(candidate):
+    """學生端偏好：志願序小者優先，相同時依 match_id（結果固定）"""
+    order = candidate['preference_order']
+    return (order if order is not None else NO_ORDER, str(candidate['match_id']))
+
+
+def _vendor_choice_key(candidate):
+    """廠商端偏好：正取優先於備取，同類名次小者優先，相同時依學生 id（結果固定）"""
+    rank = candidate['vendor_rank']
+    return (bool(candidate['is_reserve']), rank if rank is not None else NO_ORDER, str(candidate['student_id']))
+
+
+def deferred_acceptance(candidates, capacities):
+    """
+    學生提出的延遲接受演算法（Gale-Shapley）。
+    學生依志願序向職缺提出；職缺依廠商排序保留前 slots 名，其餘退回由學生改向下一志願提出。
+    回傳 {(company_id, job_id): [依廠商排序的錄取候選記錄]}；相同輸入必得相同結果。
+    """
+    prefs = {}
+    for candidate in candidates:
+        prefs.setdefault(candidate['student_id'], []).append(candidate)
+    for choices in prefs.values():
+        choices.sort(key=_student_choice_key)
+
+    next_choice = dict.fromkeys(prefs, 0)
+    held = {}
+    free = deque(sorted(prefs, key=str))
+    while free:
+        student_id = free.popleft()
+        choices = prefs[student_id]
+        index = next_choice[student_id]
+        if index >= len(choices):
+            continue  # 所有志願都被拒絕
+        next_choice[student_id] = index + 1
+        candidate = choices[index]
+        key = (candidate['company_id'], candidate['job_id'])
+        pool = held.setdefault(key, [])
+        pool.append(candidate)
+        pool.sort(key=_vendor_choice_key)
+        if len(pool) > capacities.get(key, 1):
+            free.append(pool.pop()['student_id'])
+    return held
+
+
+def effective_slots(slots):
+    """職缺實際名額：未設定或 0 視為 1（主任頁面、媒合建議與 what-if 共用同一規則）"""
+    return slots or 1
+
+
+def _move_int(move, field, label):
+    """取出調整中的整數欄位；缺少或不是整數時回傳中文錯誤（ValueError），不露出 Python 的原始訊息"""
+    value = move.get(field)
+    if value is None or isinstance(value, bool):
+        raise ValueError(f"請提供{label}")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{label}必須為整數：{value}") from None
+
+
+def _apply_moves(candidates, capacities, moves):
+    """
+    在候選記錄的副本上套用假設調整（不寫入資料庫）：
+    - {"type": "swap", "match_id1", "match_id2"}：交換兩筆記錄的廠商排序
+    - {"type": "promote", "match_id", "slot_index"}：備取提升為正取第 slot_index 名
+    - {"type": "remove", "match_id"}：移除該記錄
+    - {"type": "slots", "job_id", "slots"}：調整職缺名額（至少 1，與 effective_slots 相同）
+    """
+    candidates = deepcopy(candidates)
+    capacities = dict(capacities)
+    by_match_id = {str(c['match_id']): c for c in candidates}
+
+    def lookup(match_id):
+        candidate = by_match_id.get(str(match_id))
+        if candidate is None:
+            raise ValueError(f"找不到記錄 {match_id}")
+        return candidate
+
+    for index, move in enumerate(moves or []):
+        if not isinstance(move, dict):
+            raise ValueError(f"第 {index + 1} 個調整格式錯誤")
+        move_type = move.get("type")
+        if move_type == "swap":
+            a, b = lookup(move.get("match_id1")), lookup(move.get("match_id2"))
+            a['is_reserve'], b['is_reserve'] = b['is_reserve'], a['is_reserve']
+            a['vendor_rank'], b['vendor_rank'] = b['vendor_rank'], a['vendor_rank']
+        elif move_type == "promote":
+            slot_index = _move_int(move, "slot_index", "正取位置")
+            candidate = lookup(move.get("match_id"))
+            candidate['is_reserve'] = False
+            candidate['vendor_rank'] = slot_index
+        elif move_type == "remove":
+            candidates.remove(lookup(move.get("match_id")))
+            by_match_id.pop(str(move.get("match_id")))
+        elif move_type == "slots":
+            job_id = move.get("job_id")
+            if job_id is None:
+                raise ValueError("請提供職缺與名額")
+            slots = _move_int(move, "slots", "名額")
+            if slots < 1:
+                raise ValueError("名額至少為 1")
+            keys = [key for key in capacities if str(key[1]) == str(job_id)]
+            if not keys:
+                raise ValueError(f"找不到職缺 {job_id}")
+            for key in keys:
+                capacities[key] = slots
+        else:
+            raise ValueError(f"不支援的調整類型: {move_type}")
+    return candidates, capacities
+
+
+def _assignment_by_student(held):
+    return {c['student_id']: c for pool in held.values() for c in pool}
+
+
+def _placement(candidate):
+    if not candidate:
+        return None
+    return {
+        "match_id": candidate['match_id'],
+        "company_id": candidate['company_id'],
+        "company_name": candidate['company_name'],
+        "job_id": candidate['job_id'],
+        "job_title": candidate['job_title'],
+    }
+
+
+def _diff(candidates, before, after):
+    """比較兩組分配，回傳分配有變動的學生"""
+    names = {c['student_id']: c for c in candidates}
+    changes = []
+    for student_id in sorted(set(before) | set(after), key=str):
+        old, new = before.get(student_id), after.get(student_id)
+        if (old and old['match_id']) == (new and new['match_id']):
+            continue
+        info = names.get(student_id) or old or new
+        changes.append({
+            "student_id": student_id,
+            "student_name": info['student_name'],
+            "student_number": info['student_number'],
+            "from": _placement(old),
+            "to": _placement(new),
+        })
+    return changes
+
+
+def propose_matching(snapshot, moves=None, department=None):
+    """
+    產生媒合建議（不寫入 manage_director）。
+    moves 為假設調整（what-if），會先在記憶體副本上套用再求解，並附上與未調整建議的差異。
+    """
+    started = time.perf_counter()
+    candidates = snapshot.candidates(department)
+    capacities = snapshot.capacities()
+    baseline = deferred_acceptance(candidates, capacities)
+
+    if moves:
+        sim_candidates, sim_capacities = _apply_moves(candidates, capacities, moves)
+        held = deferred_acceptance(sim_candidates, sim_capacities)
+    else:
+        sim_candidates, sim_capacities, held = candidates, capacities, baseline
+    assignment = _assignment_by_student(held)
+
+    # 依公司/職缺整理：錄取者依廠商排序，其餘候選列為備取
+    jobs = {}
+    for candidate in sorted(sim_candidates, key=_vendor_choice_key):
+        key = (candidate['company_id'], candidate['job_id'])
+        job = jobs.setdefault(key, {
+            "company_id": candidate['company_id'],
+            "company_name": candidate['company_name'],
+            "job_id": candidate['job_id'],
+            "job_title": candidate['job_title'],
+            "job_slots": sim_capacities.get(key, 1),
+            "assigned": [],
+            "reserves": [],
+        })
+        assigned = assignment.get(candidate['student_id']) is candidate
+        job["assigned" if assigned else "reserves"].append(dict(candidate, proposed_rank=None))
+    for job in jobs.values():
+        for rank, candidate in enumerate(job["assigned"], start=1):
+            candidate["proposed_rank"] = rank
+
+    companies = {}
+    for (company_id, _), job in sorted(jobs.items(), key=lambda item: (str(item[1]['company_name']), _nulls_first(item[0][1]))):
+        company = companies.setdefault(company_id, {
+            "company_id": company_id,
+            "company_name": job["company_name"],
+            "jobs": []
+        })
+        company["jobs"].append(job)
+
+    current = {}
+    for candidate in candidates:
+        if candidate['director_decision'] == 'Approved':
+            current.setdefault(candidate['student_id'], candidate)
+    students = {c['student_id']: c for c in sim_candidates}
+    unmatched = [
+        {"student_id": sid, "student_name": c['student_name'], "student_number": c['student_number'], "class_name": c['class_name']}
+        for sid, c in sorted(students.items(), key=lambda item: str(item[0])) if sid not in assignment
+    ]
+
+    result = {
+        "companies": list(companies.values()),
+        "unmatched_students": unmatched,
+        "changes_from_current": _diff(candidates, current, assignment),  # 與目前主任核定結果的差異
+        "total_students": len(students),
+        "total_assigned": len(assignment),
+    }
+    if moves:
+        result["changes_from_proposal"] = _diff(candidates, _assignment_by_student(baseline), assignment)
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+
+def _grade_display(active_semester_year, result):
+    """依當前學年與入學年計算年級顯示（如「四孝」）；沒有入學年時以學號前三碼推算"""
+    admission_year = result["admission_year"]
+    if admission_year is None or str(admission_year).strip() == '':
+        student_number = result["student_number"]
+        if student_number and len(str(student_number)) >= 3:
+            try:
+                admission_year = int(str(student_number)[:3])
+            except (TypeError, ValueError):
+                pass
+    if active_semester_year is None or admission_year is None:
+        return ''
+    try:
+        grade_num = active_semester_year - int(admission_year) + 1
+    except (TypeError, ValueError):
+        return ''
+    class_name = result["class_name"] or ''
+    if 1 <= grade_num <= 6:
+        grade_char = ('一', '二', '三', '四', '五', '六')[grade_num - 1]
+        class_char = class_name[-1] if class_name else ''
+        return f"{grade_char}{class_char}" if class_char else f"{grade_char}年級"
+    if grade_num > 0:
+        return f"{grade_num}年級"
+    return ''
@@ -1,9 +1,15 @@
-from flask import Blueprint, request, jsonify, render_template, session
-from config import get_db
+from flask import Blueprint, request, jsonify, render_template, session, Response
+from config import get_db, get_request_db
 from datetime import datetime, timedelta
 from markupsafe import escape
+import json
+import os
+import time
 import traceback
 
+import notification_bus
+from schema_cache import has_table, refresh_schema_cache
+
 notification_bp = Blueprint("notification_bp", __name__)
 
 
@@ -22,56 +28,70 @@ def notifications_page():
 # =========================================================
 # 通知建立 Helper 函式
 # =========================================================
+def classify_notification(title, message, category="general"):
+    """依標題與內容自動分類（僅在 category = general 時判斷）"""
+    if category != "general":
+        return category
+    title_lower = (title or "").lower()
+    msg_lower = (message or "").lower()
+
+    # 媒合相關（優先判斷，避免被其他類別誤判）
+    if any(k in title_lower for k in ["媒合", "matching"]) or \
+       any(k in msg_lower for k in ["媒合", "matching"]):
+        return "matching"
+
+    # 履歷相關
+    elif any(k in title_lower for k in ["履歷", "resume"]) or \
+         any(k in msg_lower for k in ["履歷", "resume"]):
+        return "resume"
+
+    # 志願序
+    elif any(k in title_lower for k in ["志願序", "ranking"]) or \
+         any(k in msg_lower for k in ["志願序", "ranking"]):
+        return "ranking"
+
+    # 實習心得
+    elif any(k in title_lower for k in ["實習心得", "心得退件", "心得審核", "experience"]) or \
+         any(k in msg_lower for k in ["實習心得", "心得退件", "心得審核", "experience"]):
+        return "experience"
+
+    # 實習公司
+    elif any(k in title_lower for k in ["公司", "實習", "廠商", "intern"]) or \
+         any(k in msg_lower for k in ["公司", "實習", "廠商", "intern"]):
+        return "company"
+
+    # 審核通知
+    elif any(k in title_lower for k in ["審核", "批准", "退件"]) or \
+         any(k in msg_lower for k in ["審核", "批准", "退件"]):
+        return "approval"
+
+    return category
+
+
 def create_notification(user_id, title, message, category="general", link_url=None):
     """統一建立通知，支援分類、自動分類"""
+    conn = None
+    cursor = None
     try:
         # ================================
         # 1. 自動分類（若 category = general）
         # ================================
-        if category == "general":
-            title_lower = title.lower()
-            msg_lower = message.lower()
-
-            # 媒合相關（優先判斷，避免被其他類別誤判）
-            if any(k in title_lower for k in ["媒合", "matching"]) or \
-               any(k in msg_lower for k in ["媒合", "matching"]):
-                category = "matching"
-
-            # 履歷相關
-            elif any(k in title_lower for k in ["履歷", "resume"]) or \
-                 any(k in msg_lower for k in ["履歷", "resume"]):
-                category = "resume"
-
-            # 志願序
-            elif any(k in title_lower for k in ["志願序", "ranking"]) or \
-                 any(k in msg_lower for k in ["志願序", "ranking"]):
-                category = "ranking"
-
-            # 實習心得
-            elif any(k in title_lower for k in ["實習心得", "心得退件", "心得審核", "experience"]) or \
-                 any(k in msg_lower for k in ["實習心得", "心得退件", "心得審核", "experience"]):
-                category = "experience"
-
-            # 實習公司
-            elif any(k in title_lower for k in ["公司", "實習", "廠商", "intern"]) or \
-                 any(k in msg_lower for k in ["公司", "實習", "廠商", "intern"]):
-                category = "company"
-
-            # 審核通知
-            elif any(k in title_lower for k in ["審核", "批准", "退件"]) or \
-                 any(k in msg_lower for k in ["審核", "批准", "退件"]):
-                category = "approval"
+        category = classify_notification(title, message, category)
 
         # ================================
-        # 2. 寫入資料庫
+        # 2. 寫入資料庫（共用 request 連線，避免在同一請求內再開新連線）
         # ================================
-        conn = get_db()
+        conn = get_request_db()
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO notifications (user_id, title, message, category, link_url, is_read, created_at)
             VALUES (%s, %s, %s, %s, %s, 0, NOW())
         """, (user_id, title, message, category, link_url))
+        add_unread_counts(cursor, [user_id], link_url)
         conn.commit()
+        publish_unread_change([user_id], notification={
+            "title": title, "message": message, "category": category, "link_url": link_url
+        }, cursor=cursor)
         print(f"[通知創建成功] user_id={user_id}, title={title}, category={category}")
         return True
 
@@ -86,6 +106,113 @@ def create_notification(user_id, title, message, category="general", link_url=No
         if conn:
             conn.close()
 
+# =========================================================
+# 批次通知 Helper：一次發給多位使用者 / 整個角色
+# =========================================================
+NOTIFY_CHUNK_SIZE = 1000
+
+
+def notify_users(title, message, user_ids=None, roles=None, all_users=False, category="general",
+                 link_url=None, created_at=None, refresh_existing=False, auto_category=True, conn=None):
+    """
+    批次建立通知：分類只判斷一次，以 INSERT ... SELECT FROM users 寫入（user_ids 每 NOTIFY_CHUNK_SIZE 筆一批）
+
+    對象（擇一）：
+        user_ids: 使用者 id 清單（自動去除重複與空值）
+        roles: 角色清單，如 ['ta', 'director']
+        all_users: True 表示所有使用者
+    refresh_existing: 同一使用者已有相同 link_url 的通知時，改為更新內容、時間並重設為未讀（公告用）
+    auto_category: False 時 category 照傳入值寫入，不自動分類
+    conn: 傳入時使用呼叫端連線且不 commit、不推播（由呼叫端負責，錯誤會拋出；
+          呼叫端 commit 後以 publish_unread_change(**result["publish"]) 推播）；
+          否則使用 request 共用連線，commit 後推播（錯誤只記錄，不影響主流程）
+
+    回傳: {"inserted": int, "updated": int, "elapsed_ms": float, "publish": dict}
+    """
+    started = time.perf_counter()
+    result = {"inserted": 0, "updated": 0, "elapsed_ms": 0.0, "publish": None}
+    if auto_category:
+        category = classify_notification(title, message, category)
+    created_at_sql = "%s" if created_at is not None else "NOW()"
+    value_params = (title, message, category, link_url) + ((created_at,) if created_at is not None else ())
+
+    # 對象條件：(WHERE 片段, 參數)，user_ids 依 chunk 切成多段
+    if all_users:
+        targets = [("1 = 1", ())]
+    elif roles:
+        placeholders = ", ".join(["%s"] * len(roles))
+        targets = [(f"u.role IN ({placeholders})", tuple(roles))]
+    else:
+        ids = list(dict.fromkeys(uid for uid in (user_ids or []) if uid))
+        targets = [
+            (f"u.id IN ({', '.join(['%s'] * len(chunk))})", tuple(chunk))
+            for chunk in (ids[i:i + NOTIFY_CHUNK_SIZE] for i in range(0, len(ids), NOTIFY_CHUNK_SIZE))
+        ]
+    if not targets:
+        return result
+
+    own_conn = conn is None
+    cursor = None
+    try:
+        if own_conn:
+            conn = get_request_db()
+        cursor = conn.cursor()
+        for where_sql, where_params in targets:
+            target_params = where_params
+            not_exists_sql = ""
+            if refresh_existing and link_url:
+                cursor.execute(f"""
+                    UPDATE notifications n
+                    JOIN users u ON u.id = n.user_id
+                    SET n.created_at = {created_at_sql}, n.is_read = 0,
+                        n.title = %s, n.message = %s, n.category = %s
+                    WHERE n.link_url = %s AND {where_sql}
+                """, ((created_at,) if created_at is not None else ()) + (title, message, category, link_url) + where_params)
+                result["updated"] += cursor.rowcount
+                not_exists_sql = """
+                      AND NOT EXISTS (
+                          SELECT 1 FROM notifications n WHERE n.user_id = u.id AND n.link_url = %s
+                      )"""
+                where_params = where_params + (link_url,)
+            cursor.execute(f"""
+                INSERT INTO notifications (user_id, title, message, category, link_url, is_read, created_at)
+                SELECT u.id, %s, %s, %s, %s, 0, {created_at_sql}
+                FROM users u
+                WHERE {where_sql}{not_exists_sql}
+            """, value_params + where_params)
+            result["inserted"] += cursor.rowcount
+            # 既有通知重設為未讀時無法得知原本是否已讀，改為刪除計數待下次讀取重算
+            _bump_unread_counts(cursor, where_sql, target_params, link_url,
+                                expire=bool(refresh_existing and link_url))
+        # 推播對象；未 commit 前推播會讓 SSE 端讀到舊的未讀數，呼叫端連線時交由呼叫端 commit 後推播
+        result["publish"] = {
+            "user_ids": None if (all_users or roles) else [uid for _, ids in targets for uid in ids],
+            "roles": list(roles) if (roles and not all_users) else None,
+            "notification": {"title": title, "message": message, "category": category, "link_url": link_url},
+        }
+        if own_conn:
+            conn.commit()
+            publish_unread_change(cursor=cursor, **result["publish"])
+    except Exception as e:
+        print(f"[批次通知失敗] title={title}, 錯誤: {str(e)}")
+        traceback.print_exc()
+        if not own_conn:
+            raise
+        # 與 create_notification 相同：自行管理連線時不影響主流程
+        if conn:
+            conn.rollback()
+        return result
+    finally:
+        if cursor:
+            cursor.close()
+        if own_conn and conn:
+            conn.close()
+
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    print(f"[批次通知] title={title}, category={category}, 新增 {result['inserted']} 筆, "
+          f"更新 {result['updated']} 筆, 耗時 {result['elapsed_ms']} ms")
+    return result
+
 # =========================================================
 # 分類輔助函數
 # =========================================================
@@ -236,66 +363,262 @@ def get_my_notifications():
         conn.close()
 
 
+# =========================================================
+# 未讀數計數（notification_unread_counts，主頁鈴鐺每 30 秒輪詢）
+# =========================================================
+# 每位使用者一列：unread_count 為「可見」未讀數，valid_until 為下一次公告開始 / 結束的時間點。
+# 新增通知時在寫入通知的同一 transaction 內 unread_count + 1（add_unread_counts）；
+# 已讀 / 刪除、公告變更時以一條 INSERT ... SELECT 重算受影響使用者的計數（refresh_unread_counts）。
+# 讀取只查主鍵，過了 valid_until（公告區間變化）或計數不存在時才重算。計數存在資料庫，所有 worker 程序一致。
+UNREAD_COUNT_MAX_AGE = 600  # 秒；即使沒有任何變更，計數最久多久依通知表重新核對一次
+UNREAD_RECOUNT_CHUNK_SIZE = 1000
+
+
+def ensure_unread_count_table(cursor):
+    """建立 notification_unread_counts（不存在時）；CREATE TABLE 會隱含 commit，只在自己的連線上呼叫"""
+    if has_table('notification_unread_counts'):
+        return
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS notification_unread_counts (
+            user_id INT PRIMARY KEY,
+            unread_count INT NOT NULL DEFAULT 0,
+            valid_until DATETIME NOT NULL,
+            updated_at DATETIME NOT NULL
+        )
+    """)
+    refresh_schema_cache(cursor)
+
+
+def _recount_unread(cursor, user_ids, now):
+    """
+    重算並寫入使用者的可見未讀數：排除已結束、未開始的公告，與通知頁面預設顯示一致。
+    公告以主鍵對應（SUBSTRING 取出 id），不以 CONCAT 比對整張公告表；不 commit。
+    """
+    max_until = now + timedelta(seconds=UNREAD_COUNT_MAX_AGE)
+    for i in range(0, len(user_ids), UNREAD_RECOUNT_CHUNK_SIZE):
+        chunk = user_ids[i:i + UNREAD_RECOUNT_CHUNK_SIZE]
+        cursor.execute(f"""
+            INSERT INTO notification_unread_counts (user_id, unread_count, valid_until, updated_at)
+            SELECT
+                u.id,
+                COALESCE(SUM(
+                    (n.link_url NOT LIKE '/view_announcement/%%' OR a.id IS NOT NULL)
+                    AND (a.id IS NULL
+                         OR ((a.start_time IS NULL OR a.start_time <= %s) AND (a.end_time IS NULL OR a.end_time >= %s)))
+                ), 0),
+                LEAST(COALESCE(MIN(CASE WHEN a.start_time > %s THEN a.start_time
+                                        WHEN a.end_time >= %s THEN a.end_time END), %s), %s),
+                NOW()
+            FROM users u
+            LEFT JOIN notifications n ON n.user_id = u.id AND n.is_read = 0
+            LEFT JOIN announcement a
+                   ON n.link_url LIKE '/view_announcement/%%'
+                  AND a.id = CAST(SUBSTRING(n.link_url, 20) AS UNSIGNED)
+                  AND n.link_url = CONCAT('/view_announcement/', a.id)
+            WHERE u.id IN ({', '.join(['%s'] * len(chunk))})
+            GROUP BY u.id
+            ON DUPLICATE KEY UPDATE
+                unread_count = VALUES(unread_count),
+                valid_until = VALUES(valid_until),
+                updated_at = VALUES(updated_at)
+        """, (now, now, now, now, max_until, max_until) + tuple(chunk))
+
+
+def _expire_unread_counts(cursor, roles=None):
+    """依角色 / 全體發送時不逐一重算，刪除計數，下次讀取時重算"""
+    if roles:
+        cursor.execute(f"""
+            DELETE c FROM notification_unread_counts c
+            JOIN users u ON u.id = c.user_id
+            WHERE u.role IN ({', '.join(['%s'] * len(roles))})
+        """, tuple(roles))
+    else:
+        cursor.execute("DELETE FROM notification_unread_counts")
+
+
+def _bump_unread_counts(cursor, where_sql, where_params, link_url=None, expire=False):
+    """
+    新通知寫入後，在同一 transaction 內把符合條件（users u 的 WHERE 片段）使用者的計數 +1；
+    公告通知是否可見取決於公告起訖時間（或 expire=True），改為刪除計數，下次讀取時重算
+    """
+    if not has_table('notification_unread_counts'):
+        return  # 計數表於第一次讀取時建立
+    if expire or (link_url and link_url.startswith('/view_announcement/')):
+        cursor.execute(f"""
+            DELETE c FROM notification_unread_counts c
+            JOIN users u ON u.id = c.user_id
+            WHERE {where_sql}
+        """, where_params)
+    else:
+        cursor.execute(f"""
+            UPDATE notification_unread_counts c
+            JOIN users u ON u.id = c.user_id
+            SET c.unread_count = c.unread_count + 1
+            WHERE {where_sql}
+        """, where_params)
+
+
+def add_unread_counts(cursor, user_ids, link_url=None):
+    """
+    呼叫端以自己的 cursor 寫入新通知後呼叫（與通知同一 transaction，由呼叫端 commit；錯誤直接拋出）
+    """
+    user_ids = list(dict.fromkeys(uid for uid in user_ids if uid))
+    for i in range(0, len(user_ids), UNREAD_RECOUNT_CHUNK_SIZE):
+        chunk = user_ids[i:i + UNREAD_RECOUNT_CHUNK_SIZE]
+        _bump_unread_counts(cursor, f"u.id IN ({', '.join(['%s'] * len(chunk))})", tuple(chunk), link_url)
+
+
+def refresh_unread_counts(cursor, user_ids=None, roles=None):
+    """
+    通知已讀 / 刪除、公告時間變更後，在呼叫端 transaction 內重算 user_ids 的計數；
+    依角色 / 全體（user_ids 為 None）時刪除計數，下次讀取時重算。不 commit，錯誤直接拋出
+    """
+    if not has_table('notification_unread_counts'):
+        return
+    if user_ids is not None:
+        user_ids = list(dict.fromkeys(user_ids))
+        if user_ids:
+            _recount_unread(cursor, user_ids, _taiwan_now())
+    else:
+        _expire_unread_counts(cursor, roles)
+
+
+def _read_unread_counts(cursor, user_ids):
+    """讀取目前有效的計數 {str(user_id): count}；計數不存在或已過期的使用者不列入（由 SSE 端自行重算）"""
+    if not user_ids or len(user_ids) > UNREAD_RECOUNT_CHUNK_SIZE or not has_table('notification_unread_counts'):
+        return {}
+    cursor.execute(f"""
+        SELECT user_id, unread_count FROM notification_unread_counts
+        WHERE user_id IN ({', '.join(['%s'] * len(user_ids))}) AND valid_until > %s
+    """, tuple(user_ids) + (_taiwan_now(),))
+    counts = {}
+    for row in cursor.fetchall():
+        uid, count = (row["user_id"], row["unread_count"]) if isinstance(row, dict) else row
+        counts[str(uid)] = int(count)
+    return counts
+
+
+def publish_unread_change(user_ids=None, roles=None, notification=None, cursor=None):
+    """
+    計數 commit 後呼叫：推播給 SSE 連線中的使用者（user_ids / roles 皆為 None 表示所有人）
+    notification 為新通知內容（title/message/category/link_url）；
+    傳入 cursor 時以一次查詢讀出 user_ids 的未讀數放進事件（counts），SSE 端不必逐一重算。
+    推播失敗只記錄，鈴鐺仍可由 API 取得未讀數
+    """
+    if user_ids is not None:
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return
+    event = {"type": "notification", "data": notification} if notification else {"type": "unread_changed"}
+    try:
+        if cursor is not None and user_ids is not None:
+            event["counts"] = _read_unread_counts(cursor, user_ids)
+        notification_bus.publish(event, user_ids=user_ids, roles=roles)
+    except Exception as e:
+        print(f"⚠️ 通知事件推播失敗: {e}")
+
+
+def get_unread_count(user_id):
+    """取得使用者可見未讀數（讀取計數表；計數不存在或已過 valid_until 時重算）"""
+    # 不使用 request 共用連線：SSE 串流期間也會呼叫，避免整段連線期間佔用連線池；
+    # 建立計數表的 CREATE TABLE 會隱含 commit，也不能落在呼叫端的 transaction 內
+    conn = get_db(shared=False)
+    cursor = conn.cursor()
+    try:
+        ensure_unread_count_table(cursor)
+        now = _taiwan_now()
+        cursor.execute("""
+            SELECT unread_count FROM notification_unread_counts
+            WHERE user_id = %s AND valid_until > %s
+        """, (user_id, now))
+        row = cursor.fetchone()
+        if row is None:
+            _recount_unread(cursor, [user_id], now)
+            conn.commit()
+            cursor.execute("SELECT unread_count FROM notification_unread_counts WHERE user_id = %s", (user_id,))
+            row = cursor.fetchone()
+        return int(row[0]) if row else 0
+    finally:
+        cursor.close()
+        conn.close()
+
+
 @notification_bp.route("/api/my_notifications/unread_count", methods=["GET"])
 def get_visible_unread_count():
     """
     回傳「可見」未讀數量：排除已結束、未開始的公告，與通知頁面預設顯示一致。
-    主頁鈴鐺與通知中心的「未讀 X」皆為此數字。
+    主頁鈴鐺與通知中心的「未讀 X」皆為此數字。數量未變時以 ETag 回應 304。
     """
     user_id = session.get("user_id")
     if not user_id:
         return jsonify({"success": False, "message": "未登入"}), 401
 
     try:
-        conn = get_db()
-        cursor = conn.cursor(dictionary=True)
-        # 與 get_my_notifications 一致：JOIN 公告表取得 start_time/end_time（CAST 確保型別一致）
-        cursor.execute("""
-            SELECT n.id, n.is_read, n.category, n.link_url,
-                   a.start_time, a.end_time
-            FROM notifications n
-            LEFT JOIN announcement a ON n.link_url = CONCAT('/view_announcement/', CAST(a.id AS CHAR))
-            WHERE n.user_id = %s
-              AND (n.link_url NOT LIKE '/view_announcement/%%' OR a.id IS NOT NULL)
-        """, (user_id,))
-        rows = cursor.fetchall() or []
-        cursor.close()
-        conn.close()
-
-        now = _taiwan_now()
-        count = 0
-        for row in rows:
-            if row.get("is_read"):
-                continue
-            start_time = row.get("start_time")
-            end_time = row.get("end_time")
-            # 有 JOIN 到公告時間則視為公告，需在區間內才計入
-            is_announcement = start_time is not None or end_time is not None
-            if is_announcement:
-                try:
-                    st = start_time
-                    if st is not None and isinstance(st, str):
-                        st = datetime.strptime(st[:19], "%Y-%m-%d %H:%M:%S") if len(st) >= 19 else now
-                    started = start_time is None or (st <= now if isinstance(st, datetime) else True)
-                except Exception:
-                    started = True
-                try:
-                    et = end_time
-                    if et is not None and isinstance(et, str):
-                        et = datetime.strptime(et[:19], "%Y-%m-%d %H:%M:%S") if len(et) >= 19 else now
-                    not_ended = end_time is None or (et >= now if isinstance(et, datetime) else True)
-                except Exception:
-                    not_ended = True
-                if not (started and not_ended):
-                    continue
-            count += 1
-
-        return jsonify({"success": True, "unread_count": count})
+        count = get_unread_count(user_id)
+        resp = jsonify({"success": True, "unread_count": count})
+        resp.set_etag(f"unread-{user_id}-{count}", weak=True)
+        resp.headers["Cache-Control"] = "private, no-cache"
+        return resp.make_conditional(request)
     except Exception:
         traceback.print_exc()
         return jsonify({"success": False, "message": "讀取未讀數失敗"}), 500
 
 
+# =========================================================
+# 即時推播（Server-Sent Events）：取代主頁鈴鐺輪詢
+# =========================================================
+# 每個 SSE 連線在整段串流期間佔用一個 worker 執行緒（資料庫連線只在讀取未讀數時短暫借用）：
+# 部署時需使用多執行緒 / 協程 worker（app.run 預設 threaded=True；gunicorn 請用 gthread 或 gevent，
+# 執行緒數需大於同時在線人數），否則在線使用者會佔滿 worker。
+SSE_HEARTBEAT_SECONDS = 25  # 保持連線（避免 proxy 逾時切斷）
+SSE_MAX_CONNECTION_SECONDS = int(os.getenv("SSE_MAX_CONNECTION_SECONDS", "120"))  # 定期結束串流，讓瀏覽器自動重連並釋放 worker 執行緒
+
+
+def _sse_message(event_name, data):
+    return f"event: {event_name}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@notification_bp.route("/api/my_notifications/stream", methods=["GET"])
+def notification_stream():
+    """
+    推播 unread_count（未讀數變化，{"count": n}）與 notification（新通知內容）事件。
+    每個連線佔用一個 worker 執行緒最多 SSE_MAX_CONNECTION_SECONDS 秒，之後瀏覽器自動重連
+    """
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"success": False, "message": "未登入"}), 401
+    role = session.get("role")
+
+    def generate():
+        sub = notification_bus.subscribe(user_id, role)
+        deadline = time.monotonic() + SSE_MAX_CONNECTION_SECONDS
+        try:
+            last_count = get_unread_count(user_id)
+            yield "retry: 5000\n\n"
+            yield _sse_message("unread_count", {"count": last_count})
+            while time.monotonic() < deadline:
+                event = sub.get(timeout=SSE_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ": ping\n\n"
+                    continue
+                if event.get("type") == "notification" and event.get("data"):
+                    yield _sse_message("notification", event["data"])
+                # 發布端已附上未讀數時直接使用；依角色 / 全體發送（計數已刪除）時才重算
+                count = (event.get("counts") or {}).get(str(user_id))
+                if count is None:
+                    count = get_unread_count(user_id)
+                if count != last_count:
+                    last_count = count
+                    yield _sse_message("unread_count", {"count": count})
+        finally:
+            notification_bus.unsubscribe(sub)
+
+    resp = Response(generate(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # nginx 不緩衝，事件立即送出
+    return resp
+
+
 @notification_bp.route("/api/mark_read/<nid>", methods=["POST"])
 def mark_read(nid):
     user_id = session.get("user_id")
@@ -334,14 +657,18 @@ def mark_read(nid):
                         INSERT INTO notifications (user_id, title, message, category, link_url, is_read, created_at)
                         VALUES (%s, %s, %s, %s, %s, 1, NOW())
                     """, (user_id, title, message, "announcement", link_url))
+            refresh_unread_counts(cursor, [user_id])
             conn.commit()
+            publish_unread_change([user_id], cursor=cursor)
         else:
             # 處理正常的通知 ID
             try:
                 nid_int = int(nid)
                 cursor.execute("UPDATE notifications SET is_read=1 WHERE id=%s AND user_id=%s", 
                              (nid_int, user_id))
+                refresh_unread_counts(cursor, [user_id])
                 conn.commit()
+                publish_unread_change([user_id], cursor=cursor)
             except ValueError:
                 return jsonify({"success": False, "message": "無效的通知ID"}), 400
         
@@ -362,8 +689,11 @@ def delete_notification(nid):
         conn = get_db()
         cursor = conn.cursor()
         cursor.execute("DELETE FROM notifications WHERE id=%s AND user_id=%s", (nid, user_id))
+        deleted = cursor.rowcount
+        refresh_unread_counts(cursor, [user_id])
         conn.commit()
-        if cursor.rowcount == 0:
+        publish_unread_change([user_id], cursor=cursor)
+        if deleted == 0:
             return jsonify({"success": False, "message": "找不到該通知或已刪除"})
         return jsonify({"success": True, "message": "通知已刪除"})
     except Exception:
@@ -0,0 +1,170 @@
+"""
+通知事件匯流排（SSE 即時推播用）
+
+publish() 發出的事件會送到所有訂閱中（已連上 /api/my_notifications/stream）的使用者。
+事件內容由發布端決定（notification.publish_unread_change 會附上各使用者的未讀數），匯流排只負責轉送。
+
+後端：
+- 預設為程序內（單一 worker 程序）
+- 設定 NOTIFICATION_BUS_URL=redis://host:6379/0 時改用 Redis Pub/Sub，
+  多個 worker 程序的訂閱者都會收到事件（需安裝 redis 套件）
+"""
+import json
+import os
+import queue
+import threading
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+NOTIFICATION_BUS_URL = os.getenv("NOTIFICATION_BUS_URL", "")
+REDIS_CHANNEL = "notification_events"
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class Subscription:
+    """單一 SSE 連線的事件佇列"""
+
+    def __init__(self, user_id, role=None):
+        self.user_id = user_id
+        self.role = role
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def matches(self, user_ids, roles):
+        if user_ids is None and roles is None:
+            return True
+        if user_ids is not None and self.user_id in user_ids:
+            return True
+        return roles is not None and self.role in roles
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # 瀏覽器讀取太慢：丟棄事件（下一個事件仍會帶最新未讀數）
+            pass
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class _LocalHub:
+    """本程序的訂閱者"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+
+    def subscribe(self, user_id, role=None):
+        sub = Subscription(user_id, role)
+        with self._lock:
+            self._subscriptions.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscriptions.discard(sub)
+
+    def dispatch(self, event, user_ids=None, roles=None):
+        with self._lock:
+            targets = [sub for sub in self._subscriptions if sub.matches(user_ids, roles)]
+        for sub in targets:
+            sub.put(event)
+
+
+class InProcessBackend:
+    """單一程序：直接分派給本程序訂閱者"""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, event, user_ids=None, roles=None):
+        self.hub.dispatch(event, user_ids, roles)
+
+
+class RedisBackend:
+    """多程序：經由 Redis Pub/Sub 轉送，每個程序以背景執行緒接收後分派給本程序訂閱者"""
+
+    def __init__(self, hub, url):
+        self.hub = hub
+        self.client = redis.Redis.from_url(url)
+        listener = threading.Thread(target=self._listen, name="notification-bus", daemon=True)
+        listener.start()
+
+    def publish(self, event, user_ids=None, roles=None):
+        payload = {
+            "event": event,
+            "user_ids": list(user_ids) if user_ids is not None else None,
+            "roles": list(roles) if roles is not None else None,
+        }
+        try:
+            self.client.publish(REDIS_CHANNEL, json.dumps(payload, ensure_ascii=False, default=str))
+        except Exception as e:
+            # Redis 無法連線時至少通知本程序
+            print(f"⚠️ [notification_bus] Redis 發布失敗，改為僅通知本程序: {e}")
+            self.hub.dispatch(event, user_ids, roles)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(REDIS_CHANNEL)
+                for message in pubsub.listen():
+                    payload = json.loads(message["data"])
+                    user_ids = payload.get("user_ids")
+                    roles = payload.get("roles")
+                    self.hub.dispatch(
+                        payload["event"],
+                        set(user_ids) if user_ids is not None else None,
+                        set(roles) if roles is not None else None,
+                    )
+            except Exception as e:
+                print(f"⚠️ [notification_bus] Redis 訂閱中斷，5 秒後重試: {e}")
+                threading.Event().wait(5)
+
+
+_hub = _LocalHub()
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if NOTIFICATION_BUS_URL and REDIS_AVAILABLE:
+                    _backend = RedisBackend(_hub, NOTIFICATION_BUS_URL)
+                    print("✅ 通知事件匯流排：Redis")
+                else:
+                    if NOTIFICATION_BUS_URL:
+                        print("⚠️ redis 套件未安裝，通知事件匯流排改用程序內模式")
+                    _backend = InProcessBackend(_hub)
+    return _backend
+
+
+def publish(event, user_ids=None, roles=None):
+    """
+    發布事件
+    user_ids / roles 皆為 None 表示所有人；否則符合其一的使用者會收到
+    """
+    _get_backend().publish(
+        event,
+        set(user_ids) if user_ids is not None else None,
+        set(roles) if roles is not None else None,
+    )
+
+
+def subscribe(user_id, role=None):
+    _get_backend()  # Redis 模式需先啟動接收執行緒
+    return _hub.subscribe(user_id, role)
+
+
+def unsubscribe(sub):
+    _hub.unsubscribe(sub)
@@ -0,0 +1,189 @@
+"""
+PDF 匯出（reportlab）共用模組
+
+- CJK 字型於啟動時探測並註冊一次（init_pdf_fonts），之後每次匯出直接使用已註冊的字型名稱
+  探測順序：環境變數 PDF_CJK_FONT_PATHS（以 os.pathsep 分隔）→ 專案內 frontend/static/fonts →
+  Windows / Linux / macOS 常見 TrueType 中文字型
+  reportlab 的 TTFont 不支援 PostScript 外框（如 NotoSansCJK .otf/.ttc），只收 TrueType 字型
+- 都找不到時改用 reportlab 內建的 CID 字型 MSung-Light（繁體中文，不嵌入字型，由閱讀器提供），
+  不再退回無法顯示中文的 Helvetica
+- 段落樣式依字型建立一次後快取（pdf_styles）
+- PdfReport：標題 / 段落 / 表格的共用建構器，render() 回傳 PDF 與各階段耗時
+"""
+import io
+import os
+import platform
+import threading
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+from stage_timing import stage_timer, format_timings
+
+CJK_FONT_NAME = "ChineseFont"
+CID_FALLBACK_FONT = "MSung-Light"
+BUNDLED_FONT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "frontend", "static", "fonts"))
+HEADER_COLOR = colors.HexColor('#0066CC')
+
+_SYSTEM_FONT_PATHS = {
+    "Windows": [
+        "C:/Windows/Fonts/msjh.ttc",    # 微軟正黑體
+        "C:/Windows/Fonts/mingliu.ttc",  # 細明體
+        "C:/Windows/Fonts/simsun.ttc",   # 新細明體
+        "C:/Windows/Fonts/kaiu.ttf",     # 標楷體
+    ],
+    "Linux": [
+        "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+        "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+        "/usr/share/fonts/wqy-microhei/wqy-microhei.ttc",
+        "/usr/share/fonts/wqy-zenhei/wqy-zenhei.ttc",
+        "/usr/share/fonts/truetype/arphic/uming.ttc",
+        "/usr/share/fonts/truetype/arphic/ukai.ttc",
+        "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",
+    ],
+    "Darwin": [
+        "/System/Library/Fonts/STHeiti Light.ttc",
+        "/System/Library/Fonts/STHeiti Medium.ttc",
+        "/Library/Fonts/Arial Unicode.ttf",
+        "/System/Library/Fonts/Supplemental/Arial Unicode.ttf",
+    ],
+}
+
+_font_lock = threading.Lock()
+_font_name = None
+_font_source = None
+_styles = {}
+
+
+def _candidate_font_paths():
+    paths = [p for p in os.getenv("PDF_CJK_FONT_PATHS", "").split(os.pathsep) if p.strip()]
+    if os.path.isdir(BUNDLED_FONT_DIR):
+        paths.extend(
+            os.path.join(BUNDLED_FONT_DIR, name) for name in sorted(os.listdir(BUNDLED_FONT_DIR))
+            if name.lower().endswith((".ttf", ".ttc"))
+        )
+    paths.extend(_SYSTEM_FONT_PATHS.get(platform.system(), []))
+    return paths
+
+
+def _register_font():
+    for path in _candidate_font_paths():
+        if not os.path.exists(path):
+            continue
+        try:
+            if path.lower().endswith(".ttc"):
+                pdfmetrics.registerFont(TTFont(CJK_FONT_NAME, path, subfontIndex=0))
+            else:
+                pdfmetrics.registerFont(TTFont(CJK_FONT_NAME, path))
+            return CJK_FONT_NAME, path
+        except Exception as e:
+            print(f"⚠️ PDF 字型無法使用，改試下一個: {path} ({e})")
+    pdfmetrics.registerFont(UnicodeCIDFont(CID_FALLBACK_FONT))
+    return CID_FALLBACK_FONT, "reportlab CID"
+
+
+def init_pdf_fonts():
+    """註冊 CJK 字型（只做一次），回傳字型名稱"""
+    global _font_name, _font_source
+    if _font_name:
+        return _font_name
+    with _font_lock:
+        if not _font_name:
+            try:
+                _font_name, _font_source = _register_font()
+            except Exception as e:
+                print(f"⚠️ PDF 中文字型註冊失敗，改用 Helvetica: {e}")
+                _font_name, _font_source = "Helvetica", None
+            print(f"✅ PDF 字型: {_font_name} ({_font_source or '無中文字型'})")
+    return _font_name
+
+
+def pdf_styles():
+    """標題 / 內文段落樣式（依字型快取）"""
+    font_name = init_pdf_fonts()
+    styles = _styles.get(font_name)
+    if styles is None:
+        base = getSampleStyleSheet()
+        styles = {
+            "title": ParagraphStyle(
+                'CustomTitle',
+                parent=base['Heading1'],
+                fontSize=14,
+                spaceAfter=20,
+                alignment=1,  # 置中
+                textColor=HEADER_COLOR,
+                fontName=font_name
+            ),
+            "normal": ParagraphStyle(
+                'CustomNormal',
+                parent=base['Normal'],
+                fontSize=8,
+                fontName=font_name
+            ),
+        }
+        _styles[font_name] = styles
+    return styles
+
+
+def grid_table_style(body_background=None, font_size=8):
+    """表頭藍底白字、全格線；body_background 為單一顏色或交替列顏色列表"""
+    commands = [
+        ('BACKGROUND', (0, 0), (-1, 0), HEADER_COLOR),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('FONTNAME', (0, 0), (-1, -1), init_pdf_fonts()),
+        ('FONTSIZE', (0, 0), (-1, -1), font_size),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ]
+    if isinstance(body_background, (list, tuple)):
+        commands.append(('ROWBACKGROUNDS', (0, 1), (-1, -1), list(body_background)))
+    elif body_background is not None:
+        commands.append(('BACKGROUND', (0, 1), (-1, -1), body_background))
+    return TableStyle(commands)
+
+
+class PdfReport:
+    """依序加入標題、段落與表格，最後 render() 產生 PDF"""
+
+    def __init__(self, pagesize=A4, top_margin=1 * inch, bottom_margin=1 * inch):
+        self.pagesize = pagesize
+        self.top_margin = top_margin
+        self.bottom_margin = bottom_margin
+        self.styles = pdf_styles()
+        self.story = []
+        self.timings = {}
+
+    def title(self, text):
+        self.story.append(Paragraph(text, self.styles["title"]))
+
+    def paragraph(self, text):
+        self.story.append(Paragraph(text, self.styles["normal"]))
+
+    def spacer(self, height):
+        self.story.append(Spacer(1, height))
+
+    def table(self, rows, col_widths, body_background=None):
+        table = Table(rows, colWidths=col_widths)
+        table.setStyle(grid_table_style(body_background))
+        self.story.append(table)
+
+    def render(self):
+        """回傳 (BytesIO, timings)；timings 加入 build 耗時（毫秒）"""
+        buffer = io.BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=self.pagesize,
+                                topMargin=self.top_margin, bottomMargin=self.bottom_margin)
+        with stage_timer(self.timings, "build"):
+            doc.build(self.story)
+        buffer.seek(0)
+        return buffer, self.timings
+
+
+def log_pdf_timings(label, buffer, timings):
+    print(f"📄 PDF 產生完成 [{label}] {buffer.getbuffer().nbytes // 1024}KB {format_timings(timings)}")
@@ -2,16 +2,14 @@ from flask import Blueprint, render_template, request, jsonify, session, send_fi
 from config import get_db
 from datetime import datetime
 import traceback
+import time
 from collections import defaultdict
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
 import io
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from excel_export import StreamingWorkbook, XLSX_MIMETYPE
+from export_cache import export_cache_key, cached_export_response, load_export_meta
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib import colors
+from pdf_render import PdfReport, log_pdf_timings
 from docx import Document
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.enum.table import WD_TABLE_ALIGNMENT
@@ -61,6 +59,12 @@ preferences_bp = Blueprint("preferences_bp", __name__)
 # -------------------------
 # 輔助函數：處理志願序填寫截止時間後的狀態自動更新
 # -------------------------
+def get_preference_deadline(cursor):
+    """志願序填寫截止時間：優先學期流程表 internship_flows，無則 fallback 公告（datetime 或 None）"""
+    from semester import get_deadline_with_announcement_fallback
+    return get_deadline_with_announcement_fallback(cursor, 'preference', '[作業]%填寫志願序截止時間')
+
+
 def update_preference_status_after_deadline(cursor, conn):
     """
     志願序填寫截止時間後，自動更新狀態：
@@ -69,32 +73,11 @@ def update_preference_status_after_deadline(cursor, conn):
     返回: (is_deadline_passed: bool, updated_count: int)
     """
     try:
-        from semester import get_current_semester_deadline
-        # 檢查志願序填寫截止時間：優先學期流程表 internship_flows，無則 fallback 公告
-        now = datetime.now()
-        preference_deadline = get_current_semester_deadline(cursor, 'preference')
-        if preference_deadline is None:
-            cursor.execute("""
-                SELECT end_time 
-                FROM announcement 
-                WHERE title LIKE '[作業]%填寫志願序截止時間' AND is_published = 1
-                ORDER BY created_at DESC 
-                LIMIT 1
-            """)
-            deadline_result = cursor.fetchone()
-            if deadline_result and deadline_result.get('end_time'):
-                deadline = deadline_result['end_time']
-                if isinstance(deadline, datetime):
-                    preference_deadline = deadline
-                else:
-                    try:
-                        preference_deadline = datetime.strptime(str(deadline), '%Y-%m-%d %H:%M:%S')
-                    except Exception:
-                        preference_deadline = datetime.strptime(str(deadline), '%Y-%m-%d %H:%M')
-        is_preference_deadline_passed = preference_deadline is not None and now > preference_deadline
+        preference_deadline = get_preference_deadline(cursor)
+        deadline_passed = preference_deadline is not None and datetime.now() > preference_deadline
         
         # 如果已經過了截止時間，執行狀態更新
-        if is_preference_deadline_passed:
+        if deadline_passed:
             # 將所有 submitted 狀態的志願序自動改為 approved（班導審核通過）
             cursor.execute("""
                 UPDATE student_preferences 
@@ -107,7 +90,7 @@ def update_preference_status_after_deadline(cursor, conn):
                 conn.commit()
                 print(f"✅ 志願序填寫截止時間已過，已將 {updated_count} 筆志願序狀態從 'submitted' 改為 'approved'（班導審核通過）")
             
-            return is_preference_deadline_passed, updated_count
+            return deadline_passed, updated_count
         
         return False, 0
     except Exception as e:
@@ -584,9 +567,6 @@ def review_preferences():
                 except (ValueError, TypeError):
                     pass
         
-        # 檢查志願序填寫截止時間並自動更新狀態（依流程學期）
-        is_preference_deadline_passed, update_count = update_preference_status_after_deadline(cursor, conn)
-        
         print(f"🔍 班導審核志願序 - class_ids: {class_ids}, flow_semester_id: {flow_semester_id}, 僅四年級(學號前3碼={student_id_prefix})")
 
         # 1. 取得該班導班級學生（僅顯示四年級：1131 時只列 110 屆／學號 110xxx）
@@ -1086,6 +1066,15 @@ def review_preferences_api():
 # -------------------------
 # Excel 導出功能
 # -------------------------
+def _preferences_excel_filename(class_names):
+    class_names_str = "、".join(class_names)[:20]
+    return f"{class_names_str}_已通過實習志願序_{datetime.now().strftime('%Y%m%d')}.xlsx"
+
+
+# 志願序匯出的快取版本來源表（見 export_cache）
+PREFERENCES_EXPORT_SOURCES = ("student_preferences",)
+
+
 @preferences_bp.route('/export_preferences_excel')
 def export_preferences_excel():
     if 'username' not in session or session.get('role') not in ['teacher', 'director', 'class_teacher']:
@@ -1122,19 +1111,16 @@ def export_preferences_excel():
                 except (ValueError, TypeError):
                     pass
 
-        # 設定樣式（共用）
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="0066CC", end_color="0066CC", fill_type="solid")
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
+        # 匯出快取：同一班導、同一學期、志願資料未變動時直接回傳上次產生的檔案
+        cache_key = export_cache_key(cursor, "preferences", current_semester_id, PREFERENCES_EXPORT_SOURCES,
+                                     {"user_id": user_id, "class_ids": [c['class_id'] for c in class_rows]})
+        cache_meta = load_export_meta(cache_key)
+        if cache_meta and cache_meta.get("class_names"):
+            cached = cached_export_response(cache_key, _preferences_excel_filename(cache_meta["class_names"]), XLSX_MIMETYPE)
+            if cached:
+                return cached
 
-        wb = Workbook()
-        sheet_index = 0
+        book = StreamingWorkbook()
         exported_class_names = []
         for class_info in class_rows:
             class_id = class_info['class_id']
@@ -1193,35 +1179,16 @@ def export_preferences_excel():
                 continue  # 該班無四年級學生（如三忠），不匯出此班
 
             exported_class_names.append(class_name)
-            ws = wb.create_sheet(title=f"{class_name}志願序"[:31], index=sheet_index)
-            sheet_index += 1
-
-            ws.merge_cells('A1:G1')
-            title_cell = ws['A1']
-            title_cell.value = f"{class_name} - 已通過學生實習志願序統計表"
-            title_cell.font = Font(bold=True, size=16)
-            title_cell.alignment = Alignment(horizontal="center", vertical="center")
-            ws.row_dimensions[1].height = 30
+            sheet = book.sheet(f"{class_name}志願序"[:31], widths=[15, 15, 25, 25, 25, 25, 25])
 
-            ws.merge_cells('A2:G2')
-            time_cell = ws['A2']
-            time_cell.value = f"導出時間：{datetime.now().strftime('%Y年%m月%d日 %H:%M:%S')}"
-            time_cell.alignment = Alignment(horizontal="right")
+            sheet.append([f"{class_name} - 已通過學生實習志願序統計表"] + [None] * 6, ["x_title_large"] + [None] * 6, height=30)
+            sheet.merge(1, 7)
+            sheet.append([f"導出時間：{datetime.now().strftime('%Y年%m月%d日 %H:%M:%S')}"] + [None] * 6, ["x_right"] + [None] * 6)
+            sheet.merge(1, 7)
+            sheet.append([])
 
             headers = ['學生姓名', '學號', '第一志願', '第二志願', '第三志願', '第四志願', '第五志願']
-            ws.row_dimensions[4].height = 25
-            for col_num, header in enumerate(headers, 1):
-                col_letter = get_column_letter(col_num)
-                cell = ws[f'{col_letter}4']
-                cell.value = header
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = header_alignment
-                cell.border = border
-                if col_num in [3, 4, 5, 6, 7]:
-                    ws.column_dimensions[col_letter].width = 25
-            ws.column_dimensions['A'].width = 15
-            ws.column_dimensions['B'].width = 15
+            sheet.append(headers, "x_header_blue", height=25)
 
             student_data = defaultdict(lambda: {'name': '', 'student_number': '', 'preferences': [''] * 5, 'submitted_times': [''] * 5})
             for row in results:
@@ -1236,59 +1203,27 @@ def export_preferences_excel():
                             if row['submitted_at']:
                                 student_data[student_name]['submitted_times'][order] = row['submitted_at'].strftime('%m/%d %H:%M')
 
-            row_num = 5
             for student_name in sorted(student_data.keys()):
                 data = student_data[student_name]
-                ws.cell(row=row_num, column=1, value=data['name']).border = border
-                ws.cell(row=row_num, column=1).alignment = Alignment(horizontal="center", vertical="center")
-                ws.cell(row=row_num, column=2, value=data['student_number']).border = border
-                ws.cell(row=row_num, column=2).alignment = Alignment(horizontal="center", vertical="center")
-                for i in range(5):
-                    cell = ws.cell(row=row_num, column=3 + i, value=data['preferences'][i] or '')
-                    cell.border = border
-                    cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-                ws.row_dimensions[row_num].height = 30
-                row_num += 1
+                sheet.append([data['name'], data['student_number']] + [p or '' for p in data['preferences']],
+                             ["x_cell", "x_cell"] + ["x_cell_wrap"] * 5, height=30)
 
-            ws.cell(row=row_num + 1, column=1, value="統計資訊：").font = Font(bold=True)
+            sheet.append([])
+            sheet.append(["統計資訊："], "x_bold")
             company_counts = defaultdict(int)
             for data in student_data.values():
                 for pref in data['preferences']:
                     if pref:
                         company_counts[pref] += 1
-            stats_row = row_num + 2
-            ws.cell(row=stats_row, column=1, value="公司名稱").font = Font(bold=True)
-            ws.cell(row=stats_row, column=2, value="被選擇次數").font = Font(bold=True)
-            stats_row += 1
+            sheet.append(["公司名稱", "被選擇次數"], "x_bold")
             for company, count in sorted(company_counts.items(), key=lambda x: x[1], reverse=True):
-                ws.cell(row=stats_row, column=1, value=company).border = border
-                ws.cell(row=stats_row, column=2, value=count).border = border
-                stats_row += 1
-
-        # 移除預設空白「Sheet」工作表（create_sheet 會插入，預設 Sheet 仍存在）
-        try:
-            for s in list(wb.worksheets):
-                if s.title == 'Sheet':
-                    wb.remove(s)
-                    break
-        except Exception:
-            pass
+                sheet.append([company, count], "x_plain_border")
 
         if not exported_class_names:
             return "目前無四年級已通過志願序可匯出", 404
 
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-        class_names_str = "、".join(exported_class_names)[:20]
-        filename = f"{class_names_str}_已通過實習志願序_{datetime.now().strftime('%Y%m%d')}.xlsx"
-
-        return send_file(
-            output,
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            as_attachment=True,
-            download_name=filename
-        )
+        return book.response(_preferences_excel_filename(exported_class_names), cache_key=cache_key,
+                             cache_meta={"class_names": exported_class_names})
 
     except Exception as e:
         traceback.print_exc()
@@ -1312,6 +1247,7 @@ def export_preferences_pdf():
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
 
+    started = time.perf_counter()
     try:
         # 確認是否為班導，取得該班導負責的「所有」班級（與審核頁一致）
         cursor.execute("""
@@ -1338,75 +1274,9 @@ def export_preferences_pdf():
                 except (ValueError, TypeError):
                     pass
 
-        # 創建 PDF 緩衝區
-        pdf_buffer = io.BytesIO()
-        
-        # 註冊中文字體（嘗試使用系統字體）
-        try:
-            from reportlab.pdfbase import pdfmetrics
-            from reportlab.pdfbase.ttfonts import TTFont
-            import platform
-            
-            # 根據作業系統選擇字體路徑
-            if platform.system() == 'Windows':
-                # Windows 系統字體路徑
-                font_paths = [
-                    'C:/Windows/Fonts/msjh.ttc',  # 微軟正黑體
-                    'C:/Windows/Fonts/simsun.ttc',  # 新細明體
-                    'C:/Windows/Fonts/kaiu.ttf',  # 標楷體
-                ]
-                font_name = None
-                for font_path in font_paths:
-                    try:
-                        if 'msjh' in font_path.lower():
-                            pdfmetrics.registerFont(TTFont('ChineseFont', font_path, subfontIndex=0))
-                            font_name = 'ChineseFont'
-                            break
-                        elif 'simsun' in font_path.lower():
-                            pdfmetrics.registerFont(TTFont('ChineseFont', font_path, subfontIndex=0))
-                            font_name = 'ChineseFont'
-                            break
-                        elif 'kaiu' in font_path.lower():
-                            pdfmetrics.registerFont(TTFont('ChineseFont', font_path))
-                            font_name = 'ChineseFont'
-                            break
-                    except:
-                        continue
-                
-                if not font_name:
-                    # 如果找不到字體，使用 reportlab 的內建字體處理
-                    font_name = 'Helvetica'
-            else:
-                # Linux/Mac 系統，嘗試使用常見字體
-                font_name = 'Helvetica'
-        except Exception as e:
-            print(f"字體註冊失敗: {e}")
-            font_name = 'Helvetica'
-        
-        doc = SimpleDocTemplate(pdf_buffer, pagesize=A4, topMargin=1*inch, bottomMargin=1*inch)
-        
-        # 設定樣式
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=14,
-            spaceAfter=20,
-            alignment=1, # 置中
-            textColor=colors.HexColor('#0066CC'),
-            fontName=font_name if font_name else 'Helvetica'
-        )
-        normal_style = ParagraphStyle(
-            'CustomNormal',
-            parent=styles['Normal'],
-            fontSize=8,
-            fontName=font_name if font_name else 'Helvetica'
-        )
-
-        story = []
+        report = PdfReport()
         exported_class_names_pdf = []
         date_text = f"導出時間：{datetime.now().strftime('%Y年%m月%d日 %H:%M:%S')}"
-        date_para = Paragraph(date_text, normal_style)
 
         for class_info in class_rows:
             class_id = class_info['class_id']
@@ -1465,10 +1335,9 @@ def export_preferences_pdf():
                 continue
 
             exported_class_names_pdf.append(class_name)
-            title = Paragraph(f"{class_name} - 已通過學生實習志願序統計表", title_style)
-            story.append(title)
-            story.append(date_para)
-            story.append(Spacer(1, 20))
+            report.title(f"{class_name} - 已通過學生實習志願序統計表")
+            report.paragraph(date_text)
+            report.spacer(20)
 
             student_data = defaultdict(lambda: {'name': '', 'student_number': '', 'preferences': [''] * 5, 'submitted_times': [''] * 5})
             for row in results:
@@ -1488,21 +1357,11 @@ def export_preferences_pdf():
                 data = student_data[student_name]
                 table_data.append([data['name'], data['student_number']] + [data['preferences'][i] or '' for i in range(5)])
 
-            table = Table(table_data, colWidths=[1*inch, 0.8*inch, 1.2*inch, 1.2*inch, 1.2*inch, 1.2*inch, 1.2*inch])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0066CC')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('FONTNAME', (0, 0), (-1, -1), font_name if font_name else 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 8),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f0f0f0')])
-            ]))
-            story.append(table)
-            story.append(Spacer(1, 20))
-            story.append(Paragraph("<b>統計資訊：</b>", normal_style))
-            story.append(Spacer(1, 5))
+            report.table(table_data, [1*inch, 0.8*inch, 1.2*inch, 1.2*inch, 1.2*inch, 1.2*inch, 1.2*inch],
+                         body_background=[colors.white, colors.HexColor('#f0f0f0')])
+            report.spacer(20)
+            report.paragraph("<b>統計資訊：</b>")
+            report.spacer(5)
             company_counts = defaultdict(int)
             for data in student_data.values():
                 for pref in data['preferences']:
@@ -1511,27 +1370,17 @@ def export_preferences_pdf():
             stats_data = [['公司名稱', '被選擇次數']]
             for company, count in sorted(company_counts.items(), key=lambda x: x[1], reverse=True):
                 stats_data.append([company, count])
-            stats_table = Table(stats_data, colWidths=[3*inch, 1*inch])
-            stats_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0066CC')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('FONTNAME', (0, 0), (-1, -1), font_name if font_name else 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 8),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ]))
-            story.append(stats_table)
-            story.append(Spacer(1, 30))
+            report.table(stats_data, [3*inch, 1*inch], body_background=colors.beige)
+            report.spacer(30)
 
         if not exported_class_names_pdf:
             return "目前無四年級已通過志願序可匯出", 404
 
-        doc.build(story)
-        pdf_buffer.seek(0)
+        report.timings["data"] = round((time.perf_counter() - started) * 1000, 1)
+        pdf_buffer, timings = report.render()
         class_names_str = "、".join(exported_class_names_pdf)[:20]
         filename = f"{class_names_str}_已通過實習志願序_{datetime.now().strftime('%Y%m%d')}.pdf"
+        log_pdf_timings(filename, pdf_buffer, timings)
 
         return send_file(
             pdf_buffer,
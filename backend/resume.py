@@ -1,7 +1,8 @@
-from flask import Blueprint, request, jsonify, session, send_file, render_template, redirect, current_app, send_from_directory
+from flask import Blueprint, request, jsonify, session, send_file, render_template, redirect, current_app, send_from_directory, Response
 from werkzeug.utils import secure_filename
 from config import get_db
 from semester import get_current_semester_id
+from schema_cache import has_table, has_column, get_columns, has_unique_key
 from docxtpl import DocxTemplate, InlineImage
 from docx.shared import Inches
 import os
@@ -11,10 +12,17 @@ import re
 from datetime import datetime, date
 from urllib.parse import quote
 from notification import create_notification
+from resume_docx import (safe_create_inline_image, categorize_certifications, fill_certificates_to_doc,
+                         fill_certificate_photos)
+from resume_jobs import enqueue_resume_job, wake_resume_workers, get_resume_job
+from resume_data import load_one_resume_data, CertificateCodeIndex
+from image_pipeline import save_uploaded_image
+from resume_export import resume_export_scope, build_manifest, public_manifest, stream_zip, ExportScopeError
 from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.utils import get_column_letter
 import io
+import time
 
 # --- 檔案路徑設定：專案根目錄 (good)，使 uploads/resumes 對應 Featured\good\uploads\resumes ---
 BASE_UPLOAD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -51,6 +59,81 @@ resume_bp = Blueprint("resume_bp", __name__)
 def require_login():
     return 'user_id' in session and 'role' in session
 
+def get_resume_deadline(cursor):
+    """履歷上傳截止時間（datetime 或 None）"""
+    from semester import get_deadline_with_announcement_fallback
+    return get_deadline_with_announcement_fallback(cursor, 'resume', '[作業]%上傳履歷截止時間')
+
+
+def get_advisor_deadline(cursor):
+    """指導老師審核履歷截止時間（datetime 或 None）"""
+    from semester import get_deadline_with_announcement_fallback
+    return get_deadline_with_announcement_fallback(cursor, 'advisor', '[作業]%指導老師審核履歷截止時間')
+
+
+def is_resume_deadline_passed(cursor):
+    """唯讀檢查履歷上傳截止時間是否已過（狀態轉換由 deadline_engine 排程處理）"""
+    try:
+        resume_deadline = get_resume_deadline(cursor)
+    except Exception as e:
+        print(f"⚠️ 查詢履歷上傳截止時間錯誤: {e}")
+        return False
+    return resume_deadline is not None and datetime.now() > resume_deadline
+
+
+# 班導已通過的投遞（以 application_id 為單位）對應到該公司的指導老師
+_APPROVED_APPLICATIONS_FOR_ADVISOR_SQL = """
+    SELECT sja.id AS application_id, ic.advisor_user_id AS teacher_id
+    FROM resumes r
+    INNER JOIN student_job_applications sja ON sja.resume_id = r.id AND sja.student_id = r.user_id
+    JOIN internship_companies ic ON sja.company_id = ic.id
+    WHERE r.status = 'approved'
+      AND ic.advisor_user_id IS NOT NULL
+"""
+
+
+def sync_resume_teacher_for_approved_applications(cursor):
+    """
+    以集合運算把所有班導已通過的投遞同步到 resume_teacher（待指導老師審核）：
+    - 尚無記錄 → 新增 review_status='uploaded'
+    - 已有記錄且為 'uploaded' / NULL → 重設為 'uploaded'、reviewed_at=NULL
+    - 已審核過（'approved' / 'rejected'）→ 保留不動
+    不 commit，由呼叫端負責。返回受影響的筆數。
+    """
+    if has_unique_key('resume_teacher', ('application_id', 'teacher_id')):
+        cursor.execute("""
+            INSERT INTO resume_teacher (application_id, teacher_id, review_status, comment, reviewed_at, created_at)
+            SELECT apps.application_id, apps.teacher_id, 'uploaded', NULL, NULL, NOW()
+            FROM (""" + _APPROVED_APPLICATIONS_FOR_ADVISOR_SQL + """) apps
+            ON DUPLICATE KEY UPDATE
+                reviewed_at = IF(resume_teacher.review_status IS NULL OR resume_teacher.review_status = 'uploaded',
+                                 NULL, resume_teacher.reviewed_at),
+                review_status = IF(resume_teacher.review_status IS NULL OR resume_teacher.review_status = 'uploaded',
+                                   'uploaded', resume_teacher.review_status)
+        """)
+        return max(cursor.rowcount, 0)
+
+    # 沒有唯一索引時 ON DUPLICATE KEY 無法判斷重複：改用 UPDATE ... JOIN + INSERT ... SELECT ... NOT EXISTS
+    cursor.execute("""
+        UPDATE resume_teacher rt
+        INNER JOIN (""" + _APPROVED_APPLICATIONS_FOR_ADVISOR_SQL + """) apps
+            ON apps.application_id = rt.application_id AND apps.teacher_id = rt.teacher_id
+        SET rt.review_status = 'uploaded', rt.reviewed_at = NULL
+        WHERE rt.review_status IS NULL OR rt.review_status = 'uploaded'
+    """)
+    updated_count = max(cursor.rowcount, 0)
+    cursor.execute("""
+        INSERT INTO resume_teacher (application_id, teacher_id, review_status, comment, reviewed_at, created_at)
+        SELECT apps.application_id, apps.teacher_id, 'uploaded', NULL, NULL, NOW()
+        FROM (""" + _APPROVED_APPLICATIONS_FOR_ADVISOR_SQL + """) apps
+        WHERE NOT EXISTS (
+            SELECT 1 FROM resume_teacher rt
+            WHERE rt.application_id = apps.application_id AND rt.teacher_id = apps.teacher_id
+        )
+    """)
+    return updated_count + max(cursor.rowcount, 0)
+
+
 # 輔助函數：處理履歷上傳截止時間後的狀態自動更新
 def update_resume_status_after_deadline(cursor, conn):
     """
@@ -62,40 +145,13 @@ def update_resume_status_after_deadline(cursor, conn):
     返回: (is_deadline_passed: bool, updated_count: dict)
     """
     try:
-        from semester import get_current_semester_deadline
-        # 檢查履歷上傳截止時間：優先學期流程表 internship_flows，無則 fallback 公告
-        now = datetime.now()
-        resume_deadline = get_current_semester_deadline(cursor, 'resume')
-        if resume_deadline is None:
-            cursor.execute("""
-                SELECT end_time 
-                FROM announcement 
-                WHERE title LIKE '[作業]%上傳履歷截止時間' AND is_published = 1
-                ORDER BY created_at DESC 
-                LIMIT 1
-            """)
-            deadline_result = cursor.fetchone()
-            if deadline_result and deadline_result.get('end_time'):
-                deadline = deadline_result['end_time']
-                if isinstance(deadline, datetime):
-                    resume_deadline = deadline
-                else:
-                    try:
-                        resume_deadline = datetime.strptime(str(deadline), '%Y-%m-%d %H:%M:%S')
-                    except Exception:
-                        resume_deadline = datetime.strptime(str(deadline), '%Y-%m-%d %H:%M')
-        is_resume_deadline_passed = resume_deadline is not None and now > resume_deadline
+        resume_deadline = get_resume_deadline(cursor)
+        deadline_passed = resume_deadline is not None and datetime.now() > resume_deadline
         
         # 如果已經過了截止時間，執行狀態更新
-        if is_resume_deadline_passed:
+        if deadline_passed:
             # 檢查 resume_teacher 表是否存在
-            resume_teacher_table_exists = False
-            try:
-                cursor.execute("SHOW TABLES LIKE 'resume_teacher'")
-                resume_teacher_table_exists = cursor.fetchone() is not None
-            except Exception as e:
-                print(f"⚠️ 檢查 resume_teacher 表時發生錯誤: {e}")
-                resume_teacher_table_exists = False
+            resume_teacher_table_exists = has_table('resume_teacher')
             
             # 將所有未退件的履歷（uploaded 狀態）自動改為 approved（班導審核通過）
             # 不處理 rejected 狀態的履歷，保留退件狀態
@@ -107,77 +163,22 @@ def update_resume_status_after_deadline(cursor, conn):
             uploaded_to_approved_count = cursor.rowcount
             
             # 截止時間後，所有班導已通過（status='approved'）的投遞需要同步到 resume_teacher 表（以 application_id 為單位）
+            synced_count = 0
             if resume_teacher_table_exists:
-                cursor.execute("""
-                    SELECT sja.id AS application_id, ic.advisor_user_id
-                    FROM resumes r
-                    INNER JOIN student_job_applications sja ON sja.resume_id = r.id AND sja.student_id = r.user_id
-                    JOIN internship_companies ic ON sja.company_id = ic.id
-                    WHERE r.status = 'approved'
-                      AND ic.advisor_user_id IS NOT NULL
-                """)
-                apps_to_sync = cursor.fetchall()
-                print(f"🔍 [DEBUG] 找到 {len(apps_to_sync)} 筆投遞需要同步到 resume_teacher 表")
-                synced_count = 0
-                for app_info in apps_to_sync:
-                    application_id = app_info['application_id']
-                    advisor_user_id = app_info['advisor_user_id']
-                    if not application_id or not advisor_user_id:
-                        continue
-                    # 確保清除任何未讀取的結果（防止 "Unread result found" 錯誤）
-                    try:
-                        cursor.fetchall()
-                    except:
-                        pass
-                    
-                    cursor.execute("""
-                        SELECT id, review_status FROM resume_teacher 
-                        WHERE application_id = %s AND teacher_id = %s
-                    """, (application_id, advisor_user_id))
-                    existing = cursor.fetchone()
-                    if existing:
-                        # 只更新狀態為 'uploaded' 的記錄，不要覆蓋已經審核過的記錄（'approved' 或 'rejected'）
-                        current_status = existing.get('review_status')
-                        if current_status == 'uploaded' or current_status is None:
-                            # 確保清除任何未讀取的結果
-                            try:
-                                cursor.fetchall()
-                            except:
-                                pass
-                            
-                            cursor.execute("""
-                                UPDATE resume_teacher SET review_status='uploaded', reviewed_at=NULL
-                                WHERE application_id = %s AND teacher_id = %s
-                            """, (application_id, advisor_user_id))
-                            synced_count += 1
-                        # 如果已經是 'approved' 或 'rejected'，跳過（不重置）
-                    else:
-                        # 確保清除任何未讀取的結果
-                        try:
-                            cursor.fetchall()
-                        except:
-                            pass
-                        
-                        cursor.execute("""
-                            INSERT INTO resume_teacher (application_id, teacher_id, review_status, comment, reviewed_at, created_at)
-                            VALUES (%s, %s, 'uploaded', NULL, NULL, NOW())
-                        """, (application_id, advisor_user_id))
-                        synced_count += 1
+                synced_count = sync_resume_teacher_for_approved_applications(cursor)
                 if synced_count > 0:
-                    conn.commit()
                     print(f"✅ 已同步 {synced_count} 筆履歷到 resume_teacher 表，等待指導老師審核")
                 else:
                     print(f"⚠️ [DEBUG] 未找到需要同步的履歷")
             
+            conn.commit()
             if uploaded_to_approved_count > 0:
-                if synced_count == 0:
-                    # 如果沒有同步，也需要提交狀態更新
-                    conn.commit()
                 print(f"✅ 履歷提交截止時間已過，已將 {uploaded_to_approved_count} 筆未退件的履歷狀態改為 'approved'（班導審核通過），等待指導老師審核")
             
-            return is_resume_deadline_passed, {
+            return deadline_passed, {
                 'uploaded_to_approved': uploaded_to_approved_count,
-                'teacher_review_status_updated': 0
+                'teacher_review_status_updated': 0,
+                'resume_teacher_synced': synced_count
             }
         
         return False, {'uploaded_to_approved': 0, 'teacher_review_status_updated': 0}
@@ -247,47 +248,17 @@ def update_resume_applications_after_advisor_deadline(cursor, conn):
     返回: (is_deadline_passed: bool, created_count: int)
     """
     try:
-        from semester import get_current_semester_deadline
-        from notification import create_notification
-        
-        # 檢查指導老師審核截止時間：優先學期流程表 internship_flows，無則 fallback 公告
-        now = datetime.now()
-        advisor_deadline = get_current_semester_deadline(cursor, 'advisor')
-        if advisor_deadline is None:
-            cursor.execute("""
-                SELECT end_time 
-                FROM announcement 
-                WHERE title LIKE '[作業]%指導老師審核履歷截止時間' AND is_published = 1
-                ORDER BY created_at DESC 
-                LIMIT 1
-            """)
-            deadline_result = cursor.fetchone()
-            if deadline_result and deadline_result.get('end_time'):
-                deadline = deadline_result['end_time']
-                if isinstance(deadline, datetime):
-                    advisor_deadline = deadline
-                else:
-                    try:
-                        advisor_deadline = datetime.strptime(str(deadline), '%Y-%m-%d %H:%M:%S')
-                    except Exception:
-                        advisor_deadline = datetime.strptime(str(deadline), '%Y-%m-%d %H:%M')
-        
-        is_advisor_deadline_passed = advisor_deadline is not None and now > advisor_deadline
+        advisor_deadline = get_advisor_deadline(cursor)
+        deadline_passed = advisor_deadline is not None and datetime.now() > advisor_deadline
         
         # 如果已經過了截止時間，執行狀態更新
-        if is_advisor_deadline_passed:
+        if deadline_passed:
             # 檢查 resume_teacher 表是否存在
-            resume_teacher_table_exists = False
-            try:
-                cursor.execute("SHOW TABLES LIKE 'resume_teacher'")
-                resume_teacher_table_exists = cursor.fetchone() is not None
-            except Exception as e:
-                print(f"⚠️ 檢查 resume_teacher 表時發生錯誤: {e}")
-                resume_teacher_table_exists = False
+            resume_teacher_table_exists = has_table('resume_teacher')
             
             if not resume_teacher_table_exists:
                 print("⚠️ resume_teacher 表不存在，跳過自動傳給廠商的邏輯")
-                return is_advisor_deadline_passed, 0
+                return deadline_passed, 0
             
             # 查找所有指導老師已通過但尚未傳給廠商的履歷
             cursor.execute("""
@@ -319,7 +290,7 @@ def update_resume_applications_after_advisor_deadline(cursor, conn):
             
             if not approved_applications:
                 print("✅ 指導老師審核截止時間已過，但沒有需要傳給廠商的履歷")
-                return is_advisor_deadline_passed, 0
+                return deadline_passed, 0
             
             print(f"🔍 [DEBUG] 找到 {len(approved_applications)} 筆指導老師已通過但尚未傳給廠商的履歷")
             
@@ -390,7 +361,7 @@ def update_resume_applications_after_advisor_deadline(cursor, conn):
             else:
                 print(f"⚠️ 指導老師審核截止時間已過，但沒有成功創建任何 resume_applications 記錄")
             
-            return is_advisor_deadline_passed, created_count
+            return deadline_passed, created_count
         
         return False, 0
     except Exception as e:
@@ -417,26 +388,11 @@ def get_teacher_review_resumes():
     cursor = conn.cursor(dictionary=True) 
     
     try:
-        # 檢查履歷上傳截止時間並自動更新狀態
-        is_resume_deadline_passed, update_counts = update_resume_status_after_deadline(cursor, conn)
-        
-        # 確保清除任何未讀取的結果（防止 "Unread result found" 錯誤）
-        try:
-            cursor.fetchall()
-        except:
-            pass
-        
-        # 檢查指導老師審核截止時間並自動將已通過的履歷傳給廠商
-        is_advisor_deadline_passed, advisor_update_count = update_resume_applications_after_advisor_deadline(cursor, conn)
-        
-        # 確保清除任何未讀取的結果（防止 "Unread result found" 錯誤）
-        try:
-            cursor.fetchall()
-        except:
-            pass
+        # 截止後的狀態轉換由 deadline_engine 排程執行，此處只讀取是否已過截止時間
+        resume_deadline_passed = is_resume_deadline_passed(cursor)
         
         # 在截止時間之前，指導老師（包括主任切換身份）不能看到任何履歷，直接返回空結果
-        if session_role == 'teacher' and not is_resume_deadline_passed:
+        if session_role == 'teacher' and not resume_deadline_passed:
             # 獲取履歷上傳截止時間資訊（優先從 internship_flows 表讀取）
             deadline_info = None
             try:
@@ -495,33 +451,14 @@ def get_teacher_review_resumes():
             })
         
         # 檢查 resume_teacher 表是否存在
-        resume_teacher_table_exists = False
-        try:
-            cursor.execute("SHOW TABLES LIKE 'resume_teacher'")
-            resume_teacher_table_exists = cursor.fetchone() is not None
-            if resume_teacher_table_exists:
-                # 檢查表是否有必要的欄位
-                required_columns = ['application_id', 'teacher_id', 'review_status']
-                cursor.execute("SELECT DATABASE() as db_name")
-                db_result = cursor.fetchone()
-                db_name = db_result['db_name'] if db_result else None
-                
-                cursor.execute("""
-                    SELECT COLUMN_NAME 
-                    FROM INFORMATION_SCHEMA.COLUMNS 
-                    WHERE TABLE_SCHEMA = %s
-                    AND TABLE_NAME = 'resume_teacher' 
-                    AND COLUMN_NAME IN ('application_id', 'teacher_id', 'review_status')
-                """, (db_name,))
-                existing_columns = [row['COLUMN_NAME'] for row in cursor.fetchall()]
-                missing_columns = [col for col in required_columns if col not in existing_columns]
-                
-                if missing_columns:
-                    print(f"⚠️ resume_teacher 表缺少必要欄位: {', '.join(missing_columns)}")
-                    resume_teacher_table_exists = False
-        except Exception as e:
-            print(f"⚠️ 檢查 resume_teacher 表時發生錯誤: {e}")
-            resume_teacher_table_exists = False
+        resume_teacher_table_exists = has_table('resume_teacher')
+        if resume_teacher_table_exists:
+            # 檢查表是否有必要的欄位
+            required_columns = ['application_id', 'teacher_id', 'review_status']
+            missing_columns = [col for col in required_columns if not has_column('resume_teacher', col)]
+            if missing_columns:
+                print(f"⚠️ resume_teacher 表缺少必要欄位: {', '.join(missing_columns)}")
+                resume_teacher_table_exists = False
         
         # 指導老師需要 JOIN resume_teacher 表獲取 review_status
         if session_role == 'teacher' and resume_teacher_table_exists:
@@ -849,7 +786,7 @@ def get_teacher_review_resumes():
             "data": result_data,
             "deadline": deadline_info,
             "teacher_review_deadline": teacher_review_deadline_info,
-            "is_deadline_passed": is_resume_deadline_passed
+            "is_deadline_passed": resume_deadline_passed
         })
 
     except Exception as e:
@@ -910,13 +847,7 @@ def review_resume(resume_id):
 
     try:
         # 檢查 resume_teacher 表是否存在
-        resume_teacher_table_exists = False
-        try:
-            cursor.execute("SHOW TABLES LIKE 'resume_teacher'")
-            resume_teacher_table_exists = cursor.fetchone() is not None
-        except Exception as e:
-            print(f"⚠️ 檢查 resume_teacher 表時發生錯誤: {e}")
-            resume_teacher_table_exists = False
+        resume_teacher_table_exists = has_table('resume_teacher')
         
         # 2. 查詢履歷並取得學生Email和姓名（指導老師與班導皆需 application_id，以「每筆投遞」為單位審核）
         application_id_int = None
@@ -1376,12 +1307,7 @@ def update_resume_field():
     
     try:
         # 檢查 resume_teacher 表是否存在
-        resume_teacher_table_exists = False
-        try:
-            cursor.execute("SHOW TABLES LIKE 'resume_teacher'")
-            resume_teacher_table_exists = cursor.fetchone() is not None
-        except Exception as e:
-            resume_teacher_table_exists = False
+        resume_teacher_table_exists = has_table('resume_teacher')
         
         if user_role == 'teacher' and resume_teacher_table_exists and application_id:
             # 指導老師更新 resume_teacher 表的 comment
@@ -1473,6 +1399,72 @@ def download_resume(resume_id):
         conn.close()
 
 
+# -------------------------
+# API - 批次匯出履歷 ZIP（依公司 / 班級，串流下載）
+# -------------------------
+def _load_export_manifest():
+    """依 scope（company / class）與 id 建立匯出清單；回傳 (manifest, error_response)"""
+    scope = (request.args.get('scope') or '').strip().lower()
+    target_id = request.args.get('id', type=int)
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        title, rows = resume_export_scope(cursor, session['user_id'], session.get('role'), scope, target_id)
+        return build_manifest(title, rows), None
+    except ExportScopeError as e:
+        return None, (jsonify({"success": False, "message": e.message}), e.status)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+@resume_bp.route('/api/resume_export/manifest', methods=['GET'])
+def resume_export_manifest():
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "未登入"}), 403
+    try:
+        manifest, error = _load_export_manifest()
+        if error:
+            return error
+        return jsonify({"success": True, "manifest": public_manifest(manifest)})
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"匯出錯誤: {str(e)}"}), 500
+
+
+@resume_bp.route('/api/resume_export/zip', methods=['GET'])
+def resume_export_zip():
+    """
+    串流下載 ZIP。start：由清單第幾個檔案開始（續傳用）；manifest：先前取得的 manifest_id，清單已變動時回傳 409。
+    """
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "未登入"}), 403
+    try:
+        manifest, error = _load_export_manifest()
+        if error:
+            return error
+        expected = (request.args.get('manifest') or '').strip()
+        if expected and expected != manifest["manifest_id"]:
+            return jsonify({"success": False, "message": "履歷清單已變動，請重新取得清單",
+                            "manifest": public_manifest(manifest)}), 409
+        start = max(0, request.args.get('start', 0, type=int))
+        if start >= manifest["total"]:
+            return jsonify({"success": False, "message": "沒有可下載的履歷"}), 404
+
+        filename = manifest["title"] + ("" if start == 0 else f"_part{start + 1}") + ".zip"
+        headers = {
+            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}",
+            "X-Manifest-Id": manifest["manifest_id"],
+            "X-Entry-Start": str(start),
+            "X-Entry-Total": str(manifest["total"]),
+        }
+        print(f"📦 [resume-export] user={session['user_id']} {manifest['title']} 檔案 {start + 1}-{manifest['total']}（遺失 {manifest['missing']}）")
+        return Response(stream_zip(manifest, start), mimetype="application/zip", headers=headers, direct_passthrough=True)
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"匯出錯誤: {str(e)}"}), 500
+
+
 # -------------------------
 # 頁面路由
 # -------------------------
@@ -1486,7 +1478,6 @@ def review_resume_page():
     return render_template('resume/review_resume.html')
 
 
-
 # ============================================
 # 以下內容從 resume copy.py 合併而來（獨有部分）
 # ============================================
@@ -1533,8 +1524,7 @@ def get_certificates_by_authority():
         cursor = conn.cursor(dictionary=True)
         
         # 檢查是否有 name 欄位（向後兼容）
-        cursor.execute("SHOW COLUMNS FROM certificate_codes LIKE 'name'")
-        has_name_column = cursor.fetchone() is not None
+        has_name_column = has_column('certificate_codes', 'name')
         
         if has_name_column:
             name_select = "name"
@@ -1654,8 +1644,7 @@ def get_resume_data():
 
         # ===== 4. 課程資料 =====
         # 檢查是否有 ProofImage 欄位
-        cursor.execute("SHOW COLUMNS FROM course_grades LIKE 'ProofImage'")
-        has_proof_image = cursor.fetchone() is not None
+        has_proof_image = has_column('course_grades', 'ProofImage')
         
         if has_proof_image:
             cursor.execute("""
@@ -1881,11 +1870,7 @@ def get_resume_data():
                         absence_ids_filter = [int(x.strip()) for x in (mapping["absence_record_ids"] or "").split(",") if x.strip()]
                     except (ValueError, TypeError):
                         pass
-                try:
-                    cursor.execute("SHOW COLUMNS FROM absence_records LIKE 'semester_id'")
-                    has_semester = cursor.fetchone() is not None
-                except Exception:
-                    has_semester = False
+                has_semester = has_column('absence_records', 'semester_id')
                 if absence_ids_filter:
                     placeholders = ",".join(["%s"] * len(absence_ids_filter))
                     cursor.execute(f"""
@@ -2098,8 +2083,7 @@ def get_job_categories_and_levels():
         # 取得該發證中心的所有證照
         # 使用 certificate_codes 表的 job_category 和 level 字段組合生成 name
         # 檢查是否有 name 欄位（向後兼容）
-        cursor.execute("SHOW COLUMNS FROM certificate_codes LIKE 'name'")
-        has_name_column = cursor.fetchone() is not None
+        has_name_column = has_column('certificate_codes', 'name')
         
         if has_name_column:
             # 如果還有 name 欄位，使用 COALESCE 向後兼容
@@ -2254,7 +2238,8 @@ def submit_and_generate_api():
             ext = os.path.splitext(filename)[1]
             new_filename = f"{user_id}_photo_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}"
             photo_path = os.path.join(photo_dir, new_filename)
-            photo.save(photo_path)
+            if not save_uploaded_image(photo, photo_path, "photo"):
+                return jsonify({"success": False, "message": "照片檔案無效或已損壞"}), 400
             photo_path = photo_path.replace("\\", "/")
         else:
             # 未上傳新照片時保留資料庫既有路徑
@@ -2274,7 +2259,8 @@ def submit_and_generate_api():
             ext = os.path.splitext(filename)[1]
             new_filename = f"{user_id}_transcript_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}"
             transcript_path = os.path.join(transcript_dir, new_filename)
-            transcript_file.save(transcript_path)
+            if not save_uploaded_image(transcript_file, transcript_path, "transcript"):
+                return jsonify({"success": False, "message": "成績單檔案無效或已損壞"}), 400
             transcript_path = transcript_path.replace("\\", "/")
 
         # 儲存多張證照
@@ -2291,7 +2277,9 @@ def submit_and_generate_api():
                 ext = os.path.splitext(secure_filename(file.filename))[1]
                 new_filename = f"{user_id}_cert_{idx}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}"
                 file_path = os.path.join(cert_dir, new_filename)
-                file.save(file_path)
+                if not save_uploaded_image(file, file_path, "certificate"):
+                    print(f"⚠️ 證照圖片無效已跳過: {file.filename}")
+                    continue
                 cert_photo_paths.append(file_path)
 
         # 處理單張證照圖片（certificate_image + certificate_description）
@@ -2306,8 +2294,8 @@ def submit_and_generate_api():
                 file_extension = os.path.splitext(filename)[1] or '.png'
                 unique_filename = f"{session['user_id']}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{os.urandom(4).hex()}{file_extension}"
                 image_save_path = os.path.join(cert_folder, unique_filename)
-                certificate_image_file.save(image_save_path)
-                image_path_for_template = image_save_path
+                if save_uploaded_image(certificate_image_file, image_save_path, "certificate"):
+                    image_path_for_template = image_save_path
             except Exception as e:
                 print(f"❌ 儲存單一證照圖片失敗: {e}")
                 traceback.print_exc()
@@ -2425,9 +2413,9 @@ def submit_and_generate_api():
                     ext = os.path.splitext(secure_filename(uploaded_proof.filename))[1] or ".png"
                     fname = f"{user_id}_absence_proof_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}"
                     savep = os.path.join(abs_dir, fname)
-                    uploaded_proof.save(savep)
-                    # 存進 context 用相對路徑，產生 Word 時 resolve_upload_path 可正確找到
-                    absence_image_path = (ABSENCE_PROOF_FOLDER + "/" + fname).replace("\\", "/")
+                    if save_uploaded_image(uploaded_proof, savep, "proof"):
+                        # 存進 context 用相對路徑，產生 Word 時 resolve_upload_path 可正確找到
+                        absence_image_path = (ABSENCE_PROOF_FOLDER + "/" + fname).replace("\\", "/")
                 else:
                     print(f"⚠️ 上傳的缺勤佐證圖片格式不支援: {uploaded_proof.mimetype}")
         except Exception as e:
@@ -2492,7 +2480,8 @@ def submit_and_generate_api():
                                 ext = os.path.splitext(secure_filename(uploaded_image.filename))[1] or ".png"
                                 fname = f"{user_id}_record_{record_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}"
                                 save_path = os.path.join(abs_dir, fname)
-                                uploaded_image.save(save_path)
+                                if not save_uploaded_image(uploaded_image, save_path, "proof"):
+                                    continue
                                 save_path_db = (ABSENCE_PROOF_FOLDER + "/" + fname).replace("\\", "/")
                                 # 更新資料庫中對應記錄的 image_path
                                 cursor.execute("""
@@ -2518,8 +2507,7 @@ def submit_and_generate_api():
                 try:
                     if semester_id:
                         # 檢查是否有 semester_id 欄位
-                        cursor.execute("SHOW COLUMNS FROM absence_records LIKE 'semester_id'")
-                        has_semester_id = cursor.fetchone() is not None
+                        has_semester_id = has_column('absence_records', 'semester_id')
                         
                         if has_semester_id:
                             cursor.execute("""
@@ -2639,8 +2627,7 @@ def submit_and_generate_api():
         
         # 若未上傳新成績單，從資料庫取既有 ProofImage 寫回各課程（供 save_structured_data 使用，避免編輯時成績單被清空）
         if not transcript_path and student_id:
-            cursor.execute("SHOW COLUMNS FROM course_grades LIKE 'ProofImage'")
-            if cursor.fetchone():
+            if has_column('course_grades', 'ProofImage'):
                 cursor.execute("""
                     SELECT ProofImage FROM course_grades
                     WHERE StuID = %s AND ProofImage IS NOT NULL AND ProofImage != ''
@@ -2711,10 +2698,8 @@ def submit_and_generate_api():
         if transcript_path:
             try:
                 # 檢查表是否有 SemesterID 和 ProofImage 列
-                cursor.execute("SHOW COLUMNS FROM course_grades LIKE 'SemesterID'")
-                has_semester_id = cursor.fetchone() is not None
-                cursor.execute("SHOW COLUMNS FROM course_grades LIKE 'ProofImage'")
-                has_proof_image = cursor.fetchone() is not None
+                has_semester_id = has_column('course_grades', 'SemesterID')
+                has_proof_image = has_column('course_grades', 'ProofImage')
                 
                 if has_proof_image:
                     if has_semester_id and semester_id:
@@ -2740,8 +2725,7 @@ def submit_and_generate_api():
                         """, (transcript_path, student_id))
                 else:
                     # 如果沒有 ProofImage 列，嘗試使用 transcript_path（兼容舊結構）
-                    cursor.execute("SHOW COLUMNS FROM course_grades LIKE 'transcript_path'")
-                    has_transcript_path = cursor.fetchone() is not None
+                    has_transcript_path = has_column('course_grades', 'transcript_path')
                     if has_transcript_path:
                         if has_semester_id and semester_id:
                             cursor.execute("""
@@ -2760,21 +2744,17 @@ def submit_and_generate_api():
                 print("⚠️ 更新 course_grades.ProofImage 失敗:", e)
                 traceback.print_exc()
 
-        # 生成 Word 文件
-        student_data_for_doc = get_student_info_for_doc(cursor, student_id, semester_id=semester_id, resume_id=resume_id_for_save)
-        # PhotoPath & ConductScoreNumeric（未上傳新照片時保留既有路徑）
-        if photo_path is not None:
-            student_data_for_doc["info"]["PhotoPath"] = photo_path
-        student_data_for_doc["info"]["ConductScoreNumeric"] = data.get("conduct_score_numeric")
-        # 傳遞證照圖片與名稱清單（generate 會自行從 certs 讀）
-        student_data_for_doc["cert_photo_paths"] = cert_photo_paths
-        student_data_for_doc["cert_names"] = cert_names
-        # 合併 context（包含缺勤統計數據）
-        student_data_for_doc.update(context)
-        
-        # 調試輸出：確認 student_data_for_doc 中的缺勤統計數據
-        absence_keys_in_doc = {k: v for k, v in student_data_for_doc.items() if k.startswith("absence_")}
-        print("📊 student_data_for_doc 中的缺勤統計數據:", absence_keys_in_doc)
+        # 產生 Word 文件改由背景工作執行：worker 會重新載入學生資料並套用以下表單內容
+        job_payload = {
+            "student_id": student_id,
+            "semester_id": semester_id,
+            "resume_id_for_save": resume_id_for_save,
+            "photo_path": photo_path,  # 未上傳新照片時保留既有路徑
+            "conduct_score_numeric": data.get("conduct_score_numeric"),
+            "cert_photo_paths": cert_photo_paths,
+            "cert_names": cert_names,
+            "context": context,  # 包含缺勤統計數據
+        }
 
         # 編輯模式：若有 resume_id 則覆蓋既有檔案並只更新該筆履歷，畫面只保留一個檔案；新增則產生新檔並 INSERT
         resume_id_param = request.form.get("resume_id", "").strip()
@@ -2804,14 +2784,12 @@ def submit_and_generate_api():
             filename = f"{student_id}_履歷_{datetime.now().strftime('%Y%m%d_%H%M%S')}.docx"
             save_path = os.path.join(BASE_UPLOAD_DIR, UPLOAD_FOLDER, filename) if not os.path.isabs(UPLOAD_FOLDER) else os.path.join(UPLOAD_FOLDER, filename)
 
-        if not generate_application_form_docx(student_data_for_doc, save_path):
-            conn.rollback()
-            return jsonify({"success": False, "message": "文件生成失敗"}), 500
-
+        job_resume_id = None
         if had_resume_id and resume_id_param:
             # 編輯：一律只更新該筆履歷，不新增列，並更新 resume_content_mapping（含 absence_record_ids）
             try:
                 rid = int(resume_id_param)
+                job_resume_id = rid
                 filepath_for_db = existing_filepath if existing_filepath else (os.path.join(UPLOAD_FOLDER, filename)).replace("\\", "/")
                 cursor.execute("""
                     UPDATE resumes
@@ -2828,37 +2806,27 @@ def submit_and_generate_api():
             except (ValueError, TypeError):
                 pass  # 不將 resume_id_param 清空，避免誤執行下面的 INSERT
         if not had_resume_id:
-            filepath_for_db = (os.path.join(UPLOAD_FOLDER, filename)).replace("\\", "/")
-            cursor.execute("""
-                INSERT INTO resumes
-                (user_id, filepath, original_filename, status, category, semester_id, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, NOW())
-            """, (
-                user_id,
-                filepath_for_db,
-                filename,
-                'uploaded',
-                'draft',
-                semester_id
-            ))
-            # 新增履歷也要寫入 resume_content_mapping（使用 save_structured_data 回傳的 ID，確保存的是 id 而非課程名稱）
-            new_resume_id = cursor.lastrowid
-            if new_resume_id:
-                _upsert_resume_content_mapping(
-                    cursor, new_resume_id, student_id,
-                    course_grade_ids=mapping_ids.get("course_grade_ids"),
-                    certification_ids=mapping_ids.get("certification_ids"),
-                    language_skill_ids=mapping_ids.get("language_skill_ids"),
-                    absence_record_ids=mapping_ids.get("absence_record_ids")
-                )
+            # 新增：resumes 列等 worker 產生檔案成功後才寫入（與工作完成同一個 transaction），
+            # 產生失敗時不會留下指向不存在檔案的履歷
+            job_payload["new_resume"] = {
+                "filepath": (os.path.join(UPLOAD_FOLDER, filename)).replace("\\", "/"),
+                "original_filename": filename,
+                "semester_id": semester_id,
+                "mapping_ids": mapping_ids,
+            }
 
+        job_payload["save_path"] = save_path
+        job_id = enqueue_resume_job(cursor, user_id, job_resume_id, job_payload)
         conn.commit()
+        wake_resume_workers()
         return jsonify({
             "success": True,
-            "message": "履歷已成功提交並生成文件",
+            "message": "履歷資料已儲存，文件產生中",
+            "job_id": job_id,
+            "resume_id": job_resume_id,
             "file_path": save_path,
             "filename": filename
-        })
+        }), 202
 
     except Exception as e:
         print("❌ submit_and_generate_api 發生錯誤:", e)
@@ -2873,6 +2841,37 @@ def submit_and_generate_api():
         if conn:
             conn.close()
 
+@resume_bp.route('/api/resume_jobs/<int:job_id>', methods=['GET'])
+def get_resume_job_status(job_id):
+    """查詢履歷產生工作狀態（pending / running / done / failed），權限與查看該學生履歷相同"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "未登入"}), 401
+
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        job = get_resume_job(cursor, job_id)
+        # 與查看履歷相同的權限：本人、可查看該學生履歷的老師 / 班導、管理員
+        if not job or not can_access_target_resume(cursor, session['user_id'], session.get('role'), job['user_id']):
+            return jsonify({"success": False, "message": "找不到該工作"}), 404
+        return jsonify({
+            "success": True,
+            "job_id": job['id'],
+            "resume_id": job['resume_id'],
+            "status": job['status'],
+            "queue_position": job.get('queue_position'),
+            "error_message": job['error_message'],
+            "duration_ms": job['duration_ms'],
+            "created_at": job['created_at'].strftime("%Y-%m-%d %H:%M:%S") if job['created_at'] else None,
+            "finished_at": job['finished_at'].strftime("%Y-%m-%d %H:%M:%S") if job['finished_at'] else None,
+        })
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"查詢失敗: {str(e)}"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
 @resume_bp.route('/api/upload_transcript', methods=['POST'])
 def upload_transcript():
     if 'user_id' not in session or session.get('role') != 'student':
@@ -2903,7 +2902,8 @@ def upload_transcript():
     save_filename = f"transcript_{timestamp}.{ext}"
     save_path_abs = os.path.join(student_dir, save_filename)
     
-    file.save(save_path_abs)
+    if not save_uploaded_image(file, save_path_abs, "transcript"):
+        return jsonify({"success": False, "message": "圖片無效或已損壞"}), 400
 
     # 相對路徑（用於資料庫儲存）
     relative_path = os.path.join(UPLOAD_FOLDER, student_id, save_filename).replace('\\', '/')
@@ -2915,8 +2915,7 @@ def upload_transcript():
         # 這裡改為更新到 course_grades 的 ProofImage 欄位（以最新的成績單圖片為主）
         
         # 1. 確保 course_grades 表有 ProofImage 欄位
-        cursor.execute("SHOW COLUMNS FROM course_grades LIKE 'ProofImage'")
-        if not cursor.fetchone():
+        if not has_column('course_grades', 'ProofImage'):
             conn.rollback()
             return jsonify({"success": False, "message": "資料庫缺少 course_grades.ProofImage 欄位"}), 500
 
@@ -2980,7 +2979,8 @@ def upload_photo():
     save_filename = f"photo.{ext}"
     save_path_abs = os.path.join(student_dir, save_filename)
     
-    file.save(save_path_abs)
+    if not save_uploaded_image(file, save_path_abs, "photo"):
+        return jsonify({"success": False, "message": "圖片無效或已損壞"}), 400
 
     # 相對路徑（用於資料庫儲存）
     relative_path = os.path.join(UPLOAD_FOLDER, student_id, save_filename).replace('\\', '/')
@@ -3037,7 +3037,8 @@ def upload_certificate_photo():
     save_filename = f"cert_{timestamp}.{ext}"
     save_path_abs = os.path.join(student_certs_dir, save_filename)
     
-    file.save(save_path_abs)
+    if not save_uploaded_image(file, save_path_abs, "certificate"):
+        return jsonify({"success": False, "message": "圖片無效或已損壞"}), 400
 
     # 相對路徑（用於資料庫儲存）
     relative_path = os.path.join(UPLOAD_FOLDER, student_id, "certs", save_filename).replace('\\', '/')
@@ -3250,8 +3251,7 @@ def upload_course_grade_excel():
         imported_count = 0
         
         # 檢查 course_grades 表中是否有 SemesterID 欄位
-        cursor.execute("SHOW COLUMNS FROM course_grades LIKE 'SemesterID'")
-        has_semester_id = cursor.fetchone() is not None
+        has_semester_id = has_column('course_grades', 'SemesterID')
         
         for student_id, courses in data_to_import.items():
             try:
@@ -3465,9 +3465,6 @@ def get_class_resumes():
     cursor = conn.cursor(dictionary=True)
 
     try:
-        # 檢查履歷上傳截止時間並自動更新狀態
-        is_resume_deadline_passed, update_counts = update_resume_status_after_deadline(cursor, conn)
-        
         resumes = []  # 初始化結果列表
         sql_query = ""
         sql_params = tuple()
@@ -3799,8 +3796,7 @@ def get_absence_stats():
     cursor = conn.cursor(dictionary=True)
 
     try:
-        cursor.execute("SHOW COLUMNS FROM absence_records LIKE 'semester_id'")
-        has_semester_id = cursor.fetchone() is not None
+        has_semester_id = has_column('absence_records', 'semester_id')
         
         if has_semester_id:
             if start_semester_id and end_semester_id:
@@ -3911,15 +3907,13 @@ def get_absence_available_semesters():
                 except ValueError:
                     pass
         
-        cursor.execute("SHOW TABLES LIKE 'absence_default_semester_range'")
-        table_exists = cursor.fetchone() is not None
+        table_exists = has_table('absence_default_semester_range')
         
         start_semester_code = None
         end_semester_code = None
         
         if table_exists:
-            cursor.execute("SHOW COLUMNS FROM absence_default_semester_range LIKE 'admission_year'")
-            has_admission_year = cursor.fetchone() is not None
+            has_admission_year = has_column('absence_default_semester_range', 'admission_year')
             
             if has_admission_year and admission_year:
                 cursor.execute("""
@@ -3985,8 +3979,7 @@ def get_absence_default_range():
     cursor = conn.cursor(dictionary=True)
     
     try:
-        cursor.execute("SHOW TABLES LIKE 'absence_default_semester_range'")
-        table_exists = cursor.fetchone() is not None
+        table_exists = has_table('absence_default_semester_range')
         
         if not table_exists:
             return jsonify({
@@ -4008,8 +4001,7 @@ def get_absence_default_range():
                 except ValueError:
                     pass
         
-        cursor.execute("SHOW COLUMNS FROM absence_default_semester_range LIKE 'admission_year'")
-        has_admission_year = cursor.fetchone() is not None
+        has_admission_year = has_column('absence_default_semester_range', 'admission_year')
         
         if has_admission_year and admission_year:
             cursor.execute("""
@@ -4065,8 +4057,7 @@ def get_semester_absence_records():
     cursor = conn.cursor(dictionary=True)
 
     try:
-        cursor.execute("SHOW COLUMNS FROM absence_records LIKE 'semester_id'")
-        has_semester_id = cursor.fetchone() is not None
+        has_semester_id = has_column('absence_records', 'semester_id')
         
         where_conditions = ["ar.user_id = %s"]
         query_params = [user_id]
@@ -4173,8 +4164,7 @@ def get_absence_records():
     cursor = conn.cursor(dictionary=True)
 
     try:
-        cursor.execute("SHOW COLUMNS FROM absence_records LIKE 'semester_id'")
-        has_semester_id = cursor.fetchone() is not None
+        has_semester_id = has_column('absence_records', 'semester_id')
 
         if has_semester_id:
             cursor.execute("""
@@ -4267,12 +4257,12 @@ def submit_absence_record():
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"{user_id}_{timestamp}_{filename}"
             filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            proof_image.save(filepath)
+            if not save_uploaded_image(proof_image, filepath, "proof"):
+                return jsonify({"success": False, "message": "佐證圖片無效或已損壞"}), 400
             image_path = f"/uploads/{filename}"
 
         # 檢查是否有 semester_id 欄位
-        cursor.execute("SHOW COLUMNS FROM absence_records LIKE 'semester_id'")
-        has_semester_id = cursor.fetchone() is not None
+        has_semester_id = has_column('absence_records', 'semester_id')
 
         if has_semester_id and semester_id:
             cursor.execute("""
@@ -4918,23 +4908,6 @@ def student_upload_course_excel():
         conn.close()
 
 
-def _normalize_cert_category(category):
-    """
-    將資料庫 category 正規化為 labor / intl / local / other，
-    對應履歷：1.勞動部 / 2.國際證照 / 3.國內證照 / 4.其他證照
-    """
-    if not category:
-        return "other"
-    c = str(category).strip().lower()
-    if c == "labor":
-        return "labor"
-    if c == "intl":
-        return "intl"
-    if c == "local":
-        return "local"
-    return "other"
-
-
 def _upsert_resume_content_mapping(cursor, resume_id, stu_id, course_grade_ids=None, certification_ids=None, language_skill_ids=None, absence_record_ids=None):
     """依 resume_id 更新或新增一筆 resume_content_mapping，並以關聯表 resume_*_rel 儲存勾選的 ID。"""
     cursor.execute("SELECT id FROM resume_content_mapping WHERE resume_id = %s LIMIT 1", (resume_id,))
@@ -4980,7 +4953,6 @@ def _upsert_resume_content_mapping(cursor, resume_id, stu_id, course_grade_ids=N
         cursor.execute("INSERT INTO resume_absence_rel (mapping_id, absence_id) VALUES (%s, %s)", (mapping_id, aid))
 
 
-
 def _get_resume_content_mapping(cursor, resume_id):
     """依 resume_id 從關聯表讀取勾選的 course_grade_ids, certification_ids, language_skill_ids, absence_record_ids。
     回傳與舊版相容的 dict，鍵值為逗號分隔字串。若無 mapping 則回傳 None。"""
@@ -5007,83 +4979,6 @@ def _get_resume_content_mapping(cursor, resume_id):
     }
 
 
-def is_valid_image_file(file_path):
-    """
-    驗證圖片文件是否有效
-    返回 True 如果文件是有效的圖片，否則返回 False
-    """
-    if not file_path or not os.path.exists(file_path):
-        return False
-    
-    try:
-        from PIL import Image
-        # 嘗試打開並驗證圖片
-        with Image.open(file_path) as img:
-            img.verify()  # 驗證圖片是否損壞
-        
-        # verify() 後需要重新打開圖片（因為 verify 會關閉文件）
-        with Image.open(file_path) as img:
-            # 檢查圖片格式是否被支持
-            if img.format not in ['JPEG', 'PNG', 'GIF', 'BMP', 'TIFF']:
-                print(f"⚠️ 不支持的圖片格式: {img.format} (路徑: {file_path})")
-                return False
-        return True
-    except ImportError:
-        # 如果 PIL 未安裝，跳過驗證（向後兼容）
-        print("⚠️ PIL/Pillow 未安裝，跳過圖片驗證")
-        return True  # 返回 True 讓程序繼續運行
-    except Exception as e:
-        print(f"⚠️ 圖片驗證失敗 {file_path}: {e}")
-        return False
-
-def safe_create_inline_image(doc, file_path, width, description=""):
-    """
-    安全地創建 InlineImage 對象，如果失敗則返回 None。
-    先用 PIL 與 python-docx Image.from_file 驗證，避免 render 時 UnrecognizedImageError。
-    """
-    if not file_path or not os.path.exists(file_path):
-        return None
-
-    if not is_valid_image_file(file_path):
-        print(f"⚠️ {description}圖片無效或損壞，跳過: {file_path}")
-        return None
-
-    abs_path = os.path.abspath(file_path)
-    try:
-        from docx.image.image import Image as DocxImage
-        DocxImage.from_file(abs_path)
-    except Exception as e:
-        print(f"⚠️ {description}圖片格式不被 Word 支援，跳過: {file_path} ({e})")
-        return None
-
-    try:
-        image_obj = InlineImage(doc, abs_path, width=width)
-        return image_obj
-    except Exception as e:
-        print(f"⚠️ {description}圖片載入錯誤 (路徑: {file_path}): {e}")
-        traceback.print_exc()
-        return None
-
-
-
-def resolve_upload_path(path):
-    """
-    將相對路徑（如 uploads/absence_proofs/xxx）轉為絕對路徑，
-    便於 os.path.exists 與 InlineImage 在產生 Word 時正確找到檔案。
-    """
-    if not path or not str(path).strip():
-        return ""
-    path = str(path).replace("\\", "/").strip()
-    if os.path.isabs(path) and os.path.exists(path):
-        return path
-    # 相對於 BASE_UPLOAD_DIR（backend 目錄）
-    abs_path = os.path.join(BASE_UPLOAD_DIR, path)
-    if os.path.exists(abs_path):
-        return os.path.normpath(abs_path)
-    if os.path.exists(path):
-        return os.path.abspath(path)
-    return path
-
 # resume_bp 已在文件開頭定義，不需要重複定義
 
 def format_credits(credits_value):
@@ -5270,86 +5165,6 @@ def load_student_certifications(cursor, student_id):
     return results
 
 
-def categorize_certifications(cert_list):
-    """
-    分類證照 → 放到四種類別（對應履歷 1.勞動部 2.國際證照 3.國內證照 4.其他證照）
-    """
-    labor = []
-    international = []
-    local = []
-    other = []
-    for c in cert_list:
-        cert_name = c.get("cert_name") or c.get("CertName") or f"{c.get('job_category', '')}{c.get('level', '')}"
-        cert_path = c.get("cert_path") or c.get("CertPath", "")
-        acquire_date = c.get("acquire_date") or c.get("AcquisitionDate", "")
-        item = {
-            "table_name": cert_name,
-            "photo_name": cert_name,
-            "photo_path": cert_path,
-            "date": acquire_date,
-        }
-        raw = c.get("CertCategory") or c.get("category", "other")
-        category = _normalize_cert_category(raw)
-        if category == "labor":
-            labor.append(item)
-        elif category == "intl":
-            international.append(item)
-        elif category == "local":
-            local.append(item)
-        else:
-            other.append(item)
-    return labor, international, local, other
-
-
-def fill_certificates_to_doc(context, prefix, items, max_count):
-    """
-    填入 Word 模板（表格區）
-    prefix 例如: LaborCerts_  → LaborCerts_1, LaborCerts_2 …
-    空欄位與 None 一律顯示空白。
-    """
-    for i in range(1, max_count + 1):
-        if i <= len(items):
-            name = (items[i-1].get("table_name") or "").strip()
-            if name == "None":
-                name = ""
-            context[f"{prefix}{i}"] = name
-        else:
-            context[f"{prefix}{i}"] = ""
-
-
-def fill_certificate_photos(context, doc, items, start_index, max_count=8):
-    """
-    圖片區（依順序放，不分類）
-    start_index → 從第幾張開始，例如 1、9、17、25
-    max_count → 最多填充幾張（實際填充的數量可能少於此值）
-    空欄位一律填空白，不顯示 None。
-    """
-    image_size = Inches(3.0)
-    actual_count = min(len(items), max_count)
-    
-    # 填充實際有的證照
-    for idx, item in enumerate(items[:max_count], start=start_index):
-        photo_path = item.get("photo_path", "") or ""
-        photo_name = (item.get("photo_name", "") or "").strip()
-        if photo_name == "None":
-            photo_name = ""
-        
-        if photo_path:
-            image_obj = safe_create_inline_image(doc, photo_path, image_size, "證照")
-            if image_obj:
-                context[f"CertPhotoImages_{idx}"] = image_obj
-            else:
-                context[f"CertPhotoImages_{idx}"] = ""
-        else:
-            context[f"CertPhotoImages_{idx}"] = ""
-        context[f"CertPhotoName_{idx}"] = photo_name or ""
-
-    # 未使用的欄位：圖片與名稱都設為空白，避免模板顯示 None
-    if actual_count < max_count:
-        for idx in range(start_index + actual_count, start_index + max_count):
-            context[f"CertPhotoImages_{idx}"] = ""
-            context[f"CertPhotoName_{idx}"] = ""
-
 def save_structured_data(cursor, student_id, data, semester_id=None, resume_id=None):
     try:
         # -------------------------------------------------------------
@@ -5387,8 +5202,7 @@ def save_structured_data(cursor, student_id, data, semester_id=None, resume_id=N
         # -------------------------------------------------------------
         # 2) 儲存 course_grades
         # -------------------------------------------------------------
-        cursor.execute("SHOW COLUMNS FROM course_grades LIKE 'SemesterID'")
-        has_semester_id = cursor.fetchone() is not None
+        has_semester_id = has_column('course_grades', 'SemesterID')
 
         if has_semester_id and semester_id:
             cursor.execute(
@@ -5399,7 +5213,7 @@ def save_structured_data(cursor, student_id, data, semester_id=None, resume_id=N
             cursor.execute("DELETE FROM course_grades WHERE StuID=%s", (student_id,))
 
         seen_courses = set()
-        course_grade_ids_saved = []  # 儲存剛插入的 course_grades.id，供 resume_content_mapping 使用
+        course_rows = []
         for c in data.get("courses", []):
             cname = (c.get("name") or "").strip()
             if not cname:
@@ -5407,48 +5221,66 @@ def save_structured_data(cursor, student_id, data, semester_id=None, resume_id=N
             if cname in seen_courses:
                 continue
             seen_courses.add(cname)
+            course_rows.append((cname, c.get("credits"), c.get("grade"), c.get("proof_image")))
 
+        # 一次寫入後再以一次查詢取回 id（儲存剛插入的 course_grades.id，供 resume_content_mapping 使用）
+        course_grade_ids_saved = []
+        if course_rows:
             if has_semester_id and semester_id:
-                cursor.execute("""
+                cursor.executemany("""
                     INSERT INTO course_grades
                         (StuID, CourseName, Credits, Grade, SemesterID, ProofImage)
                     VALUES (%s,%s,%s,%s,%s,%s)
-                """, (student_id, cname, c.get("credits"), c.get("grade"), semester_id, c.get("proof_image")))
+                """, [(student_id, name, credits, grade, semester_id, proof) for name, credits, grade, proof in course_rows])
+                cursor.execute(
+                    "SELECT id, CourseName FROM course_grades WHERE StuID=%s AND IFNULL(SemesterID,'')=%s",
+                    (student_id, semester_id)
+                )
             else:
-                cursor.execute("""
+                cursor.executemany("""
                     INSERT INTO course_grades
                         (StuID, CourseName, Credits, Grade, ProofImage)
                     VALUES (%s,%s,%s,%s,%s)
-                """, (student_id, cname, c.get("credits"), c.get("grade"), c.get("proof_image")))
-            course_grade_ids_saved.append(cursor.lastrowid)
+                """, [(student_id, name, credits, grade, proof) for name, credits, grade, proof in course_rows])
+                cursor.execute("SELECT id, CourseName FROM course_grades WHERE StuID=%s", (student_id,))
+            ids_by_name = {r["CourseName"]: r["id"] for r in cursor.fetchall() or []}
+            course_grade_ids_saved = [ids_by_name[name] for name, *_ in course_rows if name in ids_by_name]
         
         # -------------------------------------------------------------
         # 3) 儲存 student_certifications
         # -------------------------------------------------------------
         
         # 檢查 student_certifications 表的欄位，以確定要插入哪些數據
-        cursor.execute("SHOW COLUMNS FROM student_certifications")
-        cert_columns = cursor.fetchall()
-        known_columns = {c['Field']: c for c in cert_columns}
+        known_columns = set(get_columns('student_certifications'))
 
         cert_rows = []
         processed_certs = set() # 用於去重 (job_category, level)
 
-        # 編輯時保留既有證照圖片路徑：若表單未傳 cert_path 則從 DB 帶入，避免編輯後證照圖被清空
+        struct_certs = data.get("structured_certifications", [])
+        print(f"📋 收到 structured_certifications: {len(struct_certs)} 筆")
+
+        # 學生既有證照一次讀取：編輯時保留既有證照圖片路徑（表單未傳 cert_path 則從 DB 帶入，避免編輯後證照圖被清空）、
+        # 以及表單未帶 cert_code 時沿用既有 cert_code
         existing_cert_paths = {}
-        if resume_id:
+        existing_cert_codes = {}
+        if struct_certs:
             try:
-                cursor.execute("SELECT cert_code, level, CertPath FROM student_certifications WHERE StuID=%s", (student_id,))
+                cursor.execute("SELECT id, cert_code, level, CertPath FROM student_certifications WHERE StuID=%s", (student_id,))
                 for r in cursor.fetchall() or []:
-                    key = (r.get("cert_code"), r.get("level"))
-                    if r.get("CertPath"):
-                        existing_cert_paths[key] = (r["CertPath"] or "").replace("\\", "/")
+                    existing_cert_codes[r.get("id")] = r.get("cert_code")
+                    if resume_id and r.get("CertPath"):
+                        existing_cert_paths[(r.get("cert_code"), r.get("level"))] = (r["CertPath"] or "").replace("\\", "/")
             except Exception as e:
-                print(f"⚠️ 查詢既有證照路徑失敗: {e}")
+                print(f"⚠️ 查詢既有證照失敗: {e}")
+
+        # 表單證照可能對應到的 certificate_codes 一次載入，以下解析都在記憶體比對
+        try:
+            code_index = CertificateCodeIndex.load(cursor, struct_certs, existing_cert_codes.values())
+        except Exception as e:
+            print(f"⚠️ 查詢 certificate_codes 失敗: {e}")
+            code_index = CertificateCodeIndex([])
 
         # (3) 處理結構化的證照資料 (structured_certifications)
-        struct_certs = data.get("structured_certifications", [])
-        print(f"📋 收到 structured_certifications: {len(struct_certs)} 筆")
         for cert in struct_certs:
             row = {"StuID": student_id}
             db_job_category = None
@@ -5462,117 +5294,49 @@ def save_structured_data(cursor, student_id, data, semester_id=None, resume_id=N
             raw = str(raw).strip()
             raw_upper = raw.upper() if raw else ""
             cert_code_id = None  # 要寫入 DB 的 certificate_codes.id
+            level_from_cert = (cert.get("level") or "").strip()
 
             if not raw or raw_upper == 'OTHER':
                 # 其他證照：cert_code 存 NULL；至少有名稱或職類/級別才寫入
                 cert_code_id = None
                 db_job_category = (cert.get("job_category") or "").strip() or None
-                db_level = (cert.get("level") or "").strip() or None
+                db_level = level_from_cert or None
                 if not cert.get("name") and not db_job_category and not db_level:
                     continue
-            elif raw.isdigit():
+            elif raw.isdigit() and code_index.get(int(raw)):
                 # 數字可能是 id（如 2）或 code（如 14901、11800）。先查 id 是否存在，否則當 code 查
-                try:
-                    as_id = int(raw)
-                    cursor.execute("SELECT id FROM certificate_codes WHERE id = %s LIMIT 1", (as_id,))
-                    if cursor.fetchone():
-                        cert_code_id = as_id
-                    else:
-                        level_from_cert = (cert.get("level") or "").strip()
-                        if level_from_cert:
-                            cursor.execute("""
-                                SELECT id, job_category, level, authority_id 
-                                FROM certificate_codes 
-                                WHERE code = %s AND (level = %s OR level IS NULL)
-                                LIMIT 1
-                            """, (raw_upper, level_from_cert))
-                        else:
-                            cursor.execute("""
-                                SELECT id, job_category, level, authority_id 
-                                FROM certificate_codes 
-                                WHERE code = %s
-                                LIMIT 1
-                            """, (raw_upper,))
-                        cert_info = cursor.fetchone()
-                        if cert_info:
-                            cert_code_id = cert_info.get('id')
-                except (ValueError, TypeError) as e:
-                    cert_code_id = None
-                except Exception as e:
-                    print(f"⚠️ 查詢 certificate_codes 失敗: {e}")
-                    cert_code_id = None
+                cert_code_id = int(raw)
             else:
                 # 前端傳的是證照代碼 code（如 TQC-WORD），查詢對應的 id
-                level_from_cert = (cert.get("level") or "").strip()
-                try:
-                    if level_from_cert:
-                        cursor.execute("""
-                            SELECT id, job_category, level, authority_id 
-                            FROM certificate_codes 
-                            WHERE code = %s AND (level = %s OR level IS NULL)
-                            LIMIT 1
-                        """, (raw_upper, level_from_cert))
-                    else:
-                        cursor.execute("""
-                            SELECT id, job_category, level, authority_id 
-                            FROM certificate_codes 
-                            WHERE code = %s
-                            LIMIT 1
-                        """, (raw_upper,))
-                    cert_info = cursor.fetchone()
-                    if cert_info:
-                        cert_code_id = cert_info.get('id')
-                except Exception as e:
-                    print(f"⚠️ 查詢 certificate_codes 失敗: {e}")
+                cert_info = code_index.find_by_code(raw_upper, level_from_cert)
+                if cert_info:
+                    cert_code_id = cert_info.get('id')
 
             # 若尚未解析到 cert_code_id，用前端傳的 job_category + level 查 certificate_codes（職類/級別選單會對應到同一張表）
             if cert_code_id is None:
                 jc = (cert.get("job_category") or "").strip()
-                lv = (cert.get("level") or "").strip()
+                lv = level_from_cert
                 if jc or lv:
-                    try:
-                        if jc and lv:
-                            cursor.execute("""
-                                SELECT id, job_category, level, authority_id FROM certificate_codes
-                                WHERE TRIM(COALESCE(job_category,'')) = %s AND (TRIM(COALESCE(level,'')) = %s OR level IS NULL OR level = '')
-                                LIMIT 1
-                            """, (jc, lv))
-                        elif jc:
-                            cursor.execute("""
-                                SELECT id, job_category, level, authority_id FROM certificate_codes
-                                WHERE TRIM(COALESCE(job_category,'')) = %s
-                                LIMIT 1
-                            """, (jc,))
-                        else:
-                            cursor.execute("""
-                                SELECT id, job_category, level, authority_id FROM certificate_codes
-                                WHERE TRIM(COALESCE(level,'')) = %s
-                                LIMIT 1
-                            """, (lv,))
-                        fc = cursor.fetchone()
-                        if fc and fc.get("id"):
-                            cert_code_id = fc["id"]
-                            if not db_job_category:
-                                db_job_category = (fc.get("job_category") or "").strip() or jc
-                            if not db_level:
-                                db_level = (fc.get("level") or "").strip() or lv
-                            if not db_authority_id and fc.get("authority_id"):
-                                db_authority_id = fc["authority_id"]
-                            print(f"✅ 依職類/級別解析到 cert_code_id: {cert_code_id}")
-                    except Exception as e:
-                        print(f"⚠️ 依 job_category/level 查 certificate_codes 失敗: {e}")
+                    fc = code_index.find_by_category(jc, lv)
+                    if fc and fc.get("id"):
+                        cert_code_id = fc["id"]
+                        if not db_job_category:
+                            db_job_category = (fc.get("job_category") or "").strip() or jc
+                        if not db_level:
+                            db_level = (fc.get("level") or "").strip() or lv
+                        if not db_authority_id and fc.get("authority_id"):
+                            db_authority_id = fc["authority_id"]
+                        print(f"✅ 依職類/級別解析到 cert_code_id: {cert_code_id}")
 
             # 編輯時若表單未帶 cert_code（或為 OTHER/空），保留既有 student_certifications 的 cert_code，避免日文等證照被誤存為「其他」
             existing_cert_id = cert.get("id")
             if (cert_code_id is None or cert_code_id == 0) and existing_cert_id and str(existing_cert_id).strip():
                 try:
                     eid = int(existing_cert_id)
-                    cursor.execute("SELECT cert_code FROM student_certifications WHERE id = %s AND StuID = %s LIMIT 1", (eid, student_id))
-                    existing_row = cursor.fetchone()
-                    if existing_row and existing_row.get("cert_code") is not None:
-                        cert_code_id = existing_row["cert_code"]
+                    if existing_cert_codes.get(eid) is not None:
+                        cert_code_id = existing_cert_codes[eid]
                         print(f"✅ 保留既有證照 cert_code（id={eid}）: {cert_code_id}")
-                except (ValueError, TypeError, Exception):
+                except (ValueError, TypeError):
                     pass
             row["cert_code"] = cert_code_id
 
@@ -5586,21 +5350,12 @@ def save_structured_data(cursor, student_id, data, semester_id=None, resume_id=N
 
             # 若有 cert_code_id，從 certificate_codes 取 job_category / level / authority_id
             if cert_code_id and not db_authority_id:
-                try:
-                    cursor.execute("""
-                        SELECT job_category, level, authority_id 
-                        FROM certificate_codes 
-                        WHERE id = %s
-                        LIMIT 1
-                    """, (cert_code_id,))
-                    cert_info = cursor.fetchone()
-                    if cert_info:
-                        db_job_category = (cert_info.get('job_category') or '').strip()
-                        db_level = (cert_info.get('level') or '').strip()
-                        db_authority_id = cert_info.get('authority_id')
-                except Exception as e:
-                    print(f"⚠️ 查詢 certificate_codes 失敗: {e}")
-            
+                cert_info = code_index.get(cert_code_id)
+                if cert_info:
+                    db_job_category = (cert_info.get('job_category') or '').strip()
+                    db_level = (cert_info.get('level') or '').strip()
+                    db_authority_id = cert_info.get('authority_id')
+
             # 如果前端傳來了 authority_name（其他證照），且 authority_id 為 OTHER，則設置為 NULL
             if cert.get("authority_id") == 'OTHER' or (cert.get("authority_name") and not db_authority_id):
                 db_authority_id = None
@@ -5726,13 +5481,16 @@ def save_structured_data(cursor, student_id, data, semester_id=None, resume_id=N
         # -------------------------------------------------------------
         cursor.execute("DELETE FROM student_languageskills WHERE StuID=%s", (student_id,))
         lang_ids_saved = []
-        for row in data.get("structured_languages", []):
-            if row.get("language") and row.get("level"):
-                cursor.execute("""
-                    INSERT INTO student_languageskills (StuID, Language, Level, CreatedAt)
-                    VALUES (%s,%s,%s,NOW())
-                """, (student_id, row["language"], row["level"]))
-                lang_ids_saved.append(cursor.lastrowid)
+        lang_rows = [(student_id, row["language"], row["level"])
+                     for row in data.get("structured_languages", []) if row.get("language") and row.get("level")]
+        if lang_rows:
+            cursor.executemany("""
+                INSERT INTO student_languageskills (StuID, Language, Level, CreatedAt)
+                VALUES (%s,%s,%s,NOW())
+            """, lang_rows)
+            # 剛刪除該生全部語言能力，現有資料即為本次寫入
+            cursor.execute("SELECT id FROM student_languageskills WHERE StuID=%s ORDER BY id", (student_id,))
+            lang_ids_saved = [r["id"] for r in cursor.fetchall() or []]
 
         # 一律計算 mapping 用的 ID（course_grades.id、證照 id、語文 id），供寫入 resume_content_mapping
         course_ids = course_grade_ids_saved if course_grade_ids_saved else None
@@ -5762,240 +5520,8 @@ def save_structured_data(cursor, student_id, data, semester_id=None, resume_id=N
 
 
 def get_student_info_for_doc(cursor, student_id, semester_id=None, resume_id=None):
-    data = {}
-    cursor.execute("SELECT * FROM Student_Info WHERE StuID=%s", (student_id,))
-    data['info'] = cursor.fetchone() or {}
-
-    mapping = None
-    if resume_id:
-        mapping = _get_resume_content_mapping(cursor, resume_id)
-
-    # 檢查表是否有 SemesterID、ProofImage 和 transcript_path 列
-    try:
-        cursor.execute("SHOW COLUMNS FROM course_grades LIKE 'SemesterID'")
-        has_semester_id = cursor.fetchone() is not None
-        cursor.execute("SHOW COLUMNS FROM course_grades LIKE 'ProofImage'")
-        has_proof_image = cursor.fetchone() is not None
-        cursor.execute("SHOW COLUMNS FROM course_grades LIKE 'transcript_path'")
-        has_transcript_path = cursor.fetchone() is not None
-    except:
-        has_semester_id = False
-        has_proof_image = False
-        has_transcript_path = False
-
-    # 優先使用 ProofImage 欄位，如果沒有則使用 transcript_path（兼容舊結構）
-    transcript_field = 'ProofImage' if has_proof_image else ('transcript_path' if has_transcript_path else None)
-
-    if semester_id is not None and has_semester_id:
-        if transcript_field:
-            cursor.execute(f"""
-                SELECT id, CourseName, Credits, Grade, IFNULL({transcript_field}, '') AS transcript_path, SemesterID 
-                FROM course_grades 
-                WHERE StuID=%s AND SemesterID=%s
-                ORDER BY CourseName
-            """, (student_id, semester_id))
-        else:
-            cursor.execute("""
-                SELECT id, CourseName, Credits, Grade, SemesterID 
-                FROM course_grades 
-                WHERE StuID=%s AND SemesterID=%s
-                ORDER BY CourseName
-            """, (student_id, semester_id))
-    else:
-        if transcript_field:
-            cursor.execute(f"""
-                SELECT id, CourseName, Credits, Grade, IFNULL({transcript_field}, '') AS transcript_path 
-                FROM course_grades 
-                WHERE StuID=%s 
-                ORDER BY CourseName
-            """, (student_id,))
-        else:
-            cursor.execute("""
-                SELECT id, CourseName, Credits, Grade 
-                FROM course_grades 
-                WHERE StuID=%s 
-                ORDER BY CourseName
-            """, (student_id,))
-    
-    grades_rows = cursor.fetchall() or []
-    if mapping and mapping.get("course_grade_ids"):
-        raw_ids = [x.strip() for x in (mapping["course_grade_ids"] or "").split(",") if x.strip()]
-        if raw_ids:
-            ids_are_int = all((x or "").replace("-", "").isdigit() for x in raw_ids)
-            if ids_are_int:
-                ids_set = set(int(x) for x in raw_ids)
-                grades_rows = [r for r in grades_rows if r.get("id") in ids_set]
-            else:
-                ids_set = set(raw_ids)
-                grades_rows = [r for r in grades_rows if (r.get("CourseName") or "").strip() in ids_set]
-    
-    data['grades'] = grades_rows
-    data['transcript_path'] = ''
-    # 嘗試從成績記錄中找到路徑
-    for row in grades_rows:
-        tp = row.get('transcript_path')
-        if tp:
-            data['transcript_path'] = tp
-            break
-
-    # 證照 - authority 以 student_certifications.authority_id 優先對應 cert_authorities.id，無則用 certificate_codes.authority_id；分類用 cc.category (labor/local/intl/other)
-    cursor.execute("""
-        SELECT 
-            sc.id, sc.StuID, sc.cert_code,
-            COALESCE(sc.authority_id, cc.authority_id) AS authority_id,
-            cc.job_category AS CertName, sc.AcquisitionDate, sc.CertPath,
-            sc.issuer, 
-            cc.job_category, cc.level, cc.category AS CertCategory,
-            ca.name AS authority_name
-        FROM student_certifications sc
-        LEFT JOIN certificate_codes cc 
-            ON sc.cert_code = cc.id
-        LEFT JOIN cert_authorities ca 
-            ON ca.id = COALESCE(sc.authority_id, cc.authority_id)
-        WHERE sc.StuID = %s
-        ORDER BY sc.AcquisitionDate DESC, sc.id ASC
-    """, (student_id,))
-    certs_rows = cursor.fetchall() or []
-    if mapping and mapping.get("certification_ids"):
-        try:
-            ids_set = set(int(x.strip()) for x in (mapping["certification_ids"] or "").split(",") if x.strip())
-            if ids_set:
-                certs_rows = [c for c in certs_rows if c.get("id") in ids_set]
-        except ValueError:
-            pass
-    data['certifications'] = certs_rows
-
-    # 語言能力
-    cursor.execute(""" 
-        SELECT id, Language AS language, Level AS level 
-        FROM student_languageskills 
-        WHERE StuID=%s 
-        ORDER BY Language
-    """, (student_id,))
-    lang_rows = cursor.fetchall() or []
-    if mapping and mapping.get("language_skill_ids"):
-        try:
-            ids_set = set(int(x.strip()) for x in (mapping["language_skill_ids"] or "").split(",") if x.strip())
-            if ids_set:
-                lang_rows = [l for l in lang_rows if l.get("id") in ids_set]
-        except ValueError:
-            pass
-    data['languages'] = lang_rows
-
-    # 缺勤記錄佐證圖片（僅返回最新的）
-    absence_proof_path = ''
-    try:
-        cursor.execute("SELECT id FROM users WHERE username=%s", (student_id,))
-        user_row = cursor.fetchone()
-        if user_row:
-            user_id = user_row.get('id')
-            # 嘗試使用 created_at 排序
-            try:
-                cursor.execute("""
-                    SELECT image_path 
-                    FROM absence_records 
-                    WHERE user_id = %s AND image_path IS NOT NULL AND image_path != '' 
-                    ORDER BY created_at DESC 
-                    LIMIT 1
-                """, (user_id,))
-            except:
-                # 如果 created_at 欄位不存在，使用 id 排序
-                cursor.execute("""
-                    SELECT image_path 
-                    FROM absence_records 
-                    WHERE user_id = %s AND image_path IS NOT NULL AND image_path != '' 
-                    ORDER BY id DESC 
-                    LIMIT 1
-                """, (user_id,))
-            absence_row = cursor.fetchone()
-            if absence_row:
-                absence_proof_path = absence_row.get('image_path', '')
-    except Exception as e:
-        print(f"⚠️ 查詢缺勤佐證圖片失敗: {e}")
-        traceback.print_exc()
-    data['absence_proof_path'] = absence_proof_path
-
-    # 依學生入學學期取得實習期間與查詢區間（internship_configs + semesters）
-    try:
-        admission_year = None
-        if student_id and len(str(student_id).strip()) >= 3:
-            try:
-                admission_year = int(str(student_id).strip()[:3])
-            except (ValueError, TypeError):
-                pass
-        user_id = None
-        cursor.execute("SELECT id FROM users WHERE username=%s LIMIT 1", (student_id,))
-        urow = cursor.fetchone()
-        if urow:
-            user_id = urow.get("id")
-        intern_start_date = None
-        intern_end_date = None
-        internship_semester_code = None
-        if admission_year is not None:
-            # 優先該生專用設定 (user_id = 學生)，否則用該屆預設 (user_id IS NULL)
-            cursor.execute("""
-                SELECT ic.intern_start_date, ic.intern_end_date, ic.semester_id, s.code AS semester_code
-                FROM internship_configs ic
-                JOIN semesters s ON s.id = ic.semester_id
-                WHERE ic.admission_year = %s AND (ic.user_id = %s OR ic.user_id IS NULL)
-                ORDER BY (ic.user_id IS NOT NULL) DESC, ic.id DESC
-                LIMIT 1
-            """, (admission_year, user_id))
-            iconf = cursor.fetchone()
-            if iconf:
-                intern_start_date = iconf.get("intern_start_date")
-                intern_end_date = iconf.get("intern_end_date")
-                internship_semester_code = (iconf.get("semester_code") or "").strip()
-        # 實習期間：民國年、月、日
-        if intern_start_date:
-            d = intern_start_date
-            if hasattr(d, 'year'):
-                data['InternStartYear_TW'] = str(d.year - 1911)
-                data['InternStartMonth'] = str(d.month)
-                data['InternStartDay'] = str(d.day)
-            else:
-                data['InternStartYear_TW'] = data['InternStartMonth'] = data['InternStartDay'] = ''
-        else:
-            data['InternStartYear_TW'] = data['InternStartMonth'] = data['InternStartDay'] = ''
-        if intern_end_date:
-            d = intern_end_date
-            if hasattr(d, 'year'):
-                data['InternEndMonth'] = str(d.month)
-                data['InternEndDay'] = str(d.day)
-            else:
-                data['InternEndMonth'] = data['InternEndDay'] = ''
-        else:
-            data['InternEndMonth'] = data['InternEndDay'] = ''
-        # 查詢區間：實習學期的前兩個學期（例：實習 1132 → 1122 至 1131）
-        PrevSemester_1 = ''
-        PrevSemester_2 = ''
-        if internship_semester_code:
-            cursor.execute("SELECT id, code FROM semesters WHERE code IS NOT NULL AND TRIM(code) != '' ORDER BY code")
-            all_sem = cursor.fetchall() or []
-            codes = [row.get("code", "").strip() for row in all_sem if row.get("code")]
-            try:
-                idx = codes.index(internship_semester_code)
-                if idx >= 2:
-                    PrevSemester_1 = codes[idx - 2]
-                    PrevSemester_2 = codes[idx - 1]
-                elif idx >= 1:
-                    PrevSemester_1 = codes[idx - 1]
-                    PrevSemester_2 = internship_semester_code
-                else:
-                    PrevSemester_1 = internship_semester_code
-                    PrevSemester_2 = internship_semester_code
-            except (ValueError, IndexError):
-                pass
-        data['PrevSemester_1'] = PrevSemester_1
-        data['PrevSemester_2'] = PrevSemester_2
-    except Exception as e:
-        print(f"⚠️ 取得實習期間/查詢區間失敗: {e}")
-        traceback.print_exc()
-        data['InternStartYear_TW'] = data['InternStartMonth'] = data['InternStartDay'] = ''
-        data['InternEndMonth'] = data['InternEndDay'] = ''
-        data['PrevSemester_1'] = data['PrevSemester_2'] = ''
-
-    return data
+    """套版用學生資料（dict）；實際查詢由 resume_data.load_resume_data 以固定數量的批次查詢完成"""
+    return load_one_resume_data(cursor, student_id, semester_id=semester_id, resume_id=resume_id).to_dict()
 
 def format_data_for_doc(student_data, doc_path=None):
     context = {}
@@ -6102,345 +5628,3 @@ def format_data_for_doc(student_data, doc_path=None):
             context[f'{prefix}_Lue'] = marks['Lue']
     
     return context, doc
-
-def generate_application_form_docx(student_data, output_path):
-    try:
-        base_dir = os.path.dirname(__file__)
-        template_path = os.path.abspath(os.path.join(base_dir, "..", "frontend", "static", "examples", "實習履歷(空白).docx"))
-        if not os.path.exists(template_path):
-            print("❌ 找不到模板：", template_path)
-            return False
-
-        doc = DocxTemplate(template_path)
-        info = student_data.get("info", {})
-        grades = student_data.get("grades", [])
-        certs = student_data.get("certifications", [])
-
-        # 格式化出生日期
-        def fmt_date(val):
-            if hasattr(val, 'strftime'):
-                return val.strftime("%Y-%m-%d")
-            if isinstance(val, str) and len(val) >= 10:
-                return val.split("T")[0]
-            return ""
-
-        bdate = fmt_date(info.get("BirthDate"))
-        year, month, day = ("", "", "")
-        if bdate:
-            try:
-                year, month, day = bdate.split("-")
-            except:
-                pass
-
-        # 照片（使用 safe_create 驗證格式，相對路徑需轉絕對路徑）
-        image_obj = None
-        photo_path = resolve_upload_path(info.get("PhotoPath") or "")
-        if photo_path and os.path.exists(photo_path):
-            image_obj = safe_create_inline_image(doc, photo_path, Inches(1.2), "學生照片")
-
-        # 處理課程資料（保留原邏輯）
-        MAX_COURSES = 30
-        padded_grades = grades[:MAX_COURSES]
-        padded_grades += [{'CourseName': '', 'Credits': ''}] * (MAX_COURSES - len(padded_grades))
-
-        context_courses = {}
-        NUM_ROWS = 10
-        NUM_COLS = 3
-        for i in range(NUM_ROWS):
-            for j in range(NUM_COLS):
-                index = i * NUM_COLS + j
-                if index < MAX_COURSES:
-                    course = padded_grades[index]
-                    row_num = i + 1
-                    col_num = j + 1
-                    context_courses[f'CourseName_{row_num}_{col_num}'] = (course.get('CourseName') or '')
-                    context_courses[f'Credits_{row_num}_{col_num}'] = (course.get('Credits') or '')
-
-        # 插入成績單圖片：相對路徑需轉絕對路徑
-        transcript_obj = None
-        transcript_path = resolve_upload_path(student_data.get("transcript_path") or info.get("TranscriptPath") or '')
-        if transcript_path and os.path.exists(transcript_path):
-            transcript_obj = safe_create_inline_image(doc, transcript_path, Inches(6.0), "成績單")
-
-        # 缺勤佐證圖片（相對路徑需轉絕對路徑；相容 Absence_Proof_Path / absence_proof_path）
-        absence_proof_obj = None
-        absence_raw = (student_data.get("Absence_Proof_Path") or student_data.get("absence_proof_path") or "").strip()
-        absence_proof_path = resolve_upload_path(absence_raw)
-        image_size = Inches(6.0)
-        if absence_proof_path and os.path.exists(absence_proof_path):
-            absence_proof_obj = safe_create_inline_image(doc, absence_proof_path, image_size, "缺勤佐證")
-
-        # 操行等級
-        conduct_score = info.get('ConductScore', '')
-        conduct_marks = {k: '□' for k in ['C_You', 'C_Jia', 'C_Yi', 'C_Bing', 'C_Ding']}
-        mapping = {'優': 'C_You', '甲': 'C_Jia', '乙': 'C_Yi', '丙': 'C_Bing', '丁': 'C_Ding'}
-        if conduct_score in mapping:
-            conduct_marks[mapping[conduct_score]] = '■'
-
-        # 證照分類 - 使用新的分類邏輯
-        # certs 已經從 get_student_info_for_doc 返回，格式統一
-        # 優先使用前端提交的證照名稱（如果有的話）
-        # 這樣可以確保只顯示用戶實際選擇的證照，而不是數據庫中所有相關記錄
-        cert_photo_paths_from_form = student_data.get("cert_photo_paths", []) or []
-        structured_certs = student_data.get("structured_certifications", [])
-
-        # 以 structured_certifications 為準疊代，確保每筆都有 authority_id / category，避免索引錯位
-        # 同一 photo_path 只使用一次，避免編輯後重新上傳時出現兩張一樣的證照圖
-        if structured_certs:
-            certs_from_form = []
-            used_photo_paths = set()
-            for idx, struct in enumerate(structured_certs):
-                name = (struct.get("name") or "").strip()
-                if not name:
-                    continue
-                path = (struct.get("cert_path") or "")
-                if not path and idx < len(cert_photo_paths_from_form):
-                    path = cert_photo_paths_from_form[idx] or ""
-                path = (path or "").replace("\\", "/").strip()
-                if path and path in used_photo_paths:
-                    path = ""
-                elif path:
-                    used_photo_paths.add(path)
-                matching_cert = certs[idx] if idx < len(certs) else None
-                if not matching_cert and path:
-                    for c in certs:
-                        if (c.get("cert_path") or "").replace("\\", "/") == path:
-                            matching_cert = c
-                            break
-                # 類別：優先使用 DB（certificate_codes）的 category，確保如 JLPT 等 intl 正確歸類
-                aid = struct.get("authority_id")
-                db_category = None
-                if matching_cert:
-                    db_category = (matching_cert.get("CertCategory") or matching_cert.get("category") or "").strip().lower()
-                if aid is not None and str(aid).strip() in ("1",):
-                    category = "labor"
-                elif db_category and db_category in ("labor", "intl", "local", "other"):
-                    category = db_category
-                else:
-                    try:
-                        ai = int(aid)
-                        if ai == 1:
-                            category = "labor"
-                        else:
-                            category = (struct.get("category") or "").strip().lower() or "other"
-                            if category not in ("labor", "intl", "local", "other"):
-                                category = "other"
-                    except (TypeError, ValueError):
-                        cat = (struct.get("category") or "").strip().lower()
-                        category = cat if cat in ("labor", "intl", "local", "other") else (db_category if db_category in ("labor", "intl", "local", "other") else "other")
-                certs_from_form.append({
-                    "cert_name": name,
-                    "category": category,
-                    "cert_path": path or (matching_cert.get("cert_path", "") if matching_cert else ""),
-                    "acquire_date": (matching_cert.get("acquire_date") or struct.get("acquire_date") or "") if matching_cert else (struct.get("acquire_date") or ""),
-                })
-            if certs_from_form:
-                certs = certs_from_form
-        
-        # 分類證照
-        labor_list, intl_list, local_list, other_list = categorize_certifications(certs)
-
-        def pad_list(lst, length=5):
-            lst = lst[:length]
-            lst += [''] * (length - len(lst))
-            return lst
-
-        # 建 context
-        # 處理自傳：移除多餘的換行符，避免產生空白行
-        autobiography = info.get('Autobiography', '').strip()
-        if autobiography:
-            # 將多個連續換行符替換為單個換行符，移除開頭和結尾的換行符
-            autobiography = re.sub(r'\n{3,}', '\n\n', autobiography)
-            autobiography = autobiography.strip('\n')
-        
-        context = {
-            'StuID': (info.get('StuID') or ''),
-            'StuName': (info.get('StuName') or ''),
-            'BirthYear': year, 'BirthMonth': month, 'BirthDay': day,
-            'Gender': (info.get('Gender') or ''),
-            'Phone': (info.get('Phone') or ''),
-            'Email': (info.get('Email') or ''),
-            'Address': (info.get('Address') or ''),
-            'ConductScoreNumeric': (info.get('ConductScoreNumeric') or ''),
-            'ConductScore': conduct_score,
-            'Autobiography': (autobiography or ''),
-            # 實習期間（依學生入學學期從 internship_configs 帶入）
-            'InternStartYear_TW': (student_data.get('InternStartYear_TW') or ''),
-            'InternStartMonth': (student_data.get('InternStartMonth') or ''),
-            'InternStartDay': (student_data.get('InternStartDay') or ''),
-            'InternEndMonth': (student_data.get('InternEndMonth') or ''),
-            'InternEndDay': (student_data.get('InternEndDay') or ''),
-            # 查詢區間（缺曠查詢學期，實習學期前兩學期）
-            'PrevSemester_1': (student_data.get('PrevSemester_1') or ''),
-            'PrevSemester_2': (student_data.get('PrevSemester_2') or ''),
-        }
-        if image_obj:
-            context['Image_1'] = image_obj
-        if transcript_obj:
-            context['transcript_path'] = transcript_obj
-        if absence_proof_obj:
-            context['Absence_Proof_Image'] = absence_proof_obj
-
-        empty_vars_to_clear = [
-            'empty_line_1', 'empty_line_2', 'empty_line_3',
-            'blank_line_1', 'blank_line_2', 'blank_line_3',
-            'spacer_1', 'spacer_2', 'spacer_3',
-            'extra_line_1', 'extra_line_2', 'extra_line_3',
-            'blank_1', 'blank_2', 'blank_3',
-        ]
-        for var in empty_vars_to_clear:
-            context[var] = ""
-
-        # 加入缺勤統計
-        # 只填充這8個標準字段，確保沒有多餘的空白行
-        absence_fields = ['曠課', '遲到', '事假', '病假', '生理假', '公假', '喪假', '總計']
-        for t in absence_fields:
-            key = f"absence_{t}_units"
-            value = (student_data.get(key) or "0 節")
-            context[key] = value
-            # 調試輸出
-            if value == "0 節" and t != "總計":
-                print(f"⚠️ 缺勤統計 {key} 未找到，使用預設值: {value}")
-            else:
-                print(f"✅ 缺勤統計 {key} = {value}")
-        
-        # 如果模板中有額外的行（例如第9、10、11行），將它們設為空字符串
-        # 常見的額外變數名可能是：absence_row_9, absence_row_10, absence_row_11 等
-        # 或者：absence_9_units, absence_10_units, absence_11_units 等
-        # 清空可能的額外行變數
-        for i in range(9, 12):  # 第9、10、11行
-            # 嘗試多種可能的變數名格式
-            possible_keys = [
-                f"absence_row_{i}",
-                f"absence_{i}_units",
-                f"absence_row_{i}_units",
-                f"absence_item_{i}",
-                f"absence_type_{i}",
-            ]
-            for key in possible_keys:
-                context[key] = ""
-        
-        # 清空可能存在的其他缺勤類型變數（防止模板中有額外的空白行）
-        # 例如：absence_其他_units, absence_其他1_units 等
-        # 只保留標準的8個字段，其他都設為空字符串
-        standard_keys = [f"absence_{t}_units" for t in absence_fields]
-        for key in list(context.keys()):
-            if key.startswith("absence_") and key.endswith("_units"):
-                if key not in standard_keys:
-                    context[key] = ""  # 清空非標準字段
-
-        # 加入操行等級勾選
-        context.update(conduct_marks)
-
-        # 加入課程資料
-        context.update(context_courses)
-
-        # 加入證照文字清單 - 使用新的填充函數
-        fill_certificates_to_doc(context, "LaborCerts_", labor_list, 5)
-        fill_certificates_to_doc(context, "IntlCerts_", intl_list, 5)
-        fill_certificates_to_doc(context, "LocalCerts_", local_list, 5)
-        fill_certificates_to_doc(context, "OtherCerts_", other_list, 5)
-
-        # 證照圖片（不分類，依順序塞）- 使用新的填充函數
-        # 將四類組裝成一個大 list（圖片不分類）
-        flat_list = labor_list + intl_list + local_list + other_list
-        
-        # 分頁顯示證照圖片：每頁8張，最多32張（4頁）
-        # 使用區塊變數控制頁面顯示/隱藏
-        certs_per_page = 8
-        max_total = 32  # 最多32張（4頁）
-        
-        # 將相對路徑轉為絕對路徑，否則 os.path.exists 會失敗、導致只顯示部分證照圖（如 DB 有 3 張路徑卻只生成 2 張）
-        resolved_flat = []
-        for c in flat_list:
-            p = (c.get("photo_path") or "").strip()
-            resolved_p = resolve_upload_path(p) if p else ""
-            resolved_flat.append({**c, "photo_path": resolved_p or p})
-        # 只處理實際有圖片的證照（最多32張）
-        certs_with_photos = [c for c in resolved_flat if c.get("photo_path") and os.path.exists(c.get("photo_path", ""))]
-        certs_to_display = certs_with_photos[:max_total]
-        total_certs = len(certs_to_display)
-        
-        # 初始化證照名稱為空；圖片僅在有圖時才設 key，未輸入不設以免顯示 None
-        for idx in range(1, 33):
-            context[f"CertPhotoName_{idx}"] = ""
-        
-        # 初始化所有頁面區塊為 False（不顯示）
-        # 使用布林值控制頁面顯示，模板中使用 {% if cert_page_2_block %} ... {% endif %}
-        context["cert_page_2_block"] = False
-        context["cert_page_3_block"] = False
-        context["cert_page_4_block"] = False
-        
-        if total_certs > 0:
-            # 第一頁（1-8）：總是填充（如果有證照）
-            first_page_certs = certs_to_display[:min(8, total_certs)]
-            if first_page_certs:
-                fill_certificate_photos(context, doc, first_page_certs, start_index=1, max_count=8)
-            
-            # 第二頁（9-16）：如果 total_certs > 8 則顯示
-            if total_certs > 8:
-                context["cert_page_2_block"] = True  # 設置為 True 以顯示區塊
-                second_page_certs = certs_to_display[8:min(16, total_certs)]
-                if second_page_certs:
-                    fill_certificate_photos(context, doc, second_page_certs, start_index=9, max_count=8)
-            
-            # 第三頁（17-24）：如果 total_certs > 16 則顯示
-            if total_certs > 16:
-                context["cert_page_3_block"] = True  # 設置為 True 以顯示區塊
-                third_page_certs = certs_to_display[16:min(24, total_certs)]
-                if third_page_certs:
-                    fill_certificate_photos(context, doc, third_page_certs, start_index=17, max_count=8)
-            
-            # 第四頁（25-32）：如果 total_certs > 24 則顯示
-            if total_certs > 24:
-                context["cert_page_4_block"] = True  # 設置為 True 以顯示區塊
-                fourth_page_certs = certs_to_display[24:min(32, total_certs)]
-                if fourth_page_certs:
-                    fill_certificate_photos(context, doc, fourth_page_certs, start_index=25, max_count=8)
-
-        # 語文能力
-        lang_context = {}
-        lang_codes = ['En', 'Jp', 'Tw', 'Hk']
-        level_codes = ['Jing', 'Zhong', 'Lue']
-        for code in lang_codes:
-            for level_code in level_codes:
-                lang_context[f'{code}_{level_code}'] = '□'
-
-        lang_code_map = {'英語': 'En', '日語': 'Jp', '台語': 'Tw', '客語': 'Hk'}
-        level_code_map = {'精通': 'Jing', '中等': 'Zhong', '略懂': 'Lue'}
-
-        for lang_skill in student_data.get('languages', []):
-            lang = lang_skill.get('Language') or lang_skill.get('language')
-            level = lang_skill.get('Level') or lang_skill.get('level')
-            lang_code = lang_code_map.get(lang)
-            level_code = level_code_map.get(level)
-            if lang_code and level_code:
-                key = f'{lang_code}_{level_code}'
-                if key in lang_context:
-                    lang_context[key] = '■'
-
-        # 未填寫的語文能力自動代入「略懂」
-        for code in lang_codes:
-            if all(lang_context.get(f'{code}_{lc}', '□') == '□' for lc in level_codes):
-                lang_context[f'{code}_Lue'] = '■'
-
-        context.update(lang_context)
-        
-        # 渲染前：所有 None 改為 ""，避免 Word 顯示 "None"；未輸入欄位顯示空白
-        for key in list(context.keys()):
-            if context[key] is None:
-                context[key] = ""
-
-        doc.render(context)
-        # 確保輸出路徑所在目錄存在（不同電腦路徑不同時可正常寫入）
-        output_dir = os.path.dirname(output_path)
-        if output_dir:
-            os.makedirs(output_dir, exist_ok=True)
-        doc.save(output_path)
-        print(f"✅ 履歷文件已生成: {output_path}")
-        return True
-
-    except Exception as e:
-        print("❌ 生成 Word 檔錯誤:", e)
-        traceback.print_exc()
-        return False
\ No newline at end of file
@@ -0,0 +1,394 @@
+"""
+履歷套版資料載入（單次批次查詢）
+
+load_resume_data 以固定數量的批次查詢（Student_Info、users、resume_content_mapping 與關聯表、
+course_grades、student_certifications、student_languageskills、absence_records、internship_configs、semesters）
+一次取得一位或多位學生的履歷資料，回傳 ResumeData；單份履歷產生與批次匯出的查詢數都與人數無關。
+CertificateCodeIndex 供 save_structured_data 一次載入所需的 certificate_codes，證照解析改在記憶體比對。
+"""
+import traceback
+
+from schema_cache import has_column
+
+INTERN_DATE_KEYS = ('InternStartYear_TW', 'InternStartMonth', 'InternStartDay', 'InternEndMonth', 'InternEndDay')
+
+
+class ResumeData:
+    """單份履歷的套版資料；to_dict() 回傳與舊版 get_student_info_for_doc 相同格式的 dict"""
+    __slots__ = (
+        'student_id', 'resume_id', 'user_id', 'info', 'grades', 'transcript_path', 'certifications',
+        'languages', 'absence_proof_path', 'intern_dates', 'prev_semester_1', 'prev_semester_2',
+    )
+
+    def __init__(self, student_id, resume_id=None):
+        self.student_id = student_id
+        self.resume_id = resume_id
+        self.user_id = None
+        self.info = {}
+        self.grades = []
+        self.transcript_path = ''
+        self.certifications = []
+        self.languages = []
+        self.absence_proof_path = ''
+        self.intern_dates = dict.fromkeys(INTERN_DATE_KEYS, '')
+        self.prev_semester_1 = ''
+        self.prev_semester_2 = ''
+
+    def to_dict(self):
+        data = {
+            'info': self.info,
+            'grades': self.grades,
+            'transcript_path': self.transcript_path,
+            'certifications': self.certifications,
+            'languages': self.languages,
+            'absence_proof_path': self.absence_proof_path,
+            'PrevSemester_1': self.prev_semester_1,
+            'PrevSemester_2': self.prev_semester_2,
+        }
+        data.update(self.intern_dates)
+        return data
+
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def _parse_ids(raw):
+    return [x.strip() for x in (raw or "").split(",") if x.strip()]
+
+
+def _filter_grades(rows, raw_ids):
+    """mapping 的 course_grade_ids 可能是 id 或課程名稱（舊資料）"""
+    if not raw_ids:
+        return rows
+    if all((x or "").replace("-", "").isdigit() for x in raw_ids):
+        ids_set = set(int(x) for x in raw_ids)
+        return [r for r in rows if r.get("id") in ids_set]
+    ids_set = set(raw_ids)
+    return [r for r in rows if (r.get("CourseName") or "").strip() in ids_set]
+
+
+def _filter_by_id(rows, raw_ids):
+    try:
+        ids_set = set(int(x) for x in raw_ids)
+    except ValueError:
+        return rows
+    if not ids_set:
+        return rows
+    return [r for r in rows if r.get("id") in ids_set]
+
+
+def _load_content_mappings(cursor, resume_ids):
+    """resume_id -> {course_grade_ids, certification_ids, language_skill_ids, absence_record_ids}（逗號分隔字串）"""
+    if not resume_ids:
+        return {}
+    cursor.execute(f"""
+        SELECT id, resume_id FROM resume_content_mapping
+        WHERE resume_id IN ({_placeholders(resume_ids)})
+        ORDER BY id
+    """, tuple(resume_ids))
+    mapping_by_resume = {}
+    for row in cursor.fetchall() or []:
+        mapping_by_resume.setdefault(row["resume_id"], row["id"])
+    if not mapping_by_resume:
+        return {}
+
+    mapping_ids = list(mapping_by_resume.values())
+    ph = _placeholders(mapping_ids)
+    cursor.execute(f"""
+        SELECT mapping_id, 'course_grade_ids' AS kind, grade_id AS ref_id FROM resume_grade_rel WHERE mapping_id IN ({ph})
+        UNION ALL
+        SELECT mapping_id, 'certification_ids', cert_id FROM resume_cert_rel WHERE mapping_id IN ({ph})
+        UNION ALL
+        SELECT mapping_id, 'language_skill_ids', lang_skill_id FROM resume_lang_rel WHERE mapping_id IN ({ph})
+        UNION ALL
+        SELECT mapping_id, 'absence_record_ids', absence_id FROM resume_absence_rel WHERE mapping_id IN ({ph})
+    """, tuple(mapping_ids) * 4)
+    refs = {}
+    for row in cursor.fetchall() or []:
+        refs.setdefault(row["mapping_id"], {}).setdefault(row["kind"], []).append(str(row["ref_id"]))
+
+    mappings = {}
+    for resume_id, mapping_id in mapping_by_resume.items():
+        kinds = refs.get(mapping_id, {})
+        mappings[resume_id] = {
+            kind: ",".join(kinds[kind]) if kinds.get(kind) else None
+            for kind in ("course_grade_ids", "certification_ids", "language_skill_ids", "absence_record_ids")
+        }
+    return mappings
+
+
+def _group_by(rows, key):
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row.get(key), []).append(row)
+    return grouped
+
+
+def _load_grades(cursor, student_ids, semester_id):
+    has_semester_id = has_column('course_grades', 'SemesterID')
+    # 優先使用 ProofImage 欄位，如果沒有則使用 transcript_path（兼容舊結構）
+    if has_column('course_grades', 'ProofImage'):
+        transcript_field = 'ProofImage'
+    elif has_column('course_grades', 'transcript_path'):
+        transcript_field = 'transcript_path'
+    else:
+        transcript_field = None
+
+    columns = "id, StuID, CourseName, Credits, Grade"
+    if transcript_field:
+        columns += f", IFNULL({transcript_field}, '') AS transcript_path"
+    sql = f"SELECT {columns}{', SemesterID' if has_semester_id and semester_id is not None else ''} FROM course_grades WHERE StuID IN ({_placeholders(student_ids)})"
+    params = list(student_ids)
+    if semester_id is not None and has_semester_id:
+        sql += " AND SemesterID=%s"
+        params.append(semester_id)
+    cursor.execute(sql + " ORDER BY CourseName", tuple(params))
+    grouped = _group_by(cursor.fetchall() or [], "StuID")
+    for rows in grouped.values():
+        for row in rows:
+            row.pop("StuID", None)
+    return grouped
+
+
+def _load_intern_periods(cursor, students, user_ids):
+    """
+    依入學年（學號前三碼）取得實習期間與查詢區間；該生專用設定 (user_id = 學生) 優先於該屆預設 (user_id IS NULL)。
+    回傳 student_id -> (intern_dates, prev_1, prev_2)
+    """
+    admission_years = {}
+    for student_id in students:
+        text = str(student_id or "").strip()
+        if len(text) >= 3:
+            try:
+                admission_years[student_id] = int(text[:3])
+            except (ValueError, TypeError):
+                pass
+    if not admission_years:
+        return {}
+
+    years = sorted(set(admission_years.values()))
+    uids = [uid for uid in user_ids.values() if uid]
+    user_clause = f"ic.user_id IN ({_placeholders(uids)}) OR " if uids else ""
+    cursor.execute(f"""
+        SELECT ic.admission_year, ic.user_id, ic.intern_start_date, ic.intern_end_date, s.code AS semester_code
+        FROM internship_configs ic
+        JOIN semesters s ON s.id = ic.semester_id
+        WHERE ic.admission_year IN ({_placeholders(years)}) AND ({user_clause}ic.user_id IS NULL)
+        ORDER BY ic.id DESC
+    """, tuple(years) + tuple(uids))
+    personal, defaults = {}, {}
+    for row in cursor.fetchall() or []:
+        if row.get("user_id") is None:
+            defaults.setdefault(row["admission_year"], row)
+        else:
+            personal.setdefault((row["admission_year"], row["user_id"]), row)
+
+    configs = {}
+    for student_id, year in admission_years.items():
+        uid = user_ids.get(student_id)
+        iconf = personal.get((year, uid)) if uid else None
+        configs[student_id] = iconf or defaults.get(year)
+
+    codes = []
+    if any(c and (c.get("semester_code") or "").strip() for c in configs.values()):
+        cursor.execute("SELECT id, code FROM semesters WHERE code IS NOT NULL AND TRIM(code) != '' ORDER BY code")
+        codes = [row.get("code", "").strip() for row in cursor.fetchall() or [] if row.get("code")]
+
+    periods = {}
+    for student_id, iconf in configs.items():
+        dates = dict.fromkeys(INTERN_DATE_KEYS, '')
+        prev_1 = prev_2 = ''
+        if iconf:
+            start, end = iconf.get("intern_start_date"), iconf.get("intern_end_date")
+            # 實習期間：民國年、月、日
+            if start and hasattr(start, 'year'):
+                dates['InternStartYear_TW'] = str(start.year - 1911)
+                dates['InternStartMonth'] = str(start.month)
+                dates['InternStartDay'] = str(start.day)
+            if end and hasattr(end, 'year'):
+                dates['InternEndMonth'] = str(end.month)
+                dates['InternEndDay'] = str(end.day)
+            # 查詢區間：實習學期的前兩個學期（例：實習 1132 → 1122 至 1131）
+            code = (iconf.get("semester_code") or "").strip()
+            if code in codes:
+                idx = codes.index(code)
+                if idx >= 2:
+                    prev_1, prev_2 = codes[idx - 2], codes[idx - 1]
+                elif idx >= 1:
+                    prev_1, prev_2 = codes[idx - 1], code
+                else:
+                    prev_1 = prev_2 = code
+        periods[student_id] = (dates, prev_1, prev_2)
+    return periods
+
+
+def load_resume_data(cursor, items, semester_id=None):
+    """
+    批次載入履歷套版資料。
+    items：[(student_id, resume_id), ...]（resume_id 可為 None，表示不依 resume_content_mapping 篩選）
+    回傳 {(student_id, resume_id): ResumeData}
+    """
+    items = list(dict.fromkeys(items))
+    result = {key: ResumeData(*key) for key in items}
+    student_ids = list(dict.fromkeys(student_id for student_id, _ in items))
+    if not student_ids:
+        return result
+    ph = _placeholders(student_ids)
+
+    cursor.execute(f"SELECT * FROM Student_Info WHERE StuID IN ({ph})", tuple(student_ids))
+    infos = {row["StuID"]: row for row in cursor.fetchall() or []}
+    cursor.execute(f"SELECT id, username FROM users WHERE username IN ({ph})", tuple(student_ids))
+    user_ids = {}
+    for row in cursor.fetchall() or []:
+        user_ids.setdefault(row["username"], row["id"])
+
+    mappings = _load_content_mappings(cursor, [rid for _, rid in items if rid])
+    grades = _load_grades(cursor, student_ids, semester_id)
+
+    # 證照 - authority 以 student_certifications.authority_id 優先對應 cert_authorities.id，無則用 certificate_codes.authority_id；分類用 cc.category (labor/local/intl/other)
+    cursor.execute(f"""
+        SELECT
+            sc.id, sc.StuID, sc.cert_code,
+            COALESCE(sc.authority_id, cc.authority_id) AS authority_id,
+            cc.job_category AS CertName, sc.AcquisitionDate, sc.CertPath,
+            sc.issuer,
+            cc.job_category, cc.level, cc.category AS CertCategory,
+            ca.name AS authority_name
+        FROM student_certifications sc
+        LEFT JOIN certificate_codes cc
+            ON sc.cert_code = cc.id
+        LEFT JOIN cert_authorities ca
+            ON ca.id = COALESCE(sc.authority_id, cc.authority_id)
+        WHERE sc.StuID IN ({ph})
+        ORDER BY sc.AcquisitionDate DESC, sc.id ASC
+    """, tuple(student_ids))
+    certs = _group_by(cursor.fetchall() or [], "StuID")
+
+    # 語言能力
+    cursor.execute(f"""
+        SELECT id, StuID, Language AS language, Level AS level
+        FROM student_languageskills
+        WHERE StuID IN ({ph})
+        ORDER BY Language
+    """, tuple(student_ids))
+    langs = _group_by(cursor.fetchall() or [], "StuID")
+    for rows in langs.values():
+        for row in rows:
+            row.pop("StuID", None)
+
+    # 缺勤記錄佐證圖片（每位學生僅取最新的）
+    absence_proofs = {}
+    uids = [uid for uid in user_ids.values() if uid]
+    if uids:
+        try:
+            order = "created_at DESC, id DESC" if has_column('absence_records', 'created_at') else "id DESC"
+            cursor.execute(f"""
+                SELECT user_id, image_path
+                FROM absence_records
+                WHERE user_id IN ({_placeholders(uids)}) AND image_path IS NOT NULL AND image_path != ''
+                ORDER BY user_id, {order}
+            """, tuple(uids))
+            for row in cursor.fetchall() or []:
+                absence_proofs.setdefault(row["user_id"], row.get("image_path") or '')
+        except Exception as e:
+            print(f"⚠️ 查詢缺勤佐證圖片失敗: {e}")
+            traceback.print_exc()
+
+    # 依學生入學學期取得實習期間與查詢區間（internship_configs + semesters）
+    try:
+        periods = _load_intern_periods(cursor, student_ids, user_ids)
+    except Exception as e:
+        print(f"⚠️ 取得實習期間/查詢區間失敗: {e}")
+        traceback.print_exc()
+        periods = {}
+
+    for (student_id, resume_id), data in result.items():
+        mapping = mappings.get(resume_id) or {}
+        data.user_id = user_ids.get(student_id)
+        data.info = dict(infos.get(student_id) or {})
+        data.grades = _filter_grades(list(grades.get(student_id, [])), _parse_ids(mapping.get("course_grade_ids")))
+        # 嘗試從成績記錄中找到路徑
+        data.transcript_path = next((r.get('transcript_path') for r in data.grades if r.get('transcript_path')), '')
+        data.certifications = _filter_by_id(list(certs.get(student_id, [])), _parse_ids(mapping.get("certification_ids")))
+        data.languages = _filter_by_id(list(langs.get(student_id, [])), _parse_ids(mapping.get("language_skill_ids")))
+        data.absence_proof_path = absence_proofs.get(data.user_id, '')
+        if student_id in periods:
+            dates, data.prev_semester_1, data.prev_semester_2 = periods[student_id]
+            data.intern_dates = dict(dates)
+    return result
+
+
+def load_one_resume_data(cursor, student_id, semester_id=None, resume_id=None):
+    return load_resume_data(cursor, [(student_id, resume_id)], semester_id=semester_id)[(student_id, resume_id)]
+
+
+class CertificateCodeIndex:
+    """
+    save_structured_data 用：一次載入表單證照可能對應到的 certificate_codes（依 id、code、職類、級別），
+    取代逐筆查詢；比對規則與原本各 SQL 相同，多筆符合時取 id 最小者。
+    """
+    __slots__ = ('rows', 'by_id')
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.by_id = {row["id"]: row for row in rows}
+
+    @classmethod
+    def load(cls, cursor, certs, extra_ids=()):
+        """extra_ids：另外需要的 certificate_codes.id（例如學生既有證照的 cert_code）"""
+        ids, codes, categories, levels = set(i for i in extra_ids if i is not None), set(), set(), set()
+        for cert in certs:
+            raw = str(cert.get("cert_code") if cert.get("cert_code") is not None else "").strip()
+            if raw and raw.upper() != 'OTHER':
+                if raw.isdigit():
+                    ids.add(int(raw))
+                codes.add(raw.upper())
+            if (cert.get("job_category") or "").strip():
+                categories.add(cert["job_category"].strip())
+            if (cert.get("level") or "").strip():
+                levels.add(cert["level"].strip())
+        conditions, params = [], []
+        for expr, values in (("id", ids), ("code", codes),
+                             ("TRIM(COALESCE(job_category,''))", categories),
+                             ("TRIM(COALESCE(level,''))", levels)):
+            if values:
+                conditions.append(f"{expr} IN ({_placeholders(values)})")
+                params.extend(values)
+        if not conditions:
+            return cls([])
+        cursor.execute(f"""
+            SELECT id, code, job_category, level, authority_id
+            FROM certificate_codes
+            WHERE {" OR ".join(conditions)}
+            ORDER BY id
+        """, tuple(params))
+        return cls(cursor.fetchall() or [])
+
+    def get(self, cert_code_id):
+        return self.by_id.get(cert_code_id)
+
+    def find_by_code(self, code, level=None):
+        """WHERE code = %s [AND (level = %s OR level IS NULL)]"""
+        for row in self.rows:
+            if str(row.get("code") or "").upper() != code:
+                continue
+            if level and row.get("level") not in (level, None):
+                continue
+            return row
+        return None
+
+    def find_by_category(self, job_category, level):
+        """依職類/級別比對（級別空白的 certificate_codes 視為符合任一級別）"""
+        for row in self.rows:
+            row_category = (row.get("job_category") or "").strip()
+            row_level = (row.get("level") or "").strip()
+            if job_category and row_category != job_category:
+                continue
+            if job_category and level:
+                if row_level not in (level, ""):
+                    continue
+            elif level and row_level != level:
+                continue
+            return row
+        return None
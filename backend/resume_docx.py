@@ -0,0 +1,552 @@
+"""
+履歷 Word 檔產生（套版）
+
+render pool 的 worker 程序只載入此模組（與 resume_render、image_pipeline），
+不載入 resume.py 的 Blueprint、通知與工作佇列等 Flask 相關模組。
+resume.py 仍由此匯入這些函式，原有呼叫方式不變。
+"""
+import os
+import re
+import time
+import traceback
+
+from docxtpl import InlineImage
+from docx.shared import Inches
+
+from resume_render import load_resume_template, check_image_cached
+from stage_timing import stage_timer, format_timings
+from image_pipeline import document_image_path
+
+# 專案根目錄（與 resume.BASE_UPLOAD_DIR 相同），相對路徑的上傳檔以此為基準
+BASE_UPLOAD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+def _normalize_cert_category(category):
+    """
+    將資料庫 category 正規化為 labor / intl / local / other，
+    對應履歷：1.勞動部 / 2.國際證照 / 3.國內證照 / 4.其他證照
+    """
+    if not category:
+        return "other"
+    c = str(category).strip().lower()
+    if c == "labor":
+        return "labor"
+    if c == "intl":
+        return "intl"
+    if c == "local":
+        return "local"
+    return "other"
+
+
+def is_valid_image_file(file_path):
+    """
+    驗證圖片文件是否有效
+    返回 True 如果文件是有效的圖片，否則返回 False
+    """
+    if not file_path or not os.path.exists(file_path):
+        return False
+    
+    try:
+        from PIL import Image
+        # 嘗試打開並驗證圖片
+        with Image.open(file_path) as img:
+            img.verify()  # 驗證圖片是否損壞
+        
+        # verify() 後需要重新打開圖片（因為 verify 會關閉文件）
+        with Image.open(file_path) as img:
+            # 檢查圖片格式是否被支持
+            if img.format not in ['JPEG', 'PNG', 'GIF', 'BMP', 'TIFF']:
+                print(f"⚠️ 不支持的圖片格式: {img.format} (路徑: {file_path})")
+                return False
+        return True
+    except ImportError:
+        # 如果 PIL 未安裝，跳過驗證（向後兼容）
+        print("⚠️ PIL/Pillow 未安裝，跳過圖片驗證")
+        return True  # 返回 True 讓程序繼續運行
+    except Exception as e:
+        print(f"⚠️ 圖片驗證失敗 {file_path}: {e}")
+        return False
+
+
+def _validate_image_for_docx(abs_path, description=""):
+    """用 PIL 與 python-docx Image.from_file 驗證，避免 render 時 UnrecognizedImageError"""
+    if not is_valid_image_file(abs_path):
+        print(f"⚠️ {description}圖片無效或損壞，跳過: {abs_path}")
+        return False
+    try:
+        from docx.image.image import Image as DocxImage
+        DocxImage.from_file(abs_path)
+    except Exception as e:
+        print(f"⚠️ {description}圖片格式不被 Word 支援，跳過: {abs_path} ({e})")
+        return False
+    return True
+
+
+def safe_create_inline_image(doc, file_path, width, description=""):
+    """
+    安全地創建 InlineImage 對象，如果失敗則返回 None。
+    驗證結果依檔案修改時間快取，同一張圖片不重複驗證。
+    """
+    if not file_path or not os.path.exists(file_path):
+        return None
+
+    # 上傳時已產生的文件尺寸衍生檔（舊資料沒有則用原檔）
+    abs_path = os.path.abspath(document_image_path(file_path))
+    if not check_image_cached(abs_path, lambda p: _validate_image_for_docx(p, description)):
+        return None
+
+    try:
+        image_obj = InlineImage(doc, abs_path, width=width)
+        return image_obj
+    except Exception as e:
+        print(f"⚠️ {description}圖片載入錯誤 (路徑: {file_path}): {e}")
+        traceback.print_exc()
+        return None
+
+
+def resolve_upload_path(path):
+    """
+    將相對路徑（如 uploads/absence_proofs/xxx）轉為絕對路徑，
+    便於 os.path.exists 與 InlineImage 在產生 Word 時正確找到檔案。
+    """
+    if not path or not str(path).strip():
+        return ""
+    path = str(path).replace("\\", "/").strip()
+    if os.path.isabs(path) and os.path.exists(path):
+        return path
+    # 相對於 BASE_UPLOAD_DIR（backend 目錄）
+    abs_path = os.path.join(BASE_UPLOAD_DIR, path)
+    if os.path.exists(abs_path):
+        return os.path.normpath(abs_path)
+    if os.path.exists(path):
+        return os.path.abspath(path)
+    return path
+
+
+def categorize_certifications(cert_list):
+    """
+    分類證照 → 放到四種類別（對應履歷 1.勞動部 2.國際證照 3.國內證照 4.其他證照）
+    """
+    labor = []
+    international = []
+    local = []
+    other = []
+    for c in cert_list:
+        cert_name = c.get("cert_name") or c.get("CertName") or f"{c.get('job_category', '')}{c.get('level', '')}"
+        cert_path = c.get("cert_path") or c.get("CertPath", "")
+        acquire_date = c.get("acquire_date") or c.get("AcquisitionDate", "")
+        item = {
+            "table_name": cert_name,
+            "photo_name": cert_name,
+            "photo_path": cert_path,
+            "date": acquire_date,
+        }
+        raw = c.get("CertCategory") or c.get("category", "other")
+        category = _normalize_cert_category(raw)
+        if category == "labor":
+            labor.append(item)
+        elif category == "intl":
+            international.append(item)
+        elif category == "local":
+            local.append(item)
+        else:
+            other.append(item)
+    return labor, international, local, other
+
+
+def fill_certificates_to_doc(context, prefix, items, max_count):
+    """
+    填入 Word 模板（表格區）
+    prefix 例如: LaborCerts_  → LaborCerts_1, LaborCerts_2 …
+    空欄位與 None 一律顯示空白。
+    """
+    for i in range(1, max_count + 1):
+        if i <= len(items):
+            name = (items[i-1].get("table_name") or "").strip()
+            if name == "None":
+                name = ""
+            context[f"{prefix}{i}"] = name
+        else:
+            context[f"{prefix}{i}"] = ""
+
+
+def fill_certificate_photos(context, doc, items, start_index, max_count=8):
+    """
+    圖片區（依順序放，不分類）
+    start_index → 從第幾張開始，例如 1、9、17、25
+    max_count → 最多填充幾張（實際填充的數量可能少於此值）
+    空欄位一律填空白，不顯示 None。
+    """
+    image_size = Inches(3.0)
+    actual_count = min(len(items), max_count)
+    
+    # 填充實際有的證照
+    for idx, item in enumerate(items[:max_count], start=start_index):
+        photo_path = item.get("photo_path", "") or ""
+        photo_name = (item.get("photo_name", "") or "").strip()
+        if photo_name == "None":
+            photo_name = ""
+        
+        if photo_path:
+            image_obj = safe_create_inline_image(doc, photo_path, image_size, "證照")
+            if image_obj:
+                context[f"CertPhotoImages_{idx}"] = image_obj
+            else:
+                context[f"CertPhotoImages_{idx}"] = ""
+        else:
+            context[f"CertPhotoImages_{idx}"] = ""
+        context[f"CertPhotoName_{idx}"] = photo_name or ""
+
+    # 未使用的欄位：圖片與名稱都設為空白，避免模板顯示 None
+    if actual_count < max_count:
+        for idx in range(start_index + actual_count, start_index + max_count):
+            context[f"CertPhotoImages_{idx}"] = ""
+            context[f"CertPhotoName_{idx}"] = ""
+
+
+def generate_application_form_docx(student_data, output_path, timings=None):
+    """產生履歷 Word 檔；timings（dict）會記錄 template / image_prep / render / save 各階段耗時（毫秒）"""
+    try:
+        with stage_timer(timings, "template"):
+            doc = load_resume_template()
+        if doc is None:
+            print("❌ 找不到履歷模板")
+            return False
+
+        image_prep_started = time.perf_counter()
+        info = student_data.get("info", {})
+        grades = student_data.get("grades", [])
+        certs = student_data.get("certifications", [])
+
+        # 格式化出生日期
+        def fmt_date(val):
+            if hasattr(val, 'strftime'):
+                return val.strftime("%Y-%m-%d")
+            if isinstance(val, str) and len(val) >= 10:
+                return val.split("T")[0]
+            return ""
+
+        bdate = fmt_date(info.get("BirthDate"))
+        year, month, day = ("", "", "")
+        if bdate:
+            try:
+                year, month, day = bdate.split("-")
+            except:
+                pass
+
+        # 照片（使用 safe_create 驗證格式，相對路徑需轉絕對路徑）
+        image_obj = None
+        photo_path = resolve_upload_path(info.get("PhotoPath") or "")
+        if photo_path and os.path.exists(photo_path):
+            image_obj = safe_create_inline_image(doc, photo_path, Inches(1.2), "學生照片")
+
+        # 處理課程資料（保留原邏輯）
+        MAX_COURSES = 30
+        padded_grades = grades[:MAX_COURSES]
+        padded_grades += [{'CourseName': '', 'Credits': ''}] * (MAX_COURSES - len(padded_grades))
+
+        context_courses = {}
+        NUM_ROWS = 10
+        NUM_COLS = 3
+        for i in range(NUM_ROWS):
+            for j in range(NUM_COLS):
+                index = i * NUM_COLS + j
+                if index < MAX_COURSES:
+                    course = padded_grades[index]
+                    row_num = i + 1
+                    col_num = j + 1
+                    context_courses[f'CourseName_{row_num}_{col_num}'] = (course.get('CourseName') or '')
+                    context_courses[f'Credits_{row_num}_{col_num}'] = (course.get('Credits') or '')
+
+        # 插入成績單圖片：相對路徑需轉絕對路徑
+        transcript_obj = None
+        transcript_path = resolve_upload_path(student_data.get("transcript_path") or info.get("TranscriptPath") or '')
+        if transcript_path and os.path.exists(transcript_path):
+            transcript_obj = safe_create_inline_image(doc, transcript_path, Inches(6.0), "成績單")
+
+        # 缺勤佐證圖片（相對路徑需轉絕對路徑；相容 Absence_Proof_Path / absence_proof_path）
+        absence_proof_obj = None
+        absence_raw = (student_data.get("Absence_Proof_Path") or student_data.get("absence_proof_path") or "").strip()
+        absence_proof_path = resolve_upload_path(absence_raw)
+        image_size = Inches(6.0)
+        if absence_proof_path and os.path.exists(absence_proof_path):
+            absence_proof_obj = safe_create_inline_image(doc, absence_proof_path, image_size, "缺勤佐證")
+
+        # 操行等級
+        conduct_score = info.get('ConductScore', '')
+        conduct_marks = {k: '□' for k in ['C_You', 'C_Jia', 'C_Yi', 'C_Bing', 'C_Ding']}
+        mapping = {'優': 'C_You', '甲': 'C_Jia', '乙': 'C_Yi', '丙': 'C_Bing', '丁': 'C_Ding'}
+        if conduct_score in mapping:
+            conduct_marks[mapping[conduct_score]] = '■'
+
+        # 證照分類 - 使用新的分類邏輯
+        # certs 已經從 get_student_info_for_doc 返回，格式統一
+        # 優先使用前端提交的證照名稱（如果有的話）
+        # 這樣可以確保只顯示用戶實際選擇的證照，而不是數據庫中所有相關記錄
+        cert_photo_paths_from_form = student_data.get("cert_photo_paths", []) or []
+        structured_certs = student_data.get("structured_certifications", [])
+
+        # 以 structured_certifications 為準疊代，確保每筆都有 authority_id / category，避免索引錯位
+        # 同一 photo_path 只使用一次，避免編輯後重新上傳時出現兩張一樣的證照圖
+        if structured_certs:
+            certs_from_form = []
+            used_photo_paths = set()
+            for idx, struct in enumerate(structured_certs):
+                name = (struct.get("name") or "").strip()
+                if not name:
+                    continue
+                path = (struct.get("cert_path") or "")
+                if not path and idx < len(cert_photo_paths_from_form):
+                    path = cert_photo_paths_from_form[idx] or ""
+                path = (path or "").replace("\\", "/").strip()
+                if path and path in used_photo_paths:
+                    path = ""
+                elif path:
+                    used_photo_paths.add(path)
+                matching_cert = certs[idx] if idx < len(certs) else None
+                if not matching_cert and path:
+                    for c in certs:
+                        if (c.get("cert_path") or "").replace("\\", "/") == path:
+                            matching_cert = c
+                            break
+                # 類別：優先使用 DB（certificate_codes）的 category，確保如 JLPT 等 intl 正確歸類
+                aid = struct.get("authority_id")
+                db_category = None
+                if matching_cert:
+                    db_category = (matching_cert.get("CertCategory") or matching_cert.get("category") or "").strip().lower()
+                if aid is not None and str(aid).strip() in ("1",):
+                    category = "labor"
+                elif db_category and db_category in ("labor", "intl", "local", "other"):
+                    category = db_category
+                else:
+                    try:
+                        ai = int(aid)
+                        if ai == 1:
+                            category = "labor"
+                        else:
+                            category = (struct.get("category") or "").strip().lower() or "other"
+                            if category not in ("labor", "intl", "local", "other"):
+                                category = "other"
+                    except (TypeError, ValueError):
+                        cat = (struct.get("category") or "").strip().lower()
+                        category = cat if cat in ("labor", "intl", "local", "other") else (db_category if db_category in ("labor", "intl", "local", "other") else "other")
+                certs_from_form.append({
+                    "cert_name": name,
+                    "category": category,
+                    "cert_path": path or (matching_cert.get("cert_path", "") if matching_cert else ""),
+                    "acquire_date": (matching_cert.get("acquire_date") or struct.get("acquire_date") or "") if matching_cert else (struct.get("acquire_date") or ""),
+                })
+            if certs_from_form:
+                certs = certs_from_form
+        
+        # 分類證照
+        labor_list, intl_list, local_list, other_list = categorize_certifications(certs)
+
+        def pad_list(lst, length=5):
+            lst = lst[:length]
+            lst += [''] * (length - len(lst))
+            return lst
+
+        # 建 context
+        # 處理自傳：移除多餘的換行符，避免產生空白行
+        autobiography = info.get('Autobiography', '').strip()
+        if autobiography:
+            # 將多個連續換行符替換為單個換行符，移除開頭和結尾的換行符
+            autobiography = re.sub(r'\n{3,}', '\n\n', autobiography)
+            autobiography = autobiography.strip('\n')
+        
+        context = {
+            'StuID': (info.get('StuID') or ''),
+            'StuName': (info.get('StuName') or ''),
+            'BirthYear': year, 'BirthMonth': month, 'BirthDay': day,
+            'Gender': (info.get('Gender') or ''),
+            'Phone': (info.get('Phone') or ''),
+            'Email': (info.get('Email') or ''),
+            'Address': (info.get('Address') or ''),
+            'ConductScoreNumeric': (info.get('ConductScoreNumeric') or ''),
+            'ConductScore': conduct_score,
+            'Autobiography': (autobiography or ''),
+            # 實習期間（依學生入學學期從 internship_configs 帶入）
+            'InternStartYear_TW': (student_data.get('InternStartYear_TW') or ''),
+            'InternStartMonth': (student_data.get('InternStartMonth') or ''),
+            'InternStartDay': (student_data.get('InternStartDay') or ''),
+            'InternEndMonth': (student_data.get('InternEndMonth') or ''),
+            'InternEndDay': (student_data.get('InternEndDay') or ''),
+            # 查詢區間（缺曠查詢學期，實習學期前兩學期）
+            'PrevSemester_1': (student_data.get('PrevSemester_1') or ''),
+            'PrevSemester_2': (student_data.get('PrevSemester_2') or ''),
+        }
+        if image_obj:
+            context['Image_1'] = image_obj
+        if transcript_obj:
+            context['transcript_path'] = transcript_obj
+        if absence_proof_obj:
+            context['Absence_Proof_Image'] = absence_proof_obj
+
+        empty_vars_to_clear = [
+            'empty_line_1', 'empty_line_2', 'empty_line_3',
+            'blank_line_1', 'blank_line_2', 'blank_line_3',
+            'spacer_1', 'spacer_2', 'spacer_3',
+            'extra_line_1', 'extra_line_2', 'extra_line_3',
+            'blank_1', 'blank_2', 'blank_3',
+        ]
+        for var in empty_vars_to_clear:
+            context[var] = ""
+
+        # 加入缺勤統計
+        # 只填充這8個標準字段，確保沒有多餘的空白行
+        absence_fields = ['曠課', '遲到', '事假', '病假', '生理假', '公假', '喪假', '總計']
+        for t in absence_fields:
+            key = f"absence_{t}_units"
+            value = (student_data.get(key) or "0 節")
+            context[key] = value
+            # 調試輸出
+            if value == "0 節" and t != "總計":
+                print(f"⚠️ 缺勤統計 {key} 未找到，使用預設值: {value}")
+            else:
+                print(f"✅ 缺勤統計 {key} = {value}")
+        
+        # 如果模板中有額外的行（例如第9、10、11行），將它們設為空字符串
+        # 常見的額外變數名可能是：absence_row_9, absence_row_10, absence_row_11 等
+        # 或者：absence_9_units, absence_10_units, absence_11_units 等
+        # 清空可能的額外行變數
+        for i in range(9, 12):  # 第9、10、11行
+            # 嘗試多種可能的變數名格式
+            possible_keys = [
+                f"absence_row_{i}",
+                f"absence_{i}_units",
+                f"absence_row_{i}_units",
+                f"absence_item_{i}",
+                f"absence_type_{i}",
+            ]
+            for key in possible_keys:
+                context[key] = ""
+        
+        # 清空可能存在的其他缺勤類型變數（防止模板中有額外的空白行）
+        # 例如：absence_其他_units, absence_其他1_units 等
+        # 只保留標準的8個字段，其他都設為空字符串
+        standard_keys = [f"absence_{t}_units" for t in absence_fields]
+        for key in list(context.keys()):
+            if key.startswith("absence_") and key.endswith("_units"):
+                if key not in standard_keys:
+                    context[key] = ""  # 清空非標準字段
+
+        # 加入操行等級勾選
+        context.update(conduct_marks)
+
+        # 加入課程資料
+        context.update(context_courses)
+
+        # 加入證照文字清單 - 使用新的填充函數
+        fill_certificates_to_doc(context, "LaborCerts_", labor_list, 5)
+        fill_certificates_to_doc(context, "IntlCerts_", intl_list, 5)
+        fill_certificates_to_doc(context, "LocalCerts_", local_list, 5)
+        fill_certificates_to_doc(context, "OtherCerts_", other_list, 5)
+
+        # 證照圖片（不分類，依順序塞）- 使用新的填充函數
+        # 將四類組裝成一個大 list（圖片不分類）
+        flat_list = labor_list + intl_list + local_list + other_list
+        
+        # 分頁顯示證照圖片：每頁8張，最多32張（4頁）
+        # 使用區塊變數控制頁面顯示/隱藏
+        certs_per_page = 8
+        max_total = 32  # 最多32張（4頁）
+        
+        # 將相對路徑轉為絕對路徑，否則 os.path.exists 會失敗、導致只顯示部分證照圖（如 DB 有 3 張路徑卻只生成 2 張）
+        resolved_flat = []
+        for c in flat_list:
+            p = (c.get("photo_path") or "").strip()
+            resolved_p = resolve_upload_path(p) if p else ""
+            resolved_flat.append({**c, "photo_path": resolved_p or p})
+        # 只處理實際有圖片的證照（最多32張）
+        certs_with_photos = [c for c in resolved_flat if c.get("photo_path") and os.path.exists(c.get("photo_path", ""))]
+        certs_to_display = certs_with_photos[:max_total]
+        total_certs = len(certs_to_display)
+        
+        # 初始化證照名稱為空；圖片僅在有圖時才設 key，未輸入不設以免顯示 None
+        for idx in range(1, 33):
+            context[f"CertPhotoName_{idx}"] = ""
+        
+        # 初始化所有頁面區塊為 False（不顯示）
+        # 使用布林值控制頁面顯示，模板中使用 {% if cert_page_2_block %} ... {% endif %}
+        context["cert_page_2_block"] = False
+        context["cert_page_3_block"] = False
+        context["cert_page_4_block"] = False
+        
+        if total_certs > 0:
+            # 第一頁（1-8）：總是填充（如果有證照）
+            first_page_certs = certs_to_display[:min(8, total_certs)]
+            if first_page_certs:
+                fill_certificate_photos(context, doc, first_page_certs, start_index=1, max_count=8)
+            
+            # 第二頁（9-16）：如果 total_certs > 8 則顯示
+            if total_certs > 8:
+                context["cert_page_2_block"] = True  # 設置為 True 以顯示區塊
+                second_page_certs = certs_to_display[8:min(16, total_certs)]
+                if second_page_certs:
+                    fill_certificate_photos(context, doc, second_page_certs, start_index=9, max_count=8)
+            
+            # 第三頁（17-24）：如果 total_certs > 16 則顯示
+            if total_certs > 16:
+                context["cert_page_3_block"] = True  # 設置為 True 以顯示區塊
+                third_page_certs = certs_to_display[16:min(24, total_certs)]
+                if third_page_certs:
+                    fill_certificate_photos(context, doc, third_page_certs, start_index=17, max_count=8)
+            
+            # 第四頁（25-32）：如果 total_certs > 24 則顯示
+            if total_certs > 24:
+                context["cert_page_4_block"] = True  # 設置為 True 以顯示區塊
+                fourth_page_certs = certs_to_display[24:min(32, total_certs)]
+                if fourth_page_certs:
+                    fill_certificate_photos(context, doc, fourth_page_certs, start_index=25, max_count=8)
+
+        # 語文能力
+        lang_context = {}
+        lang_codes = ['En', 'Jp', 'Tw', 'Hk']
+        level_codes = ['Jing', 'Zhong', 'Lue']
+        for code in lang_codes:
+            for level_code in level_codes:
+                lang_context[f'{code}_{level_code}'] = '□'
+
+        lang_code_map = {'英語': 'En', '日語': 'Jp', '台語': 'Tw', '客語': 'Hk'}
+        level_code_map = {'精通': 'Jing', '中等': 'Zhong', '略懂': 'Lue'}
+
+        for lang_skill in student_data.get('languages', []):
+            lang = lang_skill.get('Language') or lang_skill.get('language')
+            level = lang_skill.get('Level') or lang_skill.get('level')
+            lang_code = lang_code_map.get(lang)
+            level_code = level_code_map.get(level)
+            if lang_code and level_code:
+                key = f'{lang_code}_{level_code}'
+                if key in lang_context:
+                    lang_context[key] = '■'
+
+        # 未填寫的語文能力自動代入「略懂」
+        for code in lang_codes:
+            if all(lang_context.get(f'{code}_{lc}', '□') == '□' for lc in level_codes):
+                lang_context[f'{code}_Lue'] = '■'
+
+        context.update(lang_context)
+        
+        # 渲染前：所有 None 改為 ""，避免 Word 顯示 "None"；未輸入欄位顯示空白
+        for key in list(context.keys()):
+            if context[key] is None:
+                context[key] = ""
+        if timings is not None:
+            # 組 context 的時間幾乎都花在圖片驗證與載入
+            timings["image_prep"] = round((time.perf_counter() - image_prep_started) * 1000, 1)
+
+        with stage_timer(timings, "render"):
+            doc.render(context)
+        # 確保輸出路徑所在目錄存在（不同電腦路徑不同時可正常寫入）
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        with stage_timer(timings, "save"):
+            doc.save(output_path)
+        print(f"✅ 履歷文件已生成: {output_path} {format_timings(timings)}")
+        return True
+
+    except Exception as e:
+        print("❌ 生成 Word 檔錯誤:", e)
+        traceback.print_exc()
+        return False
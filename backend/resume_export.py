@@ -0,0 +1,252 @@
+"""
+履歷批次 ZIP 匯出（依公司 / 班級）
+
+- resume_export_scope：依角色檢查權限並查出要匯出的履歷（廠商只拿得到已傳給廠商的履歷）
+- build_manifest：固定排序的檔案清單與 manifest_id（履歷 id + 更新時間的雜湊），
+  下載中斷時以 start 指定由第幾個檔案續傳，manifest_id 不符表示清單已變動
+- stream_zip：以 zipfile 寫入不可 seek 的串流，每個檔案分塊讀取後立即送出，整個 ZIP 不會存在記憶體或暫存檔；
+  .docx 本身已壓縮，因此以 ZIP_STORED 存放。檔案遺失時每 EXPORT_REGEN_BATCH_SIZE 個一批載入資料、
+  經由 render pool 重新產生，仍失敗則列在 _missing.txt
+"""
+import hashlib
+import os
+import zipfile
+
+from config import get_db
+from resume_jobs import load_regeneration_data
+from resume_render import render_resume_cached
+
+BASE_UPLOAD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+EXPORT_CHUNK_SIZE = 256 * 1024
+EXPORT_MAX_ENTRIES = int(os.getenv("RESUME_EXPORT_MAX_ENTRIES", "1000"))
+EXPORT_REGEN_BATCH_SIZE = 50  # 每批遺失履歷以一次 load_regeneration_data 載入資料
+
+
+class ExportScopeError(Exception):
+    """匯出範圍不合法或無權限（status 為 HTTP 狀態碼）"""
+
+    def __init__(self, message, status=403):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def resume_full_path(file_path):
+    """資料庫可能存相對路徑 (uploads/resumes/...)，需對應專案根目錄"""
+    if not file_path:
+        return ""
+    if os.path.isabs(file_path):
+        return file_path
+    return os.path.normpath(os.path.join(BASE_UPLOAD_DIR, file_path.replace("\\", "/")))
+
+
+def _company_resumes(cursor, company_id, vendor_only):
+    """投遞到該公司的履歷；廠商只取已建立 resume_applications（指導老師審核通過、已傳給廠商）的投遞"""
+    vendor_join = "JOIN resume_applications ra ON ra.application_id = sja.id" if vendor_only else ""
+    cursor.execute(f"""
+        SELECT DISTINCT r.id AS resume_id, r.filepath, r.original_filename, r.updated_at, r.created_at,
+               u.username AS student_number, u.name AS student_name, COALESCE(ij.title, '') AS job_title
+        FROM student_job_applications sja
+        JOIN resumes r ON r.id = sja.resume_id
+        JOIN users u ON u.id = sja.student_id
+        LEFT JOIN internship_jobs ij ON ij.id = sja.job_id
+        {vendor_join}
+        WHERE sja.company_id = %s
+        ORDER BY u.username, r.id
+    """, (company_id,))
+    return cursor.fetchall() or []
+
+
+def _class_resumes(cursor, class_id):
+    """班級學生最新一份已上傳 / 已通過的履歷"""
+    cursor.execute("""
+        SELECT r.id AS resume_id, r.filepath, r.original_filename, r.updated_at, r.created_at,
+               u.username AS student_number, u.name AS student_name, '' AS job_title
+        FROM resumes r
+        JOIN users u ON u.id = r.user_id
+        WHERE u.class_id = %s
+          AND r.status IN ('uploaded', 'approved')
+          AND r.id = (
+              SELECT r2.id FROM resumes r2
+              WHERE r2.user_id = r.user_id AND r2.status IN ('uploaded', 'approved')
+              ORDER BY r2.created_at DESC, r2.id DESC
+              LIMIT 1
+          )
+        ORDER BY u.username
+    """, (class_id,))
+    return cursor.fetchall() or []
+
+
+def resume_export_scope(cursor, user_id, role, scope, target_id):
+    """回傳 (匯出名稱, 履歷列表)；無權限或參數錯誤時 raise ExportScopeError"""
+    if not target_id:
+        raise ExportScopeError("缺少公司或班級參數", 400)
+
+    if scope == "company":
+        cursor.execute("SELECT id, company_name, advisor_user_id FROM internship_companies WHERE id = %s", (target_id,))
+        company = cursor.fetchone()
+        if not company:
+            raise ExportScopeError("找不到公司", 404)
+        if role == "vendor":
+            from vendor import _get_vendor_companies
+            if target_id not in {c["id"] for c in _get_vendor_companies(cursor, user_id)}:
+                raise ExportScopeError("無權限匯出此公司履歷")
+        elif role == "teacher":
+            if company.get("advisor_user_id") != user_id:
+                raise ExportScopeError("無權限匯出此公司履歷")
+        elif role not in ("ta", "admin", "director"):
+            raise ExportScopeError("無權限匯出履歷")
+        return company["company_name"], _company_resumes(cursor, target_id, vendor_only=(role == "vendor"))
+
+    if scope == "class":
+        cursor.execute("SELECT id, name FROM classes WHERE id = %s", (target_id,))
+        class_row = cursor.fetchone()
+        if not class_row:
+            raise ExportScopeError("找不到班級", 404)
+        if role in ("teacher", "class_teacher"):
+            cursor.execute("SELECT 1 FROM classes_teacher WHERE class_id = %s AND teacher_id = %s LIMIT 1", (target_id, user_id))
+            if not cursor.fetchone():
+                raise ExportScopeError("無權限匯出此班級履歷")
+        elif role not in ("ta", "admin", "director"):
+            raise ExportScopeError("無權限匯出履歷")
+        return class_row["name"], _class_resumes(cursor, target_id)
+
+    raise ExportScopeError("不支援的匯出範圍", 400)
+
+
+def _safe_name(text):
+    return "".join(ch for ch in str(text or "") if ch not in '\\/:*?"<>|').strip()
+
+
+def build_manifest(title, rows):
+    """固定排序的檔案清單；arcname 以學號_姓名[_職缺] 命名並避免重複"""
+    entries = []
+    used = set()
+    digest = hashlib.sha1()
+    for row in rows[:EXPORT_MAX_ENTRIES]:
+        full_path = resume_full_path(row.get("filepath"))
+        ext = os.path.splitext(row.get("original_filename") or full_path)[1] or ".docx"
+        base = "_".join(part for part in (_safe_name(row.get("student_number")), _safe_name(row.get("student_name")),
+                                          _safe_name(row.get("job_title"))) if part) or f"resume_{row['resume_id']}"
+        arcname = f"{base}{ext}"
+        n = 2
+        while arcname in used:
+            arcname = f"{base}_{n}{ext}"
+            n += 1
+        used.add(arcname)
+        exists = bool(full_path) and os.path.exists(full_path)
+        entries.append({
+            "index": len(entries),
+            "resume_id": row["resume_id"],
+            "arcname": arcname,
+            "size": os.path.getsize(full_path) if exists else None,
+            "exists": exists,
+            "_path": full_path,
+        })
+        digest.update(f"{row['resume_id']}:{row.get('updated_at') or row.get('created_at')};".encode("utf-8"))
+    return {
+        "title": _safe_name(title) or "resumes",
+        "manifest_id": digest.hexdigest()[:16],
+        "total": len(entries),
+        "truncated": len(rows) > EXPORT_MAX_ENTRIES,
+        "missing": sum(1 for e in entries if not e["exists"]),
+        "entries": entries,
+    }
+
+
+def public_manifest(manifest):
+    """回傳給前端的清單（不含伺服器路徑）"""
+    data = dict(manifest)
+    data["entries"] = [{k: v for k, v in e.items() if not k.startswith("_")} for e in manifest["entries"]]
+    return data
+
+
+class _StreamBuffer:
+    """zipfile 的寫入目標：只累積尚未送出的位元組（不可 seek，zipfile 會改用 data descriptor）"""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        if data:
+            self._chunks.append(bytes(data))
+            self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _ensure_files(entries):
+    """
+    檔案遺失時重新產生：整批以一次 load_regeneration_data 載入套版資料（最近一次產生工作的資料，
+    舊履歷則依學號載入目前資料），再逐一經由 render pool 產生。回傳可讀取的 entry index 集合
+    """
+    ready = {entry["index"] for entry in entries if entry["exists"]}
+    pending = [entry for entry in entries if not entry["exists"] and entry["_path"]]
+    if not pending:
+        return ready
+    conn = None
+    cursor = None
+    try:
+        conn = get_db()
+        cursor = conn.cursor(dictionary=True)
+        data = load_regeneration_data(cursor, [entry["resume_id"] for entry in pending])
+    except Exception as e:
+        print(f"⚠️ [resume-export] 載入 {len(pending)} 份遺失履歷的資料失敗: {e}")
+        return ready
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+    for entry in pending:
+        student_data = data.get(entry["resume_id"])
+        if student_data is None:
+            continue
+        try:
+            ok = render_resume_cached(student_data, entry["_path"])
+        except Exception as e:
+            print(f"⚠️ [resume-export] 重新產生履歷 #{entry['resume_id']} 失敗: {e}")
+            continue
+        if ok and os.path.exists(entry["_path"]):
+            print(f"✅ [resume-export] 已重新產生遺失的履歷 #{entry['resume_id']}")
+            ready.add(entry["index"])
+    return ready
+
+
+def stream_zip(manifest, start=0):
+    """由第 start 個檔案開始逐塊產生 ZIP 位元組"""
+    buffer = _StreamBuffer()
+    missing = []
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        entries = manifest["entries"][start:]
+        for batch_start in range(0, len(entries), EXPORT_REGEN_BATCH_SIZE):
+            batch = entries[batch_start:batch_start + EXPORT_REGEN_BATCH_SIZE]
+            ready = _ensure_files(batch)
+            for entry in batch:
+                if entry["index"] not in ready:
+                    missing.append(entry["arcname"])
+                    continue
+                with open(entry["_path"], "rb") as src, zf.open(entry["arcname"], mode="w", force_zip64=True) as dest:
+                    for chunk in iter(lambda: src.read(EXPORT_CHUNK_SIZE), b""):
+                        dest.write(chunk)
+                        data = buffer.drain()
+                        if data:
+                            yield data
+                data = buffer.drain()
+                if data:
+                    yield data
+        if missing:
+            zf.writestr("_missing.txt", "以下履歷檔案不存在且無法重新產生：\n" + "\n".join(missing))
+    yield buffer.drain()
@@ -0,0 +1,361 @@
+"""
+履歷產生工作佇列（resume_generation_jobs: pending → running → done / failed）
+
+/api/submit_and_generate 只負責儲存上傳檔案與結構化資料、建立一筆工作後立即回應；
+背景 worker（RESUME_JOB_WORKERS，預設 2）依序取出工作，重新載入學生資料並交給
+resume_render 的 process pool 產生 Word 檔。新增履歷的 resumes 列等檔案產生成功後才寫入，
+產生失敗不會留下指向不存在檔案的履歷。前端以 /api/resume_jobs/<id> 輪詢狀態，
+完成或失敗時也會發送通知。截止前大量送出時，吞吐量取決於 worker 數量而非 HTTP 逾時。
+"""
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+
+from config import get_db
+from schema_cache import has_table, has_column, refresh_schema_cache, execute_ddl
+from notification import create_notification
+from resume_data import load_resume_data, load_one_resume_data
+from resume_render import render_resume_cached
+from stage_timing import stage_timer, format_timings
+
+RESUME_JOB_WORKERS = int(os.getenv("RESUME_JOB_WORKERS", "2"))
+RESUME_JOB_POLL_SECONDS = int(os.getenv("RESUME_JOB_POLL_SECONDS", "5"))
+RESUME_JOB_STALE_MINUTES = 15  # running 超過此時間視為 worker 中斷，重新排入佇列
+RESUME_JOB_MAX_ATTEMPTS = int(os.getenv("RESUME_JOB_MAX_ATTEMPTS", "3"))  # 中斷達此次數即標記 failed
+
+_wakeup = threading.Event()
+_workers_lock = threading.Lock()
+_workers = []
+_last_stale_check = 0.0
+
+
+def ensure_resume_job_table(cursor):
+    """建立 resume_generation_jobs（不存在時）；舊表補上 attempts / claimed_by 欄位"""
+    if has_table('resume_generation_jobs'):
+        if not (has_column('resume_generation_jobs', 'attempts') and has_column('resume_generation_jobs', 'claimed_by')):
+            try:
+                execute_ddl(cursor, "ALTER TABLE resume_generation_jobs ADD COLUMN attempts INT NOT NULL DEFAULT 0")
+                execute_ddl(cursor, "ALTER TABLE resume_generation_jobs ADD COLUMN claimed_by VARCHAR(64) NULL")
+            finally:
+                refresh_schema_cache(cursor)
+        return
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resume_generation_jobs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            resume_id INT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            payload LONGTEXT NOT NULL,
+            attempts INT NOT NULL DEFAULT 0,
+            claimed_by VARCHAR(64) NULL,
+            error_message TEXT NULL,
+            duration_ms INT NULL,
+            timings TEXT NULL,
+            created_at DATETIME NOT NULL,
+            started_at DATETIME NULL,
+            finished_at DATETIME NULL,
+            KEY idx_resume_job_status (status, id),
+            KEY idx_resume_job_user (user_id, id)
+        )
+    """)
+    refresh_schema_cache(cursor)
+
+
+def enqueue_resume_job(cursor, user_id, resume_id, payload):
+    """
+    新增一筆 pending 工作，回傳 job id。不 commit，由呼叫端與履歷資料一起 commit 後再呼叫 wake_resume_workers()。
+    payload：student_id / semester_id / resume_id_for_save / save_path 與套版用的 overrides（JSON 可序列化）
+    """
+    ensure_resume_job_table(cursor)
+    cursor.execute("""
+        INSERT INTO resume_generation_jobs (user_id, resume_id, status, payload, created_at)
+        VALUES (%s, %s, 'pending', %s, NOW())
+    """, (user_id, resume_id, json.dumps(payload, ensure_ascii=False, default=str)))
+    return cursor.lastrowid
+
+
+def wake_resume_workers():
+    _wakeup.set()
+
+
+def get_resume_job(cursor, job_id):
+    """查詢工作狀態；權限（本人 / 可查看該學生履歷的老師 / 管理員）由呼叫端以 can_access_target_resume 檢查"""
+    if not has_table('resume_generation_jobs'):
+        return None
+    cursor.execute("""
+        SELECT id, user_id, resume_id, status, error_message, duration_ms, timings,
+               created_at, started_at, finished_at
+        FROM resume_generation_jobs
+        WHERE id = %s
+    """, (job_id,))
+    job = cursor.fetchone()
+    if job and job.get('status') == 'pending':
+        # 排在前面的工作數，供前端顯示
+        cursor.execute("SELECT COUNT(*) AS cnt FROM resume_generation_jobs WHERE status = 'pending' AND id < %s", (job_id,))
+        job['queue_position'] = (cursor.fetchone() or {}).get('cnt', 0) + 1
+    return job
+
+
+def _requeue_stale_running(cursor, conn):
+    """
+    worker 中斷而卡在 running 的工作重新排入佇列（每分鐘最多檢查一次）；
+    已嘗試 RESUME_JOB_MAX_ATTEMPTS 次的工作改標記 failed，避免會讓 worker 當掉的工作反覆重跑
+    """
+    global _last_stale_check
+    now = time.monotonic()
+    if now - _last_stale_check < 60:
+        return
+    _last_stale_check = now
+    cursor.execute("""
+        UPDATE resume_generation_jobs
+        SET status = IF(attempts >= %s, 'failed', 'pending'),
+            error_message = IF(attempts >= %s, '履歷產生中斷次數過多，請重新提交', error_message),
+            finished_at = IF(attempts >= %s, NOW(), finished_at),
+            claimed_by = NULL
+        WHERE status = 'running' AND started_at < NOW() - INTERVAL %s MINUTE
+    """, (RESUME_JOB_MAX_ATTEMPTS, RESUME_JOB_MAX_ATTEMPTS, RESUME_JOB_MAX_ATTEMPTS, RESUME_JOB_STALE_MINUTES))
+    if cursor.rowcount:
+        print(f"⚠️ [resume-job] {cursor.rowcount} 筆履歷產生工作中斷，已重新排入佇列（超過重試次數者標記 failed）")
+    conn.commit()
+
+
+def _claim_job():
+    """
+    取出最早的一筆 pending 工作並標記為 running：以單一條件式 UPDATE ... ORDER BY id LIMIT 1 寫入本次的
+    claimed_by 後依 claimed_by 讀回，多 worker / 多程序不會重複處理
+    """
+    claim_token = uuid.uuid4().hex
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        if not has_table('resume_generation_jobs'):
+            return None
+        ensure_resume_job_table(cursor)
+        _requeue_stale_running(cursor, conn)
+        cursor.execute("""
+            UPDATE resume_generation_jobs
+            SET status = 'running', started_at = NOW(), attempts = attempts + 1, claimed_by = %s
+            WHERE status = 'pending'
+            ORDER BY id
+            LIMIT 1
+        """, (claim_token,))
+        claimed = cursor.rowcount
+        conn.commit()
+        if not claimed:
+            return None
+        cursor.execute("""
+            SELECT id, user_id, resume_id, payload FROM resume_generation_jobs
+            WHERE claimed_by = %s AND status = 'running'
+        """, (claim_token,))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _apply_payload(student_data, payload):
+    """套用送出當下的表單資料（照片、操行分數、證照圖片與額外套版欄位）"""
+    if payload.get("photo_path") is not None:
+        student_data["info"]["PhotoPath"] = payload["photo_path"]
+    student_data["info"]["ConductScoreNumeric"] = payload.get("conduct_score_numeric")
+    student_data["cert_photo_paths"] = payload.get("cert_photo_paths") or []
+    student_data["cert_names"] = payload.get("cert_names") or []
+    student_data.update(payload.get("context") or {})
+    return student_data
+
+
+def _build_student_data(payload, timings):
+    """重新載入學生資料並套用送出當下的表單資料（與原本同步產生時相同）"""
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        with stage_timer(timings, "data_load"):
+            student_data = load_one_resume_data(
+                cursor, payload["student_id"],
+                semester_id=payload.get("semester_id"),
+                resume_id=payload.get("resume_id_for_save")
+            ).to_dict()
+    finally:
+        cursor.close()
+        conn.close()
+    return _apply_payload(student_data, payload)
+
+
+def load_regeneration_data(cursor, resume_ids, timings=None):
+    """
+    批次載入多份履歷重新產生所需的套版資料，回傳 {resume_id: student_data}（找不到履歷者不列入）。
+    有產生工作紀錄者依最近一次 payload；工作佇列上線前的舊履歷依學號載入目前資料。
+    每個學期以一次 load_resume_data 載入，查詢數量與履歷份數無關。
+    """
+    resume_ids = list(dict.fromkeys(resume_ids))
+    if not resume_ids:
+        return {}
+    placeholders = ", ".join(["%s"] * len(resume_ids))
+    with stage_timer(timings, "data_load"):
+        payloads = {}
+        if has_table('resume_generation_jobs'):
+            cursor.execute(f"""
+                SELECT j.resume_id, j.payload
+                FROM resume_generation_jobs j
+                JOIN (
+                    SELECT resume_id, MAX(id) AS id FROM resume_generation_jobs
+                    WHERE resume_id IN ({placeholders})
+                    GROUP BY resume_id
+                ) latest ON latest.id = j.id
+            """, tuple(resume_ids))
+            payloads = {row['resume_id']: json.loads(row['payload']) for row in cursor.fetchall()}
+
+        # {semester_id: {resume_id: (student_id, 篩選用 resume_id)}}
+        by_semester = {}
+        for resume_id, payload in payloads.items():
+            by_semester.setdefault(payload.get("semester_id"), {})[resume_id] = (
+                payload["student_id"], payload.get("resume_id_for_save"))
+        legacy_ids = [resume_id for resume_id in resume_ids if resume_id not in payloads]
+        if legacy_ids:
+            cursor.execute(f"""
+                SELECT r.id, u.username AS student_id, r.semester_id
+                FROM resumes r
+                JOIN users u ON u.id = r.user_id
+                WHERE r.id IN ({', '.join(['%s'] * len(legacy_ids))})
+            """, tuple(legacy_ids))
+            for row in cursor.fetchall():
+                if row['student_id']:
+                    by_semester.setdefault(row['semester_id'], {})[row['id']] = (row['student_id'], row['id'])
+
+        result = {}
+        for semester_id, keys in by_semester.items():
+            loaded = load_resume_data(cursor, list(keys.values()), semester_id=semester_id)
+            for resume_id, key in keys.items():
+                student_data = loaded[key].to_dict()
+                if resume_id in payloads:
+                    # 同一學生的多份履歷可能共用同一筆 ResumeData，info 複製後再套用各自的表單資料
+                    student_data["info"] = dict(student_data["info"])
+                    _apply_payload(student_data, payloads[resume_id])
+                result[resume_id] = student_data
+    return result
+
+
+def _insert_generated_resume(cursor, job, payload):
+    """新增履歷：檔案產生成功後才寫入 resumes 與 resume_content_mapping，回傳新的 resume id"""
+    from resume import _upsert_resume_content_mapping
+    new_resume = payload["new_resume"]
+    cursor.execute("""
+        INSERT INTO resumes
+        (user_id, filepath, original_filename, status, category, semester_id, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, NOW())
+    """, (
+        job['user_id'],
+        new_resume["filepath"],
+        new_resume["original_filename"],
+        'uploaded',
+        'draft',
+        new_resume.get("semester_id")
+    ))
+    resume_id = cursor.lastrowid
+    # 使用 save_structured_data 回傳的 ID，確保存的是 id 而非課程名稱
+    mapping_ids = new_resume.get("mapping_ids") or {}
+    _upsert_resume_content_mapping(
+        cursor, resume_id, payload["student_id"],
+        course_grade_ids=mapping_ids.get("course_grade_ids"),
+        certification_ids=mapping_ids.get("certification_ids"),
+        language_skill_ids=mapping_ids.get("language_skill_ids"),
+        absence_record_ids=mapping_ids.get("absence_record_ids")
+    )
+    return resume_id
+
+
+def _finish_job(job, status, duration_ms, timings, error_message=None, payload=None):
+    """
+    更新工作狀態。新增履歷的工作成功時，resumes 列與工作狀態在同一個 transaction 寫入；
+    寫入失敗則改標記為 failed 並刪除已產生的檔案。回傳最終的錯誤訊息（成功為 None）。
+    """
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        resume_id = job.get('resume_id')
+        if status == 'done' and payload and payload.get("new_resume"):
+            try:
+                resume_id = _insert_generated_resume(cursor, job, payload)
+            except Exception as e:
+                traceback.print_exc()
+                conn.rollback()
+                status, error_message = 'failed', f"履歷資料寫入失敗: {e}"
+                try:
+                    os.remove(payload["save_path"])
+                except OSError:
+                    pass
+        cursor.execute("""
+            UPDATE resume_generation_jobs
+            SET status = %s, resume_id = %s, duration_ms = %s, timings = %s, error_message = %s, finished_at = NOW()
+            WHERE id = %s
+        """, (status, resume_id, duration_ms, json.dumps(timings), error_message, job['id']))
+        conn.commit()
+        return error_message
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _run_job(job):
+    started = time.perf_counter()
+    timings = {}
+    error_message = None
+    payload = None
+    try:
+        payload = json.loads(job['payload'])
+        student_data = _build_student_data(payload, timings)
+        ok = render_resume_cached(student_data, payload["save_path"], timings=timings)
+        if not ok:
+            error_message = "文件生成失敗"
+    except Exception as e:
+        traceback.print_exc()
+        error_message = f"系統錯誤: {e}"
+
+    duration_ms = int((time.perf_counter() - started) * 1000)
+    status = 'failed' if error_message else 'done'
+    error_message = _finish_job(job, status, duration_ms, timings, error_message, payload=payload)
+    status = 'failed' if error_message else 'done'
+    print(f"{'❌' if error_message else '✅'} [resume-job] #{job['id']} {status} {duration_ms}ms {format_timings(timings)}")
+
+    if error_message:
+        create_notification(job['user_id'], "履歷產生失敗", f"履歷文件產生失敗，請重新提交。（{error_message}）",
+                            category="resume", link_url="/upload_resume")
+    else:
+        create_notification(job['user_id'], "履歷已產生完成", "您提交的履歷文件已產生完成，可至履歷管理下載。",
+                            category="resume", link_url="/resume_folders")
+
+
+def _worker_loop(worker_no):
+    while True:
+        try:
+            job = _claim_job()
+        except Exception as e:
+            print(f"⚠️ [resume-job-worker-{worker_no}] 讀取工作佇列失敗: {e}")
+            job = None
+
+        if not job:
+            _wakeup.wait(RESUME_JOB_POLL_SECONDS)
+            _wakeup.clear()
+            continue
+        try:
+            _run_job(job)
+        except Exception:
+            traceback.print_exc()
+
+
+def start_resume_job_workers():
+    """啟動背景履歷產生 worker（重複呼叫不會重複啟動）"""
+    with _workers_lock:
+        if _workers:
+            return
+        for worker_no in range(max(1, RESUME_JOB_WORKERS)):
+            worker = threading.Thread(
+                target=_worker_loop, args=(worker_no,),
+                name=f"resume-job-worker-{worker_no}", daemon=True
+            )
+            worker.start()
+            _workers.append(worker)
+    print(f"✅ 履歷產生 worker 已啟動（{len(_workers)} 個）")
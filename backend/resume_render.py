@@ -0,0 +1,379 @@
+"""
+履歷 Word 產生（渲染子系統）
+
+- 履歷模板（實習履歷(空白).docx）讀入記憶體，檔案修改時間變動才重新讀取；
+  docxtpl 的 render 會直接修改文件內容，因此每次產生仍以記憶體中的模板建立新的 DocxTemplate
+- 圖片驗證結果（PIL / python-docx）依 (路徑, 修改時間, 大小) 快取，同一張照片、證照圖不重複驗證
+- 渲染在有上限的 process pool 執行（RESUME_RENDER_WORKERS，預設 2；設為 0 則在本程序執行），
+  docx / Jinja 的 CPU 工作不佔用 Flask worker 的 GIL；worker 以 spawn 啟動，逾時時終止並重建 pool
+- 各階段耗時（data_load / template / image_prep / render / save）回傳給呼叫端記錄
+- 產生結果依內容雜湊快取（render_resume_cached）：學生資料中會印出的欄位（不含流水號與時間戳）、
+  引用圖片的檔案雜湊與模板版本都相同時，直接複製快取檔，不重新渲染；命中率見 /admin/api/resume_cache_stats
+"""
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from docxtpl import DocxTemplate
+
+from stage_timing import stage_timer
+
+RESUME_TEMPLATE_PATH = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), "..", "frontend", "static", "examples", "實習履歷(空白).docx"
+))
+RESUME_RENDER_WORKERS = int(os.getenv("RESUME_RENDER_WORKERS", "2"))
+RESUME_RENDER_TIMEOUT = int(os.getenv("RESUME_RENDER_TIMEOUT", "120"))  # 秒
+IMAGE_CHECK_CACHE_SIZE = 2000
+RESUME_CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "uploads", "resume_cache"))
+RESUME_CACHE_MAX_FILES = int(os.getenv("RESUME_CACHE_MAX_FILES", "2000"))
+RESUME_CACHE_PRUNE_EVERY = 100  # 每寫入幾個快取檔才檢查一次是否超過上限
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tif', '.tiff', '.webp')
+# 計算內容雜湊時略過的欄位（比對時不分大小寫）
+HASH_IGNORED_KEYS = {"id", "created_at", "updated_at", "createdat", "updatedat"}
+
+
+# =========================================================
+# 模板快取
+# =========================================================
+class _TemplateCache:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = None
+        self._mtime_ns = None
+
+    def _refresh(self):
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            if self._mtime_ns != mtime_ns:
+                with open(self.path, "rb") as f:
+                    self._data = f.read()
+                self._mtime_ns = mtime_ns
+                print(f"✅ 已載入履歷模板: {self.path}")
+            return self._data
+
+    def load(self):
+        """回傳新的 DocxTemplate（由記憶體中的模板建立）；找不到模板回傳 None"""
+        data = self._refresh()
+        if data is None:
+            return None
+        return DocxTemplate(io.BytesIO(data))
+
+    def version(self):
+        """模板版本（修改時間），模板更新後產生的文件內容也會不同"""
+        self._refresh()
+        return str(self._mtime_ns or "")
+
+
+_template_cache = _TemplateCache(RESUME_TEMPLATE_PATH)
+
+
+def load_resume_template():
+    return _template_cache.load()
+
+
+def resume_template_version():
+    return _template_cache.version()
+
+
+# =========================================================
+# 圖片驗證快取
+# =========================================================
+_image_checks = {}
+_image_checks_lock = threading.Lock()
+
+
+def check_image_cached(path, validate):
+    """validate(path) 的結果依 (路徑, 修改時間, 大小) 快取；檔案變動後重新驗證"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _image_checks_lock:
+        if key in _image_checks:
+            return _image_checks[key]
+    ok = bool(validate(path))
+    with _image_checks_lock:
+        if len(_image_checks) >= IMAGE_CHECK_CACHE_SIZE:
+            _image_checks.clear()
+        _image_checks[key] = ok
+    return ok
+
+
+# =========================================================
+# 渲染 process pool
+# =========================================================
+_pool = None
+_pool_lock = threading.Lock()
+_pool_futures = {}  # pool -> 進行中的 future，逾時換 pool 時用來等其他渲染完成
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn：Flask 程序內有背景執行緒、連線池與排程器，fork 可能複製到被持有的鎖
+                _pool = ProcessPoolExecutor(
+                    max_workers=RESUME_RENDER_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                print(f"✅ 履歷渲染 process pool 已啟動（{RESUME_RENDER_WORKERS} 個 worker）")
+    return _pool
+
+
+def _reset_pool(pool, terminate=False):
+    """
+    捨棄 pool（若仍是目前使用的 pool），下次呼叫 _get_pool 時重建。
+    terminate=True（渲染逾時）：逾時的渲染無法以 future.cancel() 中止，必須終止 worker 程序；
+    但同一 pool 上其他進行中的渲染不受影響——新的渲染改送到新 pool，
+    舊 pool 由背景執行緒等其他渲染結束（最多 RESUME_RENDER_TIMEOUT 秒）後才終止
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+        retiring = _pool_futures.pop(pool, set())
+    if not terminate:
+        pool.shutdown(wait=False, cancel_futures=True)
+        return
+    others = [f for f in retiring if not f.done()]
+    threading.Thread(target=_retire_pool, args=(pool, others), daemon=True).start()
+
+
+def _retire_pool(pool, futures):
+    """等舊 pool 上其他渲染完成後終止其 worker 程序（包含逾時卡住的那一個）"""
+    if futures:
+        wait(futures, timeout=RESUME_RENDER_TIMEOUT)
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        try:
+            process.terminate()
+        except Exception:
+            pass
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit(pool, student_data, output_path):
+    future = pool.submit(_render_in_process, student_data, output_path)
+    with _pool_lock:
+        _pool_futures.setdefault(pool, set()).add(future)
+    future.add_done_callback(lambda f: _forget_future(pool, f))
+    return future
+
+
+def _forget_future(pool, future):
+    with _pool_lock:
+        futures = _pool_futures.get(pool)
+        if futures is not None:
+            futures.discard(future)
+
+
+def _render_in_process(student_data, output_path):
+    """在目前程序產生履歷（process pool worker 也呼叫此函式）"""
+    from resume_docx import generate_application_form_docx
+    timings = {}
+    ok = generate_application_form_docx(student_data, output_path, timings=timings)
+    return ok, timings
+
+
+def render_resume(student_data, output_path, timings=None):
+    """
+    產生履歷 Word 檔到 output_path，回傳是否成功。
+    timings（dict）會加入各階段耗時。渲染一律在 process pool 內執行並受 RESUME_RENDER_TIMEOUT 限制；
+    pool 中斷時重建後重試一次，不改在呼叫端（Flask / 背景 worker 執行緒）無時限地產生。
+    RESUME_RENDER_WORKERS=0 時才直接在本程序產生。
+    """
+    if RESUME_RENDER_WORKERS <= 0:
+        ok, stage_timings = _render_in_process(student_data, output_path)
+    else:
+        for attempt in (1, 2):
+            pool = _get_pool()
+            try:
+                future = _submit(pool, student_data, output_path)
+            except RuntimeError:
+                _reset_pool(pool)  # 其他執行緒剛捨棄此 pool（已 shutdown 或中斷）
+                continue
+            try:
+                ok, stage_timings = future.result(timeout=RESUME_RENDER_TIMEOUT)
+                break
+            except FutureTimeoutError:
+                print(f"❌ 履歷渲染逾時（{RESUME_RENDER_TIMEOUT} 秒），改用新的 process pool: {output_path}")
+                _reset_pool(pool, terminate=True)
+                return False
+            except BrokenProcessPool:
+                print(f"⚠️ 履歷渲染 process pool 已中斷，重建 pool（第 {attempt} 次）")
+                traceback.print_exc()
+                _reset_pool(pool)
+        else:
+            return False
+    if timings is not None:
+        timings.update(stage_timings)
+    return ok
+
+
+# =========================================================
+# 產生結果快取（內容雜湊）
+# =========================================================
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0}
+_cache_stats_lock = threading.Lock()
+_cache_writes = 0
+
+
+def _file_hash(path):
+    """圖片檔內容雜湊，依 (路徑, 修改時間, 大小) 快取"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _file_hashes_lock:
+        if key in _file_hashes:
+            return _file_hashes[key]
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    value = digest.hexdigest()
+    with _file_hashes_lock:
+        if len(_file_hashes) >= IMAGE_CHECK_CACHE_SIZE:
+            _file_hashes.clear()
+        _file_hashes[key] = value
+    return value
+
+
+def _referenced_images(value, found):
+    """找出資料中所有指向圖片檔的路徑（照片、成績單、證照、缺勤佐證）"""
+    if isinstance(value, dict):
+        for item in value.values():
+            _referenced_images(item, found)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _referenced_images(item, found)
+    elif isinstance(value, str) and value.strip().lower().endswith(IMAGE_EXTENSIONS):
+        found.add(value.strip())
+    return found
+
+
+def _rendered_fields(value):
+    """
+    去除不會出現在履歷上的欄位：資料列的流水號（course_grades、student_languageskills、證照的 id）
+    與時間戳（Student_Info.UpdatedAt 每次儲存都會更新），內容相同的履歷才會得到相同的雜湊
+    """
+    if isinstance(value, dict):
+        return {
+            key: _rendered_fields(item) for key, item in value.items()
+            if str(key).lower() not in HASH_IGNORED_KEYS
+        }
+    if isinstance(value, (list, tuple)):
+        return [_rendered_fields(item) for item in value]
+    return value
+
+
+def resume_content_hash(student_data):
+    """學生資料中會印在履歷上的欄位（基本資料、成績、證照、語言、缺勤）+ 引用圖片的檔案雜湊 + 模板版本"""
+    from resume_docx import resolve_upload_path
+    images = {}
+    for path in sorted(_referenced_images(student_data, set())):
+        resolved = resolve_upload_path(path)
+        images[path] = _file_hash(resolved) if resolved and os.path.exists(resolved) else None
+    payload = json.dumps(
+        {"data": _rendered_fields(student_data), "images": images, "template": resume_template_version()},
+        ensure_ascii=False, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _maybe_prune_cache():
+    """每寫入 RESUME_CACHE_PRUNE_EVERY 個快取檔才列目錄檢查一次，避免每次未命中都掃描整個目錄"""
+    global _cache_writes
+    with _cache_stats_lock:
+        _cache_writes += 1
+        due = _cache_writes % RESUME_CACHE_PRUNE_EVERY == 0
+    if due:
+        _prune_cache()
+
+
+def _prune_cache():
+    """快取檔超過上限時刪除最舊的一半"""
+    try:
+        entries = [os.path.join(RESUME_CACHE_DIR, name) for name in os.listdir(RESUME_CACHE_DIR) if name.endswith(".docx")]
+        if len(entries) <= RESUME_CACHE_MAX_FILES:
+            return
+        entries.sort(key=lambda p: os.path.getmtime(p))
+        for path in entries[:len(entries) // 2]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # 其他程序已刪除
+    except OSError as e:
+        print(f"⚠️ 清理履歷快取失敗: {e}")
+
+
+def render_resume_cached(student_data, output_path, timings=None):
+    """
+    與 render_resume 相同，但內容未變動時直接由快取複製。回傳是否成功；
+    timings 會加入 cache（hit / miss）。
+    """
+    with stage_timer(timings, "hash"):
+        content_hash = resume_content_hash(student_data)
+    cache_path = os.path.join(RESUME_CACHE_DIR, f"{content_hash}.docx")
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    # 不先檢查 exists：檢查與複製之間快取檔可能被清理，複製失敗就當作未命中重新產生
+    try:
+        started = time.perf_counter()
+        shutil.copyfile(cache_path, output_path)
+    except OSError:
+        pass
+    else:
+        if timings is not None:
+            timings["save"] = round((time.perf_counter() - started) * 1000, 1)
+        try:
+            os.utime(cache_path)  # 最近使用，清理時保留
+        except OSError:
+            pass
+        with _cache_stats_lock:
+            _cache_stats["hits"] += 1
+        if timings is not None:
+            timings["cache"] = "hit"
+        return True
+
+    with _cache_stats_lock:
+        _cache_stats["misses"] += 1
+    if timings is not None:
+        timings["cache"] = "miss"
+    if not render_resume(student_data, output_path, timings=timings):
+        return False
+    try:
+        os.makedirs(RESUME_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(output_path, tmp_path)
+        os.replace(tmp_path, cache_path)
+        _maybe_prune_cache()
+    except OSError as e:
+        print(f"⚠️ 寫入履歷快取失敗: {e}")
+    return True
+
+
+def resume_cache_stats():
+    with _cache_stats_lock:
+        stats = dict(_cache_stats)
+    total = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / total, 3) if total else None
+    return stats
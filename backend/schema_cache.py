@@ -0,0 +1,108 @@
+"""
+資料庫結構快取
+
+各模組為了相容新舊資料表結構，會在請求中以 SHOW TABLES / SHOW COLUMNS / information_schema
+檢查表或欄位是否存在。改為啟動時一次載入目前資料庫的所有表、欄位與唯一索引，之後 has_table / has_column /
+has_unique_key 皆為記憶體查詢。執行期建立表或修改欄位 / 索引（migration）後呼叫 refresh_schema_cache() 重新載入。
+"""
+import threading
+
+from config import get_db
+
+_lock = threading.Lock()
+_tables = None  # {table_name_lower: {column_name_lower: column_name}}
+_unique_keys = {}  # {table_name_lower: {frozenset(column_name_lower, ...), ...}}（含主鍵）
+
+
+def refresh_schema_cache(cursor=None):
+    """重新載入 information_schema（可傳入既有 cursor，否則自行借連線）"""
+    global _tables, _unique_keys
+    own_conn = None
+    if cursor is None:
+        own_conn = get_db()
+        cursor = own_conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT TABLE_NAME, COLUMN_NAME
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE()
+        """)
+        tables = {}
+        for row in cursor.fetchall():
+            if isinstance(row, dict):
+                table_name, column_name = row['TABLE_NAME'], row['COLUMN_NAME']
+            else:
+                table_name, column_name = row
+            tables.setdefault(table_name.lower(), {})[column_name.lower()] = column_name
+
+        cursor.execute("""
+            SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME
+            FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND NON_UNIQUE = 0
+        """)
+        index_columns = {}
+        for row in cursor.fetchall():
+            if isinstance(row, dict):
+                table_name, index_name, column_name = row['TABLE_NAME'], row['INDEX_NAME'], row['COLUMN_NAME']
+            else:
+                table_name, index_name, column_name = row
+            index_columns.setdefault((table_name.lower(), index_name), set()).add(column_name.lower())
+        unique_keys = {}
+        for (table_name, _), columns in index_columns.items():
+            unique_keys.setdefault(table_name, set()).add(frozenset(columns))
+
+        with _lock:
+            _tables = tables
+            _unique_keys = unique_keys
+        return len(tables)
+    finally:
+        if own_conn is not None:
+            cursor.close()
+            own_conn.close()
+
+
+def _get_tables():
+    if _tables is None:
+        with _lock:
+            loaded = _tables is not None
+        if not loaded:
+            refresh_schema_cache()
+    return _tables
+
+
+def has_table(table_name):
+    return table_name.lower() in _get_tables()
+
+
+def has_column(table_name, column_name):
+    columns = _get_tables().get(table_name.lower())
+    return columns is not None and column_name.lower() in columns
+
+
+def has_unique_key(table_name, columns):
+    """
+    該表是否有恰好由 columns 組成的唯一索引（或主鍵），決定能否以 ON DUPLICATE KEY UPDATE 依這組欄位 upsert。
+    欄位較多的唯一索引（如 (a, b, c)）不保證 (a, b) 唯一，不算符合。
+    """
+    _get_tables()
+    return frozenset(c.lower() for c in columns) in _unique_keys.get(table_name.lower(), ())
+
+
+# MySQL 錯誤碼：Duplicate column name / Duplicate key name（其他程序已先新增）
+DUPLICATE_DDL_ERRNOS = (1060, 1061)
+
+
+def execute_ddl(cursor, sql):
+    """執行 ALTER TABLE / CREATE INDEX；欄位或索引已由其他程序新增時視為成功，回傳是否由本次新增"""
+    try:
+        cursor.execute(sql)
+        return True
+    except Exception as e:
+        if getattr(e, 'errno', None) in DUPLICATE_DDL_ERRNOS:
+            return False
+        raise
+
+
+def get_columns(table_name):
+    """回傳該表所有欄位名稱（原始大小寫）；表不存在時回傳空 list"""
+    return list(_get_tables().get(table_name.lower(), {}).values())
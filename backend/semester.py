@@ -1,35 +1,153 @@
-from flask import Blueprint, request, jsonify, session, render_template
+from flask import Blueprint, request, jsonify, session, render_template, g, has_app_context
 from config import get_db
+from schema_cache import has_column, refresh_schema_cache
 from datetime import datetime, date, timedelta
 import traceback
 import time
 import re
+import threading
 
 semester_bp = Blueprint("semester_bp", __name__, url_prefix="/semester")
 
+# =========================================================
+# 學期情境快取：一次讀入 semesters 表，算出當前/上一/流程學期與實習起訖，
+# 同一 request 共用一份，跨 request 則以程序層級快取（TTL + 寫入時失效）
+# =========================================================
+SEMESTER_CONTEXT_TTL = 60  # 秒；其他 worker 程序切換學期時，最多延遲這麼久生效
+
+_context_lock = threading.Lock()
+_context_cache = None
+_context_loaded_at = 0.0
+
+
+class SemesterContext:
+    """學期情境（唯讀快照）；current 等 dict 請以 copy 取用，避免呼叫端修改到快取"""
+
+    def __init__(self, semesters):
+        self.semesters = semesters
+        self.by_id = {s['id']: s for s in semesters}
+        self.by_code = {str(s['code']).strip(): s for s in semesters if s.get('code') is not None}
+        # 依代碼排序（與 SQL 的 ORDER BY code 一致），供「上一學期」查詢
+        self._ordered = sorted((s for s in semesters if s.get('code') is not None), key=lambda s: s['code'])
+
+        self.current = next((s for s in semesters if s.get('is_active') == 1), None)
+        self.current_id = self.current['id'] if self.current else None
+        self.current_code = self.current['code'] if self.current else None
+
+        self.previous_id = self.previous_semester_id(self.current_id)
+        self.previous_code = self.by_id[self.previous_id]['code'] if self.previous_id else None
+
+        # 流程學期：當前為下學期（代碼末位 2）時沿用上學期
+        self.flow_id = None
+        if self.current:
+            code = (self.current.get('code') or '').strip()
+            if len(code) >= 1 and code[-1] == '2':
+                self.flow_id = self.previous_id if self.previous_id is not None else self.current_id
+            else:
+                self.flow_id = self.current_id
+        self.flow_code = self.by_id[self.flow_id]['code'] if self.flow_id else self.current_code
+
+        # 公司開放狀態使用的學期代碼
+        self.openings_code = None
+        if self.current_code:
+            if str(self.current_code).strip()[-1] == '2':
+                self.openings_code = self.previous_code or self.current_code
+            else:
+                self.openings_code = self.current_code
+
+        self.flow_internship_dates = self.internship_dates(self.flow_id)
+
+    def previous_semester_id(self, semester_id):
+        semester = self.by_id.get(semester_id) if semester_id else None
+        if not semester or semester.get('code') is None:
+            return None
+        previous = None
+        for s in self._ordered:
+            if s['code'] >= semester['code']:
+                break
+            previous = s
+        return previous['id'] if previous else None
+
+    def internship_dates(self, flow_semester_id):
+        """流程學期 1131 → 實習學期 1132 的 (start_date_str, end_date_str)，無則 (None, None)"""
+        semester = self.by_id.get(flow_semester_id) if flow_semester_id else None
+        if not semester:
+            return (None, None)
+        code = str(semester.get('code') or '').strip()
+        if len(code) < 4:
+            return (None, None)
+        intern_code = code[:-1] + '2' if code[-1] == '1' else code
+        intern = self.by_code.get(intern_code)
+        if not intern or not intern.get('start_date') or not intern.get('end_date'):
+            return (None, None)
+        start_val = intern['start_date']
+        end_val = intern['end_date']
+        start_str = start_val.strftime('%Y-%m-%d') if hasattr(start_val, 'strftime') else str(start_val)
+        end_str = end_val.strftime('%Y-%m-%d') if hasattr(end_val, 'strftime') else str(end_val)
+        return (start_str, end_str)
+
+
+def _load_semester_context(cursor):
+    cursor.execute("SELECT * FROM semesters")
+    rows = cursor.fetchall() or []
+    if rows and not isinstance(rows[0], dict):
+        columns = cursor.column_names
+        rows = [dict(zip(columns, row)) for row in rows]
+    return SemesterContext(rows)
+
+
+def get_semester_context(cursor):
+    """取得學期情境：request 內快取 → 程序快取（TTL）→ 以傳入的 cursor 查詢一次"""
+    global _context_cache, _context_loaded_at
+    in_request = has_app_context()
+    if in_request:
+        ctx = g.get('_semester_context')
+        if ctx is not None:
+            return ctx
+    with _context_lock:
+        ctx = _context_cache
+        if ctx is not None and time.monotonic() - _context_loaded_at > SEMESTER_CONTEXT_TTL:
+            ctx = None
+    if ctx is None:
+        ctx = _load_semester_context(cursor)
+        with _context_lock:
+            _context_cache = ctx
+            _context_loaded_at = time.monotonic()
+    if in_request:
+        g._semester_context = ctx
+    return ctx
+
+
+def invalidate_semester_context():
+    """semesters 表異動（建立/更新/切換/刪除）後呼叫"""
+    global _context_cache
+    with _context_lock:
+        _context_cache = None
+    if has_app_context():
+        g.pop('_semester_context', None)
+
+
 # =========================================================
 # Helper: 取得當前學期（可被其他模組導入使用）
 # =========================================================
 def get_current_semester(cursor):
     """取得當前活躍的學期"""
-    cursor.execute("SELECT * FROM semesters WHERE is_active = 1 LIMIT 1")
-    return cursor.fetchone()
+    current = get_semester_context(cursor).current
+    return dict(current) if current else None
 
 # =========================================================
 # Helper: 取得學期代碼（如 '1132'）（可被其他模組導入使用）
 # =========================================================
 def get_current_semester_code(cursor):
     """取得當前學期代碼"""
-    semester = get_current_semester(cursor)
-    return semester['code'] if semester else None
+    return get_semester_context(cursor).current_code
 
 # =========================================================
 # Helper: 取得當前學期ID（可被其他模組導入使用）
 # =========================================================
 def get_current_semester_id(cursor):
     """取得當前學期ID"""
-    semester = get_current_semester(cursor)
-    return semester['id'] if semester else None
+    return get_semester_context(cursor).current_id
 
 # =========================================================
 # Helper: 是否為「當前實習學期」學生（可被其他模組導入使用）
@@ -100,14 +218,7 @@ def get_previous_semester_id(cursor, semester_id):
     """依學期代碼排序，回傳比給定學期早一學期的 id，若無則 None。例：1132 → 1131，1131 → 1122。"""
     if not semester_id:
         return None
-    cursor.execute(
-        """SELECT s2.id FROM semesters s2
-           WHERE s2.code < (SELECT s1.code FROM semesters s1 WHERE s1.id = %s LIMIT 1)
-           ORDER BY s2.code DESC LIMIT 1""",
-        (semester_id,)
-    )
-    row = cursor.fetchone()
-    return row['id'] if row else None
+    return get_semester_context(cursor).previous_semester_id(semester_id)
 
 
 # =========================================================
@@ -115,15 +226,7 @@ def get_previous_semester_id(cursor, semester_id):
 # =========================================================
 def get_previous_semester_code(cursor):
     """依學期代碼排序，回傳當前學期的上一學期代碼；若無則 None。"""
-    current = get_current_semester(cursor)
-    if not current:
-        return None
-    prev_id = get_previous_semester_id(cursor, current['id'])
-    if not prev_id:
-        return None
-    cursor.execute("SELECT code FROM semesters WHERE id = %s", (prev_id,))
-    row = cursor.fetchone()
-    return row['code'] if row else None
+    return get_semester_context(cursor).previous_code
 
 
 # =========================================================
@@ -136,25 +239,12 @@ def get_flow_semester_id(cursor):
     當系統當前學期為下學期(1132)時，仍使用上學期(1131)的資料，讓主任可查志願序、科助可看媒合人數與時間管理。
     例：當前 1131 → 1131；當前 1132 → 1131。
     """
-    current = get_current_semester(cursor)
-    if not current:
-        return None
-    code = (current.get('code') or '').strip()
-    # 學期代碼末位 2 表示下學期（1132、1142…），流程學期為上一學期
-    if len(code) >= 1 and code[-1] == '2':
-        prev_id = get_previous_semester_id(cursor, current['id'])
-        return prev_id if prev_id is not None else current['id']
-    return current['id']
+    return get_semester_context(cursor).flow_id
 
 
 def get_flow_semester_code(cursor):
     """回傳流程學期的學期代碼（如 '1131'）。"""
-    flow_id = get_flow_semester_id(cursor)
-    if not flow_id:
-        return get_current_semester_code(cursor)
-    cursor.execute("SELECT code FROM semesters WHERE id = %s", (flow_id,))
-    row = cursor.fetchone()
-    return row['code'] if row else get_current_semester_code(cursor)
+    return get_semester_context(cursor).flow_code
 
 
 # =========================================================
@@ -166,29 +256,7 @@ def get_internship_semester_dates(cursor, flow_semester_id):
     流程學期 1131 → 實習學期 1132（110 學年入學學生實習周期）；1132 → 1132。
     回傳值為 (start_date_str, end_date_str) 或 (None, None)。
     """
-    if not flow_semester_id:
-        return (None, None)
-    cursor.execute("SELECT code, start_date, end_date FROM semesters WHERE id = %s", (flow_semester_id,))
-    row = cursor.fetchone()
-    if not row:
-        return (None, None)
-    code = str(row.get('code') or '').strip()
-    if len(code) < 4:
-        return (None, None)
-    # 流程學期末位 1（上學期）→ 實習學期為同學年下學期（末位 2）；已是 2 則實習學期即自身
-    intern_code = code[:-1] + '2' if code[-1] == '1' else code
-    cursor.execute(
-        "SELECT start_date, end_date FROM semesters WHERE code = %s LIMIT 1",
-        (intern_code,)
-    )
-    intern = cursor.fetchone()
-    if not intern or not intern.get('start_date') or not intern.get('end_date'):
-        return (None, None)
-    start_val = intern['start_date']
-    end_val = intern['end_date']
-    start_str = start_val.strftime('%Y-%m-%d') if hasattr(start_val, 'strftime') else str(start_val)
-    end_str = end_val.strftime('%Y-%m-%d') if hasattr(end_val, 'strftime') else str(end_val)
-    return (start_str, end_str)
+    return get_semester_context(cursor).internship_dates(flow_semester_id)
 
 
 # =========================================================
@@ -201,13 +269,7 @@ def get_semester_code_for_company_openings(cursor):
     當系統當前學期為下學期時，沿用上學期的開放狀態，不需重新開放。
     例：當前 1131 → 1131；當前 1132 → 1131。
     """
-    code = get_current_semester_code(cursor)
-    if not code:
-        return None
-    # 學期代碼末位 2 表示下學期（1132、1142…）
-    if str(code).strip()[-1] == '2':
-        return get_previous_semester_code(cursor) or code
-    return code
+    return get_semester_context(cursor).openings_code
 
 
 # =========================================================
@@ -393,6 +455,33 @@ def get_current_semester_deadline(cursor, deadline_type):
         return None
 
 
+def get_deadline_with_announcement_fallback(cursor, deadline_type, announcement_title_pattern):
+    """
+    截止時間：優先學期流程表 internship_flows，無則 fallback 最新一則符合標題的已發布公告 end_time。
+    回傳: datetime 或 None
+    """
+    flow_deadline = get_current_semester_deadline(cursor, deadline_type)
+    if flow_deadline is not None:
+        return flow_deadline
+    cursor.execute("""
+        SELECT end_time 
+        FROM announcement 
+        WHERE title LIKE %s AND is_published = 1
+        ORDER BY created_at DESC 
+        LIMIT 1
+    """, (announcement_title_pattern,))
+    deadline_result = cursor.fetchone()
+    if not deadline_result or not deadline_result.get('end_time'):
+        return None
+    deadline = deadline_result['end_time']
+    if isinstance(deadline, datetime):
+        return deadline
+    try:
+        return datetime.strptime(str(deadline), '%Y-%m-%d %H:%M:%S')
+    except Exception:
+        return datetime.strptime(str(deadline), '%Y-%m-%d %H:%M')
+
+
 # =========================================================
 # API: 取得當前學期
 # =========================================================
@@ -556,6 +645,7 @@ def create_semester():
         """, (code, start_date, end_date, auto_switch_at if auto_switch_at else None))
         
         conn.commit()
+        invalidate_semester_context()
         return jsonify({"success": True, "message": "學期建立成功"})
     except Exception as e:
         traceback.print_exc()
@@ -604,6 +694,7 @@ def perform_semester_switch(semester_id):
         _auto_update_internship_ranges(cursor, current_code)
         
         conn.commit()
+        invalidate_semester_context()
         return True, f"已切換至學期 {current_code}"
     except Exception as e:
         traceback.print_exc()
@@ -735,6 +826,7 @@ def update_semester(semester_id):
         """, params)
         
         conn.commit()
+        invalidate_semester_context()
         return jsonify({"success": True, "message": "學期資訊更新成功"})
     except Exception as e:
         traceback.print_exc()
@@ -811,6 +903,7 @@ def delete_semester(semester_id):
         # 刪除學期
         cursor.execute("DELETE FROM semesters WHERE id = %s", (semester_id,))
         conn.commit()
+        invalidate_semester_context()
         
         return jsonify({"success": True, "message": "學期已刪除"})
     except Exception as e:
@@ -1168,15 +1261,13 @@ def ensure_auto_switch_column():
         cursor = conn.cursor()
         
         # 檢查欄位是否存在
-        cursor.execute("SHOW COLUMNS FROM semesters LIKE 'auto_switch_at'")
-        result = cursor.fetchone()
-        
-        if result:
+        if has_column('semesters', 'auto_switch_at'):
             return True, "欄位 'auto_switch_at' 已存在"
         else:
             # 添加欄位
             cursor.execute("ALTER TABLE semesters ADD COLUMN auto_switch_at DATETIME NULL DEFAULT NULL")
             conn.commit()
+            refresh_schema_cache(cursor)
             return True, "已成功添加 'auto_switch_at' 欄位"
             
     except Exception as e:
@@ -1279,6 +1370,7 @@ def verify_auto_switch_logic(test_code="TEST_999", wait_seconds=3):
             pass
         return False, f"驗證過程發生錯誤: {str(e)}", {}
     finally:
+        invalidate_semester_context()
         cursor.close()
         conn.close()
 
@@ -0,0 +1,26 @@
+"""
+各階段耗時紀錄（履歷 Word / PDF 產生、履歷產生工作共用）
+
+stage_timer 把 with 區塊的耗時累加到呼叫端傳入的 dict，format_timings 轉成一行記錄用文字；
+不依賴 docxtpl 等套件，render pool 的 worker 與 Flask 程序都可直接匯入。
+"""
+import time
+from contextlib import contextmanager
+
+
+@contextmanager
+def stage_timer(timings, name):
+    """累加 with 區塊的耗時（毫秒）到 timings[name]"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[name] = round(timings.get(name, 0) + (time.perf_counter() - started) * 1000, 1)
+
+
+def format_timings(timings):
+    return " ".join(
+        f"{name}={value}ms" if isinstance(value, (int, float)) else f"{name}={value}"
+        for name, value in (timings or {}).items()
+    )
@@ -1,9 +1,11 @@
 from flask import Blueprint, request, jsonify, session,render_template,redirect, send_file
 from config import get_db
+from schema_cache import has_table, refresh_schema_cache
 from datetime import datetime
 from semester import get_current_semester_code, get_current_semester_id, get_current_semester_deadline, get_flow_semester_id, get_flow_semester_code
 from werkzeug.utils import secure_filename
-from openpyxl import Workbook, load_workbook
+from openpyxl import load_workbook
+from excel_export import StreamingWorkbook, iter_rows, fit_widths
 import traceback
 import io 
 import os
@@ -824,8 +826,6 @@ def export_companies_stats():
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
     try:
-        from openpyxl import Workbook
-
         params = []
         query = """
             SELECT c.company_name, COUNT(sp.id) AS preference_count 
@@ -881,65 +881,40 @@ def export_companies_stats():
             "未填寫": max(total_students - filled, 0)
         }
 
-        # 建立 Excel 檔，分成三個工作表
-        wb = Workbook()
-
-        # 工作表 1：公司志願統計
-        ws1 = wb.active
-        ws1.title = "公司志願統計"
-        ws1.append(["排名", "公司名稱", "志願次數"])
+        # 建立 Excel 檔，分成四個工作表（先組好各表內容，依內容估算欄寬後再逐列寫出）
+        company_rows = [["排名", "公司名稱", "志願次數"]]
         if company_data:
             for idx, row in enumerate(company_data, start=1):
-                ws1.append([idx, row.get("company_name", "-"), row.get("preference_count", 0)])
+                company_rows.append([idx, row.get("company_name", "-"), row.get("preference_count", 0)])
         else:
-            ws1.append(["-", "目前沒有志願資料", 0])
-
-        # 工作表 2：履歷繳交率
-        ws2 = wb.create_sheet("履歷繳交率")
-        ws2.append(["項目", "人數", "比例"])
-        resume_total = sum(resume_stats.values()) or 0
-        for label, value in resume_stats.items():
-            percent = f"{(value / resume_total * 100):.0f}%" if resume_total else "0%"
-            ws2.append([label, value, percent])
-
-        # 工作表 3：志願填寫率
-        ws3 = wb.create_sheet("志願填寫率")
-        ws3.append(["項目", "人數", "比例"])
-        pref_total = sum(preference_stats.values()) or 0
-        for label, value in preference_stats.items():
-            percent = f"{(value / pref_total * 100):.0f}%" if pref_total else "0%"
-            ws3.append([label, value, percent])
-
-        # 工作表 4：班級實習進度統計
-        ws4 = wb.create_sheet("班級實習進度統計")
-        ws4.append(["項目", "人數"])
-        ws4.append(["總學生數", total_students])
-        ws4.append(["已上傳履歷", uploaded])
-        ws4.append(["已填寫志願", filled])
-
-        # 調整欄寬以便閱讀
-        for ws in [ws1, ws2, ws3, ws4]:
-            for column_cells in ws.columns:
-                max_length = 0
-                for cell in column_cells:
-                    if cell.value is not None:
-                        max_length = max(max_length, len(str(cell.value)))
-                adjusted_width = max_length + 4
-                ws.column_dimensions[column_cells[0].column_letter].width = adjusted_width
-
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
+            company_rows.append(["-", "目前沒有志願資料", 0])
+
+        def ratio_rows(stats):
+            total = sum(stats.values()) or 0
+            rows = [["項目", "人數", "比例"]]
+            for label, value in stats.items():
+                rows.append([label, value, f"{(value / total * 100):.0f}%" if total else "0%"])
+            return rows
+
+        progress_rows = [
+            ["項目", "人數"],
+            ["總學生數", total_students],
+            ["已上傳履歷", uploaded],
+            ["已填寫志願", filled],
+        ]
+
+        book = StreamingWorkbook()
+        for title, rows in (("公司志願統計", company_rows),
+                            ("履歷繳交率", ratio_rows(resume_stats)),
+                            ("志願填寫率", ratio_rows(preference_stats)),
+                            ("班級實習進度統計", progress_rows)):
+            sheet = book.sheet(title, widths=fit_widths(rows))
+            for row in rows:
+                sheet.append(row)
 
         # 生成檔案名稱
         filename = f"公司志願統計_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        
-        return send_file(
-            output, 
-            download_name=filename, 
-            as_attachment=True, 
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        return book.response(filename)
     except Exception as e:
         traceback.print_exc()
         return jsonify({"success": False, "message": f"匯出 Excel 失敗: {str(e)}"}), 500
@@ -1087,12 +1062,6 @@ def export_statistics():
         return jsonify({"success": False, "message": "未授權"}), 403
     
     try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, Alignment, PatternFill
-        from openpyxl.utils import get_column_letter
-        from flask import send_file
-        import io
-        
         conn = get_db()
         cursor = conn.cursor(dictionary=True)
         
@@ -1100,16 +1069,16 @@ def export_statistics():
         current_semester_code = get_current_semester_code(cursor)
         
         # 創建 Excel 工作簿
-        wb = Workbook()
+        book = StreamingWorkbook()
         
         # Sheet 1: 總覽統計
-        ws1 = wb.active
-        ws1.title = "總覽統計"
+        ws1 = book.sheet("總覽統計")
         
         # 標題
-        ws1['A1'] = f"智慧實習系統統計報表 - {current_semester_code or '當前學期'}"
-        ws1['A1'].font = Font(bold=True, size=14)
-        ws1.merge_cells('A1:D1')
+        ws1.append([f"智慧實習系統統計報表 - {current_semester_code or '當前學期'}", None, None, None],
+                   ["x_title_left", None, None, None])
+        ws1.merge(1, 4)
+        ws1.append([])
         
         # 獲取總覽數據（使用現有的 API 邏輯）
         cursor.execute("SELECT COUNT(*) AS total FROM users WHERE role = 'student'")
@@ -1134,27 +1103,18 @@ def export_statistics():
         preference_stats = cursor.fetchone()
         
         # 寫入總覽數據
-        row = 3
-        ws1[f'A{row}'] = "項目"
-        ws1[f'B{row}'] = "數量"
-        ws1[f'C{row}'] = "完成率"
-        row += 1
-        
-        ws1[f'A{row}'] = "總學生數"
-        ws1[f'B{row}'] = total_students
-        row += 1
-        
-        ws1[f'A{row}'] = "已上傳履歷人數"
-        ws1[f'B{row}'] = resume_stats['students_with_resume'] or 0
-        ws1[f'C{row}'] = f"{round((resume_stats['students_with_resume'] or 0) * 100.0 / total_students if total_students > 0 else 0, 2)}%"
-        row += 1
-        
-        ws1[f'A{row}'] = "已填寫志願序人數"
-        ws1[f'B{row}'] = preference_stats['students_with_preferences'] or 0
-        ws1[f'C{row}'] = f"{round((preference_stats['students_with_preferences'] or 0) * 100.0 / total_students if total_students > 0 else 0, 2)}%"
-        
-        # Sheet 2: 各班級統計
-        ws2 = wb.create_sheet("各班級統計")
+        resume_count = resume_stats['students_with_resume'] or 0
+        preference_count = preference_stats['students_with_preferences'] or 0
+        ws1.append(["項目", "數量", "完成率"])
+        ws1.append(["總學生數", total_students])
+        ws1.append(["已上傳履歷人數", resume_count,
+                    f"{round(resume_count * 100.0 / total_students if total_students > 0 else 0, 2)}%"])
+        ws1.append(["已填寫志願序人數", preference_count,
+                    f"{round(preference_count * 100.0 / total_students if total_students > 0 else 0, 2)}%"])
+        
+        # Sheet 2: 各班級統計（欄寬須在寫入前設定）
+        headers = ['班級名稱', '系所', '總學生數', '已上傳履歷', '已填寫志願序', '履歷完成率', '志願序完成率']
+        ws2 = book.sheet("各班級統計", widths=[15] * len(headers))
         
         # 獲取各班級統計
         cursor.execute("""
@@ -1171,47 +1131,28 @@ def export_statistics():
             GROUP BY c.id, c.name, c.department
             ORDER BY c.name ASC, c.department ASC
         """)
-        classes_stats = cursor.fetchall()
         
         # 寫入表頭
-        headers = ['班級名稱', '系所', '總學生數', '已上傳履歷', '已填寫志願序', '履歷完成率', '志願序完成率']
-        for col, header in enumerate(headers, 1):
-            cell = ws2.cell(row=1, column=col)
-            cell.value = header
-            cell.font = Font(bold=True)
-        
-        # 寫入數據
-        for idx, stat in enumerate(classes_stats, 2):
-            ws2.cell(row=idx, column=1, value=stat['class_name'])
-            ws2.cell(row=idx, column=2, value=stat['department'])
-            ws2.cell(row=idx, column=3, value=stat['total_students'] or 0)
-            ws2.cell(row=idx, column=4, value=stat['students_with_resume'] or 0)
-            ws2.cell(row=idx, column=5, value=stat['students_with_preferences'] or 0)
-            
+        ws2.append(headers, "x_bold")
+        
+        # 寫入數據（分批讀取）
+        for stat in iter_rows(cursor):
             total = stat['total_students'] or 0
             resume_rate = round((stat['students_with_resume'] or 0) * 100.0 / total if total > 0 else 0, 2)
             pref_rate = round((stat['students_with_preferences'] or 0) * 100.0 / total if total > 0 else 0, 2)
-            ws2.cell(row=idx, column=6, value=f"{resume_rate}%")
-            ws2.cell(row=idx, column=7, value=f"{pref_rate}%")
-        
-        # 調整欄寬
-        for col in range(1, len(headers) + 1):
-            ws2.column_dimensions[get_column_letter(col)].width = 15
-        
-        # 保存到內存
-        excel_buffer = io.BytesIO()
-        wb.save(excel_buffer)
-        excel_buffer.seek(0)
+            ws2.append([
+                stat['class_name'],
+                stat['department'],
+                total,
+                stat['students_with_resume'] or 0,
+                stat['students_with_preferences'] or 0,
+                f"{resume_rate}%",
+                f"{pref_rate}%",
+            ])
         
         # 生成檔案名稱
         filename = f"實習系統統計報表_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        
-        return send_file(
-            excel_buffer,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        return book.response(filename)
     
     except Exception as e:
         traceback.print_exc()
@@ -1587,8 +1528,7 @@ def upload_standard_courses():
             print(f"❌ 警告：文件保存後無法找到！")
         
         # 檢查並創建 uploaded_course_templates 表（如果不存在）
-        cursor.execute("SHOW TABLES LIKE 'uploaded_course_templates'")
-        has_template_table = cursor.fetchone() is not None
+        has_template_table = has_table('uploaded_course_templates')
         
         if not has_template_table:
             # 創建 uploaded_course_templates 表
@@ -1602,6 +1542,7 @@ def upload_standard_courses():
                     INDEX idx_file_path (file_path)
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
             """)
+            refresh_schema_cache(cursor)
             print("✅ 已創建 uploaded_course_templates 表")
         
         # 先將舊資料標記為非活躍（不直接刪除，保留歷史）
@@ -1694,8 +1635,7 @@ def get_standard_courses_history():
     
     try:
         # 檢查 uploaded_course_templates 表是否存在
-        cursor.execute("SHOW TABLES LIKE 'uploaded_course_templates'")
-        has_template_table = cursor.fetchone() is not None
+        has_template_table = has_table('uploaded_course_templates')
         
         if has_template_table:
             # 從 uploaded_course_templates 表獲取歷史記錄
@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, session, redirect, url_for, reques
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from config import get_db
+from image_pipeline import save_uploaded_image
 from semester import is_student_in_application_phase, should_show_intern_experience, should_show_image_recognize, is_internship_semester_started
 import os
 import re 
@@ -749,7 +750,9 @@ def upload_avatar():
         os.makedirs(avatars_folder, exist_ok=True)
         
         filepath = os.path.join(avatars_folder, filename)
-        file.save(filepath)
+        # 一律正規化為 512px 以內的 PNG（檔名固定為 .png）
+        if not save_uploaded_image(file, filepath, "avatar"):
+            return jsonify({"success": False, "message": "圖片無效或已損壞"}), 400
 
         avatar_url = url_for('static', filename=f"avatars/{filename}")
         
@@ -12,6 +12,8 @@ except ImportError:
     MySQL_ProgrammingError = None
 
 from config import get_db
+from schema_cache import has_table, has_column, get_columns, has_unique_key
+from notification import add_unread_counts, publish_unread_change
 from semester import get_current_semester_id, get_current_semester_code, get_flow_semester_id
 
 vendor_bp = Blueprint('vendor', __name__)
@@ -261,13 +263,7 @@ def _record_history(cursor, preference_id, reviewer_id, action, comment, student
     if action in ["in interview", "scheduled"] and preference_id:
         try:
             # 檢查 vendor_preference_history 表是否存在
-            cursor.execute("""
-                SELECT COUNT(*) as count
-                FROM information_schema.tables
-                WHERE table_schema = DATABASE()
-                AND table_name = 'vendor_preference_history'
-            """)
-            table_exists = cursor.fetchone().get('count', 0) > 0
+            table_exists = has_table('vendor_preference_history')
             
             if table_exists:
                 # 插入記錄到 vendor_preference_history
@@ -283,7 +279,7 @@ def _record_history(cursor, preference_id, reviewer_id, action, comment, student
 
 
 def _notify_student(cursor, student_id, title, message, link_url="/vendor_review_resume", category="resume"):
-    """發送通知給學生"""
+    """發送通知給學生（不 commit、不推播；呼叫端 commit 後再以 publish_unread_change 推播）"""
     cursor.execute(
         """
         INSERT INTO notifications (user_id, title, message, category, link_url, is_read, created_at)
@@ -291,6 +287,7 @@ def _notify_student(cursor, student_id, title, message, link_url="/vendor_review
         """,
         (student_id, title, message, category, link_url),
     )
+    add_unread_counts(cursor, [student_id], link_url)
 
 
 def _fetch_latest_resume(cursor, student_id):
@@ -682,14 +679,7 @@ def get_vendor_resumes():
     conn = get_db()
     cursor = conn.cursor(dictionary=True, buffered=True)
     
-    # 檢查指導老師審核截止時間並自動將已通過的履歷傳給廠商
-    try:
-        from resume import update_resume_applications_after_advisor_deadline
-        is_advisor_deadline_passed, advisor_update_count = update_resume_applications_after_advisor_deadline(cursor, conn)
-        if advisor_update_count > 0:
-            print(f"✅ [get_vendor_resumes] 指導老師審核截止時間後，已將 {advisor_update_count} 筆履歷傳給廠商")
-    except Exception as e:
-        print(f"⚠️ [get_vendor_resumes] 檢查指導老師審核截止時間時發生錯誤: {e}")
+    # 指導老師審核截止後「傳給廠商」的轉換由 deadline_engine 排程執行，此端點只讀取
     
     # 如果是老師，需要根據 company_id 找到對應的廠商
     if user_role in ["teacher", "ta"]:
@@ -794,8 +784,7 @@ def get_vendor_resumes():
         # 重要：只顯示已經被指導老師（role='teacher'）審核通過的履歷
         # 必須等指導老師審核完後，才會給廠商學生的資料
         # 檢查 resume_teacher 表是否存在
-        cursor.execute("SHOW TABLES LIKE 'resume_teacher'")
-        resume_teacher_exists = cursor.fetchone() is not None
+        resume_teacher_exists = has_table('resume_teacher')
         
         if resume_teacher_exists:
             # 使用 resume_teacher 表查詢（新架構）
@@ -1675,6 +1664,7 @@ def vendor_review_resume(resume_id):
             _notify_student(cursor, student_id, title, message)
             
             conn.commit()
+            publish_unread_change([student_id], cursor=cursor)
             return jsonify({"success": True, "message": f"已標記為{status_label}"})
         else:
             # 如果沒有提供 preference_id，嘗試從 resume_id 查找
@@ -2499,12 +2489,7 @@ def _record_admission_and_bind_relation(cursor, student_id, company_id, job_id=N
         semester_code = get_current_semester_code(cursor) or '1132'
         
         # 4.1 偵測 teacher_student_relations 表是否有 semester_id 或 semester 欄位
-        cursor.execute("""
-            SELECT COLUMN_NAME FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'teacher_student_relations'
-            AND COLUMN_NAME IN ('semester_id', 'semester')
-        """)
-        tsr_columns = {row['COLUMN_NAME'] for row in cursor.fetchall()}
+        tsr_columns = set(get_columns('teacher_student_relations'))
         has_semester_id = 'semester_id' in tsr_columns
         has_semester = 'semester' in tsr_columns
         
@@ -2659,6 +2644,8 @@ def _handle_status_update(application_id, action):
         # 記錄歷史（只有面試相關的操作才記錄到 vendor_preference_history，因為 interview_status 欄位只用於面試狀態）
         # approve, reject, comment 等操作不再記錄到 vendor_preference_history
         conn.commit()
+        if action in status_map:
+            publish_unread_change([access["student_id"]], cursor=cursor)
 
         # 返回最新資料
         detail = _fetch_application_detail(cursor, application_id)
@@ -3000,6 +2987,7 @@ def publish_announcement():
             notification_count += 1
 
         conn.commit()
+        publish_unread_change(student_ids, cursor=cursor)
 
         return jsonify({
             "success": True,
@@ -3241,6 +3229,7 @@ def send_notification():
                         print(f"✅ 已發送面試通知給指導老師 (advisor_user_id: {advisor_user_id})")
                 
                 conn.commit()
+                publish_unread_change([student_id], cursor=cursor)
             except Exception as notify_error:
                 # 系統通知失敗不影響 Email 發送
                 print(f"⚠️ 系統通知發送失敗（不影響 Email）：{notify_error}")
@@ -3786,13 +3775,7 @@ def schedule_interviews():
                     else:
                         # 如果沒有 preference_id，直接插入到 vendor_preference_history（preference_id 為 NULL）
                         try:
-                            cursor.execute("""
-                                SELECT COUNT(*) as count
-                                FROM information_schema.tables
-                                WHERE table_schema = DATABASE()
-                                AND table_name = 'vendor_preference_history'
-                            """)
-                            table_exists = cursor.fetchone().get('count', 0) > 0
+                            table_exists = has_table('vendor_preference_history')
                             
                             if table_exists:
                                 # 直接插入記錄，preference_id 為 NULL
@@ -4261,11 +4244,7 @@ def get_email_logs():
         
         # 查詢 email_logs，關聯到該廠商公司的學生
         # 檢查 error_message 欄位是否存在
-        try:
-            cursor.execute("SHOW COLUMNS FROM email_logs LIKE 'error_message'")
-            has_error_message = cursor.fetchone() is not None
-        except Exception:
-            has_error_message = False
+        has_error_message = has_column('email_logs', 'error_message')
         
         error_message_field = "el.error_message," if has_error_message else "NULL AS error_message,"
         
@@ -4313,6 +4292,196 @@ def get_email_logs():
         traceback.print_exc()
         return jsonify({"success": False, "message": f"查詢失敗：{exc}"}), 500
 
+def _in_list(values):
+    return ','.join(['%s'] * len(values))
+
+
+def _as_int(value):
+    """前端送來的 id 可能是字串，統一轉為整數以便與資料庫查回的 id 比對"""
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return value
+
+
+def _save_matching_sort_rows(cursor, students, company_ids, semester_id=None):
+    """
+    保存廠商媒合排序：先以少數幾個 IN 查詢把 job / 志願 / 投遞 / 既有記錄載入字典，
+    在記憶體中逐筆解析 application_id，再批次寫入 resume_applications（is_reserve / slot_index）
+    與 manage_director（original_type / original_rank）。
+    解析規則與逐筆版相同：職缺或志願不屬於該廠商的公司、缺少 preference_id / student_id / 投遞者略過；
+    同一投遞出現多次時以最後一筆為準。不 commit，由呼叫端負責。返回保存的筆數。
+    """
+    entries = []
+    for student in students:
+        entries.append({
+            "student_id": _as_int(student.get("student_id")),
+            "job_id": _as_int(student.get("job_id")),
+            "preference_id": _as_int(student.get("preference_id")),
+            "slot_index": student.get("slot_index"),
+            "is_reserve": bool(student.get("is_reserve", False)),
+        })
+    job_ids = list({e["job_id"] for e in entries if e["job_id"]})
+    preference_ids = list({e["preference_id"] for e in entries if e["preference_id"]})
+    student_ids = list({e["student_id"] for e in entries if e["student_id"]})
+
+    # 1. 職缺所屬公司
+    job_company = {}
+    if job_ids:
+        cursor.execute(f"SELECT id, company_id FROM internship_jobs WHERE id IN ({_in_list(job_ids)})", tuple(job_ids))
+        job_company = {row["id"]: row["company_id"] for row in cursor.fetchall()}
+
+    # 2. 志願所屬公司；缺少 preference_id 時依 student_id + job_id (+ company_id) 找最新一筆 approved 志願
+    preference_company = {}
+    if preference_ids:
+        cursor.execute(f"SELECT id, company_id FROM student_preferences WHERE id IN ({_in_list(preference_ids)})",
+                       tuple(preference_ids))
+        preference_company = {row["id"]: row["company_id"] for row in cursor.fetchall()}
+    latest_preference = {}
+    if student_ids and job_ids and any(not e["preference_id"] for e in entries):
+        cursor.execute(f"""
+            SELECT id, student_id, job_id, company_id FROM student_preferences
+            WHERE student_id IN ({_in_list(student_ids)}) AND job_id IN ({_in_list(job_ids)}) AND status = 'approved'
+            ORDER BY id DESC
+        """, tuple(student_ids) + tuple(job_ids))
+        for row in cursor.fetchall():
+            latest_preference.setdefault((row["student_id"], row["job_id"], row["company_id"]), row["id"])
+            latest_preference.setdefault((row["student_id"], row["job_id"], None), row["id"])
+            preference_company.setdefault(row["id"], row["company_id"])
+
+    # 3. 投遞記錄（student_job_applications.id 即 resume_applications.application_id）
+    latest_application = {}
+    if student_ids and job_ids:
+        cursor.execute(f"""
+            SELECT id, student_id, company_id, job_id FROM student_job_applications
+            WHERE student_id IN ({_in_list(student_ids)}) AND job_id IN ({_in_list(job_ids)})
+            ORDER BY applied_at DESC
+        """, tuple(student_ids) + tuple(job_ids))
+        for row in cursor.fetchall():
+            latest_application.setdefault((row["student_id"], row["company_id"], row["job_id"]), row["id"])
+
+    # 4. 逐筆解析（純記憶體）
+    ra_rows = {}   # (application_id, job_id) -> (is_reserve, slot_index)
+    md_rows = {}   # application_id -> (company_id, student_id, original_type, original_rank)
+    saved_count = 0
+    for e in entries:
+        student_id, job_id, preference_id = e["student_id"], e["job_id"], e["preference_id"]
+        company_id = job_company.get(job_id) if job_id else None
+        if company_id is not None and company_id not in company_ids:
+            continue
+        if not company_id and preference_id:
+            company_id = preference_company.get(preference_id)
+            if company_id is not None and company_id not in company_ids:
+                continue
+        if not preference_id and student_id and job_id:
+            preference_id = latest_preference.get((student_id, job_id, company_id or None))
+        if not preference_id or not student_id:
+            continue
+        if not job_id:
+            continue
+        if not company_id:
+            company_id = preference_company.get(preference_id)
+        application_id = latest_application.get((student_id, company_id, job_id)) if company_id else None
+        if not application_id:
+            continue
+
+        ra_rows[(application_id, job_id)] = (1 if e["is_reserve"] else 0, e["slot_index"])
+        md_rows[application_id] = (
+            company_id, student_id,
+            'Backup' if e["is_reserve"] else 'Regular',
+            None if e["is_reserve"] else e["slot_index"],
+        )
+        saved_count += 1
+
+    if not ra_rows:
+        return 0
+
+    # 5. resume_applications：只有通過審核的學生才會出現在媒合排序中，apply_status 一律為 'approved'
+    if has_unique_key('resume_applications', ('application_id', 'job_id')):
+        values = ", ".join(["(%s, %s, 'approved', 'none', 'pending', %s, %s, NOW())"] * len(ra_rows))
+        params = [v for (application_id, job_id), (is_reserve, slot_index) in ra_rows.items()
+                  for v in (application_id, job_id, is_reserve, slot_index)]
+        cursor.execute(f"""
+            INSERT INTO resume_applications
+            (application_id, job_id, apply_status, interview_status, interview_result, is_reserve, slot_index, created_at)
+            VALUES {values}
+            ON DUPLICATE KEY UPDATE
+                is_reserve = VALUES(is_reserve),
+                slot_index = VALUES(slot_index),
+                apply_status = 'approved',
+                updated_at = NOW()
+        """, params)
+    else:
+        # 沒有唯一索引時 ON DUPLICATE KEY 無法判斷重複：先 UPDATE ... JOIN，再只新增不存在的記錄
+        application_ids = list({application_id for application_id, _ in ra_rows})
+        cursor.execute(f"""
+            SELECT application_id, job_id FROM resume_applications WHERE application_id IN ({_in_list(application_ids)})
+        """, tuple(application_ids))
+        existing = {(row["application_id"], row["job_id"]) for row in cursor.fetchall()}
+        updates = [(key, value) for key, value in ra_rows.items() if key in existing]
+        inserts = [(key, value) for key, value in ra_rows.items() if key not in existing]
+        if updates:
+            derived = " UNION ALL ".join(
+                ["SELECT %s AS application_id, %s AS job_id, %s AS is_reserve, %s AS slot_index"] * len(updates))
+            cursor.execute(f"""
+                UPDATE resume_applications ra
+                JOIN ({derived}) t ON ra.application_id = t.application_id AND ra.job_id = t.job_id
+                SET ra.is_reserve = t.is_reserve,
+                    ra.slot_index = t.slot_index,
+                    ra.apply_status = 'approved',
+                    ra.updated_at = NOW()
+            """, [v for key, value in updates for v in key + value])
+        if inserts:
+            values = ", ".join(["(%s, %s, 'approved', 'none', 'pending', %s, %s, NOW())"] * len(inserts))
+            cursor.execute(f"""
+                INSERT INTO resume_applications
+                (application_id, job_id, apply_status, interview_status, interview_result, is_reserve, slot_index, created_at)
+                VALUES {values}
+            """, [v for key, value in inserts for v in key + value])
+
+    # 6. manage_director：同步廠商排序；已有記錄保留主任決定（Rejected 改回 Pending 讓主任重新看到）
+    try:
+        application_ids = list(md_rows)
+        cursor.execute(f"""
+            SELECT DISTINCT preference_id FROM manage_director WHERE preference_id IN ({_in_list(application_ids)})
+        """, tuple(application_ids))
+        existing_md = {row["preference_id"] for row in cursor.fetchall()}
+        updates = [(application_id, row) for application_id, row in md_rows.items() if application_id in existing_md]
+        inserts = [(application_id, row) for application_id, row in md_rows.items() if application_id not in existing_md]
+        if updates:
+            derived = " UNION ALL ".join(
+                ["SELECT %s AS preference_id, %s AS original_type, %s AS original_rank"] * len(updates))
+            cursor.execute(f"""
+                UPDATE manage_director md
+                JOIN ({derived}) t ON md.preference_id = t.preference_id
+                SET md.original_type = t.original_type,
+                    md.original_rank = t.original_rank,
+                    md.director_decision = IF(md.director_decision = 'Rejected', 'Pending', md.director_decision),
+                    md.updated_at = NOW()
+            """, [v for application_id, row in updates for v in (application_id, row[2], row[3])])
+        if inserts:
+            with_semester = has_column('manage_director', 'semester_id') and semester_id
+            columns = "vendor_id, student_id, preference_id, original_type, original_rank, " \
+                      "is_conflict, director_decision, final_rank, is_adjusted, updated_at"
+            placeholder = "(%s, %s, %s, %s, %s, 0, 'Pending', %s, 0, NOW())"
+            params = []
+            for application_id, (company_id, student_id, original_type, original_rank) in inserts:
+                params.extend([company_id, student_id, application_id, original_type, original_rank, original_rank])
+            if with_semester:
+                columns = "semester_id, " + columns
+                placeholder = "(%s, " + placeholder[1:]
+                params = [v for i in range(len(inserts)) for v in [semester_id] + params[i * 6:(i + 1) * 6]]
+            cursor.execute(f"""
+                INSERT INTO manage_director ({columns})
+                VALUES {", ".join([placeholder] * len(inserts))}
+            """, params)
+    except Exception as md_error:
+        print(f"⚠️ 更新 manage_director 失敗（不影響 resume_applications 的保存）: {md_error}")
+        traceback.print_exc()
+
+    return saved_count
+
+
 @vendor_bp.route("/vendor/api/save_matching_sort", methods=["POST"])
 def save_matching_sort():
     """保存廠商媒合排序結果"""
@@ -4366,272 +4535,31 @@ def save_matching_sort():
             print(f"⚠️ 清除舊媒合排序記錄時發生錯誤: {delete_error}")
             traceback.print_exc()
         
-        # 插入新的媒合排序記錄到 vendor_preference_history
-        inserted_count = 0
-        print(f"📊 開始處理媒合排序，共 {len(students)} 筆學生資料")
-        for idx, student in enumerate(students):
-            student_id = student.get("student_id")
-            job_id = student.get("job_id")
-            preference_id = student.get("preference_id")
-            student_name = student.get("student_name", "unknown")
-            company_id = None
-            print(f"  [{idx+1}/{len(students)}] 處理學生：{student_name}, student_id={student_id}, preference_id={preference_id}, job_id={job_id}")
-            
-            # 根據 job_id 找到對應的 company_id
-            if job_id:
-                cursor.execute("""
-                    SELECT company_id FROM internship_jobs WHERE id = %s
-                """, (job_id,))
-                job_row = cursor.fetchone()
-                if job_row:
-                    company_id = job_row.get("company_id")
-                    # 驗證該公司是否屬於該廠商
-                    if company_id not in company_ids:
-                        continue
-            
-            # 如果沒有 job_id，嘗試從 preference_id 獲取 company_id
-            if not company_id and preference_id:
-                cursor.execute("""
-                    SELECT company_id FROM student_preferences WHERE id = %s
-                """, (preference_id,))
-                pref_row = cursor.fetchone()
-                if pref_row:
-                    company_id = pref_row.get("company_id")
-                    # 驗證該公司是否屬於該廠商
-                    if company_id not in company_ids:
-                        print(f"    ⚠️ 跳過：公司ID {company_id} 不屬於該廠商（允許的公司ID：{company_ids}）")
-                        continue
-            
-            # 如果缺少 preference_id，嘗試從 student_preferences 裡推回來（以 student_id + job_id (+ company_id) 為條件）
-            if not preference_id and student_id and job_id:
-                try:
-                    # 若尚未有 company_id，先依 job_id 取得
-                    if not company_id:
-                        cursor.execute("""
-                            SELECT company_id FROM internship_jobs WHERE id = %s
-                        """, (job_id,))
-                        job_row = cursor.fetchone()
-                        cursor.fetchall()
-                        if job_row:
-                            company_id = job_row.get("company_id")
-
-                    # 依 student_id + job_id (+ company_id) 找出對應的志願序（僅取一筆最新 approved）
-                    if company_id:
-                        cursor.execute("""
-                            SELECT id FROM student_preferences
-                            WHERE student_id = %s AND job_id = %s AND company_id = %s AND status = 'approved'
-                            ORDER BY id DESC
-                            LIMIT 1
-                        """, (student_id, job_id, company_id))
-                    else:
-                        cursor.execute("""
-                            SELECT id FROM student_preferences
-                            WHERE student_id = %s AND job_id = %s AND status = 'approved'
-                            ORDER BY id DESC
-                            LIMIT 1
-                        """, (student_id, job_id))
-                    pref = cursor.fetchone()
-                    cursor.fetchall()
-                    if pref and pref.get("id"):
-                        preference_id = pref["id"]
-                        print(f"    🔄 自動補上 preference_id={preference_id} (student_id={student_id}, job_id={job_id}, company_id={company_id})")
-                except Exception as pref_err:
-                    print(f"    ⚠️ 嘗試自動推回 preference_id 失敗: {pref_err}")
-                    traceback.print_exc()
-
-            if not preference_id:
-                print(f"    ⚠️ 跳過學生 {student_name}：缺少 preference_id")
-                continue
-
-            if not student_id:
-                print(f"    ⚠️ 跳過 preference_id {preference_id}：缺少 student_id")
-                continue
-            
-            # 將媒合排序資訊存儲在 resume_applications 表的 is_reserve 和 slot_index 欄位中
-            # 注意：resume_applications.application_id 對應的是 student_job_applications.id，不是 student_preferences.id
-            try:
-                slot_index_val = student.get('slot_index')
-                is_reserve_val = student.get('is_reserve', False)
-                
-                # 調試：打印接收到的資料
-                print(f"    📋 接收到的學生資料：student_id={student_id}, job_id={job_id}, preference_id={preference_id}")
-                print(f"    📋 slot_index={slot_index_val}, is_reserve={is_reserve_val}")
-                
-                # 從 preference_id 和 job_id 找到對應的 application_id（student_job_applications.id）
-                application_id = None
-                if preference_id and job_id and student_id:
-                    # 從 student_preferences 獲取 company_id（如果還沒有）
-                    if not company_id:
-                        cursor.execute("""
-                            SELECT company_id FROM student_preferences WHERE id = %s
-                        """, (preference_id,))
-                        pref_row = cursor.fetchone()
-                        # 確保結果被完全讀取
-                        if pref_row:
-                            company_id = pref_row.get('company_id')
-                        # 如果查詢返回 None，也要確保結果被讀取
-                        cursor.fetchall()  # 清空任何剩餘的結果
-                    
-                    # 查詢 student_job_applications 表獲取 application_id
-                    if company_id:
-                        cursor.execute("""
-                            SELECT id FROM student_job_applications
-                            WHERE student_id = %s AND company_id = %s AND job_id = %s
-                            ORDER BY applied_at DESC
-                            LIMIT 1
-                        """, (student_id, company_id, job_id))
-                        sja_result = cursor.fetchone()
-                        # 確保結果被完全讀取
-                        cursor.fetchall()  # 清空任何剩餘的結果
-                        if sja_result:
-                            application_id = sja_result['id']
-                            print(f"    🔍 找到 application_id: {application_id} (student_id={student_id}, company_id={company_id}, job_id={job_id})")
-                
-                if not application_id:
-                    print(f"    ⚠️ 跳過：找不到對應的 application_id (preference_id={preference_id}, job_id={job_id}, student_id={student_id})")
-                    continue
-                
-                # 更新或插入 resume_applications 記錄
-                cursor.execute("""
-                    SELECT id FROM resume_applications
-                    WHERE application_id = %s AND job_id = %s
-                """, (application_id, job_id))
-                existing_ra = cursor.fetchone()
-                # 確保結果被完全讀取
-                cursor.fetchall()  # 清空任何剩餘的結果
-                
-                if existing_ra:
-                    # 更新現有記錄的 is_reserve 和 slot_index
-                    # 同時確保 apply_status 是 'approved'（只有通過審核的學生才會出現在媒合排序中）
-                    cursor.execute("""
-                        UPDATE resume_applications
-                        SET is_reserve = %s,
-                            slot_index = %s,
-                            apply_status = 'approved',
-                            updated_at = NOW()
-                        WHERE application_id = %s AND job_id = %s
-                    """, (1 if is_reserve_val else 0, slot_index_val, application_id, job_id))
-                    print(f"    ✅ 更新 resume_applications: id={existing_ra['id']}, application_id={application_id}, job_id={job_id}, apply_status='approved', slot_index={slot_index_val}, is_reserve={is_reserve_val}")
-                else:
-                    # 創建新記錄
-                    # 注意：只有通過審核的學生才會出現在媒合排序中，所以 apply_status 應該是 'approved'
-                    cursor.execute("""
-                        INSERT INTO resume_applications
-                        (application_id, job_id, apply_status, interview_status, interview_result, is_reserve, slot_index, created_at)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
-                    """, (application_id, job_id, 'approved', 'none', 'pending', 1 if is_reserve_val else 0, slot_index_val))
-                    print(f"    ✅ 創建 resume_applications: application_id={application_id}, job_id={job_id}, apply_status='approved', slot_index={slot_index_val}, is_reserve={is_reserve_val}")
-                
-                # 同時更新或創建 manage_director 記錄，將廠商的排序資料同步過去
-                try:
-                    # 檢查 manage_director 表中是否已有記錄
-                    cursor.execute("""
-                        SELECT match_id, director_decision FROM manage_director
-                        WHERE preference_id = %s
-                    """, (application_id,))
-                    existing_md = cursor.fetchone()
-                    cursor.fetchall()  # 清空任何剩餘的結果
-                    
-                    # 確定 original_type 和 original_rank
-                    original_type = 'Regular' if not is_reserve_val else 'Backup'
-                    original_rank = slot_index_val if not is_reserve_val else None
-                    
-                    if existing_md:
-                        # 如果已有記錄，更新 original_rank（但保留 director_decision，除非是 Rejected）
-                        # 如果 director_decision 是 Rejected，則更新為 Pending，讓主任可以重新看到
-                        if existing_md.get('director_decision') == 'Rejected':
-                            cursor.execute("""
-                                UPDATE manage_director
-                                SET original_type = %s,
-                                    original_rank = %s,
-                                    director_decision = 'Pending',
-                                    updated_at = NOW()
-                                WHERE preference_id = %s
-                            """, (original_type, original_rank, application_id))
-                            print(f"    ✅ 更新 manage_director（從 Rejected 改為 Pending）: preference_id={application_id}, original_rank={original_rank}, original_type={original_type}")
-                        else:
-                            # 如果不是 Rejected，只更新 original_rank，保留 director_decision
-                            cursor.execute("""
-                                UPDATE manage_director
-                                SET original_type = %s,
-                                    original_rank = %s,
-                                    updated_at = NOW()
-                                WHERE preference_id = %s
-                            """, (original_type, original_rank, application_id))
-                            print(f"    ✅ 更新 manage_director: preference_id={application_id}, original_rank={original_rank}, original_type={original_type}")
-                    else:
-                        # 如果沒有記錄，創建新記錄
-                        # 獲取當前學期ID
-                        current_semester_id = None
-                        try:
-                            current_semester_id = get_current_semester_id(cursor)
-                        except:
-                            pass
-                        
-                        # 檢查 manage_director 表是否有 semester_id 欄位
-                        cursor.execute("""
-                            SELECT COLUMN_NAME
-                            FROM information_schema.COLUMNS
-                            WHERE TABLE_SCHEMA = DATABASE()
-                            AND TABLE_NAME = 'manage_director'
-                            AND COLUMN_NAME = 'semester_id'
-                        """)
-                        has_semester_id = cursor.fetchone() is not None
-                        cursor.fetchall()
-                        
-                        if has_semester_id and current_semester_id:
-                            cursor.execute("""
-                                INSERT INTO manage_director
-                                (semester_id, vendor_id, student_id, preference_id, original_type, original_rank, 
-                                 is_conflict, director_decision, final_rank, is_adjusted, updated_at)
-                                VALUES (%s, %s, %s, %s, %s, %s, 0, 'Pending', %s, 0, NOW())
-                            """, (current_semester_id, company_id, student_id, application_id, original_type, original_rank, original_rank))
-                        else:
-                            cursor.execute("""
-                                INSERT INTO manage_director
-                                (vendor_id, student_id, preference_id, original_type, original_rank, 
-                                 is_conflict, director_decision, final_rank, is_adjusted, updated_at)
-                                VALUES (%s, %s, %s, %s, %s, 0, 'Pending', %s, 0, NOW())
-                            """, (company_id, student_id, application_id, original_type, original_rank, original_rank))
-                        print(f"    ✅ 創建 manage_director: preference_id={application_id}, student_id={student_id}, original_rank={original_rank}, original_type={original_type}")
-                except Exception as md_error:
-                    print(f"    ⚠️ 更新 manage_director 失敗（不影響 resume_applications 的保存）: {md_error}")
-                    traceback.print_exc()
-                    # 不中斷流程，繼續處理下一個學生
-                
-                inserted_count += 1
-                print(f"✅ 已保存媒合排序記錄到 resume_applications 和 manage_director：preference_id={preference_id}, application_id={application_id}, student_id={student_id}, slot_index={slot_index_val}, is_reserve={is_reserve_val}")
-            except Exception as insert_error:
-                print(f"❌ 保存媒合排序記錄失敗：{insert_error}")
-                traceback.print_exc()
-                continue
+        # 一次解析所有學生的公司 / 志願 / 投遞，批次寫入 resume_applications 與 manage_director
+        current_semester_id = None
+        try:
+            current_semester_id = get_current_semester_id(cursor)
+        except Exception:
+            pass
+        inserted_count = _save_matching_sort_rows(cursor, students, company_ids, current_semester_id)
+        print(f"✅ 已保存 {inserted_count}/{len(students)} 筆媒合排序記錄到 resume_applications 和 manage_director")
         
         # 發送通知給指導老師和主任
         notified_teachers = set()
         notified_directors = set()
         
-        # 收集所有相關的指導老師（通過公司找到 advisor_user_id）
-        for company_id in company_ids:
-            cursor.execute("""
-                SELECT DISTINCT advisor_user_id 
-                FROM internship_companies 
-                WHERE id = %s AND advisor_user_id IS NOT NULL
-            """, (company_id,))
-            advisor_rows = cursor.fetchall() or []
-            for row in advisor_rows:
-                advisor_id = row.get('advisor_user_id')
-                if advisor_id:
-                    # 確認是指導老師或主任
-                    cursor.execute("""
-                        SELECT id, role FROM users 
-                        WHERE id = %s AND role IN ('teacher', 'director')
-                    """, (advisor_id,))
-                    user_row = cursor.fetchone()
-                    if user_row:
-                        if user_row.get('role') == 'teacher':
-                            notified_teachers.add(advisor_id)
-                        elif user_row.get('role') == 'director':
-                            notified_directors.add(advisor_id)
+        # 收集所有相關的指導老師（通過公司找到 advisor_user_id，確認是指導老師或主任）
+        cursor.execute("""
+            SELECT DISTINCT u.id, u.role
+            FROM internship_companies ic
+            JOIN users u ON u.id = ic.advisor_user_id
+            WHERE ic.id IN ({}) AND u.role IN ('teacher', 'director')
+        """.format(','.join(['%s'] * len(company_ids))), tuple(company_ids))
+        for row in cursor.fetchall() or []:
+            if row.get('role') == 'teacher':
+                notified_teachers.add(row['id'])
+            elif row.get('role') == 'director':
+                notified_directors.add(row['id'])
         
         # 收集所有主任
         cursor.execute("SELECT id FROM users WHERE role = 'director'")
@@ -4657,42 +4585,24 @@ def save_matching_sort():
         
         # 導入通知函數
         try:
-            from notification import create_notification
+            from notification import notify_users
         except ImportError:
-            print("⚠️ [警告] 無法導入 create_notification 函數")
-            create_notification = None
+            print("⚠️ [警告] 無法導入 notify_users 函數")
+            notify_users = None
         
         # 發送通知給指導老師
-        for teacher_id in notified_teachers:
-            if create_notification:
-                try:
-                    create_notification(
-                        user_id=teacher_id,
-                        title=teacher_title,
-                        message=teacher_message,
-                        category="matching",
-                        link_url=teacher_link_url
-                    )
-                except Exception as e:
-                    print(f"⚠️ [警告] 為指導老師 {teacher_id} 發送通知失敗: {e}")
+        if notify_users and notified_teachers:
+            notify_users(teacher_title, teacher_message, user_ids=notified_teachers,
+                         category="matching", link_url=teacher_link_url)
         
         # 發送通知給主任
         director_title = "廠商媒合排序已送出"
         director_message = f"{vendor_name}已送出{company_names_str}的媒合排序，請前往查看並審核。"
         director_link_url = "/admission/manage_director"
         
-        for director_id in notified_directors:
-            if create_notification:
-                try:
-                    create_notification(
-                        user_id=director_id,
-                        title=director_title,
-                        message=director_message,
-                        category="matching",
-                        link_url=director_link_url
-                    )
-                except Exception as e:
-                    print(f"⚠️ [警告] 為主任 {director_id} 發送通知失敗: {e}")
+        if notify_users and notified_directors:
+            notify_users(director_title, director_message, user_ids=notified_directors,
+                         category="matching", link_url=director_link_url)
         
         print(f"✅ [DEBUG] 已通知 {len(notified_teachers)} 位指導老師和 {len(notified_directors)} 位主任")
         
@@ -4906,7 +4816,8 @@ def test_email():
             recipient_email=recipient_email,
             subject=subject,
             content=content,
-            related_user_id=session.get('user_id')
+            related_user_id=session.get('user_id'),
+            wait_seconds=30  # 測試郵件需回報實際發送結果
         )
         
         if success: